@@ -0,0 +1,593 @@
+"""路线自动化生成 - 命令行批处理模式（无界面，不依赖 PyQt）
+
+根据 YAML/JSON 任务文件执行完整流程：场景搜索 → 坐标纠偏 → 路线生成 → 保存 Excel/JSON → 生成地图，
+输出各阶段耗时，并以退出码表示执行结果，便于在 Linux 服务器上定时批量运行。
+
+用法:
+    python route_batch.py job.yaml
+    python route_batch.py job.json --output-dir /data/routes
+    python route_batch.py --list-plans                 # 列出已缓存的路线规划
+    python route_batch.py --plan-diff 键A 键B          # 比较两个规划变体
+
+任务文件示例（YAML）:
+    city: 上海
+    districts: [浦东新区, 闵行区]      # 省略或留空表示全市
+    scenes: [学校, 医院, 公园]
+    location_filter_distance: 0.2      # 地点筛选距离（公里）
+    district_boundaries: true          # 按区县边界多边形搜索和筛选（获取失败时回退到名称匹配）
+    search_mode: keyword               # keyword（关键字轮询）| tiled（分块并发搜索，结果被截断的分块自动细分）
+    search_workers: 4                  # 分块搜索并发数
+    search_checkpoint: true            # 保存关键字搜索断点，任务中断后重新运行时从断点继续
+    stop_when_enough: false            # 够用即停：各场景地点数达到 route_num×(waypoint_num+1) 的配额后停止搜索
+    overfetch_factor: 1.5              # 够用即停的超额系数
+    rectify: true                      # 是否坐标纠偏
+    offline_snap_distance: 50          # 离线道路吸附距离（米）：用已获取路线的道路线段纠偏，0 表示全部调用接口
+    route_num: 10
+    waypoint_num: 8
+    plan_mode: greedy                  # greedy | balanced
+    spatial_sort: clockwise            # clockwise | counterclockwise | coordinate | radial | morton
+    scene_ratios: {学校: 40, 医院: 30, 公园: 30}
+    start_point_mode: saved            # auto | current_location | specified | manual | saved
+    start_point: {name: 青浦区华志路, lon: 121.2168, lat: 31.2308}
+    end_point_mode: same_as_start      # auto | same_as_start | specified | manual | saved
+    route_config: {between_waypoint_max: 2.0}
+    build_map: true
+    keys: [主密钥, 备用密钥1]          # 省略时使用环境变量 AMAP_KEYS（逗号分隔）或内置密钥
+    qps_per_key: 3                     # 每个密钥每秒最大请求数
+    require_feasible: false            # 可行性预检未通过时直接退出（默认只输出缺口报告）
+    fetch_polylines: true              # 规划后并发获取真实驾车路线（地图和里程使用真实道路）
+    polyline_workers: 4                # 获取真实路线的线程数
+    plan_cache: true                   # 相同输入复用已缓存的路线规划（与图形界面共用缓存目录）
+
+多城市任务：指定 cities（城市列表，或 all 表示 CITY_DISTRICTS 中的全部城市）和/或 jobs
+（每项是一个 {city, districts, scenes, ...} 分片），其余字段作为各分片的默认值。
+各分片在进程池中并行执行，共享同一个密钥池和限流（由协调进程托管），
+结果写入 output_dir 下各城市的子目录:
+    cities: [北京, 上海, 广州]
+    jobs:
+      - {city: 深圳, districts: [南山区, 福田区], scenes: [学校]}
+    scenes: [学校, 医院]
+    workers: 4                         # 进程数，默认 CPU 核数
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from multiprocessing import Pool
+from multiprocessing.managers import BaseManager
+
+from route_core import (VALID_SCENES, CITY_DISTRICTS, DEFAULT_AMAP_KEY, DEFAULT_BACKUP_KEYS,
+                        DEFAULT_ROUTE_CONFIG, ApiKeyPool, PlanCache, PolylineCache,
+                        DistrictBoundaryCache, SearchCheckpoint, RoadSnapCache,
+                        RoadSegmentStore, RoutePipelineMixin)
+
+logger = logging.getLogger(__name__)
+
+# 退出码
+EXIT_OK = 0                 # 全部阶段成功
+EXIT_ERROR = 1              # 未预期的异常
+EXIT_BAD_SPEC = 2           # 任务文件无效
+EXIT_NO_LOCATIONS = 3       # 搜索后没有可用地点
+EXIT_NO_ROUTES = 4          # 未生成任何路线
+EXIT_SAVE_FAILED = 5        # Excel/JSON 保存失败
+EXIT_MAP_FAILED = 6         # 地图生成失败
+EXIT_PARTIAL = 7            # 多城市任务中部分分片失败
+EXIT_INFEASIBLE = 8         # 可行性预检未通过（require_feasible: true 时）
+
+# 默认输出目录和规划缓存目录（与图形界面一致）
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated_files")
+DEFAULT_PLAN_CACHE_DIR = os.path.join(DEFAULT_OUTPUT_DIR, "plan_cache")
+DEFAULT_POLYLINE_CACHE_DIR = os.path.join(DEFAULT_OUTPUT_DIR, "polyline_cache")
+DEFAULT_DISTRICT_CACHE_DIR = os.path.join(DEFAULT_OUTPUT_DIR, "district_cache")
+DEFAULT_CHECKPOINT_DIR = os.path.join(DEFAULT_OUTPUT_DIR, "search_checkpoints")
+DEFAULT_ROAD_SNAP_CACHE_DIR = os.path.join(DEFAULT_OUTPUT_DIR, "road_snap_cache")
+DEFAULT_ROAD_SEGMENT_DIR = os.path.join(DEFAULT_OUTPUT_DIR, "road_segments")
+
+# 多城市任务中只在顶层生效、不下发到分片的字段
+SHARD_ONLY_KEYS = ('cities', 'jobs', 'workers', 'output_dir')
+
+
+class JobSpecError(ValueError):
+    """任务文件格式错误"""
+
+
+def load_job_spec(path):
+    """读取任务文件（.yaml/.yml 使用 PyYAML，其余按 JSON 解析）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    if path.lower().endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise JobSpecError("读取YAML任务文件需要安装PyYAML: pip install pyyaml")
+        spec = yaml.safe_load(text)
+    else:
+        spec = json.loads(text)
+
+    if not isinstance(spec, dict):
+        raise JobSpecError("任务文件顶层必须是字典")
+    return spec
+
+
+def validate_job_spec(spec):
+    """校验任务文件，返回补全默认值后的任务字典"""
+    job = dict(spec)
+
+    if not job.get('city') and not job.get('locations'):
+        raise JobSpecError("必须指定 city（搜索地点）或 locations（直接提供地点）")
+
+    city = job.get('city', '')
+    districts = job.get('districts') or []
+    if city in CITY_DISTRICTS:
+        unknown = [d for d in districts if d not in CITY_DISTRICTS[city]]
+        if unknown:
+            raise JobSpecError(f"{city} 没有这些行政区: {', '.join(unknown)}")
+    job['districts'] = districts
+
+    scenes = job.get('scenes') or []
+    unknown = [s for s in scenes if s not in VALID_SCENES]
+    if unknown:
+        raise JobSpecError(f"无效的场景名称: {', '.join(unknown)}（有效场景: {', '.join(VALID_SCENES)}）")
+    if job.get('city') and not scenes and not job.get('locations'):
+        raise JobSpecError("搜索地点时必须指定 scenes")
+    job['scenes'] = scenes
+
+    for field, default in (('route_num', 10), ('waypoint_num', 8)):
+        value = job.get(field, default)
+        if not isinstance(value, int) or value <= 0:
+            raise JobSpecError(f"{field} 必须是正整数")
+        job[field] = value
+
+    if job.setdefault('plan_mode', 'greedy') not in ('greedy', 'balanced'):
+        raise JobSpecError("plan_mode 只能是 greedy 或 balanced")
+
+    if job.setdefault('search_mode', 'keyword') not in ('keyword', 'tiled'):
+        raise JobSpecError("search_mode 只能是 keyword 或 tiled")
+    if not isinstance(job.setdefault('search_workers', 4), int) or job['search_workers'] <= 0:
+        raise JobSpecError("search_workers 必须是正整数")
+
+    unknown = set(job.get('route_config') or {}) - set(DEFAULT_ROUTE_CONFIG)
+    if unknown:
+        raise JobSpecError(f"未知的 route_config 参数: {', '.join(sorted(unknown))}")
+
+    job.setdefault('rectify', True)
+    job.setdefault('build_map', True)
+    job.setdefault('require_feasible', False)
+    job.setdefault('fetch_polylines', True)
+    overfetch_factor = job.setdefault('overfetch_factor', 1.5)
+    if not isinstance(overfetch_factor, (int, float)) or overfetch_factor < 1:
+        raise JobSpecError("overfetch_factor 必须是不小于1的数字")
+    if not isinstance(job.setdefault('polyline_workers', 4), int) or job['polyline_workers'] <= 0:
+        raise JobSpecError("polyline_workers 必须是正整数")
+    offline_snap_distance = job.setdefault('offline_snap_distance', 50)
+    if not isinstance(offline_snap_distance, (int, float)) or offline_snap_distance < 0:
+        raise JobSpecError("offline_snap_distance 必须是非负数")
+    job.setdefault('location_filter_distance', None)
+    return job
+
+
+def resolve_api_keys(spec):
+    """任务文件 keys → 环境变量 AMAP_KEYS（逗号分隔）→ 内置密钥"""
+    keys = spec.get('keys') or os.environ.get('AMAP_KEYS', '').split(',')
+    keys = [k.strip() for k in keys if k and k.strip()]
+    return keys or [DEFAULT_AMAP_KEY] + list(DEFAULT_BACKUP_KEYS)
+
+
+def expand_job_shards(spec):
+    """把多城市任务文件展开为分片任务列表（每个分片是一个单城市任务）"""
+    defaults = {k: v for k, v in spec.items() if k not in SHARD_ONLY_KEYS}
+
+    cities = spec.get('cities') or []
+    if cities == 'all':
+        cities = list(CITY_DISTRICTS)
+    elif isinstance(cities, str):
+        cities = [cities]
+
+    shards = [dict(defaults, city=city) for city in cities]
+    for job in spec.get('jobs') or []:
+        shards.append(dict(defaults, **job))
+    return shards
+
+
+def shard_output_dirs(shards, output_dir):
+    """为每个分片分配城市子目录，同一城市有多个分片时追加序号"""
+    city_totals = {}
+    for job in shards:
+        city_totals[job.get('city', '')] = city_totals.get(job.get('city', ''), 0) + 1
+
+    dirs = []
+    city_seen = {}
+    for job in shards:
+        city = job.get('city', '') or "未指定城市"
+        city_seen[city] = city_seen.get(city, 0) + 1
+        name = city if city_totals.get(job.get('city', ''), 0) == 1 else f"{city}_{city_seen[city]}"
+        dirs.append(os.path.join(output_dir, name))
+    return dirs
+
+
+class KeyPoolManager(BaseManager):
+    """托管共享密钥池的协调进程"""
+
+
+KeyPoolManager.register('ApiKeyPool', ApiKeyPool)
+
+
+class BatchRouteJob(RoutePipelineMixin):
+    """一次无界面的路线生成任务，属性与 MainWindow 保持一致以复用 RoutePipelineMixin"""
+
+    def __init__(self, job, output_dir, key_pool=None, cache_shard=None):
+        keys = resolve_api_keys(job)
+        self.key = keys[0]
+        self.backup_keys = keys[1:]
+        # 多城市任务时使用协调进程托管的共享密钥池
+        self.key_pool = key_pool if key_pool is not None else ApiKeyPool(keys, job.get('qps_per_key', 3.0))
+
+        self.job = job
+        self.city = job.get('city', '')
+
+        # 地点与路线数据
+        self.locations = []
+        self.coordinates = []
+        self.valid_locations = []
+        self.route_data = []
+        self.route_session = None
+        self.combined_map_path = None
+        self.last_generated_routes = []
+        self.all_history_routes = []
+        self.deleted_locations = []
+
+        # 场景与起终点设置
+        self.searched_scenes = []
+        self.scene_ratios = job.get('scene_ratios') or {}
+        self.start_point_mode = job.get('start_point_mode', 'auto')
+        self.specified_start_index = job.get('start_index')
+        self.manual_start_coords = job.get('start_point')
+        self.end_point_mode = job.get('end_point_mode', 'auto')
+        self.specified_end_index = job.get('end_index')
+        self.manual_end_coords = job.get('end_point')
+
+        # 规划参数
+        self.route_config = dict(DEFAULT_ROUTE_CONFIG)
+        self.route_config.update(job.get('route_config') or {})
+        self.route_strategy = job.get('route_strategy', 34)
+        self.rectify_enabled = bool(job.get('rectify'))
+        self.spatial_sort_type = job.get('spatial_sort', 'clockwise')
+        self.distance_calc_mode = job.get('distance_calc', 'haversine')
+        self.target_distance = job.get('target_distance')
+        self.route_num = job['route_num']
+        self.waypoint_num = job['waypoint_num']
+        self.stop_when_enough = bool(job.get('stop_when_enough'))
+        self.overfetch_factor = job.get('overfetch_factor', 1.5)
+        self.use_district_boundaries = job.get('district_boundaries', True)
+        self.district_cache = DistrictBoundaryCache(job.get('district_cache_dir') or DEFAULT_DISTRICT_CACHE_DIR)
+        # 分片任务写入各自的缓存文件，由主进程在进程池结束后合并
+        self.road_snap_cache = RoadSnapCache(job.get('road_snap_cache_dir') or DEFAULT_ROAD_SNAP_CACHE_DIR,
+                                             shard=cache_shard)
+        self.road_segment_store = RoadSegmentStore(job.get('road_segment_dir') or DEFAULT_ROAD_SEGMENT_DIR,
+                                                   shard=cache_shard)
+        self.offline_snap_distance = job.get('offline_snap_distance', 50)
+        self.search_checkpoint = None
+        if job.get('search_checkpoint', True):
+            self.search_checkpoint = SearchCheckpoint(job.get('search_checkpoint_dir') or DEFAULT_CHECKPOINT_DIR)
+
+        # 搜索/纠偏状态
+        self.is_search_paused = False
+        self.is_search_stopped = False
+        self.is_rectifying = False
+        self.coordinates_ready = False
+
+        # 输出目录
+        self.output_dir = output_dir
+        self.excel_dir = os.path.join(output_dir, "excel_files")
+        self.json_dir = os.path.join(output_dir, "json_files")
+        os.makedirs(self.excel_dir, exist_ok=True)
+        os.makedirs(self.json_dir, exist_ok=True)
+        self.exported_files = {'excel': [], 'json': []}
+
+        # 路线规划缓存
+        self.plan_cache = None
+        if job.get('plan_cache', True):
+            self.plan_cache = PlanCache(job.get('plan_cache_dir') or DEFAULT_PLAN_CACHE_DIR)
+        self.plan_cache_key = None
+        self.polyline_cache = PolylineCache(job.get('polyline_cache_dir') or DEFAULT_POLYLINE_CACHE_DIR)
+        self.polyline_count = 0
+
+        self.feasibility = None
+        self.timings = {}
+
+    # ---------------- 各阶段 ----------------
+
+    def stage_search(self):
+        """场景搜索（或直接载入任务文件中的地点）"""
+        for loc in self.job.get('locations') or []:
+            loc_data = {
+                'name': loc['name'],
+                'lon': float(loc['lon']),
+                'lat': float(loc['lat']),
+                'district': loc.get('district', ''),
+                'scene': loc.get('scene', ''),
+                'status': 'active'
+            }
+            self.coordinates.append(loc_data)
+            self.valid_locations.append(loc_data)
+            self.locations.append(loc_data['name'])
+
+        if self.job['scenes'] and self.job['search_mode'] == 'tiled':
+            self._search_scene_tiled(
+                self.city,
+                self.job['districts'] or [""],
+                self.job['scenes'],
+                self.job['location_filter_distance'],
+                rectify=False,
+                max_workers=self.job['search_workers']
+            )
+        elif self.job['scenes']:
+            self._search_scene_thread(
+                self.city,
+                self.job['districts'] or [""],
+                self.job['scenes'],
+                self.job['location_filter_distance'],
+                rectify=False
+            )
+
+        if not self.valid_locations:
+            return EXIT_NO_LOCATIONS
+        return EXIT_OK
+
+    def stage_rectify(self):
+        """坐标纠偏"""
+        self._rectify_search_results()
+        return EXIT_OK
+
+    def stage_check(self):
+        """可行性预检"""
+        active_locations = [loc for loc in self.valid_locations
+                            if loc.get('status', 'active') != 'deleted']
+        self.feasibility = self.check_feasibility(active_locations, self.job['waypoint_num'],
+                                                  self.job['route_num'], self.job['plan_mode'])
+        if not self.feasibility['feasible'] and self.job['require_feasible']:
+            return EXIT_INFEASIBLE
+        return EXIT_OK
+
+    def stage_generate(self):
+        """路线生成"""
+        active_locations = [loc for loc in self.valid_locations
+                            if loc.get('status', 'active') != 'deleted']
+        self.generate_route_batch(active_locations, self.job['waypoint_num'],
+                                  self.job['route_num'], self.job['plan_mode'])
+        if not self.route_data:
+            return EXIT_NO_ROUTES
+        self.last_generated_routes = self.route_data.copy()
+        self.all_history_routes.extend(self.route_data)
+        return EXIT_OK
+
+    def stage_polylines(self):
+        """并发获取真实驾车路线（失败的路线保留直线路径，不影响后续阶段）"""
+        self.polyline_count = self.fetch_route_polylines(self.route_data, self.job['polyline_workers'])
+        return EXIT_OK
+
+    def stage_save(self):
+        """保存 Excel 和 JSON 文件"""
+        excel_count = len(self.exported_files['excel'])
+        self._auto_save_files_to_program_dir()
+        if len(self.exported_files['excel']) == excel_count:
+            return EXIT_SAVE_FAILED
+        return EXIT_OK
+
+    def stage_map(self):
+        """生成综合路线地图"""
+        map_path = os.path.join(self.output_dir, "all_routes_map.html")
+        if not self.generate_realistic_route_map(output_path=map_path):
+            return EXIT_MAP_FAILED
+        return EXIT_OK
+
+    def run(self):
+        """依次执行各阶段，任一阶段失败即停止，返回退出码"""
+        stages = [('search', self.stage_search)]
+        if self.rectify_enabled:
+            stages.append(('rectify', self.stage_rectify))
+        stages += [('check', self.stage_check), ('generate', self.stage_generate)]
+        if self.job['fetch_polylines']:
+            stages.append(('polylines', self.stage_polylines))
+        stages.append(('save', self.stage_save))
+        if self.job['build_map']:
+            stages.append(('map', self.stage_map))
+
+        exit_code = EXIT_OK
+        for name, stage in stages:
+            stage_start = time.perf_counter()
+            try:
+                exit_code = stage()
+            except Exception as e:
+                logger.error(f"阶段 {name} 执行出错: {str(e)}", exc_info=True)
+                exit_code = EXIT_ERROR
+            self.timings[name] = time.perf_counter() - stage_start
+            logger.info(f"⏱️ 阶段 {name}: {self.timings[name]:.2f}s (exit={exit_code})")
+            if exit_code != EXIT_OK:
+                break
+        return exit_code
+
+    def write_summary(self, exit_code):
+        """写出本次任务的摘要文件 summary.json"""
+        summary = {
+            'city': self.city,
+            'exit_code': exit_code,
+            'timings': {name: round(seconds, 3) for name, seconds in self.timings.items()},
+            'location_count': len(self.valid_locations),
+            'route_count': len(self.route_data),
+            'polyline_count': self.polyline_count,
+            'excel_files': self.exported_files['excel'],
+            'json_files': self.exported_files['json'],
+            'map_file': self.combined_map_path,
+            'plan_cache_key': self.plan_cache_key,
+            'feasibility': self.feasibility,
+        }
+        summary_path = os.path.join(self.output_dir, "summary.json")
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary_path
+
+
+def _run_shard(args):
+    """进程池工作函数：执行一个分片任务，返回结果摘要"""
+    job, output_dir, key_pool, cache_shard = args
+    batch_job = BatchRouteJob(job, output_dir, key_pool=key_pool, cache_shard=cache_shard)
+    total_start = time.perf_counter()
+    try:
+        exit_code = batch_job.run()
+    except Exception as e:
+        logger.error(f"分片 {job.get('city', '')} 执行出错: {str(e)}", exc_info=True)
+        exit_code = EXIT_ERROR
+    batch_job.timings['total'] = time.perf_counter() - total_start
+    batch_job.write_summary(exit_code)
+    return {
+        'city': batch_job.city,
+        'output_dir': output_dir,
+        'exit_code': exit_code,
+        'timings': {name: round(seconds, 3) for name, seconds in batch_job.timings.items()},
+        'location_count': len(batch_job.valid_locations),
+        'route_count': len(batch_job.route_data),
+    }
+
+
+def run_sharded_jobs(spec, spec_path, output_dir):
+    """多城市任务：各分片在进程池中并行执行，共享协调进程托管的密钥池"""
+    try:
+        shards = [validate_job_spec(job) for job in expand_job_shards(spec)]
+    except ValueError as e:
+        logger.error(f"任务文件无效: {spec_path}: {str(e)}")
+        return EXIT_BAD_SPEC
+    if not shards:
+        logger.error(f"任务文件无效: {spec_path}: cities/jobs 为空")
+        return EXIT_BAD_SPEC
+
+    workers = min(spec.get('workers') or os.cpu_count() or 1, len(shards))
+    shard_dirs = shard_output_dirs(shards, output_dir)
+    print(f"共 {len(shards)} 个分片，{workers} 个工作进程，输出目录: {output_dir}")
+
+    total_start = time.perf_counter()
+    results = []
+    with KeyPoolManager() as manager:
+        key_pool = manager.ApiKeyPool(resolve_api_keys(spec), spec.get('qps_per_key', 3.0))
+        tasks = [(job, shard_dir, key_pool, f"{os.getpid()}-{i}")
+                 for i, (job, shard_dir) in enumerate(zip(shards, shard_dirs))]
+        with Pool(processes=workers) as pool:
+            for result in pool.imap_unordered(_run_shard, tasks):
+                results.append(result)
+                print(f"[{len(results)}/{len(shards)}] {result['city']}: "
+                      f"地点 {result['location_count']}  路线 {result['route_count']}  "
+                      f"耗时 {result['timings'].get('total', 0):.1f}s  退出码 {result['exit_code']}")
+        key_stats = key_pool.stats()
+    # 合并各分片写入的道路吸附缓存和线段库
+    for cache_dir in {job.get('road_snap_cache_dir') or DEFAULT_ROAD_SNAP_CACHE_DIR for job in shards}:
+        RoadSnapCache.merge_shards(cache_dir)
+    for store_dir in {job.get('road_segment_dir') or DEFAULT_ROAD_SEGMENT_DIR for job in shards}:
+        RoadSegmentStore.merge_shards(store_dir)
+    total_seconds = time.perf_counter() - total_start
+
+    exit_code = EXIT_OK if all(r['exit_code'] == EXIT_OK for r in results) else EXIT_PARTIAL
+    os.makedirs(output_dir, exist_ok=True)
+    summary_path = os.path.join(output_dir, "summary.json")
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'exit_code': exit_code,
+            'total_seconds': round(total_seconds, 3),
+            'workers': workers,
+            'key_stats': key_stats,
+            'shards': results,
+        }, f, ensure_ascii=False, indent=2)
+
+    failed = [r['city'] for r in results if r['exit_code'] != EXIT_OK]
+    print(f"\n{'='*50}")
+    print(f"任务: {spec_path}")
+    print(f"分片: {len(results)}  失败: {len(failed)}{'（' + ', '.join(failed) + '）' if failed else ''}")
+    print(f"总耗时: {total_seconds:.2f}s  密钥请求数: {key_stats['requests']}")
+    print(f"摘要: {summary_path}")
+    return exit_code
+
+
+def run_job_file(spec_path, output_dir=None):
+    """执行一个任务文件，返回退出码"""
+    try:
+        spec = load_job_spec(spec_path)
+    except (OSError, ValueError) as e:
+        logger.error(f"任务文件无效: {spec_path}: {str(e)}")
+        return EXIT_BAD_SPEC
+
+    if spec.get('cities') or spec.get('jobs'):
+        return run_sharded_jobs(spec, spec_path, output_dir or spec.get('output_dir') or DEFAULT_OUTPUT_DIR)
+
+    try:
+        job = validate_job_spec(spec)
+    except ValueError as e:
+        logger.error(f"任务文件无效: {spec_path}: {str(e)}")
+        return EXIT_BAD_SPEC
+
+    output_dir = output_dir or job.get('output_dir') or DEFAULT_OUTPUT_DIR
+
+    batch_job = BatchRouteJob(job, output_dir)
+    total_start = time.perf_counter()
+    exit_code = batch_job.run()
+    batch_job.timings['total'] = time.perf_counter() - total_start
+    summary_path = batch_job.write_summary(exit_code)
+
+    print(f"\n{'='*50}")
+    print(f"任务: {spec_path}")
+    for name, seconds in batch_job.timings.items():
+        print(f"  {name:<10} {seconds:>8.2f}s")
+    print(f"地点: {len(batch_job.valid_locations)}  路线: {len(batch_job.route_data)}  退出码: {exit_code}")
+    print(f"摘要: {summary_path}")
+    return exit_code
+
+
+def print_plan_diff(plan_cache, key_a, key_b):
+    """输出两个规划变体的差异"""
+    try:
+        diff = plan_cache.diff(key_a, key_b)
+    except KeyError as e:
+        print(str(e))
+        return EXIT_BAD_SPEC
+
+    print(f"规划 A: {key_a}")
+    print(f"规划 B: {key_b}")
+    print("输入差异:" if diff['inputs'] else "输入差异: 无")
+    for field, (value_a, value_b) in diff['inputs'].items():
+        print(f"  {field}: {value_a} → {value_b}")
+    print(f"路线差异: {len(diff['routes'])} 条")
+    for change in diff['routes']:
+        if change['order_changed']:
+            print(f"  路线 {change['route_id']}: 地点相同，顺序不同")
+            continue
+        print(f"  路线 {change['route_id']}: -[{', '.join(change['only_a'])}] +[{', '.join(change['only_b'])}]")
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="路线自动化生成 - 命令行批处理模式")
+    parser.add_argument('spec', nargs='?', help="任务文件路径（.yaml/.yml/.json）")
+    parser.add_argument('--output-dir', help="输出目录（默认使用任务文件中的 output_dir 或程序目录下的 generated_files）")
+    parser.add_argument('--plan-cache-dir', default=DEFAULT_PLAN_CACHE_DIR, help="规划缓存目录（用于 --list-plans/--plan-diff）")
+    parser.add_argument('--list-plans', action='store_true', help="列出已缓存的路线规划")
+    parser.add_argument('--plan-diff', nargs=2, metavar=('KEY_A', 'KEY_B'), help="比较两个已缓存的规划变体")
+    parser.add_argument('-q', '--quiet', action='store_true', help="只输出警告和错误日志")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.list_plans:
+        for key, created, route_count in PlanCache(args.plan_cache_dir).list_entries():
+            print(f"{key}  {created}  {route_count} 条路线")
+        return EXIT_OK
+    if args.plan_diff:
+        return print_plan_diff(PlanCache(args.plan_cache_dir), *args.plan_diff)
+    if not args.spec:
+        parser.error("需要指定任务文件")
+    return run_job_file(args.spec, args.output_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,6746 @@
+"""路线自动化生成核心逻辑（不依赖 PyQt）
+
+包含场景搜索、坐标纠偏、路线规划、结果保存和地图生成等流程，
+图形界面（MainWindow）和命令行批处理（route_batch.py）共用这一套实现。
+"""
+import os
+import json
+import math
+import time
+import tempfile
+import logging
+import threading
+import hashlib
+import glob
+from urllib.parse import quote
+
+# 延迟导入的重量级库（在需要时才导入，加快启动速度）
+np = None  # numpy
+pd = None  # pandas
+requests = None
+folium = None
+
+logger = logging.getLogger(__name__)
+
+
+def _lazy_import_numpy():
+    """延迟导入 numpy"""
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+def _lazy_import_pandas():
+    """延迟导入 pandas"""
+    global pd
+    if pd is None:
+        import pandas
+        pd = pandas
+    return pd
+
+def _lazy_import_requests():
+    """延迟导入 requests"""
+    global requests
+    if requests is None:
+        import requests as req
+        requests = req
+    return requests
+
+def _lazy_import_folium():
+    """延迟导入 folium"""
+    global folium
+    if folium is None:
+        import folium as fol
+        folium = fol
+    return folium
+
+# Selenium 延迟导入（在需要时才导入）
+SELENIUM_AVAILABLE = None  # 延迟检测
+_selenium_modules = {}
+
+def _lazy_import_selenium():
+    """延迟导入 Selenium"""
+    global SELENIUM_AVAILABLE, _selenium_modules
+    if SELENIUM_AVAILABLE is None:
+        try:
+            from selenium import webdriver
+            from selenium.webdriver.chrome.service import Service
+            from selenium.webdriver.chrome.options import Options
+            from selenium.webdriver.common.by import By
+            from selenium.webdriver.support.ui import WebDriverWait
+            from selenium.webdriver.support import expected_conditions as EC
+            from webdriver_manager.chrome import ChromeDriverManager
+            _selenium_modules = {
+                'webdriver': webdriver,
+                'Service': Service,
+                'Options': Options,
+                'By': By,
+                'WebDriverWait': WebDriverWait,
+                'EC': EC,
+                'ChromeDriverManager': ChromeDriverManager
+            }
+            SELENIUM_AVAILABLE = True
+        except ImportError:
+            SELENIUM_AVAILABLE = False
+            logger.warning("Selenium未安装，无法使用浏览器获取位置功能")
+    return SELENIUM_AVAILABLE, _selenium_modules
+
+
+# 高德地图API密钥：主密钥 + 备用密钥列表（如果主密钥不起作用，依次尝试备用密钥）
+DEFAULT_AMAP_KEY = '46fa5492b6c1effefb33cff59a0a9536'
+# 5cd11205cc7744d742da10dda92daecd
+DEFAULT_BACKUP_KEYS = [
+    '8325164e247e15eea68b59e89200988b',  # 备用密钥1
+    '3fabc36268a955439fc99a589aacbd87',  # 备用密钥2
+    '2b2d86f7b4f48047e7d5b3cec6e9f51f'   # 备用密钥3
+]
+
+# 路线规划默认配置参数
+DEFAULT_ROUTE_CONFIG = {
+    'waypoint_min_distance': 0.5,      # 途径点距起/终点最小距离：0.5公里(500米)
+    'waypoint_max_distance': 15,       # 途径点距起/终点最大距离：15公里
+    'between_waypoint_min': 0.5,       # 相邻途径点最小距离：0.5公里(500米)
+    'between_waypoint_max': 1.0,       # 相邻途径点最大距离：1.0公里(1000米)
+    'non_adjacent_min': 0.5,           # 不相邻点最小距离：0.5公里(500米)
+    'dedup_distance': 0.2,             # 地点去重距离：0.2公里(200米)
+    'similarity_threshold': 0.6,       # 路线相似度阈值
+    'enable_deduplication': True,      # 启用去重功能
+}
+
+# 有效场景列表（用于Excel导入时验证场景名称）
+VALID_SCENES = ["学校", "医院", "公园", "景区", "商场", "美食街", "酒店", "加油站", "银行", "地铁站", "公交站"]
+
+# 全国主要城市及行政区数据（新增）
+CITY_DISTRICTS = {
+    # 直辖市
+    "北京": ["东城区", "西城区", "朝阳区", "丰台区", "石景山区", "海淀区", "门头沟区", "房山区", "通州区", "顺义区", "昌平区", "大兴区", "怀柔区", "平谷区", "密云区", "延庆区"],
+    "上海": ["黄浦区", "徐汇区", "长宁区", "静安区", "普陀区", "虹口区", "杨浦区", "闵行区", "宝山区", "嘉定区", "浦东新区", "金山区", "松江区", "青浦区", "奉贤区", "崇明区"],
+    "天津": ["和平区", "河东区", "河西区", "南开区", "河北区", "红桥区", "东丽区", "西青区", "津南区", "北辰区", "武清区", "宝坻区", "滨海新区", "宁河区", "静海区", "蓟州区"],
+    "重庆": ["万州区", "涪陵区", "渝中区", "大渡口区", "江北区", "沙坪坝区", "九龙坡区", "南岸区", "北碚区", "綦江区", "大足区", "渝北区", "巴南区", "黔江区", "长寿区", "江津区", "合川区", "永川区", "南川区", "璧山区", "铜梁区", "潼南区", "荣昌区", "开州区", "梁平区", "武隆区", "城口县", "丰都县", "垫江县", "忠县", "云阳县", "奉节县", "巫山县", "巫溪县", "石柱土家族自治县", "秀山土家族苗族自治县", "酉阳土家族苗族自治县", "彭水苗族土家族自治县"],
+    
+    # 省会城市
+    "广州": ["越秀区", "海珠区", "荔湾区", "天河区", "白云区", "黄埔区", "番禺区", "花都区", "南沙区", "从化区", "增城区"],
+    "深圳": ["罗湖区", "福田区", "南山区", "宝安区", "龙岗区", "盐田区", "龙华区", "坪山区", "光明区", "大鹏新区"],
+    "成都": ["锦江区", "青羊区", "金牛区", "武侯区", "成华区", "龙泉驿区", "青白江区", "新都区", "温江区", "双流区", "郫都区", "新津区", "都江堰市", "彭州市", "邛崃市", "崇州市", "简阳市", "金堂县", "大邑县", "蒲江县"],
+    "杭州": ["上城区", "下城区", "江干区", "拱墅区", "西湖区", "滨江区", "萧山区", "余杭区", "富阳区", "临安区", "建德市", "桐庐县", "淳安县"],
+    "武汉": ["江岸区", "江汉区", "硚口区", "汉阳区", "武昌区", "青山区", "洪山区", "东西湖区", "汉南区", "蔡甸区", "江夏区", "黄陂区", "新洲区"],
+    "西安": ["新城区", "碑林区", "莲湖区", "灞桥区", "未央区", "雁塔区", "阎良区", "临潼区", "长安区", "高陵区", "鄠邑区", "蓝田县", "周至县"],
+    "南京": ["玄武区", "秦淮区", "建邺区", "鼓楼区", "浦口区", "栖霞区", "雨花台区", "江宁区", "六合区", "溧水区", "高淳区"],
+    "长沙": ["芙蓉区", "天心区", "岳麓区", "开福区", "雨花区", "望城区", "宁乡市", "浏阳市", "长沙县"],
+    "郑州": ["中原区", "二七区", "管城回族区", "金水区", "上街区", "惠济区", "巩义市", "荥阳市", "新密市", "新郑市", "登封市", "中牟县"],
+    "济南": ["历下区", "市中区", "槐荫区", "天桥区", "历城区", "长清区", "章丘区", "济阳区", "莱芜区", "钢城区", "平阴县", "商河县"],
+    "青岛": ["市南区", "市北区", "黄岛区", "崂山区", "李沧区", "城阳区", "即墨区", "胶州市", "平度市", "莱西市"],
+    "沈阳": ["和平区", "沈河区", "大东区", "皇姑区", "铁西区", "苏家屯区", "浑南区", "沈北新区", "于洪区", "辽中区", "新民市", "康平县", "法库县"],
+    "大连": ["中山区", "西岗区", "沙河口区", "甘井子区", "旅顺口区", "金州区", "普兰店区", "瓦房店市", "庄河市", "长海县"],
+    "哈尔滨": ["道里区", "南岗区", "道外区", "平房区", "松北区", "香坊区", "呼兰区", "阿城区", "双城区", "尚志市", "五常市", "依兰县", "方正县", "宾县", "巴彦县", "木兰县", "通河县", "延寿县"],
+    "长春": ["南关区", "宽城区", "朝阳区", "二道区", "绿园区", "双阳区", "九台区", "榆树市", "德惠市", "公主岭市", "农安县"],
+    "福州": ["鼓楼区", "台江区", "仓山区", "晋安区", "马尾区", "长乐区", "福清市", "闽侯县", "连江县", "罗源县", "闽清县", "永泰县", "平潭县"],
+    "厦门": ["思明区", "海沧区", "湖里区", "集美区", "同安区", "翔安区"],
+    "昆明": ["五华区", "盘龙区", "官渡区", "西山区", "东川区", "呈贡区", "晋宁区", "安宁市", "富民县", "宜良县", "石林彝族自治县", "嵩明县", "禄劝彝族苗族自治县", "寻甸回族彝族自治县"],
+    "南昌": ["东湖区", "西湖区", "青云谱区", "湾里区", "青山湖区", "新建区", "南昌县", "安义县", "进贤县"],
+    "贵阳": ["南明区", "云岩区", "花溪区", "乌当区", "白云区", "观山湖区", "清镇市", "开阳县", "息烽县", "修文县"],
+    "南宁": ["兴宁区", "青秀区", "江南区", "西乡塘区", "良庆区", "邕宁区", "武鸣区", "隆安县", "马山县", "上林县", "宾阳县", "横州市"],
+    "拉萨": ["城关区", "堆龙德庆区", "达孜区", "林周县", "当雄县", "尼木县", "曲水县", "墨竹工卡县"],
+    "西宁": ["城东区", "城中区", "城西区", "城北区", "大通回族土族自治县", "湟中县", "湟源县"],
+    "兰州": ["城关区", "七里河区", "西固区", "安宁区", "红古区", "永登县", "皋兰县", "榆中县"],
+    "银川": ["兴庆区", "西夏区", "金凤区", "灵武市", "永宁县", "贺兰县"],
+    "乌鲁木齐": ["天山区", "沙依巴克区", "新市区", "水磨沟区", "头屯河区", "达坂城区", "米东区", "乌鲁木齐县"],
+    "呼和浩特": ["新城区", "回民区", "玉泉区", "赛罕区", "土默特左旗", "托克托县", "和林格尔县", "清水河县", "武川县"],
+    "太原": ["小店区", "迎泽区", "杏花岭区", "尖草坪区", "万柏林区", "晋源区", "清徐县", "阳曲县", "娄烦县", "古交市"],
+    "石家庄": ["长安区", "桥西区", "新华区", "井陉矿区", "裕华区", "藁城区", "鹿泉区", "栾城区", "辛集市", "晋州市", "新乐市", "井陉县", "正定县", "行唐县", "灵寿县", "高邑县", "深泽县", "赞皇县", "无极县", "平山县", "元氏县", "赵县"],
+    "合肥": ["瑶海区", "庐阳区", "蜀山区", "包河区", "长丰县", "肥东县", "肥西县", "庐江县", "巢湖市"],
+    "南京": ["玄武区", "秦淮区", "建邺区", "鼓楼区", "浦口区", "栖霞区", "雨花台区", "江宁区", "六合区", "溧水区", "高淳区"],
+    "杭州": ["上城区", "下城区", "江干区", "拱墅区", "西湖区", "滨江区", "萧山区", "余杭区", "富阳区", "临安区", "建德市", "桐庐县", "淳安县"],
+    "宁波": ["海曙区", "江北区", "北仑区", "镇海区", "鄞州区", "奉化区", "余姚市", "慈溪市", "象山县", "宁海县"],
+    "苏州": ["姑苏区", "虎丘区", "吴中区", "相城区", "吴江区", "苏州工业园区", "常熟市", "张家港市", "昆山市", "太仓市"],
+    "无锡": ["锡山区", "惠山区", "滨湖区", "梁溪区", "新吴区", "江阴市", "宜兴市"],
+    "常州": ["天宁区", "钟楼区", "新北区", "武进区", "金坛区", "溧阳市"],
+    "徐州": ["云龙区", "鼓楼区", "贾汪区", "泉山区", "铜山区", "丰县", "沛县", "睢宁县", "新沂市", "邳州市"],
+    "南通": ["崇川区", "港闸区", "通州区", "如东县", "启东市", "如皋市", "海门市", "海安市"],
+    "扬州": ["广陵区", "邗江区", "江都区", "宝应县", "仪征市", "高邮市"],
+    "镇江": ["京口区", "润州区", "丹徒区", "丹阳市", "扬中市", "句容市"],
+    "泰州": ["海陵区", "高港区", "姜堰区", "兴化市", "靖江市", "泰兴市"],
+    "盐城": ["亭湖区", "盐都区", "大丰区", "响水县", "滨海县", "阜宁县", "射阳县", "建湖县", "东台市"],
+    "淮安": ["淮安区", "淮阴区", "清江浦区", "洪泽区", "涟水县", "盱眙县", "金湖县"],
+    "连云港": ["连云区", "海州区", "赣榆区", "东海县", "灌云县", "灌南县"],
+    "宿迁": ["宿城区", "宿豫区", "沭阳县", "泗阳县", "泗洪县"],
+    
+    # 其他主要城市
+    "东莞": ["莞城街道", "南城街道", "东城街道", "万江街道", "石碣镇", "石龙镇", "茶山镇", "石排镇", "企石镇", "横沥镇", "桥头镇", "谢岗镇", "东坑镇", "常平镇", "寮步镇", "樟木头镇", "大朗镇", "黄江镇", "清溪镇", "塘厦镇", "凤岗镇", "大岭山镇", "长安镇", "虎门镇", "厚街镇", "沙田镇", "道滘镇", "洪梅镇", "麻涌镇", "望牛墩镇", "中堂镇", "高埗镇"],
+    "佛山": ["禅城区", "南海区", "顺德区", "三水区", "高明区"],
+    "中山": ["石岐区", "东区", "西区", "南区", "五桂山区", "火炬开发区", "黄圃镇", "南头镇", "东凤镇", "阜沙镇", "小榄镇", "东升镇", "古镇镇", "横栏镇", "三角镇", "民众镇", "南朗镇", "港口镇", "大涌镇", "沙溪镇", "三乡镇", "板芙镇", "神湾镇", "坦洲镇"],
+    "珠海": ["香洲区", "斗门区", "金湾区"],
+    "惠州": ["惠城区", "惠阳区", "惠东县", "博罗县", "龙门县", "大亚湾经济技术开发区", "仲恺高新技术产业开发区"],
+    "汕头": ["龙湖区", "金平区", "濠江区", "潮阳区", "潮南区", "澄海区", "南澳县"],
+    "江门": ["蓬江区", "江海区", "新会区", "台山市", "开平市", "鹤山市", "恩平市"],
+    "湛江": ["赤坎区", "霞山区", "坡头区", "麻章区", "廉江市", "雷州市", "吴川市", "遂溪县", "徐闻县"],
+    "茂名": ["茂南区", "电白区", "高州市", "化州市", "信宜市"],
+    "肇庆": ["端州区", "鼎湖区", "高要区", "四会市", "广宁县", "怀集县", "封开县", "德庆县"],
+    "揭阳": ["榕城区", "揭东区", "揭西县", "惠来县", "普宁市"],
+    "潮州": ["湘桥区", "潮安区", "饶平县"],
+    "汕尾": ["城区", "海丰县", "陆河县", "陆丰市"],
+    "河源": ["源城区", "紫金县", "龙川县", "连平县", "和平县", "东源县"],
+    "阳江": ["江城区", "阳东区", "阳西县", "阳春市"],
+    "清远": ["清城区", "清新区", "英德市", "连州市", "佛冈县", "阳山县", "连山壮族瑶族自治县", "连南瑶族自治县"],
+    "韶关": ["武江区", "浈江区", "曲江区", "乐昌市", "南雄市", "始兴县", "仁化县", "翁源县", "乳源瑶族自治县", "新丰县"],
+    "梅州": ["梅江区", "梅县区", "兴宁市", "大埔县", "丰顺县", "五华县", "平远县", "蕉岭县"],
+    "云浮": ["云城区", "云安区", "罗定市", "新兴县", "郁南县"],
+    "柳州": ["城中区", "鱼峰区", "柳南区", "柳北区", "柳江区", "柳城县", "鹿寨县", "融安县", "融水苗族自治县", "三江侗族自治县"],
+    "桂林": ["秀峰区", "叠彩区", "象山区", "七星区", "雁山区", "临桂区", "阳朔县", "灵川县", "全州县", "兴安县", "永福县", "灌阳县", "龙胜各族自治县", "资源县", "平乐县", "恭城瑶族自治县"],
+    "梧州": ["万秀区", "长洲区", "龙圩区", "苍梧县", "藤县", "蒙山县", "岑溪市"],
+    "北海": ["海城区", "银海区", "铁山港区", "合浦县"],
+    "防城港": ["港口区", "防城区", "上思县", "东兴市"],
+    "钦州": ["钦南区", "钦北区", "灵山县", "浦北县"],
+    "贵港": ["港北区", "港南区", "覃塘区", "平南县", "桂平市"],
+    "玉林": ["玉州区", "福绵区", "容县", "陆川县", "博白县", "兴业县", "北流市"],
+    "百色": ["右江区", "田阳区", "田东县", "德保县", "那坡县", "凌云县", "乐业县", "田林县", "西林县", "隆林各族自治县", "靖西市", "平果市"],
+    "贺州": ["八步区", "平桂区", "昭平县", "钟山县", "富川瑶族自治县"],
+    "河池": ["金城江区", "宜州区", "南丹县", "天峨县", "凤山县", "东兰县", "罗城仫佬族自治县", "环江毛南族自治县", "巴马瑶族自治县", "都安瑶族自治县", "大化瑶族自治县"],
+    "来宾": ["兴宾区", "忻城县", "象州县", "武宣县", "金秀瑶族自治县", "合山市"],
+    "崇左": ["江州区", "扶绥县", "宁明县", "龙州县", "大新县", "天等县", "凭祥市"]
+}
+
+
+# ==================== API密钥池 ====================
+class ApiKeyPool:
+    """高德API密钥池：按密钥限流，并在密钥配额用尽时自动切换
+
+    每个密钥单独按 qps_per_key 限流，reserve() 选出最早可用的密钥并预占一个请求时间片，
+    调用方按返回的等待时间休眠后再发请求。批处理时由 multiprocessing Manager 托管一个实例，
+    各工作进程共享同一套密钥状态和限流。
+    """
+
+    # 密钥相关错误码（配额用尽、密钥无效等），遇到后标记密钥不可用
+    KEY_ERROR_CODES = ('10001', '10003', '10005', '10009', '10011')
+    # 限流类错误码（访问过于频繁、QPS 超限），遇到后该密钥退避一段时间再重试，不标记用尽
+    RATE_LIMIT_CODES = ('10004', '10014', '10015', '10019', '10020', '10021')
+    # 单次请求因限流最多重试的次数，及首次退避秒数（之后每次翻倍）
+    THROTTLE_RETRIES = 3
+    THROTTLE_BACKOFF = 1.0
+
+    def __init__(self, keys, qps_per_key=3.0):
+        self._keys = [k for k in keys if k]
+        self._interval = 1.0 / qps_per_key if qps_per_key > 0 else 0.0
+        self._next_time = {k: 0.0 for k in self._keys}
+        self._request_count = {k: 0 for k in self._keys}
+        self._exhausted = set()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """预占一个请求时间片
+
+        Returns:
+            (密钥, 需要等待的秒数)，所有密钥都不可用时返回 (None, 0)
+        """
+        with self._lock:
+            alive = [k for k in self._keys if k not in self._exhausted]
+            if not alive:
+                return None, 0.0
+            now = time.monotonic()
+            key = min(alive, key=lambda k: self._next_time[k])
+            start = max(now, self._next_time[key])
+            self._next_time[key] = start + self._interval
+            self._request_count[key] += 1
+            return key, start - now
+
+    def mark_exhausted(self, key):
+        """标记密钥不可用（配额用尽/无效），返回剩余可用密钥数"""
+        with self._lock:
+            self._exhausted.add(key)
+            return sum(1 for k in self._keys if k not in self._exhausted)
+
+    def back_off(self, key, delay):
+        """密钥被限流：delay 秒内不再分配该密钥（有其他密钥时 reserve() 会优先选用）"""
+        with self._lock:
+            if key in self._next_time:
+                self._next_time[key] = max(self._next_time[key], time.monotonic() + delay)
+
+    def capacity(self):
+        """当前可用密钥的总 QPS（未限流时返回 None）"""
+        if self._interval <= 0:
+            return None
+        with self._lock:
+            alive = sum(1 for k in self._keys if k not in self._exhausted)
+        return alive / self._interval
+
+    def key_number(self, key):
+        """密钥序号（从1开始，用于日志显示）"""
+        return self._keys.index(key) + 1 if key in self._keys else 0
+
+    def stats(self):
+        """各密钥请求次数和已用尽的密钥序号"""
+        with self._lock:
+            return {
+                'requests': {i + 1: self._request_count[k] for i, k in enumerate(self._keys)},
+                'exhausted': sorted(self._keys.index(k) + 1 for k in self._exhausted),
+            }
+
+
+# ==================== 自适应并发 ====================
+class AimdConcurrencyController:
+    """按 AIMD（加性增、乘性减）调整并发请求数
+
+    请求成功且延迟低于 latency_threshold 时，每累计 limit 次健康请求并发数 +1；
+    遇到限流类错误码或超时则并发数减半（cooldown 秒内只减一次，避免同一轮并发的
+    多个失败把并发数连续压到底）。并发上限取 max_limit 与密钥池可用密钥总 QPS 的较小值，
+    密钥被标记用尽后上限随之下降。
+    """
+
+    # 限流类错误码（访问过于频繁、QPS 超限、服务繁忙）
+    THROTTLE_CODES = ApiKeyPool.RATE_LIMIT_CODES
+
+    def __init__(self, key_pool=None, initial=2, min_limit=1, max_limit=16,
+                 latency_threshold=3.0, cooldown=1.0):
+        self._key_pool = key_pool
+        self._min = max(1, min_limit)
+        self._max = max(self._min, max_limit)
+        self._limit = float(min(max(initial, self._min), self._max))
+        self._latency_threshold = latency_threshold
+        self._cooldown = cooldown
+        self._healthy = 0
+        self._last_decrease = 0.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._slot_available = threading.Condition()
+
+    def ceiling(self):
+        """当前并发上限"""
+        capacity = self._key_pool.capacity() if self._key_pool is not None else None
+        if capacity is None:
+            return self._max
+        return max(self._min, min(self._max, int(capacity)))
+
+    @property
+    def limit(self):
+        """当前允许的并发请求数"""
+        with self._lock:
+            return max(self._min, min(int(self._limit), self.ceiling()))
+
+    def acquire(self):
+        """阻塞直到正在执行的请求数低于当前并发数，然后占用一个名额"""
+        with self._slot_available:
+            while self._in_flight >= self.limit:
+                self._slot_available.wait(0.5)
+            self._in_flight += 1
+
+    def release(self):
+        """释放 acquire() 占用的名额"""
+        with self._slot_available:
+            self._in_flight -= 1
+            self._slot_available.notify_all()
+
+    def record(self, infocode=None, latency=None, timed_out=False):
+        """记录一次请求结果
+
+        Args:
+            infocode: 接口返回的错误码（info/errcode），成功为 '10000' 或 None
+            latency: 请求耗时（秒）
+            timed_out: 是否超时
+        """
+        throttled = timed_out or (infocode is not None and str(infocode) in self.THROTTLE_CODES)
+        with self._lock:
+            if throttled:
+                self._healthy = 0
+                now = time.monotonic()
+                if now - self._last_decrease >= self._cooldown:
+                    self._last_decrease = now
+                    self._limit = max(self._min, self._limit / 2)
+                return
+            if latency is not None and latency > self._latency_threshold:
+                # 延迟偏高：保持当前并发，不再继续增加
+                self._healthy = 0
+                return
+            self._healthy += 1
+            if self._healthy >= int(self._limit):
+                self._healthy = 0
+                self._limit = min(float(self.ceiling()), self._limit + 1)
+
+
+class RectifyStream:
+    """搜索过程中的流水线坐标纠偏
+
+    通过筛选的地点用 submit() 放入队列，每凑满 batch_size 个就把这一批提交到线程池纠偏，
+    与搜索并行执行，同时执行的批次数由 AimdConcurrencyController 控制。
+    close() 提交队列中剩余的地点并等待所有批次完成，返回 {id(原地点): 纠偏后地点}。
+    """
+
+    def __init__(self, rectify_batch, controller, batch_size=30, on_batch_done=None):
+        """
+        Args:
+            rectify_batch: 纠偏函数 (地点列表, feedback字典) → 纠偏后的地点列表
+            on_batch_done: 每个批次完成后的回调 (已完成批次数, 已提交批次数, 本批纠偏数, 本批点数)
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._rectify_batch = rectify_batch
+        self._controller = controller
+        self._batch_size = batch_size
+        self._on_batch_done = on_batch_done
+        self._executor = ThreadPoolExecutor(max_workers=controller.ceiling())
+        self._queue = []
+        self._sources = []  # 保留原地点的引用，保证 id() 在流水线结束前不会被复用
+        self._results = {}
+        self._futures = []
+        self._completed = 0
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def __len__(self):
+        return len(self._sources)
+
+    def submit(self, loc):
+        """地点入队，凑满一批时提交纠偏"""
+        self._sources.append(loc)
+        self._queue.append(loc)
+        if len(self._queue) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._queue:
+            batch, self._queue = self._queue, []
+            self._futures.append(self._executor.submit(self._run, batch))
+
+    def _run(self, batch):
+        feedback = {}
+        self._controller.acquire()
+        try:
+            rectified = self._rectify_batch(batch, feedback)
+        except Exception as e:
+            logger.error(f"流水线纠偏批次失败: {str(e)}")
+            rectified = batch
+        finally:
+            self._controller.release()
+        self._controller.record(feedback.get('errcode'), feedback.get('latency'), feedback.get('timeout', False))
+        corrected = sum(1 for loc, new_loc in zip(batch, rectified)
+                        if loc['lon'] != new_loc['lon'] or loc['lat'] != new_loc['lat'])
+        with self._lock:
+            for loc, new_loc in zip(batch, rectified):
+                self._results[id(loc)] = new_loc
+            self._completed += 1
+            completed = self._completed
+        if self._on_batch_done:
+            self._on_batch_done(completed, len(self._futures), corrected, len(batch))
+
+    @property
+    def concurrency(self):
+        return self._controller.limit
+
+    def close(self):
+        """提交剩余地点，等待所有批次完成，返回 {id(原地点): 纠偏后地点}"""
+        if not self.closed:
+            self.closed = True
+            self._flush()
+            self._executor.shutdown(wait=True)
+        return self._results
+
+
+# ==================== 路线生成会话 ====================
+def location_key(loc):
+    """地点唯一标识：名称 + 经纬度（保留6位小数）"""
+    return (loc.get('name', ''), round(float(loc['lon']), 6), round(float(loc['lat']), 6))
+
+
+def _route_points(route):
+    """路线的起点、途径点和终点"""
+    return [route['start_point']] + list(route.get('waypoint_details', [])) + [route['end_point']]
+
+
+class RouteGenerationSession:
+    """一次批量路线生成过程中的地点使用状态
+
+    维护已使用地点集合和可用地点索引（保持原有顺序的字典），每生成一条路线
+    通过 commit_route 以 O(1) 代价移除其起点、终点和途径点，不再每条路线都
+    遍历已有路线、拆分途径点名称字符串并重新筛选全部地点。
+
+    同时维护 地点→路线 索引（point_routes），删除地点后可以直接找到受影响的路线，
+    只对这些路线做增量修复。
+
+    会话在生成路线后继续保留（供删除地点后的增量修复使用），地点列表的后续变化也逐个
+    同步到可用索引：新搜索到的地点 add_point、被删除的地点 remove_point、坐标被纠偏的
+    地点 replace_point，路线被撤销时 release_route 把其地点放回，不必重建整个会话。
+    """
+
+    def __init__(self, locations):
+        self.used_keys = set()
+        self.point_routes = {}
+        self._removed_keys = set()
+        self._available = {}
+        for loc in locations:
+            self.add_point(loc)
+
+    @classmethod
+    def from_routes(cls, locations, routes):
+        """根据已生成的路线恢复会话状态"""
+        session = cls(locations)
+        for route in routes:
+            session.commit_route(route)
+        return session
+
+    def __len__(self):
+        return len(self._available)
+
+    def is_used(self, loc):
+        return location_key(loc) in self.used_keys
+
+    def add_point(self, loc):
+        """新增地点加入可用索引（已删除、无坐标、已被路线使用或已移除的地点除外）"""
+        if loc.get('status', 'active') == 'deleted':
+            return
+        if loc.get('lat') is None or loc.get('lon') is None:
+            return
+        key = location_key(loc)
+        if key in self.used_keys or key in self._removed_keys:
+            return
+        self._available.setdefault(key, loc)
+
+    def replace_point(self, old, new):
+        """地点坐标被修正（如纠偏）后更新可用索引，未使用的地点以新坐标重新加入"""
+        old_key = location_key(old)
+        if old_key in self._available:
+            del self._available[old_key]
+            self.add_point(new)
+
+    def consume(self, loc):
+        """标记地点为已使用并从可用索引中移除"""
+        key = location_key(loc)
+        self.used_keys.add(key)
+        self._available.pop(key, None)
+
+    def commit_route(self, route):
+        """路线被采纳后，消耗其起点、终点和所有途径点"""
+        for loc in _route_points(route):
+            self.consume(loc)
+            self.point_routes.setdefault(location_key(loc), set()).add(route['route_id'])
+
+    def release_route(self, route):
+        """撤销路线对地点的占用（重新规划前调用）
+
+        仍被其他路线使用（如串联路线共用的起终点）或已删除的地点不会回到可用索引。
+        """
+        for loc in _route_points(route):
+            key = location_key(loc)
+            route_ids = self.point_routes.get(key)
+            if route_ids is None:
+                continue
+            route_ids.discard(route['route_id'])
+            if route_ids:
+                continue
+            del self.point_routes[key]
+            self.used_keys.discard(key)
+            if key not in self._removed_keys:
+                self._available[key] = loc
+
+    def remove_point(self, loc):
+        """地点被删除：从可用索引中永久移除，返回经过该地点的路线 route_id 集合"""
+        key = location_key(loc)
+        self._removed_keys.add(key)
+        self._available.pop(key, None)
+        return set(self.point_routes.get(key, ()))
+
+    def available_points(self, exclude=None):
+        """返回当前可用地点列表（可额外排除若干地点，如本条路线的起点）"""
+        if not exclude:
+            return list(self._available.values())
+        exclude_keys = {location_key(p) for p in exclude}
+        return [p for key, p in self._available.items() if key not in exclude_keys]
+
+
+# ==================== 地点查重索引 ====================
+class LocationIndex:
+    """搜索过程中的地点查重索引
+
+    维护名称集合、名称+坐标键集合，以及按经纬度取整得到的网格键（近似 geohash），
+    使“同名地点”、“同名同坐标地点”和“不同名称但坐标几乎重合的地点（如连锁门店）”
+    的检查都是 O(1)，不必遍历已有地点列表。
+    """
+
+    # 不同名称视为同一地点的坐标距离（公里）
+    NEAR_DUPLICATE_KM = 0.02
+
+    def __init__(self, locations=(), cell_km=NEAR_DUPLICATE_KM):
+        # 经度方向网格按纬度60°放宽一倍，保证国内任意纬度下相邻一圈网格覆盖查询半径
+        self.cell_km = max(cell_km, self.NEAR_DUPLICATE_KM)
+        self._lat_step = self.cell_km / 110.574
+        self._lon_step = self._lat_step * 2
+        self.names = set()
+        self.keys = set()
+        self._cells = {}
+        for loc in locations:
+            self.add(loc)
+
+    def _cell(self, lon, lat):
+        return (math.floor(lon / self._lon_step), math.floor(lat / self._lat_step))
+
+    def add(self, loc):
+        """登记一个地点"""
+        self.names.add(loc['name'])
+        self.keys.add(location_key(loc))
+        self._cells.setdefault(self._cell(float(loc['lon']), float(loc['lat'])), []).append(loc)
+
+    def add_name(self, name):
+        """只登记名称（如没有坐标的导入地点）"""
+        self.names.add(name)
+
+    def has_name(self, name):
+        return name in self.names
+
+    def contains(self, name, lon, lat):
+        """是否已有同名同坐标（6位小数）的地点"""
+        return (name, round(float(lon), 6), round(float(lat), 6)) in self.keys
+
+    def candidates(self, lon, lat, radius_km):
+        """返回可能位于 radius_km 范围内的地点（所在网格及周围网格中的地点）"""
+        rings = max(1, math.ceil(radius_km / self.cell_km))
+        cx, cy = self._cell(lon, lat)
+        for dx in range(-rings, rings + 1):
+            for dy in range(-rings, rings + 1):
+                yield from self._cells.get((cx + dx, cy + dy), ())
+
+
+# ==================== 行政区边界 ====================
+def simplify_polyline(points, tolerance):
+    """Douglas-Peucker 折线简化
+
+    Args:
+        points: n×2 数组（经度, 纬度）
+        tolerance: 允许的最大偏离距离（度）
+
+    Returns:
+        简化后的 m×2 数组（保留首尾点）
+    """
+    _lazy_import_numpy()
+    points = np.asarray(points, dtype=float)
+    if len(points) < 3:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = end - start
+        seg_len = np.hypot(*segment)
+        inner = points[first + 1:last] - start
+        if seg_len == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / seg_len
+        farthest = int(np.argmax(dist))
+        if dist[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return points[keep]
+
+
+def points_in_polygon(lons, lats, rings):
+    """向量化射线法判断点是否在多边形内
+
+    多个环按奇偶规则合并，飞地（多个外环）和内洞都能正确处理。
+
+    Args:
+        lons, lats: 点的经纬度数组
+        rings: 环列表，每个环是 [[经度, 纬度], ...]
+
+    Returns:
+        bool 数组
+    """
+    _lazy_import_numpy()
+    px = np.asarray(lons, dtype=float)[:, None]
+    py = np.asarray(lats, dtype=float)[:, None]
+    inside = np.zeros(len(px), dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=float)
+        x1, y1 = ring[:, 0][None, :], ring[:, 1][None, :]
+        x2, y2 = np.roll(ring[:, 0], -1)[None, :], np.roll(ring[:, 1], -1)[None, :]
+        straddles = (y1 > py) != (y2 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        crossings = (straddles & (px < x_cross)).sum(axis=1)
+        inside ^= (crossings % 2 == 1)
+    return inside
+
+
+class DistrictBoundaryCache:
+    """行政区边界缓存
+
+    区县边界来自高德行政区查询接口（v3/config/district），经 Douglas-Peucker 简化后
+    保存在内存中，指定缓存目录时同时写入 <缓存目录>/<哈希>.json。边界极少变化，
+    获取一次即可长期复用。
+    """
+
+    # 简化容差（度，约30米）
+    SIMPLIFY_TOLERANCE = 0.0003
+    # 多边形搜索参数最多使用的顶点数（控制 URL 长度），超出时加大容差进一步简化
+    QUERY_MAX_POINTS = 100
+    # 其余环面积合计不超过最大环的该比例时（如近岸小岛），只用最大环查询
+    QUERY_MINOR_RING_RATIO = 0.01
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._memory = {}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, city, district):
+        key = hashlib.sha256(f"{city}|{district}".encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, city, district):
+        """读取边界环列表 [[[经度, 纬度], ...], ...]，未缓存返回 None"""
+        with self._lock:
+            if (city, district) in self._memory:
+                return self._memory[(city, district)]
+        if not self.cache_dir or not os.path.exists(self._path(city, district)):
+            return None
+        try:
+            with open(self._path(city, district), 'r', encoding='utf-8') as f:
+                rings = json.load(f)['rings']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"读取行政区边界缓存失败: {city}{district}: {e}")
+            return None
+        with self._lock:
+            self._memory[(city, district)] = rings
+        return rings
+
+    def put(self, city, district, rings):
+        """保存边界（磁盘上先写临时文件再替换）"""
+        with self._lock:
+            self._memory[(city, district)] = rings
+        if not self.cache_dir:
+            return
+        path = self._path(city, district)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'city': city, 'district': district, 'rings': rings}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入行政区边界缓存失败: {path}: {e}")
+
+    @classmethod
+    def parse_polyline(cls, polyline):
+        """解析高德边界字符串（环之间用 | 分隔，点之间用 ; 分隔）并简化"""
+        rings = []
+        for ring_str in polyline.split('|'):
+            coords = [tuple(map(float, point.split(','))) for point in ring_str.split(';') if point]
+            if len(coords) < 3:
+                continue
+            simplified = simplify_polyline(coords, cls.SIMPLIFY_TOLERANCE)
+            if len(simplified) >= 3:
+                rings.append([[round(lon, 6), round(lat, 6)] for lon, lat in simplified.tolist()])
+        return rings
+
+    @staticmethod
+    def bbox(rings):
+        """边界外接矩形 (最小经度, 最小纬度, 最大经度, 最大纬度)"""
+        lons = [lon for ring in rings for lon, _ in ring]
+        lats = [lat for ring in rings for _, lat in ring]
+        return min(lons), min(lats), max(lons), max(lats)
+
+    @staticmethod
+    def _ring_area(ring):
+        """环的面积（平方度，鞋带公式）"""
+        coords = np.asarray(ring, dtype=float)
+        x, y = coords[:, 0], coords[:, 1]
+        return abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))) / 2
+
+    @classmethod
+    def polygon_param(cls, rings):
+        """多边形搜索（v3/place/polygon）的 polygon 参数
+
+        用面积最大的环作为查询多边形（首尾闭合，格式 经度,纬度|经度,纬度|...），
+        顶点数超过 QUERY_MAX_POINTS 时逐步加大容差简化。区县由多块面积相当的区域组成时，
+        单个多边形会漏掉其余区域，改用全部环的外接矩形。
+        """
+        _lazy_import_numpy()
+        areas = [cls._ring_area(ring) for ring in rings]
+        main = int(np.argmax(areas))
+        if sum(areas) - areas[main] > areas[main] * cls.QUERY_MINOR_RING_RATIO:
+            min_lon, min_lat, max_lon, max_lat = cls.bbox(rings)
+            return f"{min_lon:.6f},{min_lat:.6f}|{max_lon:.6f},{max_lat:.6f}"
+        ring = np.asarray(rings[main], dtype=float)
+        if not np.array_equal(ring[0], ring[-1]):
+            ring = np.vstack([ring, ring[:1]])
+        tolerance = cls.SIMPLIFY_TOLERANCE
+        while len(ring) > cls.QUERY_MAX_POINTS:
+            tolerance *= 2
+            simplified = simplify_polyline(ring, tolerance)
+            if len(simplified) < 4:
+                break
+            ring = simplified
+        return "|".join(f"{lon:.6f},{lat:.6f}" for lon, lat in ring.tolist())
+
+
+# ==================== 路线规划缓存 ====================
+class PlanCache:
+    """按规划输入内容寻址的路线规划缓存
+
+    以地点集合、route_config、scene_ratios、排序方式、起终点模式等输入的哈希为键，
+    把生成的 route_data 保存为 <缓存目录>/<哈希>.json。输入不变时（如重启程序、
+    只修改导出目录）直接返回上次的规划结果；缓存文件同时保存输入参数，便于比较
+    不同配置下的规划差异。
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def locations_digest(locations):
+        """地点集合摘要（保持顺序：地点顺序会影响贪心规划结果）"""
+        digest = hashlib.sha256()
+        for loc in locations:
+            name, lon, lat = location_key(loc)
+            digest.update(f"{name}|{lon:.6f}|{lat:.6f}|{loc.get('scene', '')}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def make_key(self, inputs):
+        """规划输入 → 缓存键"""
+        payload = json.dumps({'version': self.VERSION, 'inputs': inputs},
+                             ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """读取缓存的 route_data，未命中返回 None"""
+        entry = self.load_entry(key)
+        return entry['route_data'] if entry else None
+
+    def load_entry(self, key):
+        """读取完整缓存条目 {key, inputs, created, route_data}"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取规划缓存失败: {path}: {e}")
+            return None
+
+    def put(self, key, inputs, route_data):
+        """保存规划结果（先写临时文件再替换，避免并发读到半个文件）"""
+        entry = {
+            'key': key,
+            'inputs': inputs,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'route_data': route_data,
+        }
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+    def list_entries(self):
+        """列出所有缓存条目的 (键, 创建时间, 路线数)"""
+        entries = []
+        for filename in sorted(os.listdir(self.cache_dir)):
+            if not filename.endswith('.json'):
+                continue
+            entry = self.load_entry(filename[:-5])
+            if entry:
+                entries.append((entry['key'], entry.get('created', ''), len(entry.get('route_data', []))))
+        return entries
+
+    def diff(self, key_a, key_b):
+        """比较两个规划变体：输入参数差异 + 各路线的地点差异"""
+        entry_a = self.load_entry(key_a)
+        entry_b = self.load_entry(key_b)
+        if entry_a is None or entry_b is None:
+            missing = key_a if entry_a is None else key_b
+            raise KeyError(f"规划缓存不存在: {missing}")
+
+        def flatten(inputs):
+            # 字典类参数（route_config、scene_ratios）展开到子项，差异更直观
+            flat = {}
+            for field, value in inputs.items():
+                if isinstance(value, dict):
+                    for sub_field, sub_value in value.items():
+                        flat[f"{field}.{sub_field}"] = sub_value
+                else:
+                    flat[field] = value
+            return flat
+
+        inputs_a, inputs_b = flatten(entry_a['inputs']), flatten(entry_b['inputs'])
+        input_changes = {
+            field: (inputs_a.get(field), inputs_b.get(field))
+            for field in sorted(set(inputs_a) | set(inputs_b))
+            if inputs_a.get(field) != inputs_b.get(field)
+        }
+
+        def point_names(route):
+            return [p['name'] for p in _route_points(route)]
+
+        routes_a = {r['route_id']: r for r in entry_a['route_data']}
+        routes_b = {r['route_id']: r for r in entry_b['route_data']}
+        route_changes = []
+        for route_id in sorted(set(routes_a) | set(routes_b)):
+            names_a = point_names(routes_a[route_id]) if route_id in routes_a else []
+            names_b = point_names(routes_b[route_id]) if route_id in routes_b else []
+            if names_a != names_b:
+                route_changes.append({
+                    'route_id': route_id,
+                    'only_a': [n for n in names_a if n not in names_b],
+                    'only_b': [n for n in names_b if n not in names_a],
+                    'order_changed': sorted(names_a) == sorted(names_b),
+                })
+        return {'inputs': input_changes, 'routes': route_changes}
+
+
+# ==================== 真实路线缓存 ====================
+class PolylineCache:
+    """驾车路线坐标缓存
+
+    以路线策略 + 起点/途径点/终点坐标为键缓存 get_driving_route 的结果，
+    内存中保留一份，指定缓存目录时同时写入 <缓存目录>/<哈希>.json 供下次启动复用。
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._memory = {}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(strategy, points):
+        """路线策略 + 途经坐标序列 → 缓存键"""
+        payload = f"{strategy}|" + ";".join(
+            f"{float(p['lon']):.6f},{float(p['lat']):.6f}" for p in points
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """读取缓存的路线 {real_points, road_types, road_names, turn_points, driving_distance}"""
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+        if not self.cache_dir or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取路线缓存失败: {self._path(key)}: {e}")
+            return None
+        with self._lock:
+            self._memory[key] = entry
+        return entry
+
+    def put(self, key, entry):
+        """保存路线（磁盘上先写临时文件再替换）"""
+        with self._lock:
+            self._memory[key] = entry
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入路线缓存失败: {path}: {e}")
+
+
+# ==================== 道路吸附缓存 ====================
+class RoadSnapCache:
+    """备选纠偏（周边道路搜索 / 逆地理编码）结果缓存
+
+    以四舍五入到4位小数（约10米）的坐标为键，记录吸附到的道路点 {lon, lat, road_name}；
+    只查到街道名时记录 {nearest_road}，什么都没查到时记录空字典，同样不再重复请求。
+    指定缓存目录时整体保存在 <缓存目录>/road_snap.json，调用 save() 时写入；纠偏过程中只 put()，
+    由纠偏结束处统一 save() 一次，避免每批都重写整个文件。
+    多进程批处理时各分片指定 shard，读取共享文件、写入各自的 road_snap.shard-<分片>.json，
+    由主进程在分片全部结束后调用 merge_shards() 合并，避免分片之间互相覆盖。
+    """
+
+    PRECISION = 4
+    FILENAME = "road_snap.json"
+    SHARD_FILENAME = "road_snap.shard-{}.json"
+
+    def __init__(self, cache_dir=None, shard=None):
+        self.cache_dir = cache_dir
+        self.shard = shard
+        self._memory = {}
+        # 每次 put 递增 _version，写入成功后记录 _saved_version，两者不同表示有未保存的结果
+        self._version = 0
+        self._saved_version = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load()
+
+    @classmethod
+    def make_key(cls, lon, lat):
+        """坐标 → 缓存键（约10米精度）"""
+        return f"{float(lon):.{cls.PRECISION}f},{float(lat):.{cls.PRECISION}f}"
+
+    def _path(self):
+        return os.path.join(self.cache_dir, self.FILENAME)
+
+    def _save_path(self):
+        if self.shard is None:
+            return self._path()
+        return os.path.join(self.cache_dir, self.SHARD_FILENAME.format(self.shard))
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取道路吸附缓存失败: {path}: {e}")
+            return None
+
+    def _load(self):
+        if not os.path.exists(self._path()):
+            return
+        self._memory = self._read(self._path()) or {}
+
+    @classmethod
+    def merge_shards(cls, cache_dir):
+        """把各分片写入的 road_snap.shard-*.json 合并到共享文件并删除，返回合并的分片文件数"""
+        shard_paths = sorted(glob.glob(os.path.join(glob.escape(cache_dir), cls.SHARD_FILENAME.format('*'))))
+        if not shard_paths:
+            return 0
+        cache = cls(cache_dir)
+        for path in shard_paths:
+            entries = cls._read(path)
+            if entries:
+                with cache._lock:
+                    cache._memory.update(entries)
+                    cache._version += 1
+        cache.save()
+        for path in shard_paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"删除分片缓存失败: {path}: {e}")
+        return len(shard_paths)
+
+    def get(self, lon, lat):
+        """读取吸附结果，未缓存返回 None"""
+        with self._lock:
+            return self._memory.get(self.make_key(lon, lat))
+
+    def put(self, lon, lat, entry):
+        with self._lock:
+            self._memory[self.make_key(lon, lat)] = entry
+            self._version += 1
+
+    def save(self):
+        """有新结果时写入磁盘（先写临时文件再替换）
+
+        写入由 _save_lock 串行化，快照在持有写入锁时获取，较旧的快照不会覆盖较新的文件；
+        写入成功后才标记已保存，失败时下次 save() 重试。
+        """
+        if not self.cache_dir:
+            return
+        with self._save_lock:
+            with self._lock:
+                if self._version == self._saved_version:
+                    return
+                snapshot = dict(self._memory)
+                version = self._version
+            path = self._save_path()
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"写入道路吸附缓存失败: {path}: {e}")
+                return
+            with self._lock:
+                self._saved_version = version
+
+
+# ==================== 离线道路吸附 ====================
+class RoadSegmentStore:
+    """离线道路线段库
+
+    把已获取的驾车路线坐标（get_driving_route、路线计算）中相邻两点组成的道路线段和道路名
+    保存下来，按 CELL_SIZE 度的网格建立空间索引（线段登记到其外接矩形覆盖的所有网格）。
+    snap() 在查询点附近的网格中找最近的线段并投影到线段上，实现不调用接口的坐标纠偏。
+    指定目录时线段、道路名和网格索引整体保存在 <目录>/road_segments.json，调用 save() 时写入。
+    多进程批处理时各分片指定 shard，写入各自的 road_segments.shard-<分片>.json，
+    由主进程调用 merge_shards() 合并（与 RoadSnapCache 相同）。
+    """
+
+    VERSION = 1
+    # 网格边长（度，约200米）
+    CELL_SIZE = 0.002
+    FILENAME = "road_segments.json"
+    SHARD_FILENAME = "road_segments.shard-{}.json"
+
+    def __init__(self, store_dir=None, shard=None):
+        self.store_dir = store_dir
+        self.shard = shard
+        self._segments = []  # [经度1, 纬度1, 经度2, 纬度2, 道路名序号]
+        self._names = []
+        self._name_ids = {}
+        self._cells = {}
+        self._seen = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+            self._load()
+
+    def __len__(self):
+        return len(self._segments)
+
+    @classmethod
+    def _cell(cls, lon, lat):
+        return int(math.floor(lon / cls.CELL_SIZE)), int(math.floor(lat / cls.CELL_SIZE))
+
+    @staticmethod
+    def _segment_key(lon1, lat1, lon2, lat2):
+        """线段去重键（约1米精度，与方向无关）"""
+        a = (round(lon1, 5), round(lat1, 5))
+        b = (round(lon2, 5), round(lat2, 5))
+        return (a, b) if a <= b else (b, a)
+
+    def _register(self, seg_id):
+        lon1, lat1, lon2, lat2, _ = self._segments[seg_id]
+        min_x, min_y = self._cell(min(lon1, lon2), min(lat1, lat2))
+        max_x, max_y = self._cell(max(lon1, lon2), max(lat1, lat2))
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                self._cells.setdefault((x, y), []).append(seg_id)
+
+    def _path(self):
+        return os.path.join(self.store_dir, self.FILENAME)
+
+    def _save_path(self):
+        if self.shard is None:
+            return self._path()
+        return os.path.join(self.store_dir, self.SHARD_FILENAME.format(self.shard))
+
+    @classmethod
+    def _read(cls, path):
+        """读取线段库文件，失败或版本不符时返回 None"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取道路线段库失败: {path}: {e}")
+            return None
+        return data if data.get('version') == cls.VERSION else None
+
+    def _load(self):
+        if not os.path.exists(self._path()):
+            return
+        data = self._read(self._path())
+        if data is None:
+            return
+        self._segments = data.get('segments', [])
+        self._names = data.get('names', [])
+        self._name_ids = {name: i for i, name in enumerate(self._names)}
+        self._seen = {self._segment_key(*seg[:4]) for seg in self._segments}
+        if data.get('cell_size') == self.CELL_SIZE:
+            self._cells = {
+                tuple(map(int, cell.split(','))): ids for cell, ids in data.get('cells', {}).items()
+            }
+        else:
+            # 网格尺寸变化时重建索引
+            for seg_id in range(len(self._segments)):
+                self._register(seg_id)
+
+    def add_polyline(self, points, road_names=None):
+        """加入一条路线的坐标
+
+        Args:
+            points: [(经度, 纬度), ...]
+            road_names: 与坐标点一一对应的道路名（线段取终点所在路段的道路名）
+
+        Returns:
+            新增的线段数
+        """
+        added = 0
+        with self._lock:
+            for i in range(1, len(points)):
+                lon1, lat1 = map(float, points[i - 1])
+                lon2, lat2 = map(float, points[i])
+                name = road_names[i] if road_names and i < len(road_names) else ''
+                added += self._add_segment(lon1, lat1, lon2, lat2, name)
+            if added:
+                self._dirty = True
+        return added
+
+    def _add_segment(self, lon1, lat1, lon2, lat2, name):
+        """加入一条线段（调用方持有 _lock），重复或退化线段返回 False"""
+        key = self._segment_key(lon1, lat1, lon2, lat2)
+        if key[0] == key[1] or key in self._seen:
+            return False
+        self._seen.add(key)
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self._names)
+            self._names.append(name)
+        self._segments.append([round(lon1, 6), round(lat1, 6), round(lon2, 6), round(lat2, 6), name_id])
+        self._register(len(self._segments) - 1)
+        return True
+
+    @classmethod
+    def merge_shards(cls, store_dir):
+        """把各分片写入的 road_segments.shard-*.json 合并到共享文件并删除，返回合并的分片文件数"""
+        shard_paths = sorted(glob.glob(os.path.join(glob.escape(store_dir), cls.SHARD_FILENAME.format('*'))))
+        if not shard_paths:
+            return 0
+        store = cls(store_dir)
+        for path in shard_paths:
+            data = cls._read(path)
+            if data is None:
+                continue
+            names = data.get('names', [])
+            with store._lock:
+                for lon1, lat1, lon2, lat2, name_id in data.get('segments', []):
+                    name = names[name_id] if 0 <= name_id < len(names) else ''
+                    if store._add_segment(lon1, lat1, lon2, lat2, name):
+                        store._dirty = True
+        store.save()
+        for path in shard_paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"删除分片线段库失败: {path}: {e}")
+        return len(shard_paths)
+
+    def snap(self, lon, lat, max_distance=50):
+        """把坐标吸附到最近的已知道路线段
+
+        Args:
+            max_distance: 最大吸附距离（米），超出时视为附近没有已知道路
+
+        Returns:
+            {lon, lat, road_name, distance}，附近没有线段时返回 None
+        """
+        meters_per_deg = 111320.0
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        reach = max(1, int(math.ceil(max_distance / (meters_per_deg * cos_lat) / self.CELL_SIZE)))
+        cell_x, cell_y = self._cell(lon, lat)
+        with self._lock:
+            candidates = set()
+            for x in range(cell_x - reach, cell_x + reach + 1):
+                for y in range(cell_y - reach, cell_y + reach + 1):
+                    candidates.update(self._cells.get((x, y), ()))
+            best = None
+            for seg_id in candidates:
+                lon1, lat1, lon2, lat2, name_id = self._segments[seg_id]
+                # 以查询点为原点的局部平面坐标（米）
+                ax, ay = (lon1 - lon) * meters_per_deg * cos_lat, (lat1 - lat) * meters_per_deg
+                dx, dy = (lon2 - lon1) * meters_per_deg * cos_lat, (lat2 - lat1) * meters_per_deg
+                length_sq = dx * dx + dy * dy
+                t = 0.0 if length_sq == 0 else min(1.0, max(0.0, -(ax * dx + ay * dy) / length_sq))
+                distance = math.hypot(ax + t * dx, ay + t * dy)
+                if distance <= max_distance and (best is None or distance < best[0]):
+                    best = (distance, lon1 + t * (lon2 - lon1), lat1 + t * (lat2 - lat1), name_id)
+            if best is None:
+                return None
+            return {
+                'lon': round(best[1], 6),
+                'lat': round(best[2], 6),
+                'road_name': self._names[best[3]],
+                'distance': round(best[0], 1),
+            }
+
+    def save(self):
+        """有新线段时写入磁盘（先写临时文件再替换）"""
+        with self._lock:
+            if not self.store_dir or not self._dirty:
+                return
+            data = {
+                'version': self.VERSION,
+                'cell_size': self.CELL_SIZE,
+                'names': list(self._names),
+                'segments': list(self._segments),
+                'cells': {f"{x},{y}": list(ids) for (x, y), ids in self._cells.items()},
+            }
+            self._dirty = False
+        path = self._save_path()
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入道路线段库失败: {path}: {e}")
+
+
+# ==================== 搜索断点 ====================
+class SearchCheckpoint:
+    """场景搜索断点
+
+    保存关键字搜索各(场景, 行政区)的翻页进度、当前页POI、筛选计数和已添加的地点，
+    暂停后继续、或程序重启后以相同条件再次搜索时从断点接着搜索，不重复请求已处理的页。
+    分块搜索保存已获取的POI和尚未查询的分块（save_tiles），继续时只查询剩余分块。
+    每组搜索条件对应一个文件 <断点目录>/<哈希>.json，搜索正常结束或被终止时删除。
+    """
+
+    VERSION = 1
+    # 断点中每个POI只保留搜索筛选用到的字段
+    POI_FIELDS = ('id', 'name', 'location', 'adname')
+    # 断点中保存的搜索状态字段（边界在恢复时重新读取边界缓存）
+    STATE_FIELDS = ('scene', 'district', 'page', 'poi_index', 'pois', 'in_district', 'exhausted', 'total_pages')
+
+    def __init__(self, checkpoint_dir):
+        self.checkpoint_dir = checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def make_key(self, city, districts, scenes, location_filter_distance, mode=None):
+        """搜索条件 → 断点键（mode 区分关键字搜索与分块搜索，关键字搜索为 None）"""
+        inputs = {
+            'version': self.VERSION,
+            'city': city,
+            'districts': list(districts),
+            'scenes': list(scenes),
+            'location_filter_distance': location_filter_distance,
+        }
+        if mode:
+            inputs['mode'] = mode
+        payload = json.dumps(inputs, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, key):
+        return os.path.join(self.checkpoint_dir, f"{key}.json")
+
+    def load(self, key):
+        """读取断点，不存在或损坏时返回 None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取搜索断点失败: {path}: {e}")
+            return None
+
+    def save(self, key, search_states, current_index, consecutive_failures, stats, added_locations):
+        """保存断点（先写临时文件再替换）"""
+        states = []
+        for state in search_states:
+            saved = {field: state[field] for field in self.STATE_FIELDS}
+            saved['pois'] = [{f: poi.get(f) for f in self.POI_FIELDS} for poi in state['pois']]
+            states.append(saved)
+        checkpoint = {
+            'key': key,
+            'saved': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'states': states,
+            'current_index': current_index,
+            'consecutive_failures': consecutive_failures,
+            'stats': stats,
+            'locations': added_locations,
+        }
+        self._write(key, checkpoint)
+
+    def save_tiles(self, key, scene_pois, pending_tiles, tiles_done, requests_made):
+        """保存分块搜索断点
+
+        Args:
+            scene_pois: {场景: {POI标识: (POI, 区县)}}，已获取的POI
+            pending_tiles: [(场景, 区县, 分块外接矩形), ...]，尚未完成查询的分块
+        """
+        checkpoint = {
+            'key': key,
+            'mode': 'tiled',
+            'saved': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'pois': {
+                scene: [[{f: poi.get(f) for f in self.POI_FIELDS}, district] for poi, district in pois.values()]
+                for scene, pois in scene_pois.items()
+            },
+            'pending': [[scene, district, list(bbox)] for scene, district, bbox in pending_tiles],
+            'tiles_done': tiles_done,
+            'requests_made': requests_made,
+        }
+        self._write(key, checkpoint)
+
+    def _write(self, key, checkpoint):
+        """写入断点文件（先写临时文件再替换）"""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"保存搜索断点失败: {path}: {e}")
+
+    def clear(self, key):
+        """删除断点"""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+# ==================== 全局均衡聚类规划 ====================
+def _scene_quotas(scene_ratios, count):
+    """按场景比例计算每条路线各场景的点数配额（与贪心算法的配额规则一致）"""
+    total_ratio = sum(scene_ratios.values())
+    if total_ratio <= 0:
+        return {}
+    quotas = {scene: int(count * ratio / total_ratio) for scene, ratio in scene_ratios.items()}
+    allocated = sum(quotas.values())
+    if allocated < count:
+        max_ratio_scene = max(scene_ratios.items(), key=lambda x: x[1])[0]
+        quotas[max_ratio_scene] += count - allocated
+    return quotas
+
+
+def _project_km(points):
+    """经纬度投影到以质心为原点的平面坐标（公里），返回 n×2 数组"""
+    lons = np.array([float(p['lon']) for p in points])
+    lats = np.array([float(p['lat']) for p in points])
+    lon0, lat0 = lons.mean(), lats.mean()
+    return np.column_stack([
+        (lons - lon0) * 111.320 * math.cos(math.radians(lat0)),
+        (lats - lat0) * 110.574,
+    ])
+
+
+def _capacitated_assign(coords, centroids, capacity):
+    """带容量约束的最近簇分配
+
+    一次性计算所有点到所有簇中心的距离矩阵，按距离从小到大依次分配，
+    簇满后不再接收。容量总和小于点数时，离所有簇都较远的点不参与分配。
+
+    Returns:
+        每个点的簇编号数组，-1 表示未分配
+    """
+    n = len(coords)
+    assign = np.full(n, -1, dtype=int)
+    remaining = capacity.copy()
+    if n == 0 or remaining.sum() <= 0:
+        return assign
+    dist = ((coords[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+    left = int(min(n, remaining.sum()))
+    for flat in np.argsort(dist, axis=None, kind='stable'):
+        point_idx, cluster_idx = divmod(int(flat), len(centroids))
+        if assign[point_idx] >= 0 or remaining[cluster_idx] <= 0:
+            continue
+        assign[point_idx] = cluster_idx
+        remaining[cluster_idx] -= 1
+        left -= 1
+        if left == 0:
+            break
+    return assign
+
+
+def _nearest_neighbor_order(coords, start_xy):
+    """从 start_xy 出发按最近邻顺序排列 coords，返回下标列表"""
+    order = []
+    visited = np.zeros(len(coords), dtype=bool)
+    current = np.asarray(start_xy, dtype=float)
+    for _ in range(len(coords)):
+        dist = ((coords - current) ** 2).sum(axis=1)
+        dist[visited] = np.inf
+        idx = int(np.argmin(dist))
+        visited[idx] = True
+        order.append(idx)
+        current = coords[idx]
+    return order
+
+
+def plan_balanced_routes(locations, route_num, waypoint_num, scene_ratios=None,
+                         start_point=None, end_point=None, closed_loop=False, iterations=10):
+    """全局均衡聚类规划：一次性为所有路线划分地点
+
+    1. 将地点投影到以质心为原点的平面坐标（公里）
+    2. 扫描法（按质心方位角切分）初始化 route_num 个簇中心
+    3. 迭代执行带容量约束的 k-means：各场景按配额分别分配，剩余名额（起终点、
+       场景点不足的缺口）由其余地点补齐，保证每个簇点数均衡且紧凑
+    4. 每个簇内按最近邻排序：起点 → 途径点 → 终点
+
+    Args:
+        locations: 可用地点列表（需包含 lon、lat，可选 scene）
+        route_num: 路线数量
+        waypoint_num: 每条路线的途径点数量
+        scene_ratios: 场景比例 {场景名: 百分比}，为空表示不限制
+        start_point: 固定起点（如收藏点），为 None 时从簇内选择
+        end_point: 固定终点（如收藏点），为 None 时从簇内选择
+        closed_loop: 闭环路线，终点与起点相同
+
+    Returns:
+        [{'start_point', 'waypoints', 'end_point'}, ...]，地点不足时路线数可能少于 route_num
+    """
+    _lazy_import_numpy()
+    points = [p for p in locations if p.get('lat') is not None and p.get('lon') is not None]
+    if route_num <= 0 or not points:
+        return []
+
+    # 每条路线需要从簇内选出的起终点数量
+    fixed_end = closed_loop or end_point is not None
+    extra = (0 if start_point is not None else 1) + (0 if fixed_end else 1)
+    per_route = waypoint_num + extra
+    if per_route <= 0:
+        return []
+    route_num = min(route_num, len(points) // per_route)
+    if route_num <= 0:
+        return []
+
+    lons = np.array([float(p['lon']) for p in points])
+    lats = np.array([float(p['lat']) for p in points])
+    lon0, lat0 = lons.mean(), lats.mean()
+    coords = np.column_stack([
+        (lons - lon0) * 111.320 * math.cos(math.radians(lat0)),
+        (lats - lat0) * 110.574,
+    ])
+
+    # 场景分组：配额内的场景各自分配，其余名额由“自由组”补齐
+    quotas = _scene_quotas(scene_ratios, waypoint_num) if scene_ratios else {}
+    scenes = np.array([p.get('scene', '未分类') for p in points])
+    scene_groups = [(np.where(scenes == scene)[0], quota) for scene, quota in quotas.items() if quota > 0]
+
+    # 扫描法初始化：按方位角排序后均分为 route_num 段，取各段均值作为初始中心
+    angles = np.arctan2(coords[:, 0], coords[:, 1])
+    chunks = np.array_split(np.argsort(angles, kind='stable'), route_num)
+    centroids = np.array([coords[chunk].mean(axis=0) for chunk in chunks])
+
+    assign = np.full(len(points), -1, dtype=int)
+    via_free = np.zeros(len(points), dtype=bool)
+    for _ in range(max(1, iterations)):
+        new_assign = np.full(len(points), -1, dtype=int)
+        shortfall = np.zeros(route_num, dtype=int)
+        for idx, quota in scene_groups:
+            sub = _capacitated_assign(coords[idx], centroids, np.full(route_num, quota, dtype=int))
+            new_assign[idx] = sub
+            shortfall += quota - np.bincount(sub[sub >= 0], minlength=route_num)
+        free_idx = np.where(new_assign < 0)[0]
+        free_capacity = shortfall + (per_route - sum(q for _, q in scene_groups))
+        # 自由名额（起终点、场景缺口）优先从未配置场景的地点中补齐，
+        # 这些地点不够时再用配额外多出的场景点补足，避免簇因点数不足被整体丢弃
+        configured = np.isin(scenes[free_idx], list(quotas.keys())) if scene_groups else np.zeros(len(free_idx), dtype=bool)
+        preferred, fallback = free_idx[~configured], free_idx[configured]
+        new_assign[preferred] = _capacitated_assign(coords[preferred], centroids, free_capacity)
+        filled = new_assign[preferred]
+        remaining = free_capacity - np.bincount(filled[filled >= 0], minlength=route_num)
+        if len(fallback) and remaining.sum() > 0:
+            new_assign[fallback] = _capacitated_assign(coords[fallback], centroids, remaining)
+        via_free = np.zeros(len(points), dtype=bool)
+        via_free[free_idx] = new_assign[free_idx] >= 0
+
+        if np.array_equal(new_assign, assign):
+            break
+        assign = new_assign
+        for c in range(route_num):
+            members = coords[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+
+    def _project(p):
+        return ((float(p['lon']) - lon0) * 111.320 * math.cos(math.radians(lat0)),
+                (float(p['lat']) - lat0) * 110.574)
+
+    plans = []
+    for c in range(route_num):
+        members = np.where(assign == c)[0]
+        if len(members) < per_route:
+            continue
+        # 起终点从自由组分配的点中选择，保证途径点满足场景配额
+        endpoint_pool = members[via_free[members]]
+        if len(endpoint_pool) < extra:
+            endpoint_pool = members
+
+        route_start = start_point
+        if route_start is None:
+            # 选择距离簇中心最远的点作为起点，使路线从簇边缘扫向另一侧
+            far = ((coords[endpoint_pool] - centroids[c]) ** 2).sum(axis=1)
+            start_idx = int(endpoint_pool[int(np.argmax(far))])
+            route_start = points[start_idx]
+            members = members[members != start_idx]
+            endpoint_pool = endpoint_pool[endpoint_pool != start_idx]
+
+        order = [int(members[i]) for i in _nearest_neighbor_order(coords[members], _project(route_start))]
+        if closed_loop:
+            route_end = route_start
+        elif end_point is not None:
+            route_end = end_point
+        else:
+            # 终点取最近邻顺序中最后出现的候选起终点
+            pool = set(int(i) for i in endpoint_pool)
+            end_idx = next((i for i in reversed(order) if i in pool), order[-1])
+            order.remove(end_idx)
+            route_end = points[end_idx]
+
+        plans.append({
+            'start_point': route_start,
+            'waypoints': [points[i] for i in order[:waypoint_num]],
+            'end_point': route_end,
+        })
+    return plans
+
+
+# ==================== 可行性预检 ====================
+class _GridIndex:
+    """均匀网格空间索引：网格边长等于查询半径，半径查询只需检查 3×3 个网格"""
+
+    def __init__(self, coords, cell_size):
+        self.coords = coords
+        self.cell_size = cell_size
+        buckets = {}
+        for i, cell in enumerate(map(tuple, np.floor(coords / cell_size).astype(np.int64))):
+            buckets.setdefault(cell, []).append(i)
+        self._buckets = {cell: np.array(idx) for cell, idx in buckets.items()}
+
+    def count_in_ring(self, query, r_min, r_max):
+        """统计每个查询点在 [r_min, r_max] 距离环内的索引点数量（不含重合点）
+
+        查询点按所在网格分组，每组与相邻 3×3 网格的候选点一次性计算距离矩阵。
+        """
+        counts = np.zeros(len(query), dtype=np.int64)
+        if not self._buckets or len(query) == 0:
+            return counts
+        r_low = max(r_min, 1e-6)
+        groups = {}
+        for i, cell in enumerate(map(tuple, np.floor(query / self.cell_size).astype(np.int64))):
+            groups.setdefault(cell, []).append(i)
+        for (cx, cy), members in groups.items():
+            neighbors = [self._buckets[c] for c in
+                         ((cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+                         if c in self._buckets]
+            if not neighbors:
+                continue
+            candidates = self.coords[np.concatenate(neighbors)]
+            members = np.array(members)
+            dist = np.linalg.norm(query[members][:, None, :] - candidates[None, :, :], axis=2)
+            counts[members] = ((dist >= r_low) & (dist <= r_max)).sum(axis=1)
+        return counts
+
+
+def check_route_feasibility(locations, route_num, waypoint_num, scene_ratios=None,
+                            between_min=0.0, between_max=float('inf'), endpoint_demand=0):
+    """路线规划前的快速可行性预检
+
+    按场景分别建立网格空间索引，统计每个地点在相邻途径点距离环
+    [between_min, between_max] 内的邻居数量：没有任何邻居的孤立点无法串进路线，
+    不计入可用点。再把各场景可用点数与 route_num × 每条路线场景配额比较，
+    得出各场景缺口和估计可生成的最大路线数。
+
+    Args:
+        locations: 可用地点列表
+        route_num: 路线数量
+        waypoint_num: 每条路线的途径点数量
+        scene_ratios: 场景比例 {场景名: 百分比}，为空表示不限制
+        between_min/between_max: 相邻途径点距离范围（公里）
+        endpoint_demand: 除途径点外还需从地点中选出的起终点总数
+
+    Returns:
+        {feasible, required_total, available_total, usable_total, isolated, max_routes,
+         scenes: {场景名: {count, usable, required, shortfall}}}
+    """
+    _lazy_import_numpy()
+    points = [p for p in locations if p.get('lat') is not None and p.get('lon') is not None]
+    scene_names = [p.get('scene', '未分类') or '未分类' for p in points]
+
+    usable = np.ones(len(points), dtype=bool)
+    if len(points) >= 2 and between_max != float('inf'):
+        coords = _project_km(points)
+        neighbor_counts = np.zeros(len(points), dtype=np.int64)
+        for scene in set(scene_names):
+            mask = np.array([name == scene for name in scene_names])
+            scene_index = _GridIndex(coords[mask], max(between_max, 1e-3))
+            neighbor_counts += scene_index.count_in_ring(coords, between_min, between_max)
+        usable = neighbor_counts > 0
+    elif len(points) < 2:
+        usable[:] = False
+
+    quotas = _scene_quotas(scene_ratios, waypoint_num) if scene_ratios else {}
+    scenes = {}
+    for scene in sorted(set(scene_names) | set(quotas)):
+        mask = [name == scene for name in scene_names]
+        count = sum(mask)
+        usable_count = int(usable[np.array(mask, dtype=bool)].sum()) if count else 0
+        required = quotas.get(scene, 0) * route_num
+        scenes[scene] = {
+            'count': count,
+            'usable': usable_count,
+            'required': required,
+            'shortfall': max(0, required - usable_count),
+        }
+
+    usable_total = int(usable.sum())
+    required_total = route_num * waypoint_num + endpoint_demand
+    per_route = waypoint_num + endpoint_demand / route_num if route_num > 0 else waypoint_num
+    max_routes = int(usable_total // per_route) if per_route > 0 else 0
+    for scene, quota in quotas.items():
+        if quota > 0:
+            max_routes = min(max_routes, scenes[scene]['usable'] // quota)
+
+    return {
+        'feasible': usable_total >= required_total and all(s['shortfall'] == 0 for s in scenes.values()),
+        'required_total': required_total,
+        'available_total': len(points),
+        'usable_total': usable_total,
+        'isolated': len(points) - usable_total,
+        'max_routes': max_routes,
+        'scenes': scenes,
+    }
+
+
+def search_scene_targets(scenes, route_num, waypoint_num, scene_ratios=None, overfetch_factor=1.5):
+    """按需搜索时各场景需要的地点数
+
+    总需求为 route_num × (waypoint_num + 1)（途径点 + 每条路线一个起/终点）。
+    设置了场景比例时途径点按比例配额分配、起终点在各场景间平均分摊，否则平均分配到各场景；
+    再乘以超额系数，为纠偏失败、可行性预检淘汰的点留出余量。
+
+    Returns:
+        {场景名: 目标地点数}
+    """
+    scenes = list(scenes)
+    if not scenes:
+        return {}
+    quotas = _scene_quotas({k: v for k, v in (scene_ratios or {}).items() if k in scenes}, waypoint_num)
+    if quotas:
+        endpoint_share = math.ceil(route_num / len(scenes))
+        required = {scene: quotas.get(scene, 0) * route_num + endpoint_share for scene in scenes}
+    else:
+        share = math.ceil(route_num * (waypoint_num + 1) / len(scenes))
+        required = {scene: share for scene in scenes}
+    return {scene: math.ceil(count * max(overfetch_factor, 1.0)) for scene, count in required.items()}
+
+
+def format_feasibility_report(report):
+    """把可行性预检结果整理成便于显示的文本行"""
+    lines = [
+        f"需要地点: {report['required_total']} 个，现有 {report['available_total']} 个"
+        f"（可用 {report['usable_total']} 个，孤立点 {report['isolated']} 个）",
+        f"估计最多可生成 {report['max_routes']} 条路线",
+    ]
+    for scene, info in report['scenes'].items():
+        if info['required'] == 0:
+            continue
+        status = f"缺 {info['shortfall']} 个" if info['shortfall'] else "充足"
+        lines.append(f"  {scene}: 需要 {info['required']} 个，可用 {info['usable']}/{info['count']} 个 - {status}")
+    return lines
+
+
+# ==================== 路线Excel读取 ====================
+# 道路类型文字/代码 → 地图统计用的代码（高速 "1"、高架 "2"，其余为 "0"）
+ROAD_TYPE_CODES = {"高速公路": "1", "1": "1", "城市高架": "2", "2": "2"}
+
+
+def _sheet_column(df, column):
+    """按列名取列，列名不存在时整数按位置取，其余情况返回全空列"""
+    if column in df.columns:
+        return df[column]
+    if isinstance(column, int) and column < len(df.columns):
+        return df.iloc[:, column]
+    return pd.Series(None, index=df.index, dtype=object)
+
+
+def _numeric_column(series):
+    """整列转为浮点数，无法解析的值（含文字、空白）为 NaN"""
+    if series.dtype == object:
+        series = series.astype(str).str.strip()
+    return pd.to_numeric(series, errors='coerce')
+
+
+def _text_column(series):
+    """整列转为去除首尾空白的字符串，空值为空字符串"""
+    return series.fillna("").astype(str).str.strip()
+
+
+def load_route_workbook(file_path):
+    """读取一个路线Excel文件，返回地图生成用的路线数据
+
+    工作簿只打开一次，"所有坐标点"、"路段信息"、"转向节点"都从同一个 ExcelFile 句柄读取，
+    各列整列转换后直接组装路线数组。坐标无法解析的行整行丢弃，道路类型和道路名称与坐标点一一对应。
+    没有"所有坐标点"工作表或其中没有有效坐标时返回 None。不依赖 Qt，可在子进程中运行。
+    """
+    _lazy_import_pandas()
+    with pd.ExcelFile(file_path) as xl:
+        if "所有坐标点" not in xl.sheet_names:
+            return None
+
+        df = xl.parse("所有坐标点")
+
+        # 获取经纬度列
+        if '经度' in df.columns:
+            lon_col = '经度'
+        elif 'B' in df.columns:
+            lon_col = 'B'
+        else:
+            lon_col = 1
+
+        if '纬度' in df.columns:
+            lat_col = '纬度'
+        elif 'C' in df.columns:
+            lat_col = 'C'
+        else:
+            lat_col = 2
+
+        # 跳过第一行（标题行）如果没有列名为"经度"和"纬度"
+        if '经度' not in df.columns and '纬度' not in df.columns:
+            df = df.iloc[1:]
+
+        lons = _numeric_column(_sheet_column(df, lon_col))
+        lats = _numeric_column(_sheet_column(df, lat_col))
+        valid = lons.notna() & lats.notna()
+        if not valid.any():
+            return None
+        df = df[valid]
+
+        point_list = [{'lon': lon, 'lat': lat, 'name': f'点{idx}', 'address': ''}
+                      for idx, lon, lat in zip(df.index, lons[valid].tolist(), lats[valid].tolist())]
+
+        route_name = os.path.basename(file_path).replace('.xlsx', '').replace('.xls', '')
+        route_data = {'routeName': route_name, 'pointList': point_list}
+
+        if "道路类型" in df.columns:
+            # 数值列中的 1/2 读出来是 1.0/2.0，去掉小数部分后再对照代码表
+            types = _text_column(df["道路类型"]).str.replace(r'\.0$', '', regex=True)
+            route_data['road_types'] = types.map(ROAD_TYPE_CODES).fillna("0").tolist()
+
+        if "道路名称" in df.columns:
+            route_data['road_names'] = _text_column(df["道路名称"]).tolist()
+
+        # 当前路线的左转 / 右转 / 掉头总数（来自路段信息）
+        left_turns_total = 0
+        right_turns_total = 0
+        uturns_total = 0
+        try:
+            if "路段信息" in xl.sheet_names:
+                seg_df = xl.parse("路段信息")
+                if "左转数" in seg_df.columns:
+                    left_turns_total = int(seg_df["左转数"].fillna(0).sum())
+                if "右转数" in seg_df.columns:
+                    right_turns_total = int(seg_df["右转数"].fillna(0).sum())
+                if "掉头数" in seg_df.columns:
+                    uturns_total = int(seg_df["掉头数"].fillna(0).sum())
+        except Exception as e:
+            logger.warning(f"读取转向统计失败（{file_path}）: {e}")
+        route_data["left_turns_total"] = left_turns_total
+        route_data["right_turns_total"] = right_turns_total
+        route_data["uturns_total"] = uturns_total
+
+        # 转向节点的具体位置（缺坐标或类型的行跳过）
+        turn_points = []
+        try:
+            if "转向节点" in xl.sheet_names:
+                turn_df = xl.parse("转向节点")
+                turn_lons = _numeric_column(_sheet_column(turn_df, "经度"))
+                turn_lats = _numeric_column(_sheet_column(turn_df, "纬度"))
+                labels = _text_column(_sheet_column(turn_df, "类型"))
+                turn_types = (labels.mask(labels.str.contains("[掉调]"), "uturn")
+                              .mask(labels.str.contains("右"), "right")
+                              .mask(labels.str.contains("左"), "left"))
+                indexes = _numeric_column(_sheet_column(turn_df, "序号"))
+                type_indexes = _numeric_column(_sheet_column(turn_df, "同类型序号"))
+                from_roads = _text_column(_sheet_column(turn_df, "由道路"))
+                to_roads = _text_column(_sheet_column(turn_df, "到道路"))
+
+                keep = turn_lons.notna() & turn_lats.notna() & (labels != "")
+                columns = [turn_lons, turn_lats, turn_types, indexes, type_indexes, from_roads, to_roads]
+                for lon, lat, t_type, idx_val, type_idx_val, from_road, to_road in zip(
+                        *(column[keep].tolist() for column in columns)):
+                    turn_points.append({
+                        "lon": lon,
+                        "lat": lat,
+                        "type": t_type,
+                        "index": None if pd.isna(idx_val) else int(idx_val),
+                        "type_index": None if pd.isna(type_idx_val) else int(type_idx_val),
+                        "from_road": from_road,
+                        "to_road": to_road
+                    })
+        except Exception as e:
+            logger.warning(f"读取转向节点失败（{file_path}）: {e}")
+        route_data["turn_points"] = turn_points
+
+    return route_data
+
+
+def _load_route_workbook_timed(file_path):
+    """子进程入口：返回 (路线数据, 耗时秒数)"""
+    start = time.perf_counter()
+    route_data = load_route_workbook(file_path)
+    return route_data, time.perf_counter() - start
+
+
+def load_route_workbooks(file_paths, max_workers=None, on_loaded=None):
+    """用进程池并行读取多个路线Excel文件，结果按输入顺序返回
+
+    每个文件读完（按完成顺序）调用 on_loaded(序号, 文件路径, 路线数据, 异常, 耗时)，
+    读取失败的文件对应位置为 None、异常通过 on_loaded 报告。只有一个文件或进程池不可用时
+    在当前进程内依次读取。
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+
+    file_paths = list(file_paths)
+    results = [None] * len(file_paths)
+
+    def report(index, route_data, error, elapsed):
+        results[index] = route_data
+        if on_loaded is not None:
+            on_loaded(index, file_paths[index], route_data, error, elapsed)
+
+    def load_serial(indexes):
+        for index in indexes:
+            start = time.perf_counter()
+            try:
+                route_data, error = load_route_workbook(file_paths[index]), None
+            except Exception as e:
+                route_data, error = None, e
+            report(index, route_data, error, time.perf_counter() - start)
+
+    workers = min(max_workers or os.cpu_count() or 1, len(file_paths))
+    if workers <= 1:
+        load_serial(range(len(file_paths)))
+        return results
+
+    pending = set(range(len(file_paths)))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_load_route_workbook_timed, path): index
+                       for index, path in enumerate(file_paths)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    route_data, elapsed = future.result()
+                    error = None
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    route_data, elapsed, error = None, 0.0, e
+                pending.discard(index)
+                report(index, route_data, error, elapsed)
+    except (BrokenProcessPool, OSError, NotImplementedError) as e:
+        # 打包环境或受限系统中无法启动子进程时，剩余文件在当前进程读取
+        logger.warning(f"进程池读取Excel失败，改为逐个读取: {e}")
+        load_serial(sorted(pending))
+    return results
+
+
+# ==================== 地图渲染 ====================
+# 转向点类型 → (颜色, 图标文字, 名称)
+TURN_MARKER_STYLES = {
+    'left': ('blue', 'L', '左转'),
+    'right': ('orange', 'R', '右转'),
+    'uturn': ('purple', 'U', '掉头'),
+}
+
+
+def parse_turn_point(tp, route_name):
+    """解析转向节点，返回 (纬度, 经度, 类型, 提示文字)，无法识别时返回 None"""
+    try:
+        lon = float(tp.get("lon"))
+        lat = float(tp.get("lat"))
+        t_type = str(tp.get("type") or "").lower()
+        idx = int(tp.get("index", 0) or 0)
+        type_idx = int(tp.get("type_index", 0) or 0)
+        from_road = str(tp.get("from_road", "") or "")
+        to_road = str(tp.get("to_road", "") or "")
+    except Exception:
+        return None
+
+    if t_type not in TURN_MARKER_STYLES:
+        return None
+    type_label = TURN_MARKER_STYLES[t_type][2]
+
+    if type_idx > 0:
+        order_text = f"第{type_idx}个{type_label}"
+    elif idx > 0:
+        order_text = f"全程第{idx}个{type_label}"
+    else:
+        order_text = type_label
+
+    if from_road or to_road:
+        trans_text = f"，由 {from_road or '未知道路'} 转到 {to_road or '未知道路'}"
+    else:
+        trans_text = ""
+
+    return lat, lon, t_type, f"{route_name} - {order_text}{trans_text}"
+
+
+def route_geojson(route_name, color, line, start_point, end_point, turn_points):
+    """把一条路线的线、起终点和转向点合成一个 GeoJSON 要素集合
+
+    line 为 [[纬度, 经度], ...]，坐标保留6位小数。要素的 properties 带有
+    kind（route/start/end/turn）、颜色和提示文字，由页面脚本按数据设置样式。
+    """
+    def position(lat, lon):
+        return [round(lon, 6), round(lat, 6)]
+
+    features = [{
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': [position(lat, lon) for lat, lon in line]},
+        'properties': {'kind': 'route', 'color': color, 'tooltip': route_name},
+    }]
+    for kind, point, label, fill in (('start', start_point, '起点', 'lightgreen'),
+                                     ('end', end_point, '终点', 'darkred')):
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': position(point['lat'], point['lon'])},
+            'properties': {'kind': kind, 'color': fill, 'tooltip': f"{route_name} - {label}",
+                           'popup': f"<b>{route_name}</b><br>{label}"},
+        })
+    for tp in turn_points:
+        parsed = parse_turn_point(tp, route_name)
+        if parsed is None:
+            continue
+        lat, lon, t_type, tooltip = parsed
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': position(lat, lon)},
+            'properties': {'kind': 'turn', 'turn': t_type, 'color': TURN_MARKER_STYLES[t_type][0],
+                           'tooltip': tooltip},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+# Canvas 渲染脚本：每条路线一个 L.geoJSON 图层，点要素画成 circleMarker，
+# 图例的 toggleRoute / toggleTurnMarkers / toggleAllRoutes 直接操作图层对象。
+# 路线带 src 时几何数据放在单独的数据脚本里，路线处于显示状态且进入视野后才加载。
+ROUTE_CANVAS_JS = """
+window.initCanvasRouteMap = function(map, routes) {
+    var turnVisible = {left: true, right: true, uturn: true};
+    var markersVisible = true;
+    var routeLayers = {};
+    var pointLayers = {};
+    var routeInfo = {};
+    var loadState = {};
+    var overlays = {};
+
+    function pointVisible(props) {
+        if (!markersVisible) { return false; }
+        return props.kind !== 'turn' || turnVisible[props.turn] !== false;
+    }
+
+    function refreshRoutePoints(index) {
+        var layer = routeLayers[index];
+        pointLayers[index].forEach(function(point) {
+            if (pointVisible(point.feature.properties)) {
+                layer.addLayer(point);
+            } else {
+                layer.removeLayer(point);
+            }
+        });
+    }
+
+    function refreshPoints() {
+        for (var index in pointLayers) { refreshRoutePoints(index); }
+    }
+
+    // 差分编码的坐标（1e-6 度整数）还原为 [经度, 纬度]
+    function decodeLine(flat) {
+        var coords = [];
+        var lon = 0, lat = 0;
+        for (var k = 0; k + 1 < flat.length; k += 2) {
+            lon += flat[k];
+            lat += flat[k + 1];
+            coords.push([lon / 1e6, lat / 1e6]);
+        }
+        return coords;
+    }
+
+    // 路线数据脚本加载后调用
+    window.loadRouteGeometry = function(index, data) {
+        var layer = routeLayers[index];
+        if (!layer || loadState[index] === 'loaded') { return; }
+        loadState[index] = 'loaded';
+        var line = {
+            type: 'Feature',
+            geometry: {type: 'LineString', coordinates: decodeLine(data.line)},
+            properties: data.props
+        };
+        layer.addData({type: 'FeatureCollection', features: [line].concat(data.points)});
+        refreshRoutePoints(index);
+    };
+
+    function inView(route) {
+        var b = route.bbox;
+        return map.getBounds().pad(0.2).intersects(L.latLngBounds([b[0], b[1]], [b[2], b[3]]));
+    }
+
+    function ensureLoaded(index) {
+        var route = routeInfo[index];
+        if (!route || loadState[index] || !route.src) { return; }
+        if (!map.hasLayer(routeLayers[index]) || !inView(route)) { return; }
+        loadState[index] = 'loading';
+        var script = document.createElement('script');
+        script.src = route.src;
+        script.onerror = function() { loadState[index] = null; };
+        document.head.appendChild(script);
+    }
+
+    function loadVisibleRoutes() {
+        for (var index in routeInfo) { ensureLoaded(index); }
+    }
+
+    routes.forEach(function(route) {
+        var points = [];
+        var layer = L.geoJSON(route.geojson || null, {
+            style: function(feature) {
+                return {color: feature.properties.color, weight: 3, opacity: 0.85};
+            },
+            pointToLayer: function(feature, latlng) {
+                var props = feature.properties;
+                return L.circleMarker(latlng, {
+                    radius: props.kind === 'turn' ? 6 : 8,
+                    color: '#000', weight: 1, opacity: 0.6,
+                    fillColor: props.color, fillOpacity: 0.95
+                });
+            },
+            onEachFeature: function(feature, featureLayer) {
+                var props = feature.properties;
+                featureLayer.bindTooltip(props.tooltip, {sticky: props.kind === 'route'});
+                if (props.popup) { featureLayer.bindPopup(props.popup); }
+                if (props.kind !== 'route') { points.push(featureLayer); }
+            }
+        }).addTo(map);
+        routeLayers[route.index] = layer;
+        pointLayers[route.index] = points;
+        routeInfo[route.index] = route;
+        if (route.geojson) { loadState[route.index] = 'loaded'; }
+        overlays[route.name] = layer;
+    });
+    L.control.layers(null, overlays, {collapsed: true}).addTo(map);
+
+    function syncLegend(index, show) {
+        var checkbox = document.getElementById('checkbox-' + index);
+        if (checkbox) { checkbox.checked = show; }
+        var routeInfoDiv = document.getElementById('route-info-' + index);
+        if (routeInfoDiv) { routeInfoDiv.style.display = show ? 'block' : 'none'; }
+    }
+
+    map.on('overlayadd overlayremove', function(e) {
+        for (var index in routeLayers) {
+            if (routeLayers[index] === e.layer) {
+                syncLegend(index, e.type === 'overlayadd');
+                ensureLoaded(index);
+            }
+        }
+    });
+    map.on('moveend', loadVisibleRoutes);
+
+    window.toggleRoute = function(index, show) {
+        var layer = routeLayers[index];
+        if (!layer) { return; }
+        if (show) { map.addLayer(layer); } else { map.removeLayer(layer); }
+        syncLegend(index, show);
+        ensureLoaded(index);
+    };
+
+    window.toggleTurnMarkers = function(type, show) {
+        turnVisible[type] = show;
+        refreshPoints();
+    };
+
+    window.toggleAllRoutes = function(show) {
+        for (var index in routeLayers) { window.toggleRoute(index, show); }
+    };
+
+    var btn = document.getElementById('toggle-markers-btn');
+    if (btn) {
+        btn.onclick = function() {
+            markersVisible = !markersVisible;
+            this.textContent = markersVisible ? '隐藏所有标记' : '显示所有标记';
+            this.style.backgroundColor = markersVisible ? '#f0f0f0' : '#ffcccc';
+            refreshPoints();
+        };
+    }
+
+    loadVisibleRoutes();
+};
+"""
+
+# folium 模式：隐藏标记按钮，以及图例复选框与图层控件的联动
+ROUTE_MAP_JS = """
+document.addEventListener('DOMContentLoaded', function() {
+    var btn = document.getElementById('toggle-markers-btn');
+    if (!btn) { return; }
+    var markersHidden = false;
+    btn.onclick = function() {
+        if (markersHidden) {
+            window.location.reload();
+            return;
+        }
+        markersHidden = true;
+        this.textContent = '显示所有标记';
+        this.style.backgroundColor = '#ffcccc';
+        var styleEl = document.getElementById('marker-style');
+        if (!styleEl) {
+            styleEl = document.createElement('style');
+            styleEl.id = 'marker-style';
+            document.head.appendChild(styleEl);
+        }
+        styleEl.textContent = `
+            .leaflet-marker-pane *,
+            .leaflet-shadow-pane *,
+            .leaflet-popup-pane * {
+                display: none !important;
+                visibility: hidden !important;
+                opacity: 0 !important;
+                width: 0 !important;
+                height: 0 !important;
+                overflow: hidden !important;
+                position: absolute !important;
+                left: -9999px !important;
+                top: -9999px !important;
+                pointer-events: none !important;
+                z-index: -9999 !important;
+            }
+        `;
+        setTimeout(function() {
+            var markerPane = document.querySelector('.leaflet-marker-pane');
+            var shadowPane = document.querySelector('.leaflet-shadow-pane');
+            var popupPane = document.querySelector('.leaflet-popup-pane');
+            if (markerPane) markerPane.innerHTML = '';
+            if (shadowPane) shadowPane.innerHTML = '';
+            if (popupPane) popupPane.innerHTML = '';
+        }, 100);
+    };
+});
+
+document.addEventListener('DOMContentLoaded', function() {
+    setTimeout(function() {
+        var layerControls = document.querySelectorAll('.leaflet-control-layers-selector');
+        var routeLayers = [];
+        var layerNames = [];
+        for (var i = 0; i < layerControls.length; i++) {
+            routeLayers.push(layerControls[i]);
+            var label = layerControls[i].nextSibling;
+            while (label && label.nodeType !== 1) { label = label.nextSibling; }
+            layerNames.push(label ? label.textContent.trim() : '未命名图层');
+        }
+
+        window.toggleRoute = function(index, show) {
+            var checkboxId = 'checkbox-' + index;
+            var checkboxLabel = document.querySelector('label[for="' + checkboxId + '"]');
+            if (checkboxLabel) {
+                var routeName = checkboxLabel.textContent.trim().split(' (')[0];
+                for (var i = 0; i < layerNames.length; i++) {
+                    if (layerNames[i] === routeName) {
+                        if (routeLayers[i].checked !== show) {
+                            routeLayers[i].click();
+                        }
+                        break;
+                    }
+                }
+                var routeInfoDiv = document.getElementById('route-info-' + index);
+                if (routeInfoDiv) { routeInfoDiv.style.display = show ? 'block' : 'none'; }
+
+                var turnMarkers = document.getElementsByClassName('route-' + index);
+                for (var k = 0; k < turnMarkers.length; k++) {
+                    turnMarkers[k].style.display = show ? 'block' : 'none';
+                }
+            }
+        };
+
+        window.toggleTurnMarkers = function(type, show) {
+            var className = 'turn-' + type + '-marker';
+            var markers = document.getElementsByClassName(className);
+            for (var i = 0; i < markers.length; i++) {
+                markers[i].style.display = show ? 'block' : 'none';
+            }
+        };
+
+        window.toggleAllRoutes = function(show) {
+            var checkboxes = document.querySelectorAll('input[id^="checkbox-"]');
+            for (var i = 0; i < checkboxes.length; i++) {
+                checkboxes[i].checked = show;
+                var index = parseInt(checkboxes[i].id.replace('checkbox-', ''));
+                toggleRoute(index, show);
+            }
+        };
+
+        for (var i = 0; i < routeLayers.length; i++) {
+            (function(index, layerName) {
+                routeLayers[index].addEventListener('change', function() {
+                    var checkboxes = document.querySelectorAll('input[id^="checkbox-"]');
+                    for (var j = 0; j < checkboxes.length; j++) {
+                        var checkboxId = checkboxes[j].id;
+                        var checkboxLabel = document.querySelector('label[for="' + checkboxId + '"]');
+                        if (checkboxLabel && checkboxLabel.textContent.trim().split(' (')[0] === layerName) {
+                            checkboxes[j].checked = this.checked;
+                            var routeIndex = parseInt(checkboxId.replace('checkbox-', ''));
+                            var routeInfoDiv = document.getElementById('route-info-' + routeIndex);
+                            if (routeInfoDiv) { routeInfoDiv.style.display = this.checked ? 'block' : 'none'; }
+
+                            var turnMarkers = document.getElementsByClassName('route-' + routeIndex);
+                            for (var k = 0; k < turnMarkers.length; k++) {
+                                turnMarkers[k].style.display = this.checked ? 'block' : 'none';
+                            }
+                            break;
+                        }
+                    }
+                });
+            })(i, layerNames[i]);
+        }
+
+    }, 1500);
+});
+"""
+
+# 路线地图图例和说明框样式
+ROUTE_MAP_CSS = """
+.route-legend {
+    position: fixed;
+    bottom: 50px; right: 50px; width: 360px; height: auto;
+    background-color: white; border: 2px solid grey; z-index: 9999;
+    font-size: 14px; font-family: 'Microsoft YaHei', Arial, sans-serif;
+    padding: 12px; border-radius: 5px; max-height: 500px; overflow-y: auto;
+}
+.route-legend-title { text-align: center; font-weight: bold; font-size: 16px; margin-bottom: 8px; }
+.route-legend-item { display: flex; align-items: center; margin-bottom: 6px; font-size: 14px; }
+.route-legend-item input { margin-right: 6px; width: 16px; height: 16px; }
+.route-legend-item label { cursor: pointer; font-size: 14px; }
+.route-legend-swatch { width: 16px; height: 16px; margin-right: 6px; border-radius: 2px; }
+.route-legend-turns { margin-left: 24px; font-size: 13px; margin-top: -3px; margin-bottom: 5px; color: #555; }
+.route-info { margin-left: 24px; font-size: 13px; margin-bottom: 10px; color: #333; }
+.route-legend-section { margin-top: 10px; border-top: 1px solid #ccc; padding-top: 10px; }
+.route-legend-section-title { font-weight: bold; font-size: 14px; margin-bottom: 6px; }
+.route-legend-toggles { font-size: 14px; margin-bottom: 5px; }
+.route-legend-toggles label { cursor: pointer; margin-right: 12px; }
+.route-legend-toggles input { width: 14px; height: 14px; }
+.route-legend-buttons { margin-top: 8px; border-top: 1px solid #eee; padding-top: 8px; text-align: center; }
+.route-legend-buttons button { margin: 0 5px; padding: 5px 12px; font-size: 13px; cursor: pointer; }
+.route-legend-total { border-top: 1px solid #ccc; margin-top: 8px; padding-top: 8px; font-size: 14px; text-align: center; }
+.route-legend-total-title { font-weight: bold; font-size: 15px; margin-bottom: 4px; }
+.route-legend-total-turns { margin-top: 6px; }
+#map-info-box {
+    position: fixed;
+    top: 10px; left: 50px; width: 260px;
+    background-color: white; border: 2px solid grey; z-index: 9999;
+    font-size: 14px; font-family: 'Microsoft YaHei', Arial, sans-serif;
+    padding: 12px; border-radius: 5px;
+}
+.map-info-title { font-weight: bold; font-size: 15px; margin-bottom: 8px; }
+.map-info-line { margin-bottom: 5px; font-size: 14px; }
+.map-info-buttons { margin-top: 10px; text-align: center; }
+#toggle-markers-btn {
+    padding: 6px 12px; cursor: pointer; background-color: #f0f0f0;
+    border: 1px solid #ccc; border-radius: 4px; font-weight: bold; font-size: 13px;
+}
+"""
+
+# 地点地图：删除确认框和加载提示的样式
+LOCATION_MAP_CSS = """
+/* 自定义对话框样式 */
+.custom-modal {
+    display: none;
+    position: fixed;
+    z-index: 9999;
+    left: 0;
+    top: 0;
+    width: 100%;
+    height: 100%;
+    background-color: rgba(0,0,0,0.5);
+}
+.modal-content {
+    background-color: #fefefe;
+    margin: 15% auto;
+    padding: 20px;
+    border: 1px solid #888;
+    border-radius: 8px;
+    width: 400px;
+    box-shadow: 0 4px 8px rgba(0,0,0,0.2);
+    animation: slideDown 0.3s ease;
+}
+@keyframes slideDown {
+    from { transform: translateY(-50px); opacity: 0; }
+    to { transform: translateY(0); opacity: 1; }
+}
+.modal-header {
+    font-size: 18px;
+    font-weight: bold;
+    margin-bottom: 15px;
+    color: #333;
+}
+.modal-body {
+    margin-bottom: 20px;
+    color: #666;
+    line-height: 1.6;
+}
+.modal-buttons {
+    text-align: right;
+}
+.modal-btn {
+    padding: 8px 20px;
+    margin-left: 10px;
+    border: none;
+    border-radius: 4px;
+    cursor: pointer;
+    font-size: 14px;
+    transition: all 0.3s;
+}
+.btn-confirm {
+    background-color: #f44336;
+    color: white;
+}
+.btn-confirm:hover {
+    background-color: #da190b;
+}
+.btn-cancel {
+    background-color: #e0e0e0;
+    color: #333;
+}
+.btn-cancel:hover {
+    background-color: #d0d0d0;
+}
+.loading-overlay {
+    display: none;
+    position: fixed;
+    z-index: 10000;
+    left: 0;
+    top: 0;
+    width: 100%;
+    height: 100%;
+    background-color: rgba(0,0,0,0.7);
+}
+.loading-content {
+    position: absolute;
+    top: 50%;
+    left: 50%;
+    transform: translate(-50%, -50%);
+    background-color: white;
+    padding: 30px;
+    border-radius: 8px;
+    text-align: center;
+}
+.spinner {
+    border: 4px solid #f3f3f3;
+    border-top: 4px solid #3498db;
+    border-radius: 50%;
+    width: 40px;
+    height: 40px;
+    animation: spin 1s linear infinite;
+    margin: 0 auto 15px;
+}
+@keyframes spin {
+    0% { transform: rotate(0deg); }
+    100% { transform: rotate(360deg); }
+}
+"""
+
+# 地点地图标准模式的标记图标（folium.Icon / L.AwesomeMarkers 参数），删除补丁随附同一份样式
+LOCATION_MARKER_ICONS = {
+    'active': {'markerColor': 'blue', 'icon': 'info-sign', 'prefix': 'fa'},
+    'deleted': {'markerColor': 'red', 'icon': 'ban', 'prefix': 'fa'},
+}
+
+# 地点地图：删除确认框、删除请求和标记的就地更新
+# （本地服务地址由页面中的 LOCATION_MAP_SERVER 提供，标记按地点名称登记在 window.locationMarkers）
+LOCATION_MAP_JS = """
+let currentLocationToDelete = null;
+window.locationMarkers = window.locationMarkers || {};
+
+function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, function(c) {
+        return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+    });
+}
+
+function locationStatusText(loc) {
+    return loc.status === 'deleted' ? '已删除' : '正常';
+}
+
+function locationPopup(loc) {
+    var deleted = loc.status === 'deleted';
+    var div = document.createElement('div');
+    div.style.width = '200px';
+    div.style.fontFamily = 'Arial';
+    div.innerHTML =
+        "<b style='font-size: 14px;'>" + escapeHtml(loc.name) + "</b><br>" +
+        "<hr style='margin: 5px 0;'>" +
+        "<span style='font-size: 12px;'>经度: " + loc.lon.toFixed(6) + "</span><br>" +
+        "<span style='font-size: 12px;'>纬度: " + loc.lat.toFixed(6) + "</span><br>" +
+        "<span style='font-size: 12px;'>状态: <span style='color: " + (deleted ? 'red' : 'green') + ";'>" +
+        locationStatusText(loc) + "</span></span><br>";
+    var button = document.createElement('button');
+    if (deleted) {
+        button.disabled = true;
+        button.textContent = '已删除';
+        button.style.cssText = 'background-color: #ccc; color: #666; padding: 5px 10px; border: none; border-radius: 3px; cursor: not-allowed;';
+    } else {
+        button.textContent = '🗑️ 删除地点';
+        button.style.cssText = 'background-color: #f44336; color: white; padding: 5px 10px; border: none; border-radius: 3px; cursor: pointer; margin-top: 5px;';
+        button.onclick = function() { deleteLocation(loc.name); };
+    }
+    div.appendChild(button);
+    return div;
+}
+
+// 按服务端返回的补丁 {name, lon, lat, status} 就地更新标记，不重新生成整张地图
+function applyLocationPatch(patch) {
+    var marker = window.locationMarkers[patch.name];
+    if (!marker) { return; }
+    if (marker.location) {
+        // 聚合模式：提示和弹窗按 marker.location 动态生成，只需更新数据和样式
+        marker.location.status = patch.status;
+        marker.setStyle(locationStyle(marker.location));
+        if (marker.isPopupOpen()) { marker.getPopup().update(); }
+        return;
+    }
+    // 标准模式：folium 生成的 Marker，图标样式由服务端随补丁给出
+    if (patch.icon && marker.setIcon && L.AwesomeMarkers) {
+        marker.setIcon(L.AwesomeMarkers.icon(patch.icon));
+    }
+    if (marker.getTooltip()) {
+        marker.setTooltipContent(escapeHtml(patch.name) + ' (' + locationStatusText(patch) + ')');
+    }
+    marker.setPopupContent(locationPopup(patch));
+}
+
+// 页面重新打开时，如果地图文件落后于程序中的地点状态，先让服务端重新生成再刷新
+window.addEventListener('load', function() {
+    fetch(LOCATION_MAP_SERVER + '/regenerate_map?if_stale=1')
+        .then(response => response.json())
+        .then(data => {
+            if (data.status === 'success' && data.regenerated) {
+                window.location.reload();
+            }
+        })
+        .catch(function() {});
+});
+
+document.addEventListener('DOMContentLoaded', function() {
+    var container = document.createElement('div');
+    container.innerHTML =
+        '<div id="confirmModal" class="custom-modal">' +
+        '  <div class="modal-content">' +
+        '    <div class="modal-header">⚠️ 确认删除</div>' +
+        '    <div class="modal-body" id="modalMessage"></div>' +
+        '    <div class="modal-buttons">' +
+        '      <button class="modal-btn btn-cancel" onclick="closeModal()">取消</button>' +
+        '      <button class="modal-btn btn-confirm" onclick="confirmDelete()">确认删除</button>' +
+        '    </div>' +
+        '  </div>' +
+        '</div>' +
+        '<div id="loadingOverlay" class="loading-overlay">' +
+        '  <div class="loading-content">' +
+        '    <div class="spinner"></div>' +
+        '    <div>正在删除地点...</div>' +
+        '  </div>' +
+        '</div>';
+    while (container.firstChild) {
+        document.body.appendChild(container.firstChild);
+    }
+});
+
+function deleteLocation(locationName) {
+    currentLocationToDelete = locationName;
+    document.getElementById('modalMessage').innerHTML =
+        '确定要删除地点 <strong>"' + locationName + '"</strong> 吗？<br><br>' +
+        '删除后该地点将标记为<span style="color: red; font-weight: bold;">已删除状态</span>（红色显示），不会从列表中移除。';
+    document.getElementById('confirmModal').style.display = 'block';
+}
+
+function closeModal() {
+    document.getElementById('confirmModal').style.display = 'none';
+    currentLocationToDelete = null;
+}
+
+function confirmDelete() {
+    if (!currentLocationToDelete) return;
+
+    const locationToDelete = currentLocationToDelete;
+
+    // 关闭确认对话框
+    closeModal();
+
+    // 显示加载中
+    document.getElementById('loadingOverlay').style.display = 'block';
+    document.querySelector('.loading-content div:last-child').textContent = '正在删除地点...';
+
+    // 发送删除请求到Python后端
+    fetch(LOCATION_MAP_SERVER + '/delete_location?name=' + encodeURIComponent(locationToDelete))
+        .then(response => response.json())
+        .then(data => {
+            if (data.status === 'success') {
+                // 就地更新标记，地图文件在下次打开时再按需重新生成
+                applyLocationPatch(data.patch);
+
+                // 在loading overlay中显示成功信息（保持位置不变）
+                document.querySelector('.spinner').style.display = 'none';
+                document.querySelector('.loading-content div:last-child').innerHTML =
+                    '<span style="color: #4CAF50; font-size: 24px;">✅</span><br><br>' +
+                    data.message + ' - 地图已更新';
+
+                setTimeout(function() {
+                    document.getElementById('loadingOverlay').style.display = 'none';
+                    document.querySelector('.spinner').style.display = '';
+                }, 800);
+            } else {
+                document.getElementById('loadingOverlay').style.display = 'none';
+                alert('❌ 删除失败' + (data.message ? ': ' + data.message : ''));
+            }
+        })
+        .catch(error => {
+            document.getElementById('loadingOverlay').style.display = 'none';
+            console.error('Error:', error);
+            alert('❌ 删除请求失败: ' + error.message);
+        });
+}
+
+function showSuccessMessage(message) {
+    // 创建成功提示
+    const successDiv = document.createElement('div');
+    successDiv.style.cssText = `
+        position: fixed;
+        top: 20px;
+        left: 50%;
+        transform: translateX(-50%);
+        background-color: #4CAF50;
+        color: white;
+        padding: 15px 30px;
+        border-radius: 5px;
+        box-shadow: 0 4px 8px rgba(0,0,0,0.2);
+        z-index: 10001;
+        font-size: 16px;
+        animation: slideDown 0.3s ease;
+    `;
+    successDiv.textContent = message;
+    document.body.appendChild(successDiv);
+
+    // 3秒后自动移除
+    setTimeout(function() {
+        successDiv.remove();
+    }, 3000);
+}
+
+// 点击对话框外部关闭
+window.onclick = function(event) {
+    const modal = document.getElementById('confirmModal');
+    if (event.target === modal) {
+        closeModal();
+    }
+}
+"""
+
+# 地点地图聚合模式：地点以数据数组传入，放进 MarkerCluster 聚合图层，
+# 提示和弹窗在需要显示时才按模板生成（依赖 LOCATION_MAP_JS 的弹窗模板和 deleteLocation）
+LOCATION_CLUSTER_JS = """
+window.locationMarkers = {};
+
+function locationStyle(loc) {
+    var deleted = loc.status === 'deleted';
+    return {radius: 7, color: '#fff', weight: 1.5, fillColor: deleted ? '#d63e2a' : '#38aadd', fillOpacity: 0.9};
+}
+
+// rows: [[名称, 经度, 纬度, 状态], ...]
+window.initLocationMap = function(map, rows) {
+    var cluster = L.markerClusterGroup({chunkedLoading: true, disableClusteringAtZoom: 16});
+    var markers = rows.map(function(row) {
+        var loc = {name: row[0], lon: row[1], lat: row[2], status: row[3]};
+        var marker = L.circleMarker([loc.lat, loc.lon], locationStyle(loc));
+        marker.location = loc;
+        marker.bindTooltip(function() { return escapeHtml(loc.name) + ' (' + locationStatusText(loc) + ')'; });
+        marker.bindPopup(function() { return locationPopup(loc); }, {maxWidth: 250});
+        window.locationMarkers[loc.name] = marker;
+        return marker;
+    });
+    cluster.addLayers(markers);
+    map.addLayer(cluster);
+};
+"""
+
+# 共享资源目录（相对地图文件所在目录）
+MAP_ASSETS_DIR = "map_assets"
+
+
+def write_map_asset(output_dir, name, content):
+    """把共享脚本/样式写到 <output_dir>/map_assets/，返回供页面引用的相对路径
+
+    文件名带内容哈希作为版本号：内容不变时直接复用已有文件，脚本更新后换成新文件名，
+    浏览器可以放心缓存。
+    """
+    stem, ext = os.path.splitext(name)
+    digest = hashlib.md5(content.encode('utf-8')).hexdigest()[:10]
+    filename = f"{stem}.{digest}{ext}"
+    asset_dir = os.path.join(output_dir, MAP_ASSETS_DIR)
+    path = os.path.join(asset_dir, filename)
+    if not os.path.exists(path):
+        os.makedirs(asset_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return f"{MAP_ASSETS_DIR}/{filename}"
+
+
+# 按路线拆分的几何数据目录（相对地图文件所在目录）
+ROUTE_DATA_DIR = "route_data"
+
+
+def encode_line_deltas(coordinates):
+    """[[经度, 纬度], ...] 编码为扁平的整数差分数组（单位 1e-6 度），首点为绝对值"""
+    flat = []
+    prev_lon = prev_lat = 0
+    for lon, lat in coordinates:
+        ilon = int(round(lon * 1e6))
+        ilat = int(round(lat * 1e6))
+        flat.append(ilon - prev_lon)
+        flat.append(ilat - prev_lat)
+        prev_lon, prev_lat = ilon, ilat
+    return flat
+
+
+def write_route_sidecars(output_dir, routes, map_stem):
+    """把每条路线的几何数据写成 <output_dir>/route_data/<map_stem>/ 下的单独数据脚本
+
+    routes 与 canvas_route_map_script 的参数相同，map_stem 为地图文件名（不含扩展名），
+    同一目录下的每张地图各用一个子目录，重新生成时只清理自己的数据脚本。
+    线坐标做差分编码，起终点和转向点原样保留，数据脚本以 <script> 方式加载
+    （本地 file:// 页面也可用），加载后调用 loadRouteGeometry。
+    返回页面内联的路线索引 [{'index', 'name', 'bbox', 'src'}, ...]，bbox 为
+    [最小纬度, 最小经度, 最大纬度, 最大经度]，供页面判断路线是否进入视野。
+    """
+    data_dir = os.path.join(output_dir, ROUTE_DATA_DIR, map_stem)
+    os.makedirs(data_dir, exist_ok=True)
+    # 清理这张地图上一次生成的数据脚本（文件名带内容哈希，不会被浏览器缓存的旧版本顶替）
+    for name in os.listdir(data_dir):
+        if name.startswith('route_') and name.endswith('.js'):
+            try:
+                os.remove(os.path.join(data_dir, name))
+            except OSError as e:
+                logger.warning(f"清理路线数据文件失败: {name}: {e}")
+
+    entries = []
+    for route in routes:
+        line, *points = route['geojson']['features']
+        coords = line['geometry']['coordinates']
+        positions = coords + [feature['geometry']['coordinates'] for feature in points]
+        lons = [position[0] for position in positions]
+        lats = [position[1] for position in positions]
+        payload = json.dumps({'line': encode_line_deltas(coords), 'props': line['properties'], 'points': points},
+                             ensure_ascii=False, separators=(',', ':'))
+        digest = hashlib.md5(payload.encode('utf-8')).hexdigest()[:10]
+        filename = f"route_{route['index']}.{digest}.js"
+        with open(os.path.join(data_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(f"loadRouteGeometry({route['index']},{payload});\n")
+        entries.append({
+            'index': route['index'],
+            'name': route['name'],
+            'bbox': [min(lats), min(lons), max(lats), max(lons)],
+            'src': f"{ROUTE_DATA_DIR}/{quote(map_stem)}/{filename}",
+        })
+    return entries
+
+
+def map_asset_tags(output_dir, *assets):
+    """写出共享资源并返回引用它们的 <link>/<script> 标签，assets 为 (文件名, 内容)"""
+    tags = []
+    for name, content in assets:
+        href = write_map_asset(output_dir, name, content)
+        if name.endswith('.css'):
+            tags.append(f'<link rel="stylesheet" href="{href}"/>')
+        else:
+            tags.append(f'<script src="{href}"></script>')
+    return '\n'.join(tags)
+
+
+def location_marker_registry_script(markers):
+    """生成登记标准模式地点标记的页面脚本，markers 为 [(地点名称, 标记变量名), ...]"""
+    lines = [f"    window.locationMarkers[{json.dumps(name, ensure_ascii=False)}] = {var_name};"
+             for name, var_name in markers]
+    body = '\n'.join(lines).replace('</', '<\\/')
+    return "<script>\nwindow.addEventListener('load', function() {\n" + body + "\n});\n</script>"
+
+
+def location_map_script(map_name, rows):
+    """生成地点地图聚合模式的页面数据脚本，rows 为 [[名称, 经度, 纬度, 状态], ...]"""
+    data = json.dumps(rows, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+    return ("<script>\nwindow.addEventListener('load', function() {\n"
+            f"    initLocationMap({map_name}, {data});\n"
+            "});\n</script>")
+
+
+def canvas_route_map_script(map_name, routes):
+    """生成 Canvas 渲染模式的页面数据脚本（渲染逻辑在共享资源 ROUTE_CANVAS_JS 中）
+
+    routes 为 [{'index': 图例序号, 'name': 路线名, 'geojson': route_geojson(...)}, ...]，
+    或 write_route_sidecars 返回的路线索引（几何数据按需加载）；
+    map_name 为页面中 Leaflet 地图对象的变量名（folium 的 Map.get_name()）。
+    """
+    data = json.dumps(routes, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+    return ("<script>\nwindow.addEventListener('load', function() {\n"
+            f"    initCanvasRouteMap({map_name}, {data});\n"
+            "});\n</script>")
+
+
+# 模板页面引用的 Leaflet 版本（与 folium 生成页面所用版本一致）
+LEAFLET_CSS_URL = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css"
+LEAFLET_JS_URL = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"
+
+
+class RouteMapPage:
+    """不经过 folium 对象树、按模板直接写出的 Leaflet 地图页面
+
+    只提供路线地图用到的部分：底图、比例尺、页面头部和主体片段。页面只依赖 Leaflet 本身，
+    图层由共享脚本（ROUTE_CANVAS_JS）绘制；save 按片段顺序流式写入文件，接口与 folium.Map.save 相同。
+    """
+
+    def __init__(self, location, zoom_start, tiles, attr, control_scale=False, prefer_canvas=False,
+                 name="route_map"):
+        self.location = [float(location[0]), float(location[1])]
+        self.zoom_start = zoom_start
+        self.tiles = tiles
+        self.attr = attr
+        self.control_scale = control_scale
+        self.prefer_canvas = prefer_canvas
+        self.name = name
+        self._header = []
+        self._body = []
+
+    def get_name(self):
+        """页面中 Leaflet 地图对象的变量名"""
+        return self.name
+
+    def add_header(self, html):
+        self._header.append(html)
+
+    def add_body(self, html):
+        """主体片段按加入顺序写在地图容器之前，脚本片段应在 load 事件中访问地图对象"""
+        self._body.append(html)
+
+    def _map_script(self):
+        options = json.dumps({'center': self.location, 'zoom': self.zoom_start,
+                              'preferCanvas': self.prefer_canvas})
+        tile_options = json.dumps({'maxZoom': 18, 'attribution': self.attr}).replace('</', '<\\/')
+        lines = [
+            "<script>",
+            f"var {self.name} = L.map({json.dumps(self.name)}, {options});",
+            f"L.tileLayer({json.dumps(self.tiles)}, {tile_options}).addTo({self.name});",
+        ]
+        if self.control_scale:
+            lines.append(f"L.control.scale().addTo({self.name});")
+        lines.append("</script>")
+        return '\n'.join(lines) + '\n'
+
+    def iter_html(self):
+        """按顺序产出页面片段"""
+        yield ('<!DOCTYPE html>\n<html>\n<head>\n'
+               '<meta http-equiv="content-type" content="text/html; charset=UTF-8" />\n'
+               '<meta name="viewport" content="width=device-width, initial-scale=1.0, '
+               'maximum-scale=1.0, user-scalable=no" />\n'
+               f'<link rel="stylesheet" href="{LEAFLET_CSS_URL}"/>\n'
+               f'<script src="{LEAFLET_JS_URL}"></script>\n'
+               '<style>\n'
+               'html, body { width: 100%; height: 100%; margin: 0; padding: 0; }\n'
+               f'#{self.name} {{ position: absolute; top: 0; bottom: 0; left: 0; right: 0; }}\n'
+               '.leaflet-container { font-size: 1rem; }\n'
+               '</style>\n')
+        for html in self._header:
+            yield html + '\n'
+        yield '</head>\n<body>\n'
+        for html in self._body:
+            yield html + '\n'
+        yield f'<div id="{self.name}"></div>\n'
+        yield self._map_script()
+        yield '</body>\n</html>\n'
+
+    def save(self, path):
+        """写出页面（先写临时文件再替换，浏览器不会读到写了一半的页面）"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for chunk in self.iter_html():
+                f.write(chunk)
+        os.replace(tmp_path, path)
+
+
+# ==================== 路线生成流程 ====================
+class RoutePipelineMixin:
+    """搜索 → 纠偏 → 路线生成 → 保存 → 地图 的完整流程
+
+    宿主类需要提供与 MainWindow 相同的数据属性（key、backup_keys、valid_locations、
+    route_config、scene_ratios、起终点模式等）。下面的界面回调默认只写日志，
+    MainWindow 会用信号槽版本覆盖它们，无界面运行时直接使用默认实现即可。
+    """
+
+    # ---------------- 界面回调（无界面时的默认实现） ----------------
+
+    def update_api_response(self, message):
+        """输出日志"""
+        logger.info(message)
+
+    def _safe_update_status(self, text, color="black"):
+        """更新状态文本"""
+        logger.info(text)
+
+    def _safe_update_table(self):
+        """刷新地点表格"""
+        pass
+
+    def _safe_set_button_enabled(self, button_name, enabled):
+        """设置按钮可用状态"""
+        pass
+
+    def refresh_generate_button_state(self):
+        """刷新生成按钮状态"""
+        pass
+
+    def get_distance_config_from_ui(self):
+        """获取相邻点距离配置，无界面时直接使用 route_config"""
+        return (self.route_config['between_waypoint_min'],
+                self.route_config['between_waypoint_max'],
+                self.route_config['non_adjacent_min'])
+
+    def get_target_distance_range(self):
+        """获取目标里程范围，未设置 target_distance 时返回 None（随机规划）"""
+        target_distance = getattr(self, 'target_distance', None)
+        if not target_distance or target_distance <= 0:
+            return None
+        return (max(0, target_distance - 5), target_distance + 5)
+
+    def _is_rectify_enabled(self):
+        """是否启用坐标纠偏"""
+        return getattr(self, 'rectify_enabled', True)
+
+    def _get_spatial_sort_type(self):
+        """空间排序算法类型"""
+        return getattr(self, 'spatial_sort_type', 'clockwise')
+
+    def _get_distance_calc_mode(self):
+        """距离计算方式：haversine 或 amap"""
+        return getattr(self, 'distance_calc_mode', 'haversine')
+
+    def _get_city_name(self):
+        """当前城市名称"""
+        return getattr(self, 'city', '')
+
+    def _get_search_targets(self, selected_scenes):
+        """按需搜索（够用即停）时各场景的目标地点数，未启用时返回 None"""
+        if not getattr(self, 'stop_when_enough', False):
+            return None
+        return search_scene_targets(selected_scenes, self.route_num, self.waypoint_num,
+                                    self.scene_ratios, getattr(self, 'overfetch_factor', 1.5))
+
+    # ---------------- API密钥 ----------------
+
+    def _get_key_pool(self):
+        """API密钥池，宿主未设置 key_pool 时按 key/backup_keys 创建"""
+        if getattr(self, 'key_pool', None) is None:
+            self.key_pool = ApiKeyPool([self.key] + self.backup_keys)
+        return self.key_pool
+
+    def _acquire_key(self):
+        """获取一个可用密钥（按限流等待），所有密钥都不可用时返回 None"""
+        key, wait = self._get_key_pool().reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return key
+
+    def _key_attempts(self):
+        """单次请求最多尝试次数：每个密钥一次，另加限流退避重试"""
+        return len([self.key] + self.backup_keys) + ApiKeyPool.THROTTLE_RETRIES
+
+    def _back_off_key(self, key, retries):
+        """密钥被限流时退避（第 retries 次限流等待 THROTTLE_BACKOFF * 2^(retries-1) 秒）"""
+        self._get_key_pool().back_off(key, ApiKeyPool.THROTTLE_BACKOFF * (2 ** max(0, retries - 1)))
+
+    # ---------------- 行政区边界 ----------------
+
+    def _get_district_cache(self):
+        """行政区边界缓存（宿主未设置 district_cache 时使用仅内存缓存）"""
+        if getattr(self, 'district_cache', None) is None:
+            self.district_cache = DistrictBoundaryCache()
+        return self.district_cache
+
+    def _request_district(self, keywords, subdistrict=0, extensions='base'):
+        """调用高德行政区查询接口，返回第一个匹配的行政区数据，失败返回 None"""
+        key_pool = self._get_key_pool()
+        throttled = 0
+        for _ in range(self._key_attempts()):
+            current_key = self._acquire_key()
+            if current_key is None:
+                return None
+            try:
+                response = requests.get(
+                    "https://restapi.amap.com/v3/config/district",
+                    params={
+                        'keywords': keywords,
+                        'subdistrict': subdistrict,
+                        'extensions': extensions,
+                        'key': current_key,
+                    },
+                    timeout=15
+                )
+                data = response.json()
+            except Exception as e:
+                logger.error(f"行政区查询失败 ({keywords}): {str(e)}")
+                return None
+            if data.get('status') == '1':
+                districts = data.get('districts') or []
+                return districts[0] if districts else None
+            if data.get('infocode', '') in ApiKeyPool.RATE_LIMIT_CODES and throttled < ApiKeyPool.THROTTLE_RETRIES:
+                throttled += 1
+                self._back_off_key(current_key, throttled)
+                continue
+            if data.get('infocode', '') in ApiKeyPool.KEY_ERROR_CODES:
+                key_pool.mark_exhausted(current_key)
+                continue
+            logger.error(f"行政区查询失败 ({keywords}): {data.get('info', '未知错误')}")
+            return None
+        return None
+
+    def load_district_boundaries(self, city, districts):
+        """获取各区县的简化边界（优先读缓存）
+
+        先按城市查询下级区县的行政区划代码，再按代码获取边界，避免不同城市同名区县混淆。
+        区县名为空字符串时获取整个城市的边界。
+
+        Returns:
+            {区县名: 边界环列表}，获取失败的区县不在结果中
+        """
+        cache = self._get_district_cache()
+        boundaries = {}
+        missing = []
+        for district in districts:
+            rings = cache.get(city, district)
+            if rings is None:
+                missing.append(district)
+            else:
+                boundaries[district] = rings
+        if not missing:
+            return boundaries
+
+        _lazy_import_requests()
+        city_info = self._request_district(city, subdistrict=1)
+        adcodes = {d.get('name'): d.get('adcode') for d in (city_info or {}).get('districts', [])}
+        for district in missing:
+            info = self._request_district(adcodes.get(district, district) if district else city, extensions='all')
+            rings = DistrictBoundaryCache.parse_polyline(info.get('polyline', '')) if info else []
+            if rings:
+                cache.put(city, district, rings)
+                boundaries[district] = rings
+                self.update_api_response(
+                    f"🗺️ 已获取 {district or city} 边界（{sum(len(r) for r in rings)} 个顶点）"
+                )
+            else:
+                self.update_api_response(f"⚠️ 无法获取 {district or city} 边界，改用关键字搜索和区县名称匹配")
+        return boundaries
+
+    def _pois_in_boundary(self, pois, rings):
+        """一次性判断一页POI是否位于区县边界内（无坐标的POI记为 False）"""
+        coords = []
+        for poi in pois:
+            try:
+                lon, lat = map(float, poi.get('location', '').split(','))
+            except ValueError:
+                lon, lat = float('nan'), float('nan')
+            coords.append((lon, lat))
+        lons, lats = zip(*coords) if coords else ((), ())
+        return points_in_polygon(lons, lats, rings).tolist()
+
+    # ---------------- 场景搜索 ----------------
+
+    def _search_scene_thread(self, city, selected_districts, selected_scenes, location_filter_distance, rectify=True):
+        """在线程中搜索场景地点并直接获取坐标（轮询方式）
+
+        Args:
+            city: 城市名称
+            selected_districts: 选中的区域列表
+            selected_scenes: 选中的场景列表
+            location_filter_distance: 地点筛选距离（公里），None表示不筛选
+            rectify: 是否纠偏（搜索过程中以流水线方式纠偏），False时由调用方自行调用 _rectify_search_results
+        """
+        _lazy_import_requests()
+        rectify_stream = None
+        try:
+            stats = self._new_search_stats()
+
+            # 密钥管理：由密钥池负责轮换和限流
+            key_pool = self._get_key_pool()
+
+            location_index = self._new_search_index(location_filter_distance)
+            
+            # 记录已搜索的场景
+            for scene in selected_scenes:
+                if scene not in self.searched_scenes:
+                    self.searched_scenes.append(scene)
+            
+            # 行政区边界：有边界的区县改用多边形搜索，并按边界判断POI是否在区内
+            boundaries = {}
+            named_districts = [d for d in selected_districts if d]
+            if named_districts and getattr(self, 'use_district_boundaries', True):
+                boundaries = self.load_district_boundaries(city, named_districts)
+
+            # 为每个(场景, 行政区)组合创建搜索状态
+            # 状态包含: 场景名、行政区、当前页码、当前页内索引、该页的POI列表、是否耗尽
+            search_states = []
+            for scene in selected_scenes:
+                for district in selected_districts:
+                    search_states.append({
+                        'scene': scene,
+                        'district': district,
+                        'boundary': boundaries.get(district),
+                        'page': 1,
+                        'poi_index': 0,
+                        'pois': [],
+                        'in_district': [],
+                        'exhausted': False,
+                        'total_pages': None
+                    })
+            
+            if not search_states:
+                return
+
+            if rectify:
+                rectify_stream = self._start_rectify_stream()
+            
+            # 轮询获取地点
+            current_index = 0
+            consecutive_failures = 0  # 连续失败计数器
+            max_consecutive_failures = len(search_states) * 2  # 最大连续失败次数
+            throttle_retries = 0  # 当前请求因限流已重试的次数
+            stopped_early = False  # 各场景达到目标地点数后提前结束
+            checkpoint_saved = False  # 未搜索完（如密钥用尽）时保存了断点
+
+            # 搜索断点：相同搜索条件有断点时从断点继续
+            checkpoint = getattr(self, 'search_checkpoint', None)
+            checkpoint_key = None
+            added_locations = []
+            if checkpoint is not None:
+                checkpoint_key = checkpoint.make_key(city, selected_districts, selected_scenes, location_filter_distance)
+                saved = checkpoint.load(checkpoint_key)
+                if saved:
+                    current_index, consecutive_failures, added_locations = self._restore_search_checkpoint(
+                        saved, search_states, stats, location_index, rectify_stream
+                    )
+
+            def save_checkpoint():
+                if checkpoint is not None:
+                    checkpoint.save(checkpoint_key, search_states, current_index,
+                                    consecutive_failures, stats, added_locations)
+
+            # 够用即停：各场景达到目标地点数后不再为该场景请求
+            scene_targets = self._get_search_targets(selected_scenes)
+            scene_counts = self._scene_location_counts()
+            if scene_targets:
+                self.update_api_response(
+                    "🎯 够用即停: " + "，".join(f"{scene} {count} 个" for scene, count in scene_targets.items())
+                )
+
+            def scene_done(state):
+                return bool(scene_targets) and scene_counts.get(state['scene'], 0) >= scene_targets.get(state['scene'], 0)
+            
+            while True:
+                if self.is_search_stopped:
+                    if checkpoint is not None:
+                        checkpoint.clear(checkpoint_key)
+                    self.update_api_response("⏹️ 搜索已终止")
+                    return
+                if self.is_search_paused:
+                    save_checkpoint()
+                    self.update_api_response(f"⏸️ 搜索已暂停")
+                    return
+                
+                # 检查是否所有搜索都已耗尽（或各场景都已达到目标）
+                if all(state['exhausted'] or scene_done(state) for state in search_states):
+                    if scene_targets and not all(state['exhausted'] for state in search_states):
+                        stopped_early = True
+                        self.update_api_response("🎯 各场景地点数已达到目标，停止搜索")
+                    break
+                
+                # 获取当前要处理的搜索状态
+                state = search_states[current_index]
+                
+                # 跳过已耗尽或已达到目标的搜索
+                if state['exhausted'] or scene_done(state):
+                    current_index = (current_index + 1) % len(search_states)
+                    continue
+                
+                # 如果当前页的POI已经处理完，获取下一页
+                if state['poi_index'] >= len(state['pois']):
+                    scene = state['scene']
+                    district = state['district']
+                    page = state['page']
+
+                    # 构建API请求URL - 从密钥池获取密钥（按限流等待）
+                    if district:
+                        search_keywords = f"{scene} {district}"
+                    else:
+                        search_keywords = scene
+
+                    current_key = self._acquire_key()
+                    if current_key is None:
+                        self.update_api_response(f"❌ 所有密钥都已用尽，搜索终止")
+                        break
+
+                    if state['boundary']:
+                        # 多边形搜索：按简化后的区县边界查询，减少被区域筛选丢弃的结果
+                        if state.get('polygon') is None:
+                            state['polygon'] = DistrictBoundaryCache.polygon_param(state['boundary'])
+                        polygon = state['polygon']
+                        url = f"https://restapi.amap.com/v3/place/polygon?polygon={quote(polygon, safe=',')}&keywords={quote(scene)}&output=json&offset=20&page={page}&key={current_key}"
+                    else:
+                        url = f"https://restapi.amap.com/v3/place/text?keywords={quote(search_keywords)}&city={quote(city)}&output=json&offset=20&page={page}&key={current_key}"
+
+                    try:
+                        response = requests.get(url, timeout=10)
+                        data = response.json()
+                    except Exception as e:
+                        self.update_api_response(f"❌ API请求失败: {str(e)}")
+                        state['exhausted'] = True
+                        current_index = (current_index + 1) % len(search_states)
+                        consecutive_failures += 1
+                        if consecutive_failures >= max_consecutive_failures:
+                            break
+                        continue
+
+                    if data.get('status') != '1':
+                        error_info = data.get('info', '未知错误')
+                        error_code = data.get('infocode', '')
+
+                        # 被限流：该密钥退避后重试当前搜索，不标记为用尽
+                        if error_code in ApiKeyPool.RATE_LIMIT_CODES and throttle_retries < ApiKeyPool.THROTTLE_RETRIES:
+                            throttle_retries += 1
+                            self._back_off_key(current_key, throttle_retries)
+                            self.update_api_response(f"⚠️ 密钥{key_pool.key_number(current_key)}被限流({error_info})，稍后重试")
+                            continue
+
+                        # 检查是否是密钥相关错误（配额用尽、密钥无效等）
+                        if error_code in ApiKeyPool.KEY_ERROR_CODES:
+                            # 尝试切换到下一个密钥
+                            key_number = key_pool.key_number(current_key)
+                            remaining = key_pool.mark_exhausted(current_key)
+                            if remaining > 0:
+                                self.update_api_response(f"⚠️ 密钥{key_number}达到限制({error_info})，切换到备用密钥（剩余{remaining}个）")
+                                # 不标记为exhausted，重试当前搜索
+                                continue
+                            else:
+                                self.update_api_response(f"❌ 所有密钥都已用尽，搜索终止")
+                                break
+
+                        self.update_api_response(f"❌ [{scene}] 搜索失败: {error_info}")
+                        state['exhausted'] = True
+                        current_index = (current_index + 1) % len(search_states)
+                        consecutive_failures += 1
+                        if consecutive_failures >= max_consecutive_failures:
+                            break
+                        continue
+                    
+                    throttle_retries = 0
+                    pois = data.get('pois', [])
+                    if not pois:
+                        state['exhausted'] = True
+                        current_index = (current_index + 1) % len(search_states)
+                        consecutive_failures += 1
+                        if consecutive_failures >= max_consecutive_failures:
+                            break
+                        continue
+                    
+                    # 获取总页数
+                    if state['total_pages'] is None:
+                        total = int(data.get('count', '0'))
+                        state['total_pages'] = (total // 20) + 1
+                    
+                    # 保存这一页的POI
+                    state['pois'] = pois
+                    state['poi_index'] = 0
+                    if state['boundary']:
+                        state['in_district'] = self._pois_in_boundary(pois, state['boundary'])
+                    save_checkpoint()
+                
+                # 处理当前POI
+                found_valid = False
+                while state['poi_index'] < len(state['pois']):
+                    if self.is_search_stopped or self.is_search_paused:
+                        break
+
+                    poi = state['pois'][state['poi_index']]
+                    state['poi_index'] += 1
+
+                    stats['total_found'] += 1
+                    in_district = state['in_district'][state['poi_index'] - 1] if state['boundary'] else None
+                    loc_data = self._accept_search_poi(
+                        poi, state['scene'], location_index, location_filter_distance, stats,
+                        selected_districts, state['district'] if state['boundary'] else None, in_district
+                    )
+                    if loc_data is None:
+                        continue
+
+                    added_locations.append(dict(loc_data))
+                    if rectify_stream is not None:
+                        rectify_stream.submit(loc_data)
+                    scene_counts[loc_data['scene']] = scene_counts.get(loc_data['scene'], 0) + 1
+                    found_valid = True
+                    consecutive_failures = 0  # 成功获取，重置失败计数
+
+                    # 找到一个有效地点后，立即切换到下一个场景
+                    break
+
+                # 暂停/终止时保持当前进度（不计入失败、不切换搜索状态），由循环开头处理
+                if self.is_search_stopped or self.is_search_paused:
+                    continue
+
+                # 如果没有找到有效地点，增加失败计数
+                if not found_valid:
+                    consecutive_failures += 1
+                    if consecutive_failures >= max_consecutive_failures:
+                        self.update_api_response(f"⚠️ 连续{consecutive_failures}次未找到有效地点，可能已获取所有可用地点")
+                        break
+                
+                # 如果当前页处理完且还有下一页，准备获取下一页
+                if state['poi_index'] >= len(state['pois']):
+                    if state['total_pages'] is None or state['page'] < state['total_pages']:
+                        state['page'] += 1
+                        state['pois'] = []
+                        state['poi_index'] = 0
+                    else:
+                        state['exhausted'] = True
+                
+                # 切换到下一个搜索状态
+                current_index = (current_index + 1) % len(search_states)
+
+            # 全部耗尽或连续找不到地点视为搜索结束；密钥用尽等中断保留断点以便之后继续
+            if checkpoint is not None:
+                if (all(state['exhausted'] for state in search_states)
+                        or consecutive_failures >= max_consecutive_failures):
+                    checkpoint.clear(checkpoint_key)
+                else:
+                    save_checkpoint()
+                    checkpoint_saved = True
+                    self.update_api_response("💾 搜索进度已保存，再次以相同条件搜索时将从断点继续")
+            
+            self._finish_search(stats, rectify, rectify_stream,
+                                stopped_early=stopped_early, checkpoint_saved=checkpoint_saved)
+            
+        except Exception as e:
+            logger.error(f"搜索线程错误: {str(e)}", exc_info=True)
+            self.update_api_response(f"❌ 搜索线程错误: {str(e)}")
+            self._safe_update_status(f"搜索出错: {str(e)}", "red")
+        finally:
+            if rectify_stream is not None and not rectify_stream.closed:
+                # 暂停/终止/出错：已入队的地点仍然完成纠偏，坐标就绪状态由调用方决定
+                self._drain_rectify_stream(rectify_stream, final=False)
+            self._restore_search_buttons()
+
+    # ---------------- 分块搜索 ----------------
+
+    # 单个查询可翻页获取的结果上限，count 达到该值时认为结果被截断
+    TILE_RESULT_CAP = 900
+    # 分块最小边长（度，约1公里），小于该值不再细分
+    TILE_MIN_SIZE = 0.01
+
+    def _request_polygon_page(self, scene, bbox, page):
+        """矩形范围内的POI搜索（v3/place/polygon）的一页结果，失败返回 None"""
+        key_pool = self._get_key_pool()
+        min_lon, min_lat, max_lon, max_lat = bbox
+        polygon = f"{min_lon:.6f},{min_lat:.6f}|{max_lon:.6f},{max_lat:.6f}"
+        throttled = 0
+        for _ in range(self._key_attempts()):
+            current_key = self._acquire_key()
+            if current_key is None:
+                return None
+            url = f"https://restapi.amap.com/v3/place/polygon?polygon={quote(polygon, safe=',')}&keywords={quote(scene)}&output=json&offset=20&page={page}&key={current_key}"
+            try:
+                data = requests.get(url, timeout=10).json()
+            except Exception as e:
+                logger.error(f"分块搜索请求失败 ({scene}, 第{page}页): {str(e)}")
+                return None
+            if data.get('status') == '1':
+                return data
+            if data.get('infocode', '') in ApiKeyPool.RATE_LIMIT_CODES and throttled < ApiKeyPool.THROTTLE_RETRIES:
+                throttled += 1
+                self._back_off_key(current_key, throttled)
+                continue
+            if data.get('infocode', '') in ApiKeyPool.KEY_ERROR_CODES:
+                key_pool.mark_exhausted(current_key)
+                continue
+            logger.error(f"分块搜索失败 ({scene}): {data.get('info', '未知错误')}")
+            return None
+        return None
+
+    def _fetch_tile_pois(self, scene, bbox):
+        """获取一个矩形分块内某场景的POI
+
+        Returns:
+            (POI列表, 是否需要细分, 请求次数)。结果被截断且分块仍可细分时只返回第一页，
+            由调用方把分块四等分后继续搜索。
+        """
+        data = self._request_polygon_page(scene, bbox, 1)
+        if data is None:
+            return [], False, 1
+        pois = list(data.get('pois', []))
+        count = int(data.get('count', '0') or 0)
+        min_lon, min_lat, max_lon, max_lat = bbox
+        if count >= self.TILE_RESULT_CAP and max(max_lon - min_lon, max_lat - min_lat) > self.TILE_MIN_SIZE:
+            return pois, True, 1
+
+        requests_made = 1
+        for page in range(2, math.ceil(count / 20) + 1):
+            if self.is_search_stopped or self.is_search_paused:
+                break
+            data = self._request_polygon_page(scene, bbox, page)
+            requests_made += 1
+            if not data or not data.get('pois'):
+                break
+            pois.extend(data['pois'])
+        return pois, False, requests_made
+
+    @staticmethod
+    def _split_tile(bbox, rings):
+        """把分块四等分，去掉与区域边界不相交的子分块"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        mid_lon, mid_lat = (min_lon + max_lon) / 2, (min_lat + max_lat) / 2
+        children = [
+            (min_lon, min_lat, mid_lon, mid_lat), (mid_lon, min_lat, max_lon, mid_lat),
+            (min_lon, mid_lat, mid_lon, max_lat), (mid_lon, mid_lat, max_lon, max_lat),
+        ]
+        vertices = np.array([point for ring in rings for point in ring])
+        kept = []
+        for tile in children:
+            t_min_lon, t_min_lat, t_max_lon, t_max_lat = tile
+            corners = [(t_min_lon, t_min_lat), (t_max_lon, t_min_lat), (t_min_lon, t_max_lat),
+                       (t_max_lon, t_max_lat), ((t_min_lon + t_max_lon) / 2, (t_min_lat + t_max_lat) / 2)]
+            lons, lats = zip(*corners)
+            vertex_inside = ((vertices[:, 0] >= t_min_lon) & (vertices[:, 0] <= t_max_lon) &
+                             (vertices[:, 1] >= t_min_lat) & (vertices[:, 1] <= t_max_lat)).any()
+            if vertex_inside or points_in_polygon(lons, lats, rings).any():
+                kept.append(tile)
+        return kept
+
+    def _search_scene_tiled(self, city, selected_districts, selected_scenes, location_filter_distance,
+                            rectify=True, max_workers=4):
+        """分块搜索模式：按区域外接矩形分块并发查询，结果被截断的分块递归四等分
+
+        关键字搜索单次查询的结果数有上限，密集区县只能拿到一部分地点；分块搜索让每个
+        分块的结果都在上限以内，从而用尽量少的请求获取尽量多的不重复地点。
+        需要区县（或整个城市）边界，边界获取失败时回退到关键字搜索。
+
+        暂停时把已获取的POI和未完成的分块保存到搜索断点，继续搜索时只查询剩余分块。
+
+        Args:
+            与 _search_scene_thread 相同；max_workers 为并发查询的分块数
+        """
+        _lazy_import_requests()
+        _lazy_import_numpy()
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+        rectify_stream = None
+        fallback = False
+        try:
+            regions = [d for d in selected_districts if d] or [""]
+            boundaries = self.load_district_boundaries(city, regions)
+            if len(boundaries) < len(regions):
+                self.update_api_response("⚠️ 部分区域边界获取失败，改用关键字搜索")
+                # 关键字搜索结束时自行恢复按钮状态
+                fallback = True
+                self._search_scene_thread(city, selected_districts, selected_scenes, location_filter_distance, rectify)
+                return
+
+            stats = self._new_search_stats()
+            location_index = self._new_search_index(location_filter_distance)
+            for scene in selected_scenes:
+                if scene not in self.searched_scenes:
+                    self.searched_scenes.append(scene)
+
+            # 够用即停：某场景收集到的候选地点达到目标后不再细分该场景的分块
+            scene_targets = self._get_search_targets(selected_scenes)
+            scene_counts = self._scene_location_counts()
+
+            search_start = time.time()
+            scene_pois = {scene: {} for scene in selected_scenes}  # 场景 → {POI标识: (POI, 区县)}
+            tiles_done = 0
+            requests_made = 0
+            stopped_early = False  # 有场景因达到目标地点数而不再细分分块或不再加入地点
+            initial_tiles = [(scene, district, DistrictBoundaryCache.bbox(boundaries[district]))
+                             for scene in selected_scenes for district in regions]
+
+            def poi_key(poi):
+                return poi.get('id') or f"{poi.get('name', '')}|{poi.get('location', '')}"
+
+            # 搜索断点：相同搜索条件暂停过时，恢复已获取的POI并只查询剩余分块
+            checkpoint = getattr(self, 'search_checkpoint', None)
+            checkpoint_key = None
+            if checkpoint is not None:
+                checkpoint_key = checkpoint.make_key(city, selected_districts, selected_scenes,
+                                                     location_filter_distance, mode='tiled')
+                saved = checkpoint.load(checkpoint_key)
+                if saved and saved.get('mode') == 'tiled':
+                    for scene, items in saved.get('pois', {}).items():
+                        if scene in scene_pois:
+                            for poi, district in items:
+                                scene_pois[scene].setdefault(poi_key(poi), (poi, district))
+                    initial_tiles = [(scene, district, tuple(bbox)) for scene, district, bbox in saved.get('pending', [])
+                                     if scene in scene_pois and district in boundaries]
+                    tiles_done = saved.get('tiles_done', 0)
+                    requests_made = saved.get('requests_made', 0)
+                    self.update_api_response(
+                        f"▶️ 从断点继续分块搜索（{saved.get('saved', '')}）：已完成 {tiles_done} 个分块，"
+                        f"已获取 {sum(len(p) for p in scene_pois.values())} 个地点，剩余 {len(initial_tiles)} 个分块"
+                    )
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = {}
+                for scene, district, bbox in initial_tiles:
+                    pending[executor.submit(self._fetch_tile_pois, scene, bbox)] = (scene, district, bbox)
+
+                while pending:
+                    if self.is_search_stopped or self.is_search_paused:
+                        for future in pending:
+                            future.cancel()
+                        if checkpoint is not None and self.is_search_stopped:
+                            checkpoint.clear(checkpoint_key)
+                        elif checkpoint is not None:
+                            # 未完成（含已取消）的分块继续搜索时重新查询
+                            checkpoint.save_tiles(checkpoint_key, scene_pois, list(pending.values()),
+                                                  tiles_done, requests_made)
+                        self.update_api_response("⏹️ 搜索已终止" if self.is_search_stopped else "⏸️ 搜索已暂停")
+                        return
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        scene, district, bbox = pending.pop(future)
+                        try:
+                            pois, split, tile_requests = future.result()
+                        except Exception as e:
+                            logger.error(f"分块搜索出错: {str(e)}")
+                            continue
+                        tiles_done += 1
+                        requests_made += tile_requests
+                        for poi in pois:
+                            scene_pois[scene].setdefault(poi_key(poi), (poi, district))
+                        scene_full = bool(scene_targets) and (
+                            scene_counts.get(scene, 0) + len(scene_pois[scene]) >= scene_targets.get(scene, 0)
+                        )
+                        if split and scene_full:
+                            stopped_early = True
+                        elif split:
+                            for child in self._split_tile(bbox, boundaries[district]):
+                                pending[executor.submit(self._fetch_tile_pois, scene, child)] = (scene, district, child)
+
+                    unique_count = sum(len(p) for p in scene_pois.values())
+                    self._safe_update_status(
+                        f"分块搜索: 已完成 {tiles_done} 个分块，待查询 {len(pending)} 个，获取 {unique_count} 个地点", "blue"
+                    )
+
+            if checkpoint is not None:
+                checkpoint.clear(checkpoint_key)
+            unique_count = sum(len(p) for p in scene_pois.values())
+            self.update_api_response(
+                f"🧩 分块搜索完成: {tiles_done} 个分块，{requests_made} 次请求，{unique_count} 个不重复地点"
+                f"（平均每次请求 {unique_count / max(requests_made, 1):.1f} 个），用时 {time.time() - search_start:.1f} 秒"
+            )
+
+            # 按区县边界一次性判断所有POI是否在区内
+            candidates = {scene: list(pois.values()) for scene, pois in scene_pois.items()}
+            in_district = {}
+            for scene, items in candidates.items():
+                for district in regions:
+                    indices = [i for i, (_, d) in enumerate(items) if d == district]
+                    mask = self._pois_in_boundary([items[i][0] for i in indices], boundaries[district])
+                    for i, inside in zip(indices, mask):
+                        in_district[(scene, i)] = inside
+
+            if rectify:
+                rectify_stream = self._start_rectify_stream()
+
+            # 各场景轮流加入地点，保持与关键字搜索相同的场景交替顺序
+            for position in range(max((len(items) for items in candidates.values()), default=0)):
+                for scene, items in candidates.items():
+                    if position >= len(items):
+                        continue
+                    if scene_targets and scene_counts.get(scene, 0) >= scene_targets.get(scene, 0):
+                        stopped_early = True
+                        continue
+                    poi, district = items[position]
+                    stats['total_found'] += 1
+                    loc_data = self._accept_search_poi(
+                        poi, scene, location_index, location_filter_distance, stats,
+                        selected_districts, district, in_district[(scene, position)]
+                    )
+                    if loc_data:
+                        scene_counts[scene] = scene_counts.get(scene, 0) + 1
+                        if rectify_stream is not None:
+                            rectify_stream.submit(loc_data)
+
+            self._finish_search(stats, rectify, rectify_stream, stopped_early=stopped_early)
+
+        except Exception as e:
+            logger.error(f"搜索线程错误: {str(e)}", exc_info=True)
+            self.update_api_response(f"❌ 搜索线程错误: {str(e)}")
+            self._safe_update_status(f"搜索出错: {str(e)}", "red")
+        finally:
+            if rectify_stream is not None and not rectify_stream.closed:
+                self._drain_rectify_stream(rectify_stream, final=False)
+            if not fallback:
+                self._restore_search_buttons()
+
+    def _restore_search_checkpoint(self, saved, search_states, stats, location_index, rectify_stream=None):
+        """把断点中的搜索进度写回 search_states / stats，并补回断点中已添加但当前列表没有的地点
+
+        补回的地点是搜索时的原始坐标，有流水线纠偏时一并放入纠偏队列。
+
+        Returns:
+            (current_index, consecutive_failures, 已添加地点列表)
+        """
+        saved_states = {(s['scene'], s['district']): s for s in saved.get('states', [])}
+        for state in search_states:
+            saved_state = saved_states.get((state['scene'], state['district']))
+            if saved_state:
+                for field in SearchCheckpoint.STATE_FIELDS:
+                    state[field] = saved_state[field]
+                if state['boundary'] is None:
+                    # 边界不可用时改按区县名称筛选
+                    state['in_district'] = []
+        stats.update(saved.get('stats', {}))
+
+        added_locations = saved.get('locations', [])
+        restored = 0
+        for loc in added_locations:
+            if location_index.has_name(loc['name']):
+                continue
+            loc_data = dict(loc)
+            self.coordinates.append(loc_data)
+            self.valid_locations.append(loc_data)
+            self.locations.append(loc_data['name'])
+            location_index.add(loc_data)
+            if getattr(self, 'route_session', None) is not None:
+                self.route_session.add_point(loc_data)
+            if rectify_stream is not None:
+                rectify_stream.submit(loc_data)
+            restored += 1
+        if restored:
+            self._safe_update_table()
+
+        pages = sum(max(s['page'] - 1, 0) + (1 if s['pois'] else 0) for s in search_states)
+        self.update_api_response(
+            f"▶️ 从断点继续搜索（{saved.get('saved', '')}）：已处理 {pages} 页，"
+            f"已添加 {len(added_locations)} 个地点（恢复 {restored} 个）"
+        )
+        current_index = saved.get('current_index', 0) % len(search_states)
+        return current_index, saved.get('consecutive_failures', 0), list(added_locations)
+
+    def _scene_location_counts(self):
+        """当前各场景的有效地点数（不含已删除的地点）"""
+        counts = {}
+        for loc in self.valid_locations:
+            if loc.get('status', 'active') != 'deleted':
+                counts[loc.get('scene', '')] = counts.get(loc.get('scene', ''), 0) + 1
+        return counts
+
+    def _new_search_stats(self):
+        """搜索统计计数"""
+        return {
+            'total_found': 0,
+            'added': 0,
+            'no_coord': 0,
+            'wrong_district': 0,
+            'near_duplicate': 0,
+            'too_close': 0,
+        }
+
+    def _new_search_index(self, location_filter_distance):
+        """查重索引：网格大小与筛选距离一致，距离筛选只需检查相邻网格"""
+        location_index = LocationIndex(self.valid_locations, cell_km=location_filter_distance or 0)
+        for existing_name in self.locations:
+            location_index.add_name(existing_name)
+        for existing in self.coordinates:
+            location_index.add_name(existing['name'])
+        return location_index
+
+    def _accept_search_poi(self, poi, scene, location_index, location_filter_distance, stats,
+                           selected_districts, district=None, in_district=None):
+        """对一个搜索到的POI执行去重和筛选，通过后加入地点列表
+
+        Args:
+            district: 按边界搜索时的区县名（空字符串表示整个城市），为 None 时按 adname 匹配 selected_districts
+            in_district: 按区县边界搜索时该POI是否位于边界内
+
+        Returns:
+            新增的地点数据，被过滤时返回 None
+        """
+        name = poi.get('name', '')
+        location_str = poi.get('location', '')
+        poi_district = poi.get('adname', '')
+
+        if not name:
+            return None
+
+        # 筛选1: 检查是否有坐标
+        if not location_str:
+            stats['no_coord'] += 1
+            self.update_api_response(f"   ⛔ {name} - 无坐标，已过滤")
+            return None
+
+        try:
+            lon, lat = map(float, location_str.split(','))
+        except:
+            stats['no_coord'] += 1
+            self.update_api_response(f"   ⛔ {name} - 坐标格式错误，已过滤")
+            return None
+
+        # 检查是否已存在（名称+经纬度）
+        if location_index.contains(name, lon, lat):
+            # 已存在相同地点，自动跳过（去重）
+            self.update_api_response(f"   ⛔ 跳过重复地点: {name}")
+            return None
+
+        # 检查名称是否已存在（仅名称重复）
+        if location_index.has_name(name):
+            return None
+
+        # 筛选2: 检查是否在选中区域内（有边界时按边界判断，否则匹配区县名称）
+        if district is not None:
+            if not in_district:
+                stats['wrong_district'] += 1
+                self.update_api_response(f"   ⛔ {name} - 不在{district or '城市'}边界内({poi_district})，已过滤")
+                return None
+            poi_district = district or poi_district
+        elif selected_districts and selected_districts[0] != "":
+            if not any(d in poi_district for d in selected_districts):
+                stats['wrong_district'] += 1
+                self.update_api_response(f"   ⛔ {name} - 不在选中区域({poi_district})，已过滤")
+                return None
+
+        # 检查坐标是否与其他名称的地点重合（如同一位置的连锁门店）
+        new_point = {'lat': lat, 'lon': lon}
+        for existing in location_index.candidates(lon, lat, LocationIndex.NEAR_DUPLICATE_KM):
+            if self.calculate_distance_between_points(new_point, existing) < LocationIndex.NEAR_DUPLICATE_KM:
+                stats['near_duplicate'] += 1
+                self.update_api_response(f"   ⛔ {name} - 与{existing['name']}坐标重合，已过滤")
+                return None
+
+        # 筛选3: 检查与已有地点的距离
+        if location_filter_distance is not None and location_filter_distance > 0:
+            for existing in location_index.candidates(lon, lat, location_filter_distance):
+                dist = self.calculate_distance_between_points(new_point, existing)
+                if dist < location_filter_distance:
+                    stats['too_close'] += 1
+                    self.update_api_response(f"   ⛔ {name} - 距离{existing['name']}太近({dist*1000:.0f}m<{location_filter_distance*1000:.0f}m)，已过滤")
+                    return None
+
+        # 通过所有筛选，添加到列表
+        loc_data = {
+            'name': name,
+            'lon': lon,
+            'lat': lat,
+            'district': poi_district,
+            'scene': scene,
+            'status': 'active'  # 新增地点默认为正常状态
+        }
+        self.coordinates.append(loc_data)
+        self.valid_locations.append(loc_data)
+        self.locations.append(name)
+        location_index.add(loc_data)
+        if getattr(self, 'route_session', None) is not None:
+            self.route_session.add_point(loc_data)
+        stats['added'] += 1
+
+        self.update_api_response(f"   ✅ {name} ({poi_district}) [{scene}] - 坐标: {lon:.6f}, {lat:.6f}")
+
+        # 更新表格（线程安全）
+        self._safe_update_table()
+
+        # 更新状态（线程安全）
+        valid_count = len(self.valid_locations)
+        self._safe_update_status(f"已获取 {valid_count} 个有效坐标", "blue")
+
+        # 刷新生成按钮状态
+        self.refresh_generate_button_state()
+
+        return loc_data
+
+    def _finish_search(self, stats, rectify, rectify_stream=None, stopped_early=False, checkpoint_saved=False):
+        """输出搜索统计，按需纠偏（有流水线纠偏时等待其完成）并更新状态
+
+        Args:
+            stopped_early: 各场景达到目标地点数后提前结束了搜索
+            checkpoint_saved: 搜索未完成（如密钥用尽），已保存断点
+        """
+        self.update_api_response(f"\n📊 搜索统计:")
+        self.update_api_response(f"   总共找到: {stats['total_found']} 个地点")
+        self.update_api_response(f"   成功添加: {stats['added']} 个")
+        self.update_api_response(f"   过滤-无坐标: {stats['no_coord']} 个")
+        self.update_api_response(f"   过滤-不在区域: {stats['wrong_district']} 个")
+        self.update_api_response(f"   过滤-坐标重合: {stats['near_duplicate']} 个")
+        self.update_api_response(f"   过滤-距离太近: {stats['too_close']} 个")
+        self.update_api_response(f"   当前有效坐标: {len(self.valid_locations)} 个")
+        
+        # 执行坐标纠偏（修正到最近公开道路）- 根据开关状态决定
+        rectify_enabled = self._is_rectify_enabled()
+        if rectify_stream is not None:
+            self._drain_rectify_stream(rectify_stream, final=not self.is_search_paused)
+        elif rectify:
+            self._rectify_search_results()
+        
+        if self.is_search_paused:
+            self._safe_update_status(f"搜索已暂停，当前有 {len(self.valid_locations)} 个有效坐标", "orange")
+        else:
+            notes = []
+            if rectify_stream is not None or (rectify and rectify_enabled):
+                notes.append("已纠偏")
+            if stopped_early:
+                notes.append("已达到目标地点数，提前结束")
+            if checkpoint_saved:
+                notes.append("未搜索完，进度已保存")
+            status_suffix = f"（{'，'.join(notes)}）" if notes else ""
+            self._safe_update_status(f"搜索完成，共 {len(self.valid_locations)} 个有效坐标{status_suffix}",
+                                     "orange" if checkpoint_saved else "green")
+
+    def _restore_search_buttons(self):
+        """搜索线程结束时恢复按钮状态（暂停时保持暂停/终止按钮可用）"""
+        if self.is_search_paused and not self.is_search_stopped:
+            # 暂停状态：保持暂停/终止按钮可用
+            logger.info("搜索已暂停，保持按钮可用状态")
+        else:
+            # 完成或终止状态：恢复按钮默认状态
+            self._safe_set_button_enabled('search_scene_btn', True)
+            self._safe_set_button_enabled('pause_btn', False)
+            self._safe_set_button_enabled('stop_btn', False)
+            # 重置暂停按钮文本
+            if hasattr(self, 'pause_btn'):
+                try:
+                    self.pause_btn.setText("⏸️ 暂停搜索")
+                except:
+                    pass
+            self.refresh_generate_button_state()
+            logger.info("搜索线程结束，按钮状态已恢复")
+    
+    def _start_rectify_stream(self, batch_size=30):
+        """创建流水线纠偏队列，未启用纠偏时返回 None"""
+        if not self._is_rectify_enabled():
+            return None
+        _lazy_import_requests()
+        self.coordinates_ready = False
+
+        def on_batch_done(completed, submitted, corrected, count):
+            self.update_api_response(
+                f"   🔧 流水线纠偏 {completed}/{submitted} 批完成 ({corrected}/{count} 纠偏) · 并发 {stream.concurrency}"
+            )
+
+        stream = RectifyStream(
+            self._rectify_batch_with_offline_snap,
+            AimdConcurrencyController(self._get_key_pool()),
+            batch_size, on_batch_done
+        )
+        self.update_api_response(f"🔧 流水线纠偏已启动：搜索到的地点每满 {batch_size} 个即并发纠偏")
+        return stream
+
+    def _rectify_batch_with_offline_snap(self, batch, feedback=None):
+        """先离线吸附，剩余的点再调用轨迹纠偏接口"""
+        snapped_batch, pending = self.snap_locations_offline(batch)
+        if pending:
+            rectified = self._rectify_batch([snapped_batch[i] for i in pending], feedback)
+            for i, loc in zip(pending, rectified):
+                snapped_batch[i] = loc
+        return snapped_batch
+
+    def _drain_rectify_stream(self, stream, final=True):
+        """等待流水线纠偏的剩余批次完成，把结果写回地点列表
+
+        Args:
+            final: 是否为搜索正常结束，是则完成后标记坐标就绪
+        """
+        if final:
+            self.is_rectifying = True
+            self.refresh_generate_button_state()
+            self._safe_update_status(f"等待坐标纠偏完成（{len(stream)} 个点）...", "blue")
+        drain_start = time.time()
+        results = stream.close()
+        # 备选纠偏的结果在各批次中只放入缓存，流水线结束后写入一次
+        self._get_road_snap_cache().save()
+
+        session = getattr(self, 'route_session', None)
+
+        def replace(loc):
+            new_loc = results.get(id(loc))
+            if new_loc is None:
+                return loc
+            # 纠偏期间地点可能被标记删除，以当前状态为准
+            return dict(new_loc, status=loc.get('status', 'active'))
+
+        if session is not None:
+            for loc in self.valid_locations:
+                if id(loc) in results:
+                    session.replace_point(loc, replace(loc))
+        self.valid_locations = [replace(loc) for loc in self.valid_locations]
+        self.coordinates = [replace(loc) for loc in self.coordinates]
+        self._safe_update_table()
+
+        rectified_count = sum(1 for loc in results.values() if loc.get('rectified', False))
+        self.update_api_response(
+            f"📍 坐标纠偏完成: {rectified_count}/{len(stream)} 个点已修正到道路"
+            f"（搜索结束后等待 {time.time() - drain_start:.1f} 秒）"
+        )
+        if final:
+            self.is_rectifying = False
+            self.coordinates_ready = True
+            self.refresh_generate_button_state()
+
+    def _rectify_search_results(self):
+        """对搜索得到的有效地点执行坐标纠偏，完成后标记坐标就绪"""
+        # 标记坐标就绪状态
+        self.coordinates_ready = False  # 先设为False，等纠偏完成后设为True
+        
+        # 执行坐标纠偏（修正到最近公开道路）- 根据开关状态决定
+        rectify_enabled = self._is_rectify_enabled()
+        if not self.is_search_paused and len(self.valid_locations) > 0 and rectify_enabled:
+            # 设置纠偏状态标志
+            self.is_rectifying = True
+            self.refresh_generate_button_state()  # 禁用生成按钮
+            
+            self._safe_update_status(f"正在进行坐标纠偏...", "blue")
+            
+            # 批量纠偏坐标（使用并发优化）
+            rectified_locations = self.rectify_coordinates_batch_concurrent(
+                self.valid_locations, 
+                batch_size=30  # 并发数由自适应控制器根据延迟和限流错误调整
+            )
+            
+            # 更新坐标列表（已有路线生成会话时同步纠偏后的坐标）
+            if getattr(self, 'route_session', None) is not None:
+                for old_loc, new_loc in zip(self.valid_locations, rectified_locations):
+                    self.route_session.replace_point(old_loc, new_loc)
+            self.valid_locations = rectified_locations
+            self.coordinates = rectified_locations.copy()
+            
+            # 更新表格显示
+            self._safe_update_table()
+            
+            # 统计纠偏数量
+            rectified_count = sum(1 for loc in rectified_locations if loc.get('rectified', False))
+            self.update_api_response(f"📍 坐标纠偏完成: {rectified_count}/{len(rectified_locations)} 个点已修正到道路")
+            
+            # 纠偏完成，恢复状态
+            self.is_rectifying = False
+            self.coordinates_ready = True
+        elif not rectify_enabled:
+            self.update_api_response(f"ℹ️ 坐标纠偏已禁用，使用原始坐标")
+            self.coordinates_ready = True  # 未启用纠偏，坐标直接就绪
+    
+    # ======================== 坐标纠偏功能 ========================
+    
+    def rectify_coordinates_batch(self, locations, batch_size=30):
+        """批量纠偏坐标到最近公开道路
+        
+        使用高德地图轨迹纠偏API，将原始坐标修正到最近的公开道路上
+        
+        Args:
+            locations: 地点列表，每个元素包含 name, lon, lat 等字段
+            batch_size: 每批处理的点数，默认30个（API限制）
+        
+        Returns:
+            rectified_locations: 纠偏后的地点列表
+        """
+        _lazy_import_requests()
+        if not locations:
+            return locations
+        
+        self.update_api_response(f"\n🔧 开始坐标纠偏...")
+        self.update_api_response(f"📊 待纠偏坐标数: {len(locations)}")
+        self.update_api_response(f"📦 批次大小: {batch_size}")
+        
+        rectified_locations = []
+        total_batches = (len(locations) + batch_size - 1) // batch_size
+        
+        for batch_idx in range(total_batches):
+            start_idx = batch_idx * batch_size
+            end_idx = min(start_idx + batch_size, len(locations))
+            batch = locations[start_idx:end_idx]
+            
+            self.update_api_response(f"   📍 处理第 {batch_idx + 1}/{total_batches} 批 ({len(batch)} 个点)...")
+            
+            try:
+                rectified_batch = self._rectify_batch(batch)
+                rectified_locations.extend(rectified_batch)
+                
+                # 统计纠偏结果
+                corrected = sum(1 for i, loc in enumerate(rectified_batch) 
+                               if loc['lon'] != batch[i]['lon'] or loc['lat'] != batch[i]['lat'])
+                self.update_api_response(f"      ✅ 完成，{corrected}/{len(batch)} 个坐标已纠偏")
+                
+            except Exception as e:
+                logger.error(f"批次 {batch_idx + 1} 纠偏失败: {str(e)}")
+                self.update_api_response(f"      ⚠️ 批次纠偏失败，保留原坐标: {str(e)}")
+                rectified_locations.extend(batch)
+            
+            # 添加短暂延迟，避免API频率限制
+            if batch_idx < total_batches - 1:
+                time.sleep(0.3)
+        
+        self.update_api_response(f"🔧 坐标纠偏完成，共处理 {len(rectified_locations)} 个点")
+        
+        return rectified_locations
+    
+    def rectify_coordinates_batch_concurrent(self, locations, batch_size=30, max_workers=None):
+        """并发批量纠偏坐标到最近公开道路（性能优化版本）
+        
+        使用多线程并发处理多个批次，并发数由 AimdConcurrencyController 自适应调整：
+        请求健康时逐步加大并发，遇到限流错误码或超时时减半，上限跟随密钥池可用密钥的总 QPS
+        
+        Args:
+            locations: 地点列表，每个元素包含 name, lon, lat 等字段
+            batch_size: 每批处理的点数，默认30个（API限制）
+            max_workers: 并发数上限，默认 None（仅受密钥池 QPS 限制，最多16）
+        
+        Returns:
+            rectified_locations: 纠偏后的地点列表
+        """
+        _lazy_import_requests()
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        
+        if not locations:
+            return locations
+        
+        # 先用本地道路线段库离线吸附，附近没有已知道路的点才调用接口纠偏
+        snapped_locations, pending = self.snap_locations_offline(locations)
+        if len(pending) < len(locations):
+            self.update_api_response(
+                f"🗺️ 离线道路吸附: {len(locations) - len(pending)}/{len(locations)} 个点，"
+                f"剩余 {len(pending)} 个点调用接口纠偏"
+            )
+        if not pending:
+            return snapped_locations
+        locations = [snapped_locations[i] for i in pending]
+        
+        controller = AimdConcurrencyController(
+            self._get_key_pool(), max_limit=max_workers or 16
+        )
+        
+        self.update_api_response(f"\n🔧 开始坐标纠偏（并发模式）...")
+        self.update_api_response(f"📊 待纠偏坐标数: {len(locations)}")
+        self.update_api_response(f"📦 批次大小: {batch_size}")
+        self.update_api_response(f"🚀 自适应并发: 初始 {controller.limit}，上限 {controller.ceiling()}")
+        
+        # 将locations分成多个批次
+        batches = []
+        for i in range(0, len(locations), batch_size):
+            batch = locations[i:i + batch_size]
+            batches.append((i // batch_size, batch))
+        
+        total_batches = len(batches)
+        self.update_api_response(f"📦 总批次数: {total_batches}")
+        
+        # 用于存储结果，保持顺序
+        results = [None] * total_batches
+        completed_count = 0
+        
+        def process_batch(batch_info):
+            """处理单个批次"""
+            batch_idx, batch = batch_info
+            feedback = {}
+            try:
+                rectified_batch = self._rectify_batch(batch, feedback)
+                corrected = sum(1 for i, loc in enumerate(rectified_batch) 
+                               if loc['lon'] != batch[i]['lon'] or loc['lat'] != batch[i]['lat'])
+                return batch_idx, rectified_batch, corrected, None, feedback
+            except Exception as e:
+                logger.error(f"批次 {batch_idx + 1} 纠偏失败: {str(e)}")
+                return batch_idx, batch, 0, str(e), feedback
+        
+        # 使用线程池并发处理，按控制器当前并发数逐个提交批次
+        start_time = time.time()
+        queued = iter(batches)
+        running = set()
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=controller.ceiling()) as executor:
+            while True:
+                while not exhausted and len(running) < controller.limit:
+                    batch_info = next(queued, None)
+                    if batch_info is None:
+                        exhausted = True
+                        break
+                    running.add(executor.submit(process_batch, batch_info))
+                if not running:
+                    break
+                
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_idx, rectified_batch, corrected, error, feedback = future.result()
+                    controller.record(feedback.get('errcode'), feedback.get('latency'),
+                                      feedback.get('timeout', False))
+                    results[batch_idx] = rectified_batch
+                    completed_count += 1
+                    
+                    if error:
+                        self.update_api_response(f"   ⚠️ 批次 {batch_idx + 1}/{total_batches} 失败: {error}")
+                    else:
+                        self.update_api_response(f"   ✅ 批次 {batch_idx + 1}/{total_batches} 完成 ({corrected}/{len(rectified_batch)} 纠偏)")
+                
+                # 更新进度状态
+                progress_pct = int(completed_count / total_batches * 100)
+                self._safe_update_status(
+                    f"坐标纠偏中... {completed_count}/{total_batches} ({progress_pct}%) · 并发 {controller.limit}",
+                    "blue"
+                )
+        
+        # 合并结果
+        rectified_locations = []
+        for batch_result in results:
+            if batch_result:
+                rectified_locations.extend(batch_result)
+        
+        # 备选纠偏的结果在各批次中只放入缓存，全部完成后写入一次
+        self._get_road_snap_cache().save()
+        
+        elapsed_time = time.time() - start_time
+        self.update_api_response(f"🔧 坐标纠偏完成，共处理 {len(rectified_locations)} 个点")
+        self.update_api_response(f"⏱️ 耗时: {elapsed_time:.1f} 秒")
+        
+        for i, loc in zip(pending, rectified_locations):
+            snapped_locations[i] = loc
+        return snapped_locations
+    
+    def _get_road_segment_store(self):
+        """离线道路线段库（宿主未设置 road_segment_store 时使用仅内存的线段库）"""
+        if getattr(self, 'road_segment_store', None) is None:
+            self.road_segment_store = RoadSegmentStore()
+        return self.road_segment_store
+    
+    def snap_locations_offline(self, locations, max_distance=None):
+        """用本地道路线段库吸附坐标
+        
+        Args:
+            max_distance: 最大吸附距离（米），默认取 offline_snap_distance 属性（50米），0 表示不使用
+        
+        Returns:
+            (吸附后的地点列表, 未能吸附的地点下标列表)
+        """
+        if max_distance is None:
+            max_distance = getattr(self, 'offline_snap_distance', 50)
+        store = self._get_road_segment_store()
+        if not max_distance or not len(store):
+            return list(locations), list(range(len(locations)))
+        
+        snapped_locations = []
+        pending = []
+        for i, loc in enumerate(locations):
+            snap = store.snap(loc['lon'], loc['lat'], max_distance)
+            if snap is None:
+                snapped_locations.append(loc)
+                pending.append(i)
+                continue
+            new_loc = loc.copy()
+            new_loc['lon'] = snap['lon']
+            new_loc['lat'] = snap['lat']
+            new_loc['rectified'] = True
+            new_loc['road_name'] = snap['road_name']
+            new_loc['original_lon'] = loc['lon']
+            new_loc['original_lat'] = loc['lat']
+            snapped_locations.append(new_loc)
+        return snapped_locations, pending
+    
+    def _rectify_batch(self, batch, feedback=None):
+        """对一批坐标进行纠偏
+        
+        使用高德地图轨迹纠偏API (grasproad)
+        API文档: https://lbs.amap.com/api/track/lieying-kaifa/api/grasproad
+        
+        Args:
+            batch: 一批地点，每个包含 name, lon, lat
+            feedback: 可选字典，写入本次纠偏请求的 errcode、耗时(latency)和是否超时(timeout)，
+                      供自适应并发控制使用
+        
+        Returns:
+            rectified_batch: 纠偏后的地点列表
+        """
+        _lazy_import_requests()
+        # 构建请求数据
+        # 轨迹纠偏API需要每个点包含：x(经度), y(纬度), sp(速度), ag(方向), tm(时间戳)
+        # 对于静态POI点，我们使用模拟值
+        
+        base_time = int(time.time())
+        trace_points = []
+        
+        for i, loc in enumerate(batch):
+            point = {
+                "x": loc['lon'],
+                "y": loc['lat'],
+                "sp": 10,  # 模拟速度 10 km/h
+                "ag": 0,   # 方向角度
+                "tm": base_time + i * 60  # 每个点间隔60秒
+            }
+            trace_points.append(point)
+        
+        # 高德轨迹纠偏API
+        url = "https://restapi.amap.com/v4/grasproad/driving"
+        
+        headers = {
+            "Content-Type": "application/json"
+        }
+        
+        request_data = {
+            "data": trace_points
+        }
+        
+        if feedback is None:
+            feedback = {}
+        # 从密钥池获取密钥：密钥无效/配额用尽时换密钥重试，被限流时退避后重试
+        key_pool = self._get_key_pool()
+        throttled = 0
+        result = None
+        for _ in range(self._key_attempts()):
+            current_key = self._acquire_key()
+            if current_key is None:
+                # 所有密钥都不可用时不再发送请求，直接使用道路吸附缓存/备选方案
+                logger.warning("轨迹纠偏没有可用的API密钥，尝试备选方案")
+                break
+            request_start = time.monotonic()
+            try:
+                response = requests.post(
+                    url, 
+                    params={"key": current_key}, 
+                    json=request_data, 
+                    headers=headers,
+                    timeout=30
+                )
+                result = response.json()
+            except requests.exceptions.Timeout:
+                logger.warning("轨迹纠偏API超时")
+                feedback['timeout'] = True
+                feedback['latency'] = time.monotonic() - request_start
+                return self._rectify_using_nearby_road(batch)
+            except Exception as e:
+                logger.error(f"轨迹纠偏请求失败: {str(e)}")
+                return self._rectify_using_nearby_road(batch)
+            
+            errcode = str(result.get('errcode', ''))
+            feedback['latency'] = time.monotonic() - request_start
+            if not throttled:
+                # 重试前遇到过限流时保留限流错误码，自适应并发控制器据此降低并发
+                feedback['errcode'] = errcode
+            if errcode in ApiKeyPool.RATE_LIMIT_CODES and throttled < ApiKeyPool.THROTTLE_RETRIES:
+                throttled += 1
+                self._back_off_key(current_key, throttled)
+                continue
+            if errcode in ApiKeyPool.KEY_ERROR_CODES:
+                key_pool.mark_exhausted(current_key)
+                result = None
+                continue
+            break
+        
+        if result is None:
+            return self._rectify_using_nearby_road(batch)
+        
+        # 调试：记录API响应
+        logger.info(f"轨迹纠偏API响应: errcode={result.get('errcode')}, errmsg={result.get('errmsg')}")
+        
+        if result.get('errcode') == 10000 or result.get('errcode') == 0:
+            # 成功
+            roads_data = result.get('data', {}).get('roads', [])
+            
+            # 调试：记录roads数据
+            logger.info(f"轨迹纠偏返回 {len(roads_data)} 条道路数据")
+            
+            if roads_data:
+                # 解析纠偏后的坐标
+                rectified_batch = []
+                
+                for i, loc in enumerate(batch):
+                    new_loc = loc.copy()
+                    
+                    # 尝试从纠偏结果中获取对应的坐标
+                    if i < len(roads_data):
+                        road_point = roads_data[i]
+                        
+                        # 高德轨迹纠偏API返回的坐标在crosspoint字段中
+                        # 格式: "经度,纬度"
+                        crosspoint = road_point.get('crosspoint', '')
+                        if crosspoint:
+                            try:
+                                lon_str, lat_str = crosspoint.split(',')
+                                new_loc['lon'] = float(lon_str)
+                                new_loc['lat'] = float(lat_str)
+                                new_loc['rectified'] = True
+                                new_loc['road_name'] = road_point.get('roadname', '')
+                                # 记录原始坐标
+                                new_loc['original_lon'] = loc['lon']
+                                new_loc['original_lat'] = loc['lat']
+                                logger.info(f"纠偏成功: {loc['name']} ({loc['lon']},{loc['lat']}) -> ({new_loc['lon']},{new_loc['lat']}) 道路:{new_loc['road_name']}")
+                            except (ValueError, AttributeError) as e:
+                                logger.warning(f"解析crosspoint失败: {crosspoint}, 错误: {e}")
+                        elif 'x' in road_point and 'y' in road_point:
+                            # 兼容其他可能的返回格式
+                            new_loc['lon'] = float(road_point['x'])
+                            new_loc['lat'] = float(road_point['y'])
+                            new_loc['rectified'] = True
+                            new_loc['original_lon'] = loc['lon']
+                            new_loc['original_lat'] = loc['lat']
+                    
+                    rectified_batch.append(new_loc)
+                
+                return rectified_batch
+            else:
+                # 没有返回纠偏数据，尝试备选方案
+                logger.warning("轨迹纠偏API未返回roads数据，尝试备选方案")
+                return self._rectify_using_nearby_road(batch)
+        else:
+            # API返回错误
+            error_msg = result.get('errmsg', result.get('errdetail', '未知错误'))
+            logger.warning(f"轨迹纠偏API错误: {error_msg}")
+            
+            # 尝试使用道路吸附API作为备选方案
+            return self._rectify_using_nearby_road(batch)
+    
+    # 批量逆地理编码每次最多查询的坐标数（接口限制）
+    REGEO_BATCH_SIZE = 20
+
+    def _get_road_snap_cache(self):
+        """备选纠偏结果缓存（宿主未设置 road_snap_cache 时使用仅内存缓存）"""
+        if getattr(self, 'road_snap_cache', None) is None:
+            self.road_snap_cache = RoadSnapCache()
+        return self.road_snap_cache
+
+    def _request_amap(self, url, params, timeout=10):
+        """GET 请求高德接口，密钥配额用尽时换密钥重试、被限流时退避后重试；成功返回响应数据，失败返回 None"""
+        key_pool = self._get_key_pool()
+        throttled = 0
+        for _ in range(self._key_attempts()):
+            current_key = self._acquire_key()
+            if current_key is None:
+                return None
+            try:
+                response = requests.get(url, params=dict(params, key=current_key), timeout=timeout)
+                data = response.json()
+            except Exception as e:
+                logger.warning(f"请求失败 ({url}): {str(e)}")
+                return None
+            if data.get('status') == '1':
+                return data
+            if data.get('infocode', '') in ApiKeyPool.RATE_LIMIT_CODES and throttled < ApiKeyPool.THROTTLE_RETRIES:
+                throttled += 1
+                self._back_off_key(current_key, throttled)
+                continue
+            if data.get('infocode', '') in ApiKeyPool.KEY_ERROR_CODES:
+                key_pool.mark_exhausted(current_key)
+                continue
+            logger.warning(f"请求失败 ({url}): {data.get('info', '未知错误')}")
+            return None
+        return None
+
+    @staticmethod
+    def _apply_road_snap(loc, entry):
+        """把缓存的吸附结果应用到地点上"""
+        if not entry:
+            return loc
+        new_loc = loc.copy()
+        if 'lon' in entry:
+            new_loc['lon'] = entry['lon']
+            new_loc['lat'] = entry['lat']
+            new_loc['rectified'] = True
+            new_loc['road_name'] = entry.get('road_name', '')
+            new_loc['original_lon'] = loc['lon']
+            new_loc['original_lat'] = loc['lat']
+        elif entry.get('nearest_road'):
+            new_loc['nearest_road'] = entry['nearest_road']
+        return new_loc
+
+    def _around_road_point(self, loc):
+        """周边搜索最近的路口/道路点
+
+        Returns:
+            {lon, lat, road_name}；附近没有路口返回空字典；请求失败返回 None
+        """
+        result = self._request_amap("https://restapi.amap.com/v3/place/around", {
+            "location": f"{loc['lon']},{loc['lat']}",
+            "radius": 100,  # 100米范围
+            "types": "190301|190302|190303|190304|190305",  # 道路类型: 路口、交叉口等
+            "offset": 1,  # 只取最近的1个
+            "extensions": "base"
+        })
+        if result is None:
+            return None
+        for poi in result.get('pois') or []:
+            location = poi.get('location', '')
+            if location:
+                lon_str, lat_str = location.split(',')
+                return {'lon': float(lon_str), 'lat': float(lat_str), 'road_name': poi.get('name', '')}
+        return {}
+
+    @staticmethod
+    def _parse_regeo_road(regeocode):
+        """从逆地理编码结果中取最近道路点，没有道路时取街道名"""
+        for road in regeocode.get('roads') or []:
+            road_location = road.get('location', '')
+            if road_location:
+                lon_str, lat_str = road_location.split(',')
+                return {'lon': float(lon_str), 'lat': float(lat_str), 'road_name': road.get('name', '')}
+        street = (regeocode.get('addressComponent') or {}).get('street', '')
+        if street and isinstance(street, str):
+            return {'nearest_road': street}
+        return {}
+
+    def _regeo_road_points(self, locs):
+        """批量逆地理编码（batch=true，每次最多 REGEO_BATCH_SIZE 个坐标）获取最近道路
+
+        Returns:
+            与 locs 一一对应的吸附结果列表，请求失败的位置为 None
+        """
+        entries = [None] * len(locs)
+        for start in range(0, len(locs), self.REGEO_BATCH_SIZE):
+            chunk = locs[start:start + self.REGEO_BATCH_SIZE]
+            result = self._request_amap("https://restapi.amap.com/v3/geocode/regeo", {
+                "location": "|".join(f"{loc['lon']},{loc['lat']}" for loc in chunk),
+                "batch": "true",
+                "extensions": "all",  # 获取详细信息
+                "radius": 100,
+                "roadlevel": 0  # 获取所有级别道路
+            })
+            if result is None:
+                continue
+            regeocodes = result.get('regeocodes') or []
+            if len(regeocodes) != len(chunk):
+                logger.warning(f"批量逆地理编码返回数量不符: {len(regeocodes)}/{len(chunk)}")
+                continue
+            for offset, regeocode in enumerate(regeocodes):
+                entries[start + offset] = self._parse_regeo_road(regeocode)
+        return entries
+
+    def _rectify_using_nearby_road(self, batch, max_workers=4):
+        """备选纠偏方案：使用周边道路搜索获取最近道路上的点
+        
+        原理：
+        1. 先查道路吸附缓存（约10米精度的坐标为键），命中的点不再请求
+        2. 未命中的点并发执行周边搜索，找最近的道路/路口
+        3. 周边搜索没找到的点合并为批量逆地理编码请求，取最近道路（或街道名）
+        """
+        _lazy_import_requests()
+        from concurrent.futures import ThreadPoolExecutor
+        
+        cache = self._get_road_snap_cache()
+        entries = [cache.get(loc['lon'], loc['lat']) for loc in batch]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            self.update_api_response(
+                f"   🔄 使用周边道路搜索进行纠偏（缓存命中 {len(batch) - len(missing)}/{len(batch)}）..."
+            )
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                around_results = list(executor.map(lambda i: self._around_road_point(batch[i]), missing))
+            
+            regeo_indices = []
+            for i, entry in zip(missing, around_results):
+                if entry:
+                    entries[i] = entry
+                    cache.put(batch[i]['lon'], batch[i]['lat'], entry)
+                    logger.info(f"周边搜索纠偏成功: {batch[i]['name']} -> {entry['road_name']}")
+                else:
+                    regeo_indices.append(i)
+            
+            if regeo_indices:
+                regeo_results = self._regeo_road_points([batch[i] for i in regeo_indices])
+                for i, entry in zip(regeo_indices, regeo_results):
+                    if entry is None:
+                        continue
+                    entries[i] = entry
+                    cache.put(batch[i]['lon'], batch[i]['lat'], entry)
+        
+        return [self._apply_road_snap(loc, entry) for loc, entry in zip(batch, entries)]
+    
+    def _rectify_single_point(self, loc):
+        """对单个点进行纠偏：使用逆地理编码获取最近道路（结果放入道路吸附缓存，由调用方 save()）"""
+        _lazy_import_requests()
+        cache = self._get_road_snap_cache()
+        entry = cache.get(loc['lon'], loc['lat'])
+        if entry is None:
+            entry = self._regeo_road_points([loc])[0]
+            if entry is None:
+                return loc
+            cache.put(loc['lon'], loc['lat'], entry)
+        return self._apply_road_snap(loc, entry)
+    
+    def calculate_distance_between_points(self, point1, point2):
+        """计算两个坐标点之间的直线距离（单位：公里）- Haversine公式"""
+        EARTH_RADIUS = 6371
+        
+        lat1_rad = math.radians(point1['lat'])
+        lon1_rad = math.radians(point1['lon'])
+        lat2_rad = math.radians(point2['lat'])
+        lon2_rad = math.radians(point2['lon'])
+        
+        dlat = lat2_rad - lat1_rad
+        dlon = lon2_rad - lon1_rad
+        
+        a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+        c = 2 * math.asin(math.sqrt(a))
+        distance = EARTH_RADIUS * c
+        
+        return distance
+    
+    def get_driving_distance(self, point1, point2):
+        """使用高德API获取两点之间的实际驾驶距离（单位：公里）"""
+        _lazy_import_requests()
+        try:
+            origin = f"{point1['lon']},{point1['lat']}"
+            destination = f"{point2['lon']},{point2['lat']}"
+            
+            # 使用高德地图v5驾车路径规划API
+            route_url = "https://restapi.amap.com/v5/direction/driving"
+            
+            params = {
+                'origin': origin,
+                'destination': destination,
+                'key': self._acquire_key(),
+                'strategy': 34
+            }
+            
+            response = requests.get(route_url, params=params, timeout=10)
+            data = response.json()
+            
+            if data.get('status') == '1' and data.get('route'):
+                paths = data['route'].get('paths', [])
+                if paths:
+                    # 获取第一条路径的距离（单位：米）
+                    distance_meters = int(paths[0].get('distance', 0))
+                    distance_km = distance_meters / 1000
+                    return distance_km
+            
+            # API调用失败，回退到直线距离
+            return self.calculate_distance_between_points(point1, point2)
+            
+        except Exception as e:
+            logger.error(f"获取驾驶距离失败: {str(e)}")
+            # 出错时回退到直线距离
+            return self.calculate_distance_between_points(point1, point2)
+    
+    def is_waypoint_in_valid_range(self, waypoint, start_point, end_point, other_waypoints=None):
+        """检查途径点是否在合理的距离范围内"""
+        config = self.route_config
+        
+        dist_to_start = self.calculate_distance_between_points(waypoint, start_point)
+        if not (config['waypoint_min_distance'] <= dist_to_start <= config['waypoint_max_distance']):
+            return False
+        
+        dist_to_end = self.calculate_distance_between_points(waypoint, end_point)
+        if not (config['waypoint_min_distance'] <= dist_to_end <= config['waypoint_max_distance']):
+            return False
+        
+        # 检查与其他途径点的距离
+        non_adj_min = config.get('non_adjacent_min', 0.5)  # 不相邻点最小距离
+        if other_waypoints:
+            for other_wp in other_waypoints:
+                dist_between = self.calculate_distance_between_points(waypoint, other_wp)
+                # 相邻点检查
+                if not (config['between_waypoint_min'] <= dist_between <= config['between_waypoint_max']):
+                    return False
+                # 不相邻点检查（大于500米）
+                if dist_between < non_adj_min:
+                    return False
+        
+        if len(other_waypoints or []) > 0:
+            for other_wp in (other_waypoints or []):
+                if self.are_points_collinear(start_point, waypoint, other_wp):
+                    return False
+        
+        return True
+    
+    def are_points_collinear(self, p1, p2, p3, tolerance=0.05):
+        """检查三个点是否共线"""
+        area = abs(
+            (p2['lat'] - p1['lat']) * (p3['lon'] - p1['lon']) -
+            (p3['lat'] - p1['lat']) * (p2['lon'] - p1['lon'])
+        )
+        
+        return area < tolerance
+    
+    def calculate_route_signature(self, route):
+        """生成路线的指纹（特征值）"""
+        all_points = [
+            (route['start_point']['lon'], route['start_point']['lat']),
+            (route['end_point']['lon'], route['end_point']['lat'])
+        ]
+        for wp in route.get('waypoint_details', []):
+            all_points.append((wp['lon'], wp['lat']))
+        
+        total_distance = 0
+        for i in range(len(all_points) - 1):
+            p1 = {'lat': all_points[i][1], 'lon': all_points[i][0]}
+            p2 = {'lat': all_points[i+1][1], 'lon': all_points[i+1][0]}
+            total_distance += self.calculate_distance_between_points(p1, p2)
+        
+        center_lat = sum(p[1] for p in all_points) / len(all_points)
+        center_lon = sum(p[0] for p in all_points) / len(all_points)
+        
+        signature = {
+            'total_distance': round(total_distance, 2),
+            'center': (round(center_lat, 4), round(center_lon, 4)),
+            'point_count': len(all_points),
+            'points_sorted': tuple(sorted(all_points))
+        }
+        
+        return signature
+    
+    def calculate_route_similarity(self, route1, route2):
+        """计算两条路线的相似度"""
+        sig1 = self.calculate_route_signature(route1)
+        sig2 = self.calculate_route_signature(route2)
+        
+        points1 = set(sig1['points_sorted'])
+        points2 = set(sig2['points_sorted'])
+        overlap = len(points1 & points2)
+        total = len(points1 | points2)
+        point_similarity = overlap / total if total > 0 else 0
+        
+        dist_diff = abs(sig1['total_distance'] - sig2['total_distance'])
+        avg_dist = (sig1['total_distance'] + sig2['total_distance']) / 2
+        distance_similarity = 1 - (dist_diff / avg_dist if avg_dist > 0 else 0)
+        
+        center1 = {'lat': sig1['center'][0], 'lon': sig1['center'][1]}
+        center2 = {'lat': sig2['center'][0], 'lon': sig2['center'][1]}
+        center_dist = self.calculate_distance_between_points(center1, center2)
+        center_similarity = max(0, 1 - (center_dist / 5))
+        
+        final_similarity = (
+            point_similarity * 0.5 +
+            distance_similarity * 0.3 +
+            center_similarity * 0.2
+        )
+        
+        return final_similarity
+    
+    def is_route_duplicate(self, new_route, existing_routes):
+        """检查新路线是否与现有路线重复"""
+        if not self.route_config['enable_deduplication']:
+            return False
+        
+        if not existing_routes:
+            return False
+        
+        for existing_route in existing_routes:
+            similarity = self.calculate_route_similarity(new_route, existing_route)
+            if similarity > self.route_config['similarity_threshold']:
+                self.update_api_response(
+                    f"⚠️ 新路线与已生成的路线 {existing_route['route_id']} 相似度过高 "
+                    f"({similarity:.2%})，已过滤"
+                )
+                return True
+        
+        return False
+    
+    # ======================== 空间排序算法 ========================
+    
+    def select_start_point(self):
+        """根据用户设置的起点模式选择起点
+        
+        Returns:
+            起点地点字典 {name, lon, lat, ...}
+        """
+        if not self.valid_locations:
+            return None
+        
+        mode = self.start_point_mode
+        
+        if mode == "auto":
+            # 自动模式：选择距离质心最近的点作为起点
+            centroid = self.calculate_centroid(self.valid_locations)
+            if centroid:
+                # 找到距离质心最近的实际点
+                closest_point = min(
+                    self.valid_locations,
+                    key=lambda p: self.calculate_distance_between_points(
+                        {'lon': centroid['lon'], 'lat': centroid['lat']}, p
+                    )
+                )
+                self.update_api_response(f"📍 自动起点：选择距离中心最近的点")
+                return closest_point
+            else:
+                return self.valid_locations[0]
+        
+        elif mode == "current_location":
+            # 当前位置模式：尝试获取用户位置
+            current_loc = self.get_current_location()
+            if current_loc:
+                # 注意：不将当前位置添加到valid_locations，只作为起点使用
+                # 这样可以避免干扰序号选择和表格显示
+                self.update_api_response(f"📍 使用当前位置作为起点: {current_loc['lon']:.6f}, {current_loc['lat']:.6f}")
+                return current_loc
+            else:
+                # 获取失败，退回自动模式
+                self.update_api_response("⚠️ 无法获取当前位置，使用自动模式")
+                centroid = self.calculate_centroid(self.valid_locations)
+                if centroid:
+                    return min(
+                        self.valid_locations,
+                        key=lambda p: self.calculate_distance_between_points(
+                            {'lon': centroid['lon'], 'lat': centroid['lat']}, p
+                        )
+                    )
+                return self.valid_locations[0]
+        
+        elif mode == "specified":
+            # 指定序号模式：直接使用valid_locations的索引
+            # 因为表格顾序已经与valid_locations保持一致
+            if self.specified_start_index is not None:
+                # 序号从1开始，索引从0开始
+                idx = self.specified_start_index - 1
+                
+                if 0 <= idx < len(self.valid_locations):
+                    selected_loc = self.valid_locations[idx]
+                    self.update_api_response(
+                        f"📍 使用指定序号 {self.specified_start_index} 作为起点: "
+                        f"{selected_loc['name']} ({selected_loc['lon']:.6f}, {selected_loc['lat']:.6f})"
+                    )
+                    return selected_loc
+                else:
+                    self.update_api_response(
+                        f"⚠️ 序号 {self.specified_start_index} 超出范围 (1-{len(self.valid_locations)})，使用第一个点"
+                    )
+                    if self.valid_locations:
+                        return self.valid_locations[0]
+            else:
+                self.update_api_response("⚠️ 未指定起点序号，使用第一个点")
+                if self.valid_locations:
+                    return self.valid_locations[0]
+        
+        elif mode == "manual":
+            # 手动输入模式：使用用户输入的经纬度和地名
+            if self.manual_start_coords:
+                lon = self.manual_start_coords.get('lon')
+                lat = self.manual_start_coords.get('lat')
+                name = self.manual_start_coords.get('name', '手动输入点')
+
+                if lon is not None and lat is not None:
+                    self.update_api_response(
+                        f"📍 使用手动输入的起点: {name} ({lon:.6f}, {lat:.6f})"
+                    )
+                    return {
+                        'name': name,
+                        'lon': lon,
+                        'lat': lat,
+                        'scene': '手动输入'
+                    }
+                else:
+                    self.update_api_response("⚠️ 手动起点经纬度未设置，使用第一个点")
+                    if self.valid_locations:
+                        return self.valid_locations[0]
+            else:
+                self.update_api_response("⚠️ 手动起点未设置，使用第一个点")
+                if self.valid_locations:
+                    return self.valid_locations[0]
+
+        elif mode == "saved":
+            # 从收藏中选择模式：使用用户选择的收藏点
+            if self.manual_start_coords:
+                lon = self.manual_start_coords.get('lon')
+                lat = self.manual_start_coords.get('lat')
+                name = self.manual_start_coords.get('name', '收藏点')
+
+                if lon is not None and lat is not None:
+                    self.update_api_response(
+                        f"📍 使用收藏点作为起点: {name} ({lon:.6f}, {lat:.6f})"
+                    )
+                    return {
+                        'name': name,
+                        'lon': lon,
+                        'lat': lat,
+                        'scene': '收藏点'
+                    }
+                else:
+                    self.update_api_response("⚠️ 收藏点起点经纬度未设置，使用自动模式")
+                    centroid = self.calculate_centroid(self.valid_locations)
+                    if centroid:
+                        return min(
+                            self.valid_locations,
+                            key=lambda p: self.calculate_distance_between_points(
+                                {'lon': centroid['lon'], 'lat': centroid['lat']}, p
+                            )
+                        )
+                    if self.valid_locations:
+                        return self.valid_locations[0]
+            else:
+                self.update_api_response("⚠️ 未选择收藏点起点，使用自动模式")
+                centroid = self.calculate_centroid(self.valid_locations)
+                if centroid:
+                    return min(
+                        self.valid_locations,
+                        key=lambda p: self.calculate_distance_between_points(
+                            {'lon': centroid['lon'], 'lat': centroid['lat']}, p
+                        )
+                    )
+                if self.valid_locations:
+                    return self.valid_locations[0]
+        
+        # 默认返回第一个点
+        return self.valid_locations[0]
+    
+    def select_end_point(self, start_point, available_points):
+        """根据用户设置的终点模式选择终点
+        
+        Args:
+            start_point: 起点
+            available_points: 可用的终点候选列表
+            
+        Returns:
+            终点地点字典 {name, lon, lat, ...}
+        """
+        if not available_points:
+            return None
+        
+        mode = self.end_point_mode
+        
+        if mode == "same_as_start":
+            # 同起点模式：返回起点作为终点（闭环路线）
+            self.update_api_response(f"🔄 终点模式：同起点（闭环路线）")
+            return start_point
+        
+        elif mode == "specified":
+            # 指定序号模式：直接使用valid_locations的索引
+            if self.specified_end_index is not None:
+                idx = self.specified_end_index - 1
+                
+                if 0 <= idx < len(self.valid_locations):
+                    selected_loc = self.valid_locations[idx]
+                    # 确保选择的点在可用点列表中
+                    if any(p['name'] == selected_loc['name'] for p in available_points):
+                        self.update_api_response(
+                            f"🏁 使用指定序号 {self.specified_end_index} 作为终点: "
+                            f"{selected_loc['name']} ({selected_loc['lon']:.6f}, {selected_loc['lat']:.6f})"
+                        )
+                        return selected_loc
+                    else:
+                        self.update_api_response(f"⚠️ 指定的终点已被使用，使用自动选择")
+                else:
+                    self.update_api_response(
+                        f"⚠️ 序号 {self.specified_end_index} 超出范围 (1-{len(self.valid_locations)})，使用自动选择"
+                    )
+        
+        elif mode == "manual":
+            # 手动输入模式：使用用户输入的经纬度和地名
+            if self.manual_end_coords:
+                lon = self.manual_end_coords.get('lon')
+                lat = self.manual_end_coords.get('lat')
+                name = self.manual_end_coords.get('name', '手动输入点')
+
+                if lon is not None and lat is not None:
+                    self.update_api_response(
+                        f"🏁 使用手动输入的终点: {name} ({lon:.6f}, {lat:.6f})"
+                    )
+                    return {
+                        'name': name,
+                        'lon': lon,
+                        'lat': lat,
+                        'scene': '手动输入'
+                    }
+                else:
+                    self.update_api_response("⚠️ 手动终点经纬度未设置，使用自动选择")
+                    return None
+            else:
+                self.update_api_response("⚠️ 手动终点未设置，使用自动选择")
+                return None
+
+        elif mode == "saved":
+            # 从收藏中选择模式：使用用户选择的收藏点
+            if self.manual_end_coords:
+                lon = self.manual_end_coords.get('lon')
+                lat = self.manual_end_coords.get('lat')
+                name = self.manual_end_coords.get('name', '收藏点')
+
+                if lon is not None and lat is not None:
+                    self.update_api_response(
+                        f"🏁 使用收藏点作为终点: {name} ({lon:.6f}, {lat:.6f})"
+                    )
+                    return {
+                        'name': name,
+                        'lon': lon,
+                        'lat': lat,
+                        'scene': '收藏点'
+                    }
+                else:
+                    self.update_api_response("⚠️ 收藏点终点经纬度未设置，使用自动选择")
+                    return None
+            else:
+                self.update_api_response("⚠️ 未选择收藏点终点，使用自动选择")
+                return None
+        
+        # auto模式或其他情况：返回None，让算法自动选择
+        return None
+    
+    def get_current_location(self):
+        """获取用户当前位置（通过高德IP定位API，失败则使用浏览器授权）
+        
+        Returns:
+            位置字典 {name, lon, lat} 或 None
+        """
+        _lazy_import_requests()
+        # 方法1: 尝试IP定位
+        try:
+            url = f"https://restapi.amap.com/v3/ip?key={self.key}"
+            response = requests.get(url, timeout=10)
+            data = response.json()
+            
+            if data.get('status') == '1':
+                # 获取城市中心点作为当前位置
+                rectangle = data.get('rectangle', '')
+                if rectangle:
+                    # rectangle格式: "经度1,纬度1;经度2,纬度2"
+                    coords = rectangle.split(';')
+                    if len(coords) >= 2:
+                        lon1, lat1 = map(float, coords[0].split(','))
+                        lon2, lat2 = map(float, coords[1].split(','))
+                        # 取中心点
+                        center_lon = (lon1 + lon2) / 2
+                        center_lat = (lat1 + lat2) / 2
+                        self.update_api_response(f"✅ IP定位成功: {data.get('city', '未知城市')}")
+                        return {
+                            'name': f"当前位置({data.get('city', '未知城市')})",
+                            'lon': center_lon,
+                            'lat': center_lat,
+                            'scene': '当前位置'
+                        }
+            
+            self.update_api_response(f"⚠️ IP定位失败: {data.get('info', '未知错误')}，尝试使用浏览器定位...")
+        except Exception as e:
+            logger.error(f"IP定位失败: {e}")
+            self.update_api_response(f"⚠️ IP定位失败: {str(e)}，尝试使用浏览器定位...")
+
+        # 方法2: 使用浏览器授权定位
+        # 延迟检查 selenium 是否可用
+        selenium_available, _ = _lazy_import_selenium()
+        if selenium_available:
+            return self.get_location_by_browser()
+        else:
+            self.update_api_response("❌ 无法获取位置，请安装selenium: pip install selenium webdriver-manager")
+            return None
+    
+    def get_location_by_browser(self):
+        """通过浏览器访问高德地图获取精确位置
+
+        Returns:
+            位置字典 {name, lon, lat} 或 None
+        """
+        _lazy_import_requests()
+        driver = None
+        try:
+            self.update_api_response("🌐 正在启动浏览器获取位置...")
+
+            # 延迟导入 selenium
+            available, modules = _lazy_import_selenium()
+            if not available:
+                self.update_api_response("❌ Selenium未安装，无法使用浏览器定位")
+                return None
+
+            Options = modules['Options']
+            Service = modules['Service']
+            ChromeDriverManager = modules['ChromeDriverManager']
+            webdriver = modules['webdriver']
+
+            # 配置Chrome选项
+            chrome_options = Options()
+            chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+            chrome_options.add_experimental_option('excludeSwitches', ['enable-automation'])
+            chrome_options.add_experimental_option('useAutomationExtension', False)
+            chrome_options.add_argument('--disable-gpu')
+            # 允许地理位置访问
+            prefs = {
+                "profile.default_content_setting_values.geolocation": 1,  # 1=允许, 2=拒绝
+            }
+            chrome_options.add_experimental_option('prefs', prefs)
+
+            # 创建driver
+            service = Service(ChromeDriverManager().install())
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+            driver.set_page_load_timeout(30)
+            
+            # 访问高德地图定位页面
+            self.update_api_response("📍 正在访问高德地图...")
+            driver.get("https://www.amap.com/")
+            
+            # 等待页面加载并执行JavaScript获取位置
+            time.sleep(5)  # 增加等待时间
+            
+            # 注入JavaScript获取位置
+            location_script = """
+            return new Promise((resolve, reject) => {
+                if (!navigator.geolocation) {
+                    reject('浏览器不支持地理定位');
+                    return;
+                }
+                const timeout = setTimeout(() => {
+                    reject('定位超时');
+                }, 20000);
+                
+                navigator.geolocation.getCurrentPosition(
+                    position => {
+                        clearTimeout(timeout);
+                        resolve({
+                            longitude: position.coords.longitude,
+                            latitude: position.coords.latitude,
+                            accuracy: position.coords.accuracy
+                        });
+                    },
+                    error => {
+                        clearTimeout(timeout);
+                        reject('定位失败: ' + error.message);
+                    },
+                    {timeout: 15000, enableHighAccuracy: true, maximumAge: 0}
+                );
+            });
+            """
+            
+            self.update_api_response("📡 正在获取GPS位置，请在浏览器中允许位置授权...（最多等待20秒）")
+            location_data = driver.execute_async_script(location_script)
+            
+            if location_data and 'longitude' in location_data:
+                lon = location_data['longitude']
+                lat = location_data['latitude']
+                accuracy = location_data.get('accuracy', 0)
+                
+                # 使用高德逆地理编码获取地址名称
+                try:
+                    url = f"https://restapi.amap.com/v3/geocode/regeo?location={lon},{lat}&key={self.key}"
+                    response = requests.get(url, timeout=10)
+                    data = response.json()
+                    if data.get('status') == '1':
+                        address = data.get('regeocode', {}).get('formatted_address', '当前位置')
+                        location_name = f"当前位置({address[:20]}...)"
+                    else:
+                        location_name = "当前位置"
+                except:
+                    location_name = "当前位置"
+                
+                self.update_api_response(f"✅ 浏览器定位成功！经度:{lon:.6f} 纬度:{lat:.6f} 精度:{accuracy:.0f}米")
+                
+                return {
+                    'name': location_name,
+                    'lon': lon,
+                    'lat': lat,
+                    'scene': '当前位置'
+                }
+            else:
+                self.update_api_response("❌ 未获取到位置信息")
+                return None
+                
+        except Exception as e:
+            logger.error(f"浏览器定位失败: {e}")
+            self.update_api_response(f"❌ 浏览器定位失败: {str(e)}")
+            return None
+        finally:
+            if driver:
+                try:
+                    driver.quit()
+                    self.update_api_response("🔒 浏览器已关闭")
+                except:
+                    pass
+    
+    def find_leftmost_top_point(self, points):
+        """找到最左上角的点：先比较经度（选最小→最西），若相同选纬度最大→最北"""
+        if not points:
+            return None
+        return min(points, key=lambda p: (p['lon'], -p['lat']))
+    
+    def calculate_centroid(self, points):
+        """计算所有点的重心（经纬度平均值）"""
+        if not points:
+            return None
+        avg_lon = sum(p['lon'] for p in points) / len(points)
+        avg_lat = sum(p['lat'] for p in points) / len(points)
+        return {'lon': avg_lon, 'lat': avg_lat}
+    
+    def calculate_angle_from_centroid(self, point, centroid):
+        """计算点相对于重心的角度（0-360度，北为0，顺时针增加）"""
+        import math
+        dx = point['lon'] - centroid['lon']
+        dy = point['lat'] - centroid['lat']
+        # atan2返回-π到π，转换为0-360度，北为0
+        angle = math.atan2(dx, dy)  # 注意：y轴向上为北
+        angle_deg = math.degrees(angle)
+        if angle_deg < 0:
+            angle_deg += 360
+        return angle_deg
+    
+    def spatial_sort_clockwise(self, points, start_point=None):
+        """顺时针排序：基于重心的角度，从小到大排列"""
+        if len(points) <= 1:
+            return points
+        centroid = self.calculate_centroid(points)
+        # 按角度从小到大排序（顺时针：北→东→南→西）
+        sorted_points = sorted(points, key=lambda p: self.calculate_angle_from_centroid(p, centroid))
+        return sorted_points
+    
+    def spatial_sort_counterclockwise(self, points, start_point=None):
+        """逆时针排序：基于重心的角度，从大到小排列"""
+        if len(points) <= 1:
+            return points
+        centroid = self.calculate_centroid(points)
+        # 按角度从大到小排序（逆时针：北→西→南→东）
+        sorted_points = sorted(points, key=lambda p: -self.calculate_angle_from_centroid(p, centroid))
+        return sorted_points
+    
+    def spatial_sort_coordinate(self, points, start_point=None):
+        """坐标轴排序：先按纬度（北→南，大到小），再按经度（西→东，小到大）"""
+        if len(points) <= 1:
+            return points
+        # 纬度降序（北→南），经度升序（西→东）
+        sorted_points = sorted(points, key=lambda p: (-p['lat'], p['lon']))
+        return sorted_points
+    
+    def spatial_sort_radial(self, points, start_point):
+        """放射状排序：以起点为中心，按距离由近到远排列"""
+        if len(points) <= 1:
+            return points
+        if not start_point:
+            return points
+        # 按距离起点的直线距离排序
+        sorted_points = sorted(points, 
+                              key=lambda p: self.calculate_distance_between_points(start_point, p))
+        return sorted_points
+    
+    def calculate_morton_code(self, lon, lat, precision=20):
+        """计算Morton码（Z-order曲线）
+        将经纬度转为整数后交错组合成Morton码
+        """
+        # 将经纬度归一化到0-1范围
+        # 经度：-180到180 → 0到1
+        # 纬度：-90到90 → 0到1
+        norm_lon = (lon + 180) / 360
+        norm_lat = (lat + 90) / 180
+        
+        # 转为整数（precision位）
+        max_val = (1 << precision) - 1
+        int_lon = int(norm_lon * max_val)
+        int_lat = int(norm_lat * max_val)
+        
+        # 交错组合成Morton码
+        morton = 0
+        for i in range(precision):
+            morton |= ((int_lon >> i) & 1) << (2 * i)
+            morton |= ((int_lat >> i) & 1) << (2 * i + 1)
+        
+        return morton
+    
+    def spatial_sort_morton(self, points, start_point=None):
+        """Morton码排序：保证空间相邻点排序后仍相邻"""
+        if len(points) <= 1:
+            return points
+        # 为每个点计算Morton码并排序
+        sorted_points = sorted(points, 
+                              key=lambda p: self.calculate_morton_code(p['lon'], p['lat']))
+        return sorted_points
+    
+    def apply_spatial_sort(self, points, sort_type, start_point=None):
+        """根据选择的排序类型应用空间排序"""
+        if sort_type == "clockwise":
+            return self.spatial_sort_clockwise(points, start_point)
+        elif sort_type == "counterclockwise":
+            return self.spatial_sort_counterclockwise(points, start_point)
+        elif sort_type == "coordinate":
+            return self.spatial_sort_coordinate(points, start_point)
+        elif sort_type == "radial":
+            return self.spatial_sort_radial(points, start_point)
+        elif sort_type == "morton":
+            return self.spatial_sort_morton(points, start_point)
+        else:
+            return points
+    
+    # ======================== 贪心算法优化 ========================
+    
+    def greedy_optimize_route(self, start_point, candidates, waypoint_num, 
+                              min_adj_km=0, max_adj_km=float('inf'), non_adj_min=0,
+                              calc_distance=None, scene_ratios=None):
+        """贪心算法优化路线：从起点出发，每次选择最近的未访问点（支持场景比例约束）
+        
+        Args:
+            start_point: 起点
+            candidates: 候选途径点列表（已经过空间排序）
+            waypoint_num: 需要选择的途径点数量
+            min_adj_km: 相邻点最小距离（公里）
+            max_adj_km: 相邻点最大距离（公里）
+            non_adj_min: 非相邻点最小距离（公里）
+            calc_distance: 距离计算函数
+            scene_ratios: 场景比例字典 {场景名: 百分比}，为空表示不限制
+        
+        Returns:
+            selected_waypoints: 优化后的途径点列表
+        """
+        if calc_distance is None:
+            calc_distance = self.calculate_distance_between_points
+        
+        # 初始化场景配额
+        scene_quotas = {}  # {场景名: 配额数量}
+        scene_used = {}    # {场景名: 已使用数量}
+        
+        if scene_ratios:
+            # 根据比例计算各场景的配额
+            total_ratio = sum(scene_ratios.values())
+            if total_ratio > 0:
+                for scene, ratio in scene_ratios.items():
+                    quota = int(waypoint_num * ratio / total_ratio)
+                    scene_quotas[scene] = quota
+                    scene_used[scene] = 0
+                
+                # 处理舍入误差：将剩余配额分配给比例最高的场景
+                allocated = sum(scene_quotas.values())
+                if allocated < waypoint_num:
+                    max_ratio_scene = max(scene_ratios.items(), key=lambda x: x[1])[0]
+                    scene_quotas[max_ratio_scene] += (waypoint_num - allocated)
+        
+        selected = []
+        remaining = candidates.copy()
+        current_point = start_point
+        distance_limit_enabled = min_adj_km > 0 or max_adj_km < float('inf') or non_adj_min > 0
+        
+        while len(selected) < waypoint_num and remaining:
+            best_candidate = None
+            best_distance = float('inf')
+            
+            for candidate in remaining:
+                # 检查场景配额
+                if scene_quotas:
+                    candidate_scene = candidate.get('scene', '未分类')
+                    if candidate_scene in scene_quotas:
+                        if scene_used.get(candidate_scene, 0) >= scene_quotas[candidate_scene]:
+                            continue  # 该场景配额已满，跳过
+                    # 如果候选点的场景不在配额中，也跳过（只选择配置的场景）
+                    elif candidate_scene != '未分类':
+                        continue
+                
+                dist = calc_distance(current_point, candidate)
+                
+                # 检查距离约束
+                if distance_limit_enabled:
+                    # 相邻点距离约束
+                    if dist < min_adj_km or dist > max_adj_km:
+                        continue
+                    
+                    # 非相邻点距离约束
+                    if non_adj_min > 0 and len(selected) > 0:
+                        valid = True
+                        for wp in selected[:-1] if len(selected) > 1 else []:
+                            if calc_distance(wp, candidate) < non_adj_min:
+                                valid = False
+                                break
+                        if not valid:
+                            continue
+                
+                # 贪心选择：选最近的
+                if dist < best_distance:
+                    best_distance = dist
+                    best_candidate = candidate
+            
+            if best_candidate:
+                selected.append(best_candidate)
+                remaining.remove(best_candidate)
+                current_point = best_candidate
+                
+                # 更新场景使用计数
+                if scene_quotas:
+                    candidate_scene = best_candidate.get('scene', '未分类')
+                    if candidate_scene in scene_used:
+                        scene_used[candidate_scene] += 1
+            else:
+                # 没有满足约束的点
+                if scene_quotas:
+                    # 在场景约束下没有找到满足条件的点，尝试放宽场景约束
+                    fallback_candidates = []
+                    for p in remaining:
+                        p_scene = p.get('scene', '未分类')
+                        # 允许选择未满配额的场景
+                        if p_scene in scene_quotas and scene_used.get(p_scene, 0) < scene_quotas[p_scene]:
+                            fallback_candidates.append(p)
+                    
+                    if fallback_candidates:
+                        fallback = min(fallback_candidates, 
+                                      key=lambda p: calc_distance(current_point, p))
+                        selected.append(fallback)
+                        remaining.remove(fallback)
+                        current_point = fallback
+                        
+                        fallback_scene = fallback.get('scene', '未分类')
+                        if fallback_scene in scene_used:
+                            scene_used[fallback_scene] += 1
+                    else:
+                        break  # 所有场景配额都已用完
+                else:
+                    # 没有场景约束，放宽距离条件选择最近的
+                    if remaining:
+                        fallback = min(remaining, 
+                                      key=lambda p: calc_distance(current_point, p))
+                        selected.append(fallback)
+                        remaining.remove(fallback)
+                        current_point = fallback
+                    else:
+                        break
+        
+        return selected
+
+    def select_optimal_waypoints(self, start_point, end_point, waypoint_num, available_points, moving_left=True):
+        """智能选择最优的途径点 - 空间排序 + 贪心算法 + 场景比例约束
+        
+        算法流程：
+        1. 空间排序：根据用户选择的算法对候选点进行空间排序
+        2. 场景比例：根据用户设置的场景比例分配各场景的途径点数量
+        3. 贪心优化：从起点出发，每次选择最近的未访问点（在场景配额内），压缩路线长度
+        4. 距离约束：检查相邻点和非相邻点的距离约束
+        
+        Args:
+            available_points: 路线生成会话提供的可用地点（已排除已使用的点）
+        """
+        # 从UI获取距离配置
+        self.get_distance_config_from_ui()
+        config = self.route_config
+        
+        # 获取空间排序算法类型
+        sort_type = self._get_spatial_sort_type()
+        sort_name_map = {
+            "clockwise": "顺时针",
+            "counterclockwise": "逆时针", 
+            "coordinate": "坐标轴(北→南)",
+            "radial": "放射状(近→远)",
+            "morton": "Morton码"
+        }
+        sort_name = sort_name_map.get(sort_type, sort_type)
+        
+        self.update_api_response(f"\n🔍 开始选择 {waypoint_num} 个途径点")
+        self.update_api_response(f"📋 起点: {start_point['name']}")
+        self.update_api_response(f"📋 终点: {end_point['name']}")
+        self.update_api_response(f"📋 候选点总数: {len(self.valid_locations)}")
+        
+        # 显示场景比例设置
+        if self.scene_ratios:
+            self.update_api_response(f"🎭 场景比例约束: 已启用")
+            for scene, ratio in self.scene_ratios.items():
+                count = int(waypoint_num * ratio / 100)
+                self.update_api_response(f"   - {scene}: {ratio}% ({count}个点)")
+        else:
+            self.update_api_response(f"🎲 场景比例: 随机分配（不限制）")
+        
+        # 距离约束参数（从UI获取，0或inf表示不限制）
+        min_adj_km = config.get('between_waypoint_min', 0)
+        max_adj_km = config.get('between_waypoint_max', float('inf'))
+        non_adj_min = config.get('non_adjacent_min', 0)
+        
+        # 判断是否启用距离限制
+        distance_limit_enabled = min_adj_km > 0 or max_adj_km < float('inf') or non_adj_min > 0
+        
+        if distance_limit_enabled:
+            adj_min_str = f"{min_adj_km*1000:.0f}m" if min_adj_km > 0 else "不限"
+            adj_max_str = f"{max_adj_km*1000:.0f}m" if max_adj_km < float('inf') else "不限"
+            non_adj_str = f">{non_adj_min*1000:.0f}m" if non_adj_min > 0 else "不限"
+            self.update_api_response(f"📊 距离约束: 相邻点{adj_min_str}-{adj_max_str}, 非相邻点{non_adj_str}")
+        else:
+            self.update_api_response(f"📊 距离约束: 未启用")
+        
+        # 获取距离计算方式
+        use_amap_distance = self._get_distance_calc_mode() == "amap"
+        if use_amap_distance:
+            self.update_api_response(f"🚗 使用高德导航距离计算(精准但较慢)")
+            calc_distance = self.get_driving_distance
+        else:
+            self.update_api_response(f"📍 使用Haversine直线距离计算(快速)")
+            calc_distance = self.calculate_distance_between_points
+        
+        # 筛选候选点：排除起终点（已使用点和无坐标点已由会话排除）
+        endpoint_keys = {location_key(start_point), location_key(end_point)}
+        candidates = []
+        for point in available_points:
+            if location_key(point) in endpoint_keys:
+                continue
+            candidates.append(point.copy())  # 使用副本避免修改原数据
+        
+        self.update_api_response(f"🔢 可用候选点: {len(candidates)}")
+        
+        if len(candidates) == 0:
+            self.update_api_response("⚠️ 没有可用的候选途径点")
+            return []
+        
+        # Step 1: 空间排序（确定点的基础顺序）
+        self.update_api_response(f"📐 执行算法排序: {sort_name}...")
+        sorted_candidates = self.apply_spatial_sort(candidates, sort_type, start_point)
+        
+        # 显示排序后的前几个点
+        if sorted_candidates:
+            preview = [p['name'] for p in sorted_candidates[:5]]
+            self.update_api_response(f"   排序后前5点: {' → '.join(preview)}...")
+        
+        # Step 2: 贪心算法优化（压缩路线长度 + 场景比例约束）
+        selected_waypoints = self.greedy_optimize_route(
+            start_point=start_point,
+            candidates=sorted_candidates,
+            waypoint_num=waypoint_num,
+            min_adj_km=min_adj_km,
+            max_adj_km=max_adj_km,
+            non_adj_min=non_adj_min,
+            calc_distance=calc_distance,
+            scene_ratios=self.scene_ratios  # 传入场景比例配置
+        )
+        
+        # 输出选中的途径点
+        current_point = start_point
+        scene_stats = {}  # 统计各场景选中的点数
+        for i, wp in enumerate(selected_waypoints):
+            dist = calc_distance(current_point, wp)
+            scene = wp.get('scene', '未分类')
+            scene_stats[scene] = scene_stats.get(scene, 0) + 1
+            self.update_api_response(f"   ✅ 第{i+1}个途径点: {wp['name']} [{scene}] (距{dist*1000:.0f}m)")
+            current_point = wp
+        
+        # 输出场景统计
+        if scene_stats and self.scene_ratios:
+            self.update_api_response(f"🎭 场景分布统计:")
+            for scene, count in scene_stats.items():
+                percentage = (count / len(selected_waypoints) * 100) if selected_waypoints else 0
+                target_pct = self.scene_ratios.get(scene, 0)
+                status = "✅" if abs(percentage - target_pct) < 10 else "⚠️"
+                self.update_api_response(f"   {status} {scene}: {count}个 ({percentage:.1f}%, 目标{target_pct}%)")
+        
+        # 检查最后一个途径点与终点的距离
+        if selected_waypoints and distance_limit_enabled:
+            last_wp = selected_waypoints[-1]
+            dist_to_end = calc_distance(last_wp, end_point)
+            if min_adj_km > 0 and dist_to_end < min_adj_km:
+                self.update_api_response(f"   ⚠️ 最后途径点距终点{dist_to_end*1000:.0f}m < 最小限制{min_adj_km*1000:.0f}m")
+            elif max_adj_km < float('inf') and dist_to_end > max_adj_km:
+                self.update_api_response(f"   ⚠️ 最后途径点距终点{dist_to_end*1000:.0f}m > 最大限制{max_adj_km*1000:.0f}m")
+            else:
+                self.update_api_response(f"   ✅ 最后途径点距终点{dist_to_end*1000:.0f}m")
+        
+        self.update_api_response(f"📌 最终选择的途径点: {len(selected_waypoints)}个")
+        
+        if len(selected_waypoints) < waypoint_num:
+            self.update_api_response(f"⚠️ 警告：只找到 {len(selected_waypoints)}/{waypoint_num} 个途径点")
+        
+        return selected_waypoints
+    
+    def generate_navigation_url(self, start_point, end_point, waypoints):
+        """生成高德导航链接"""
+        try:
+            base_url = "https://ditu.amap.com/dir?type=car&policy=1"
+            
+            start_lnglat = f"{start_point['lon']},{start_point['lat']}"
+            base_url += f"&from[lnglat]={start_lnglat}"
+            base_url += f"&from[name]={quote(start_point['name'])}"
+            
+            end_lnglat = f"{end_point['lon']},{end_point['lat']}"
+            base_url += f"&to[lnglat]={end_lnglat}"
+            base_url += f"&to[name]={quote(end_point['name'])}"
+            
+            for i, point in enumerate(waypoints):
+                wp_lnglat = f"{point['lon']},{point['lat']}"
+                base_url += f"&via[{i}][lnglat]={wp_lnglat}"
+                base_url += f"&via[{i}][name]={quote(point['name'])}"
+                
+            return base_url
+        except Exception as e:
+            self.update_api_response(f"❌ 生成导航链接错误: {str(e)}")
+            logger.error(f"生成导航链接错误: {str(e)}")
+            return None
+    
+    def get_driving_route(self, start, end, waypoints):
+        """获取驾驶路线 - 使用高德地图v5驾车路径规划API
+        返回: (points, road_types, road_names, turn_points) 或 (None, None, None, None)
+        """
+        _lazy_import_requests()
+        # 从密钥池获取密钥（按限流等待），失败时最多尝试与密钥数相同的次数
+        key_pool = self._get_key_pool()
+        throttled = 0
+        
+        for _ in range(self._key_attempts()):
+            current_key = self._acquire_key()
+            if current_key is None:
+                break
+            key_index = key_pool.key_number(current_key) - 1
+            try:
+                origin = f"{start['lon']},{start['lat']}"
+                destination = f"{end['lon']},{end['lat']}"
+                
+                # 途径点格式：经度1,纬度1|经度2,纬度2（v5 API使用|分隔）
+                waypoint_str = ""
+                if waypoints:
+                    waypoint_str = "|".join([f"{wp['lon']},{wp['lat']}" for wp in waypoints])
+                
+                # 使用高德地图v5驾车路径规划API
+                route_url = "https://restapi.amap.com/v5/direction/driving"
+                
+                # 获取当前选择的路线策略
+                strategy = getattr(self, 'route_strategy', 34)  # 默认走高速
+                
+                params = {
+                    'origin': origin,
+                    'destination': destination,
+                    'key': current_key,
+                    'strategy': strategy,  # 路线策略：34走高速、35不走高速、37大路优先
+                    'show_fields': 'polyline',  # 返回路线坐标点
+                    'extensions': 'all'  # 请求详细信息，包括转向指令
+                }
+                
+                # 只有当有途径点时才添加waypoints参数
+                if waypoint_str:
+                    params['waypoints'] = waypoint_str
+                
+                response = requests.get(route_url, params=params, timeout=15)
+                data = response.json()
+                
+                # v5 API响应格式
+                if data.get('status') == '1' and data.get('route'):
+                    route = data['route']
+                    points = []
+                    road_types = []
+                    road_names = []
+                    turn_points = []
+                    
+                    # 转向统计
+                    global_turn_index = 0
+                    left_turn_index = 0
+                    right_turn_index = 0
+                    uturn_index = 0
+                    
+                    # v5 API的路径数据结构
+                    paths = route.get('paths', [])
+                    for path in paths:
+                        steps = path.get('steps', [])
+                        for i, step in enumerate(steps):
+                            polyline = step.get('polyline', '')
+                            road_name = step.get('road', '未知道路')
+                            road_type = step.get('road_type', '0')  # 道路类型
+                            
+                            # 解析转向指令
+                            action = str(step.get("action", "") or "")
+                            assistant_action = str(step.get("assistant_action", "") or "")
+                            instruction = str(step.get("instruction", "") or "")
+                            action_text = action + assistant_action + instruction
+                            
+                            turn_type = None
+                            if ("掉头" in action_text) or ("调头" in action_text):
+                                turn_type = "uturn"
+                            elif "左转" in action_text:
+                                turn_type = "left"
+                            elif "右转" in action_text:
+                                turn_type = "right"
+                            
+                            # 添加坐标点
+                            polyline_points = []
+                            if polyline:
+                                for point in polyline.split(';'):
+                                    if point:
+                                        lon, lat = point.split(',')
+                                        points.append([float(lat), float(lon)])
+                                        polyline_points.append(point)
+                                        road_types.append(road_type)
+                                        road_names.append(road_name)
+                            
+                            # 处理转向点
+                            if turn_type and polyline_points:
+                                global_turn_index += 1
+                                try:
+                                    # 使用当前step的终点作为转向位置
+                                    turn_point = polyline_points[-1]
+                                    lon_mid, lat_mid = map(float, turn_point.split(","))
+                                    
+                                    # 获取前后道路名称
+                                    prev_name = ""
+                                    if i > 0:
+                                        prev_name = str(steps[i - 1].get("road", "") or "").strip()
+                                    curr_name = road_name.strip()
+                                    next_name = ""
+                                    if i + 1 < len(steps):
+                                        next_name = str(steps[i + 1].get("road", "") or "").strip()
+                                    
+                                    from_road_name = ""
+                                    to_road_name = ""
+                                    
+                                    # 确定转向的起止道路
+                                    if curr_name and next_name and curr_name != next_name:
+                                        from_road_name = curr_name
+                                        to_road_name = next_name
+                                    elif prev_name and curr_name and prev_name != curr_name:
+                                        from_road_name = prev_name
+                                        to_road_name = curr_name
+                                    elif prev_name and next_name and prev_name != next_name:
+                                        from_road_name = prev_name
+                                        to_road_name = next_name
+                                    else:
+                                        from_road_name = prev_name or curr_name
+                                        to_road_name = next_name or curr_name
+                                    
+                                    # 过滤主路/辅路切换
+                                    def _base_name(name: str) -> str:
+                                        return name.replace("辅路", "").strip()
+                                    
+                                    base_from = _base_name(from_road_name)
+                                    base_to = _base_name(to_road_name)
+                                    if base_from and base_from == base_to:
+                                        continue
+                                    
+                                    # 根据转向类型更新计数
+                                    if turn_type == "left":
+                                        left_turn_index += 1
+                                        type_idx = left_turn_index
+                                    elif turn_type == "right":
+                                        right_turn_index += 1
+                                        type_idx = right_turn_index
+                                    else:  # uturn
+                                        uturn_index += 1
+                                        type_idx = uturn_index
+                                    
+                                    turn_points.append({
+                                        "lon": lon_mid,
+                                        "lat": lat_mid,
+                                        "type": turn_type,
+                                        "index": global_turn_index,
+                                        "type_index": type_idx,
+                                        "from_road": from_road_name,
+                                        "to_road": to_road_name,
+                                    })
+                                except Exception as e:
+                                    logger.debug(f"解析转向点错误: {e}")
+                    
+                    if points:
+                        self.update_api_response(
+                            f"✅ 使用密钥{key_index + 1}成功获取驾驶路线，"
+                            f"共{len(points)}个坐标点，{len(turn_points)}个转向点"
+                        )
+                        return points, road_types, road_names, turn_points
+                else:
+                    error_info = data.get('info', '未知错误')
+                    error_code = data.get('infocode', '')
+                    self.update_api_response(f"⚠️ 密钥{key_index + 1}请求失败: {error_info} (错误码: {error_code})")
+                    
+                    # 被限流时退避后重试；如果是密钥问题，标记后尝试下一个密钥
+                    if error_code in ApiKeyPool.RATE_LIMIT_CODES and throttled < ApiKeyPool.THROTTLE_RETRIES:
+                        throttled += 1
+                        self._back_off_key(current_key, throttled)
+                        continue
+                    if error_code in ApiKeyPool.KEY_ERROR_CODES:
+                        key_pool.mark_exhausted(current_key)
+                        continue
+                    
+            except requests.exceptions.Timeout:
+                self.update_api_response(f"⚠️ 密钥{key_index + 1}请求超时，尝试下一个密钥")
+                continue
+            except Exception as e:
+                logger.error(f"获取驾驶路线错误 (密钥{key_index + 1}): {str(e)}")
+                self.update_api_response(f"❌ 密钥{key_index + 1}获取路线错误: {str(e)}")
+                continue
+        
+        self.update_api_response("❌ 所有密钥均无法获取驾驶路线")
+        return None, None, None, None
+    
+    # # 路线策略选择变更（已注释）
+    # def on_strategy_changed(self, index):
+    #     """路线策略选择变更"""
+    #     if hasattr(self, 'strategy_combo'):
+    #         self.route_strategy = self.strategy_combo.currentData()
+    #         strategy_name = self.strategy_combo.currentText()
+    #         self.update_api_response(f"🛣️ 路线策略已切换为: {strategy_name} (strategy={self.route_strategy})")
+    
+    # ---------------- 真实路线获取 ----------------
+
+    def _get_polyline_cache(self):
+        """真实路线缓存（宿主未设置 polyline_cache 时使用仅内存缓存）"""
+        if getattr(self, 'polyline_cache', None) is None:
+            self.polyline_cache = PolylineCache()
+        return self.polyline_cache
+
+    def _fetch_route_polyline(self, route):
+        """获取单条路线的真实驾车路线（优先读缓存），失败返回 None"""
+        waypoints = route.get('waypoint_details', [])
+        strategy = getattr(self, 'route_strategy', 34)
+        cache = self._get_polyline_cache()
+        key = cache.make_key(strategy, _route_points(route))
+
+        entry = cache.get(key)
+        if entry is None:
+            points, road_types, road_names, turn_points = self.get_driving_route(
+                route['start_point'], route['end_point'], waypoints
+            )
+            if not points:
+                return None
+            driving_distance = sum(
+                self.calculate_distance(lat1, lon1, lat2, lon2)
+                for (lat1, lon1), (lat2, lon2) in zip(points, points[1:])
+            ) / 1000
+            entry = {
+                'real_points': points,
+                'road_types': road_types,
+                'road_names': road_names,
+                'turn_points': turn_points,
+                'driving_distance': round(driving_distance, 2),
+            }
+            cache.put(key, entry)
+        # 路线坐标加入离线道路线段库（real_points 为 [纬度, 经度]）
+        self._get_road_segment_store().add_polyline(
+            [(lon, lat) for lat, lon in entry['real_points']], entry.get('road_names')
+        )
+        return entry
+
+    def fetch_route_polylines(self, routes=None, max_workers=4, generation=None):
+        """并发获取路线的真实驾车路线，每获取到一条就替换该路线的直线路径
+
+        请求通过密钥池限流，线程数不超过 max_workers。再次调用（重新生成路线）时，
+        上一批尚未开始的请求会被取消，已过期的结果不再写回。generation 为调用方已登记的批次号，
+        不传时在这里登记新批次。
+
+        Returns:
+            成功替换的路线数
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        routes = list(self.route_data if routes is None else routes)
+        if generation is None:
+            self._polyline_generation = getattr(self, '_polyline_generation', 0) + 1
+            generation = self._polyline_generation
+        if not routes:
+            return 0
+
+        fetch_start = time.time()
+        fetched = 0
+        total_distance = 0
+        self.update_api_response(f"🛣️ 开始获取 {len(routes)} 条路线的真实驾车路线（{max_workers} 个线程）")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._fetch_route_polyline, route): route for route in routes}
+            for done, future in enumerate(as_completed(futures), 1):
+                if self._polyline_generation != generation:
+                    for pending in futures:
+                        pending.cancel()
+                    self.update_api_response("⚠️ 路线已重新生成，停止获取上一批真实路线")
+                    return fetched
+
+                route = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    logger.error(f"获取路线 {route['route_id']} 真实路线失败: {str(e)}")
+                    entry = None
+
+                if entry:
+                    route.update(entry)
+                    fetched += 1
+                    total_distance += entry['driving_distance']
+                    self.update_api_response(f"   路线 {route['route_id']}: 驾车里程 {entry['driving_distance']} 公里")
+                self._safe_update_status(
+                    f"真实路线 {done}/{len(routes)}（成功 {fetched} 条，总里程 {total_distance:.2f} 公里）", "blue"
+                )
+
+        self._get_road_segment_store().save()
+        self.update_api_response(
+            f"✅ 真实路线获取完成: {fetched}/{len(routes)} 条，"
+            f"总里程 {total_distance:.2f} 公里，用时 {time.time() - fetch_start:.1f} 秒"
+        )
+        return fetched
+
+    def start_polyline_fetch(self, routes=None, max_workers=4):
+        """在后台线程中获取真实驾车路线，不阻塞界面；完成后重新保存路线文件并刷新地图"""
+        self._polyline_generation = getattr(self, '_polyline_generation', 0) + 1
+        generation = self._polyline_generation
+        self.polyline_fetch_running = True
+        thread = threading.Thread(target=self._run_polyline_fetch,
+                                  args=(routes, max_workers, generation), daemon=True)
+        thread.start()
+        return thread
+
+    def _run_polyline_fetch(self, routes, max_workers, generation):
+        """后台线程：获取真实路线，本批未被新一批取代时写回路线文件和地图"""
+        try:
+            fetched = self.fetch_route_polylines(routes, max_workers, generation)
+            if fetched and self._polyline_generation == generation:
+                self.refresh_routes_after_polyline_fetch()
+        except Exception as e:
+            logger.error(f"获取真实路线失败: {str(e)}", exc_info=True)
+            self.update_api_response(f"❌ 获取真实路线失败: {str(e)}")
+        finally:
+            if self._polyline_generation == generation:
+                self.polyline_fetch_running = False
+                self._safe_set_button_enabled('fetch_polyline_btn', True)
+
+    def refresh_routes_after_polyline_fetch(self):
+        """真实路线写回后，覆盖保存本次生成的 Excel/JSON（带驾车里程）并重新生成路线地图"""
+        if getattr(self, 'last_generated_routes', None):
+            self._auto_save_files_to_program_dir(getattr(self, 'last_export_timestamp', None))
+            self.update_api_response("💾 路线文件已按真实路线重新保存")
+        if self.generate_realistic_route_map(getattr(self, 'combined_map_path', None)):
+            self.update_api_response(f"🗺️ 路线地图已按真实路线更新: {self.combined_map_path}")
+
+    def generate_simple_route(self, start_point, end_point, waypoints):
+        """当无法从API获取路线时，生成简单的直线路径"""
+        points = [[start_point['lat'], start_point['lon']]]
+        
+        for wp in waypoints:
+            points.append([wp['lat'], wp['lon']])
+        
+        points.append([end_point['lat'], end_point['lon']])
+        
+        return points
+    
+    def _build_route_info(self, route_num, start_point, end_point, waypoints):
+        """根据起点、终点和途径点组装路线数据（导航链接 + 简化直线路径）"""
+        nav_url = self.generate_navigation_url(start_point, end_point, waypoints)
+        if not nav_url:
+            self.update_api_response(f"❌ 路线 {route_num} 生成导航链接失败")
+            return None
+        
+        # 使用简化路线（不再调用驾驶路线API获取详细信息）
+        waypoint_coords = [{"lat": wp["lat"], "lon": wp["lon"]} for wp in waypoints]
+        real_points = self.generate_simple_route(start_point, end_point, waypoint_coords)
+        
+        return {
+            'route_id': route_num,
+            'start_point': start_point,
+            'end_point': end_point,
+            'waypoints': '; '.join([wp['name'] for wp in waypoints]),
+            'navigation_url': nav_url,
+            'real_points': real_points if real_points else [],
+            'road_types': [],
+            'road_names': [],
+            'turn_points': [],
+            'waypoint_details': [{'name': wp['name'], 'lat': wp['lat'], 'lon': wp['lon']} for wp in waypoints],
+            'straight_distance': self.calculate_distance_between_points(start_point, end_point),
+            'waypoint_count': len(waypoints)
+        }
+    
+    def generate_route(self, route_num, waypoint_num, existing_routes=None, session=None):
+        """【改进版】生成一条测试路线 - 空间排序 + 贪心算法
+        
+        起点设置模式：
+        1. 自动模式：选择所有地点的质心（中心点）
+        2. 手动-当前位置：使用用户当前位置（需定位）
+        3. 手动-指定序号：使用用户指定的地点序号
+        
+        多路线串联：后续路线起点承接上一条路线的终点
+        
+        session: 路线生成会话，未传入时根据 existing_routes 重建
+        """
+        if existing_routes is None:
+            existing_routes = []
+        if session is None:
+            session = RouteGenerationSession.from_routes(self.valid_locations, existing_routes)
+        
+        if len(self.valid_locations) < 2:
+            self.update_api_response("❌ 错误: 有效地点数量不足，无法生成路线")
+            return None
+        
+        # 获取目标里程范围
+        distance_range = self.get_target_distance_range()
+        
+        start_point = None
+        end_point = None
+        straight_distance = 0
+        
+        # 获取空间排序算法
+        sort_type = self._get_spatial_sort_type()
+
+        # 确定起点
+        # 当用户选择"从收藏中选择"作为起点时，每条路线都使用该收藏点作为起点
+        if self.start_point_mode == "saved" and self.manual_start_coords:
+            # 用户选择了收藏点作为起点，所有路线都使用该收藏点
+            lon = self.manual_start_coords.get('lon')
+            lat = self.manual_start_coords.get('lat')
+            name = self.manual_start_coords.get('name', '收藏点')
+            if lon is not None and lat is not None:
+                start_point = {
+                    'name': name,
+                    'lon': lon,
+                    'lat': lat,
+                    'scene': '收藏点'
+                }
+                self.update_api_response(f"📍 路线 {route_num}: 使用收藏点作为起点 ({name})")
+            else:
+                # 收藏点数据不完整，回退到自动模式
+                start_point = self.select_start_point()
+                self.update_api_response(f"⚠️ 路线 {route_num}: 收藏点数据不完整，使用自动选择起点")
+        elif existing_routes:
+            # 后续路线：起点直接承接上一条路线的终点（避免全局绕路）
+            prev_route = existing_routes[-1]
+            start_point = prev_route['end_point']
+            self.update_api_response(f"🔗 路线 {route_num}: 起点承接自路线 {prev_route['route_id']} 的终点 ({start_point['name']})")
+        else:
+            # 第一条路线：根据起点模式选择
+            start_point = self.select_start_point()
+            mode_text = {
+                "auto": "自动（质心）",
+                "current_location": "当前位置",
+                "specified": f"指定序号 {self.specified_start_index}",
+                "saved": "收藏点"
+            }.get(self.start_point_mode, "自动")
+            self.update_api_response(f"🚩 路线 {route_num}: 起点模式 [{mode_text}] ({start_point['name']})")
+        
+        # 可用点直接取自会话索引（已排除已使用的点），再排除本条路线的起点
+        available_points = session.available_points(exclude=[start_point])
+        
+        if len(available_points) == 0:
+            self.update_api_response(f"❌ 路线 {route_num}: 没有可用的终点")
+            return None
+        
+        # 应用空间排序对可用点进行排序
+        sorted_available = self.apply_spatial_sort(available_points, sort_type, start_point)
+        
+        # 改进：先选择途经点，再基于最后一个途经点选择终点
+        # 这样可以避免终点离最后一个途经点过远
+        
+        waypoints = []
+        temp_endpoint = None
+        
+        if waypoint_num > 0:
+            # 先选择途经点，但不指定终点，让算法自由选择
+            # 使用一个临时终点（排序后的最后一个点）
+            temp_endpoint = sorted_available[-1] if sorted_available else available_points[0]
+            
+            waypoints = self.select_optimal_waypoints(
+                start_point, temp_endpoint, waypoint_num, available_points
+            )
+            
+            if len(waypoints) < waypoint_num:
+                self.update_api_response(f"⚠️ 警告：只找到 {len(waypoints)}/{waypoint_num} 个途径点")
+        
+        # 现在选择终点：从最后一个实际点（起点或最后一个途经点）出发
+        last_actual_point = waypoints[-1] if waypoints else start_point
+        
+        # 重新筛选可用终点（排除已用作途经点的）
+        waypoint_keys = {location_key(wp) for wp in waypoints}
+        available_endpoints = [p for p in sorted_available if location_key(p) not in waypoint_keys]
+        
+        if not available_endpoints:
+            self.update_api_response(f"❌ 路线 {route_num}: 没有可用的终点")
+            return None
+
+        # 优先处理用户选择的收藏点终点（saved模式）
+        # 当用户选择"从收藏中选择"作为终点时，每条路线都使用该收藏点作为终点
+        if self.end_point_mode == "saved" and self.manual_end_coords:
+            lon = self.manual_end_coords.get('lon')
+            lat = self.manual_end_coords.get('lat')
+            name = self.manual_end_coords.get('name', '收藏点')
+            if lon is not None and lat is not None:
+                end_point = {
+                    'name': name,
+                    'lon': lon,
+                    'lat': lat,
+                    'scene': '收藏点'
+                }
+                dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
+                straight_distance = self.calculate_distance_between_points(start_point, end_point)
+                self.update_api_response(f"🏁 路线 {route_num}: 使用收藏点作为终点 ({name})")
+            else:
+                # 收藏点数据不完整，使用自动选择
+                self.update_api_response(f"⚠️ 路线 {route_num}: 收藏点数据不完整，使用自动选择终点")
+                end_point = available_endpoints[0]
+                dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
+                straight_distance = self.calculate_distance_between_points(start_point, end_point)
+        elif self.end_point_mode == "same_as_start":
+            # 闭环路线：终点与起点相同
+            end_point = start_point
+            dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
+            straight_distance = 0
+            self.update_api_response(f"🔄 路线 {route_num}: 闭环路线，终点与起点相同 ({end_point['name']})")
+        else:
+            # 其他模式：使用原有的终点选择逻辑
+            user_selected_endpoint = self.select_end_point(start_point, available_endpoints)
+
+            if user_selected_endpoint:
+                # 用户指定了终点（同起点或指定序号）
+                end_point = user_selected_endpoint
+                dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
+                straight_distance = self.calculate_distance_between_points(start_point, end_point)
+            else:
+                # 自动选择终点：从最后一个实际点出发选择合适的终点
+                if distance_range:
+                    min_dist, max_dist = distance_range
+                    straight_min = min_dist / 1.5
+                    straight_max = max_dist / 1.2
+
+                    # 计算已经累积的距离
+                    accumulated_dist = 0
+                    if waypoints:
+                        current = start_point
+                        for wp in waypoints:
+                            accumulated_dist += self.calculate_distance_between_points(current, wp)
+                            current = wp
+
+                    # 计算还需要多少距离才能达到目标
+                    remaining_min = max(0, straight_min - accumulated_dist)
+                    remaining_max = straight_max - accumulated_dist
+
+                    # 在可用终点中找符合距离的
+                    valid_endpoints = []
+                    for p in available_endpoints:
+                        dist = self.calculate_distance_between_points(last_actual_point, p)
+                        if remaining_min <= dist <= remaining_max:
+                            valid_endpoints.append((p, dist))
+
+                    if valid_endpoints:
+                        # 选择距离适中的点作为终点（优先选择距离较近的）
+                        valid_endpoints.sort(key=lambda x: x[1])
+                        end_point, dist_to_end = valid_endpoints[len(valid_endpoints)//2]  # 选中间的
+                    else:
+                        # 没有符合距离的，选择距离最接近目标的点
+                        target_dist = (remaining_min + remaining_max) / 2
+                        end_point = min(available_endpoints,
+                                       key=lambda p: abs(self.calculate_distance_between_points(last_actual_point, p) - target_dist))
+                        dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
+                else:
+                    # 没有目标里程，智能选择终点：基于已有途经点的平均距离
+                    endpoint_distances = [(p, self.calculate_distance_between_points(last_actual_point, p))
+                                         for p in available_endpoints]
+                    endpoint_distances.sort(key=lambda x: x[1])
+
+                    # 计算已有路线的平均相邻点距离
+                    if waypoints and len(waypoints) > 0:
+                        all_points = [start_point] + waypoints
+                        total_dist = 0
+                        for i in range(len(all_points) - 1):
+                            total_dist += self.calculate_distance_between_points(all_points[i], all_points[i+1])
+                        avg_adjacent_dist = total_dist / len(all_points) if len(all_points) > 1 else 5.0  # 默认5km
+
+                        # 终点距离应该在平均距离的0.5-2倍之间，保持路线连贯性
+                        min_reasonable = avg_adjacent_dist * 0.5
+                        max_reasonable = avg_adjacent_dist * 2.0
+
+                        self.update_api_response(f"   📊 平均相邻距离: {avg_adjacent_dist*1000:.0f}m, 终点范围: {min_reasonable*1000:.0f}-{max_reasonable*1000:.0f}m")
+
+                        # 在合理范围内选择终点
+                        reasonable_endpoints = [(p, d) for p, d in endpoint_distances
+                                               if min_reasonable <= d <= max_reasonable]
+
+                        if reasonable_endpoints:
+                            # 有合理距离的点，选择靠前1/3的点（较近但不是最近）
+                            target_idx = len(reasonable_endpoints) // 3
+                            end_point, dist_to_end = reasonable_endpoints[target_idx]
+                            self.update_api_response(f"   ✅ 在合理范围内选择第{target_idx+1}个候选点")
+                        else:
+                            # 没有合理范围内的点，选择最接近平均距离的点
+                            target_dist = avg_adjacent_dist
+                            end_point, dist_to_end = min(endpoint_distances,
+                                                        key=lambda x: abs(x[1] - target_dist))
+                            self.update_api_response(f"   ⚠️ 无合理范围点，选择最接近平均距离的点")
+                    else:
+                        # 没有途经点，使用保守策略：选择前1/3距离的点（较近）
+                        max_idx = max(1, len(endpoint_distances) // 3)
+                        end_point, dist_to_end = endpoint_distances[max_idx]
+                        self.update_api_response(f"   ℹ️ 无途经点参考，选择较近的终点(第{max_idx+1}/{len(endpoint_distances)}个)")
+        
+        straight_distance = self.calculate_distance_between_points(start_point, end_point)
+        
+        self.update_api_response(
+            f"📍 路线 {route_num}: 起点[{start_point['name']}] → 终点[{end_point['name']}] "
+            f"(直线距离: {straight_distance:.2f}km, 最后一点到终点: {dist_to_end*1000:.0f}m)")
+        
+        if waypoints:
+            waypoint_dists = []
+            prev_point = start_point
+            for wp in waypoints:
+                dist = self.calculate_distance_between_points(prev_point, wp)
+                waypoint_dists.append(f"{wp['name']}({dist*1000:.0f}m)")
+                prev_point = wp
+
+            self.update_api_response(
+                f"   └─ 途径点: {' → '.join(waypoint_dists)}"
+            )
+        
+        route_info = self._build_route_info(route_num, start_point, end_point, waypoints)
+        if not route_info:
+            return None
+        
+        # 验证途径点距离是否满足要求
+        if waypoints:
+            self.check_route_distances(start_point, waypoints, end_point)
+        
+        if self.is_route_duplicate(route_info, existing_routes):
+            self.update_api_response(f"⏭️ 路线 {route_num} 已被过滤（与现有路线过于相似）")
+            return None
+        
+        self.update_api_response(f"✅ 路线 {route_num} 已成功生成（包含 {len(waypoints)} 个途径点）")
+        return route_info
+    
+    def check_route_distances(self, start_point, waypoints, end_point):
+        """检查并输出路线各段距离（相邻点最小/最大距离、不相邻点最小距离）
+
+        Returns:
+            超出距离限制的项数
+        """
+        config = self.route_config
+        min_adj_km = config.get('between_waypoint_min', 0)
+        max_adj_km = config.get('between_waypoint_max', float('inf'))
+        non_adj_min = config.get('non_adjacent_min', 0)
+        
+        # 判断是否启用距离限制
+        distance_limit_enabled = min_adj_km > 0 or max_adj_km < float('inf') or non_adj_min > 0
+        
+        all_points = [start_point] + waypoints + [end_point]
+        violations = 0
+        
+        self.update_api_response(f"📏 途径点距离信息...")
+        for i in range(len(all_points) - 1):
+            dist = self.calculate_distance_between_points(all_points[i], all_points[i+1])
+            self.update_api_response(f"   {all_points[i]['name']} → {all_points[i+1]['name']}: {dist*1000:.0f}m")
+            if distance_limit_enabled:
+                if min_adj_km > 0 and dist < min_adj_km:
+                    violations += 1
+                    self.update_api_response(f"   ⚠️ 相邻点距离{dist*1000:.0f}m < 最小限制{min_adj_km*1000:.0f}m")
+                if max_adj_km < float('inf') and dist > max_adj_km:
+                    violations += 1
+                    self.update_api_response(f"   ⚠️ 相邻点距离{dist*1000:.0f}m > 最大限制{max_adj_km*1000:.0f}m")
+        
+        # 检查不相邻点距离（仅在启用限制时）
+        if distance_limit_enabled and non_adj_min > 0:
+            for i in range(len(all_points)):
+                for j in range(i + 2, len(all_points)):
+                    dist = self.calculate_distance_between_points(all_points[i], all_points[j])
+                    if dist < non_adj_min:
+                        violations += 1
+                        self.update_api_response(f"   ⚠️ 不相邻点 {all_points[i]['name']} 和 {all_points[j]['name']} 距离{dist*1000:.0f}m < {non_adj_min*1000:.0f}m")
+        return violations
+    
+    def check_feasibility(self, active_locations, waypoint_num, target_route_num, plan_mode="greedy"):
+        """路线生成前的快速可行性预检，输出各场景缺口并返回检查结果"""
+        self.get_distance_config_from_ui()
+        start_from_pool = self.start_point_mode in ("auto", "specified")
+        end_from_pool = self.end_point_mode not in ("saved", "manual", "same_as_start")
+        if plan_mode == "balanced":
+            # 均衡聚类：自动模式的起终点从各自簇内选择，其余模式所有路线共用同一起终点
+            per_route = int(self.start_point_mode == "auto") + int(self.end_point_mode == "auto")
+            fixed = int(self.start_point_mode == "specified") + int(self.end_point_mode == "specified")
+            endpoint_demand = target_route_num * per_route + fixed
+        else:
+            # 贪心串联：后续路线起点承接上一条路线的终点
+            endpoint_demand = int(start_from_pool) + target_route_num * int(end_from_pool)
+
+        check_start = time.time()
+        report = check_route_feasibility(
+            active_locations, target_route_num, waypoint_num,
+            scene_ratios=self.scene_ratios,
+            between_min=self.route_config['between_waypoint_min'],
+            between_max=self.route_config['between_waypoint_max'],
+            endpoint_demand=endpoint_demand
+        )
+        status = "✅ 可行性预检通过" if report['feasible'] else "⚠️ 可行性预检未通过"
+        self.update_api_response(f"{status}（{(time.time() - check_start)*1000:.0f}ms）")
+        for line in format_feasibility_report(report):
+            self.update_api_response(f"   {line}")
+        return report
+
+    def _plan_cache_inputs(self, active_locations, waypoint_num, target_route_num, plan_mode):
+        """规划缓存的输入参数（所有会影响规划结果的设置）"""
+        self.get_distance_config_from_ui()
+        return {
+            'locations': PlanCache.locations_digest(active_locations),
+            'location_count': len(active_locations),
+            'route_config': self.route_config,
+            'scene_ratios': self.scene_ratios,
+            'sort_type': self._get_spatial_sort_type(),
+            'distance_calc': self._get_distance_calc_mode(),
+            'target_distance_range': self.get_target_distance_range(),
+            'plan_mode': plan_mode,
+            'waypoint_num': waypoint_num,
+            'route_num': target_route_num,
+            'start_point_mode': self.start_point_mode,
+            'start_coords': self.manual_start_coords if self.start_point_mode in ("manual", "saved") else None,
+            'start_index': self.specified_start_index if self.start_point_mode == "specified" else None,
+            'end_point_mode': self.end_point_mode,
+            'end_coords': self.manual_end_coords if self.end_point_mode in ("manual", "saved") else None,
+            'end_index': self.specified_end_index if self.end_point_mode == "specified" else None,
+        }
+
+    def generate_route_batch(self, active_locations, waypoint_num, target_route_num, plan_mode="greedy"):
+        """按规划模式批量生成路线，结果写入 self.route_data 并返回
+
+        设置了 plan_cache 时，相同输入直接返回缓存的规划结果（当前位置起点依赖实时定位，不缓存）。
+        只缓存达到目标路线数的规划结果，地点不足时下次仍重新规划。
+        """
+        plan_cache = getattr(self, 'plan_cache', None)
+        cache_key = None
+        if plan_cache is not None and self.start_point_mode != "current_location":
+            cache_inputs = self._plan_cache_inputs(active_locations, waypoint_num, target_route_num, plan_mode)
+            cache_key = plan_cache.make_key(cache_inputs)
+            cached_routes = plan_cache.get(cache_key)
+            # 早期版本可能缓存了路线数不足的规划，这类结果不复用
+            if cached_routes and len(cached_routes) >= target_route_num:
+                self.route_data = cached_routes
+                self.route_session = RouteGenerationSession.from_routes(active_locations, self.route_data)
+                self.plan_cache_key = cache_key
+                self.update_api_response(f"♻️ 命中路线规划缓存 {cache_key[:8]}，直接使用 {len(cached_routes)} 条已规划路线")
+                return self.route_data
+
+        self.route_data = []
+        self.route_session = RouteGenerationSession(active_locations)
+
+        if plan_mode == "balanced":
+            # 全局均衡聚类：一次性规划所有路线
+            for route in self._generate_routes_balanced(active_locations, waypoint_num, target_route_num):
+                self.route_data.append(route)
+                self.route_session.commit_route(route)
+        else:
+            failed_count = 0
+            max_failed = 10
+
+            route_id = 1
+            while len(self.route_data) < target_route_num and failed_count < max_failed:
+                route = self.generate_route(route_id, waypoint_num, self.route_data, self.route_session)
+
+                if route:
+                    self.route_data.append(route)
+                    self.route_session.commit_route(route)
+                    self._safe_update_status(
+                        f"已生成 {len(self.route_data)}/{target_route_num} 条有效路线", "blue"
+                    )
+                    failed_count = 0
+                    time.sleep(1)
+                else:
+                    failed_count += 1
+
+                route_id += 1
+
+        if cache_key and len(self.route_data) < target_route_num:
+            self.update_api_response(
+                f"ℹ️ 仅生成 {len(self.route_data)}/{target_route_num} 条路线，不写入规划缓存"
+            )
+        elif cache_key and self.route_data:
+            try:
+                plan_cache.put(cache_key, cache_inputs, self.route_data)
+                self.plan_cache_key = cache_key
+                self.update_api_response(f"💾 路线规划已缓存: {cache_key[:8]}")
+            except OSError as e:
+                logger.warning(f"保存规划缓存失败: {e}")
+        return self.route_data
+
+    def repair_routes_after_delete(self, deleted_loc):
+        """删除地点后增量修复路线
+
+        通过会话的 地点→路线 索引找到经过该地点的路线，只重新规划这些路线的途径点
+        （候选点取自未使用的地点），其余路线保持不变。被删除的地点如果是起点/终点，
+        用离它最近的未使用地点代替（串联路线共用的起终点会同时替换）。
+
+        Returns:
+            被重新规划的路线 route_id 列表
+        """
+        if not self.route_data:
+            return []
+        if self.route_session is None:
+            self.route_session = RouteGenerationSession.from_routes(self.valid_locations, self.route_data)
+        session = self.route_session
+
+        affected_ids = session.remove_point(deleted_loc)
+        if not affected_ids:
+            return []
+
+        deleted_key = location_key(deleted_loc)
+        replacement = None
+        repaired = []
+        for idx, route in enumerate(self.route_data):
+            if route['route_id'] not in affected_ids:
+                continue
+
+            session.release_route(route)
+            start_point = route['start_point']
+            end_point = route['end_point']
+
+            if deleted_key in (location_key(start_point), location_key(end_point)):
+                if replacement is None:
+                    candidates = session.available_points()
+                    if not candidates:
+                        self.update_api_response(f"⚠️ 路线 {route['route_id']}: 没有可替代的起终点，保留原路线")
+                        session.commit_route(route)
+                        continue
+                    replacement = min(candidates,
+                                      key=lambda p: self.calculate_distance_between_points(p, deleted_loc))
+                if location_key(start_point) == deleted_key:
+                    start_point = replacement
+                if location_key(end_point) == deleted_key:
+                    end_point = replacement
+
+            waypoint_num = route.get('waypoint_count', len(route.get('waypoint_details', [])))
+            candidates = session.available_points(exclude=[start_point, end_point])
+            waypoints = self.select_optimal_waypoints(start_point, end_point, waypoint_num, candidates)
+
+            new_route = self._build_route_info(route['route_id'], start_point, end_point, waypoints)
+            if not new_route:
+                session.commit_route(route)
+                continue
+
+            self.route_data[idx] = new_route
+            session.commit_route(new_route)
+            repaired.append(route['route_id'])
+            self.update_api_response(
+                f"🔧 路线 {route['route_id']} 已增量修复（{len(waypoints)}/{waypoint_num} 个途径点）"
+            )
+
+        return repaired
+
+    def _generate_routes_balanced(self, active_locations, waypoint_num, target_route_num):
+        """使用全局均衡聚类一次性规划所有路线
+        
+        起终点设置沿用用户配置：自动模式由各簇内部选择；当前位置、指定序号、手动输入、
+        收藏点模式按 select_start_point/select_end_point 选出一个点，所有路线共用
+        （均衡规划的路线之间不串联）；闭环路线终点同起点。指定的起终点不参与聚类。
+        生成的路线与贪心规划一样检查各段距离，并过滤与已有路线过于相似的路线。
+        """
+        start_point = None
+        if self.start_point_mode != "auto":
+            start_point = self.select_start_point()
+        
+        closed_loop = self.end_point_mode == "same_as_start"
+        end_point = None
+        if not closed_loop and self.end_point_mode != "auto":
+            # 返回 None 时（指定的终点无效）退回由各簇选择
+            end_point = self.select_end_point(start_point, active_locations)
+        
+        fixed_keys = {location_key(p) for p in (start_point, end_point) if p}
+        cluster_locations = [p for p in active_locations if location_key(p) not in fixed_keys]
+        
+        self.update_api_response(f"🧮 全局均衡聚类规划: {len(cluster_locations)} 个地点 → {target_route_num} 个簇")
+        plan_start = time.time()
+        plans = plan_balanced_routes(
+            cluster_locations, target_route_num, waypoint_num,
+            scene_ratios=self.scene_ratios,
+            start_point=start_point,
+            end_point=end_point,
+            closed_loop=closed_loop
+        )
+        self.update_api_response(f"⏱️ 聚类规划耗时: {(time.time() - plan_start)*1000:.0f}ms，得到 {len(plans)} 条路线")
+        
+        routes = []
+        for plan_index, plan in enumerate(plans, 1):
+            route = self._build_route_info(plan_index, plan['start_point'], plan['end_point'], plan['waypoints'])
+            if not route:
+                continue
+            if plan['waypoints']:
+                violations = self.check_route_distances(plan['start_point'], plan['waypoints'], plan['end_point'])
+                if violations:
+                    self.update_api_response(f"⚠️ 规划方案 {plan_index}: {violations} 项距离超出限制")
+            if self.is_route_duplicate(route, routes):
+                self.update_api_response(f"⏭️ 规划方案 {plan_index} 已被过滤（与现有路线过于相似）")
+                continue
+            # 路线编号按采纳顺序连续编号（用于导出文件名和图例），与贪心规划一致
+            route['route_id'] = len(routes) + 1
+            routes.append(route)
+            self.update_api_response(
+                f"✅ 路线 {route['route_id']}（规划方案 {plan_index}）: {plan['start_point']['name']} → {plan['end_point']['name']} "
+                f"（{len(plan['waypoints'])} 个途径点，直线距离 {route['straight_distance']:.2f}km）"
+            )
+        
+        if len(routes) < target_route_num:
+            self.update_api_response(f"⚠️ 地点不足，仅规划出 {len(routes)}/{target_route_num} 条路线")
+        return routes
+    
+    def generate_realistic_route_map(self, output_path=None):
+        """生成综合路线地图（增强版：包含转向标记、里程统计）
+        
+        Args:
+            output_path: 地图保存路径，默认保存到系统临时目录
+        """
+        try:
+            if not self.route_data:
+                return False
+            
+            all_lats = []
+            all_lons = []
+            
+            for route in self.route_data:
+                for point in route.get('real_points', []):
+                    all_lats.append(point[0])
+                    all_lons.append(point[1])
+            
+            if not all_lats:
+                return False
+            
+            _lazy_import_folium()
+            center_lat = sum(all_lats) / len(all_lats)
+            center_lon = sum(all_lons) / len(all_lons)
+            
+            # 使用高德地图瓦片服务
+            route_map = folium.Map(
+                location=[center_lat, center_lon],
+                zoom_start=12,
+                tiles='https://webrd03.is.autonavi.com/appmaptile?lang=zh_cn&size=1&scale=1&style=8&x={x}&y={y}&z={z}',
+                attr='© <a href="https://ditu.amap.com/">高德地图</a>',
+                control_scale=True
+            )
+            
+            # 使用与地图生成功能相同的颜色列表
+            colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'darkblue', 'darkgreen']
+            
+            # 统计信息
+            total_distance = 0
+            total_highway_distance = 0
+            total_elevated_distance = 0
+            total_left_turns = 0
+            total_right_turns = 0
+            total_uturns = 0
+            
+            # 图例HTML
+            legend_html = '''
+            <div style="position: fixed; 
+                bottom: 50px; right: 50px; width: 350px; height: auto; 
+                background-color: white; border:2px solid grey; z-index:9999; 
+                font-size:14px; padding: 10px; border-radius: 5px; max-height: 500px; overflow-y: auto;">
+                <div style="text-align: center; font-weight: bold; margin-bottom: 5px;">路线图例</div>
+            '''
+            
+            for i, route in enumerate(self.route_data):
+                color = colors[i % len(colors)]
+                route_id = route['route_id']
+                
+                if route.get('real_points'):
+                    # 获取路线信息
+                    start_name = route.get('start_point', {}).get('name', '起点')
+                    end_name = route.get('end_point', {}).get('name', '终点')
+                    waypoints = route.get('waypoints', '')
+                    
+                    # 使用PolyLine绘制路径
+                    folium.PolyLine(
+                        locations=route['real_points'],
+                        color=color,
+                        weight=4,
+                        opacity=0.8,
+                        tooltip=f"路线 {route_id}"
+                    ).add_to(route_map)
+                    
+                    # 添加起点标记
+                    start_point = route['real_points'][0]
+                    folium.Marker(
+                        location=start_point,
+                        popup=f"<b>路线{route_id} - 起点</b><br>{start_name}",
+                        icon=folium.Icon(color='lightgreen', icon='play', prefix='fa')
+                    ).add_to(route_map)
+                    
+                    # 添加终点标记
+                    end_point = route['real_points'][-1]
+                    folium.Marker(
+                        location=end_point,
+                        popup=f"<b>路线{route_id} - 终点</b><br>{end_name}",
+                        icon=folium.Icon(color='darkred', icon='stop', prefix='fa')
+                    ).add_to(route_map)
+                    
+                    # 添加转向标记
+                    turn_points = route.get('turn_points', [])
+                    route_left_turns = 0
+                    route_right_turns = 0
+                    route_uturns = 0
+                    
+                    for tp in turn_points:
+                        try:
+                            lat_tp = float(tp.get("lat"))
+                            lon_tp = float(tp.get("lon"))
+                            t_type = str(tp.get("type") or "").lower()
+                            type_idx = int(tp.get("type_index", 0) or 0)
+                            from_road = str(tp.get("from_road", "") or "")
+                            to_road = str(tp.get("to_road", "") or "")
+                        except Exception:
+                            continue
+                        
+                        if t_type == "left":
+                            icon_color = 'blue'
+                            icon_text = 'L'
+                            type_label = "左转"
+                            route_left_turns += 1
+                        elif t_type == "right":
+                            icon_color = 'orange'
+                            icon_text = 'R'
+                            type_label = "右转"
+                            route_right_turns += 1
+                        elif t_type == "uturn":
+                            icon_color = 'purple'
+                            icon_text = 'U'
+                            type_label = "掉头"
+                            route_uturns += 1
+                        else:
+                            continue
+                        
+                        if type_idx > 0:
+                            order_text = f"第{type_idx}个{type_label}"
+                        else:
+                            order_text = type_label
+                        
+                        if from_road or to_road:
+                            fr = from_road or "未知道路"
+                            tr = to_road or "未知道路"
+                            trans_text = f"，由 {fr} 转到 {tr}"
+                        else:
+                            trans_text = ""
+                        
+                        tooltip = f"路线{route_id} - {order_text}{trans_text}"
+                        
+                        turn_icon = folium.features.DivIcon(
+                            icon_size=(18, 18),
+                            icon_anchor=(9, 9),
+                            html=f'''
+                                <div style="
+                                    width: 16px;
+                                    height: 16px;
+                                    border-radius: 50%;
+                                    background-color: {icon_color};
+                                    color: white;
+                                    font-size: 11px;
+                                    text-align: center;
+                                    line-height: 16px;
+                                    box-shadow: 0 0 3px #000;
+                                ">{icon_text}</div>
+                            '''
+                        )
+                        
+                        folium.Marker(
+                            [lat_tp, lon_tp],
+                            icon=turn_icon,
+                            tooltip=tooltip
+                        ).add_to(route_map)
+                    
+                    total_left_turns += route_left_turns
+                    total_right_turns += route_right_turns
+                    total_uturns += route_uturns
+                    
+                    # 计算里程
+                    route_distance = 0
+                    highway_distance = 0
+                    elevated_distance = 0
+                    
+                    road_types = route.get('road_types', [])
+                    if road_types and len(route['real_points']) > 1:
+                        for j in range(len(route['real_points']) - 1):
+                            if j < len(road_types):
+                                road_type = str(road_types[j]).strip()
+                                lat1, lon1 = route['real_points'][j]
+                                lat2, lon2 = route['real_points'][j + 1]
+                                
+                                distance = self.calculate_distance(lat1, lon1, lat2, lon2) / 1000
+                                route_distance += distance
+                                
+                                if road_type == "1":
+                                    highway_distance += distance
+                                elif road_type == "2":
+                                    elevated_distance += distance
+                    
+                    total_distance += route_distance
+                    total_highway_distance += highway_distance
+                    total_elevated_distance += elevated_distance
+                    
+                    # 添加到图例
+                    legend_html += f'''
+                    <div style="display: flex; align-items: center; margin-bottom: 5px;">
+                        <div style="background-color: {color}; width: 15px; height: 15px; margin-right: 5px;"></div>
+                        <span>路线 {route_id} ({round(route_distance, 2)} 公里)</span>
+                    </div>
+                    '''
+                    
+                    if route_left_turns > 0 or route_right_turns > 0 or route_uturns > 0:
+                        legend_html += f'''
+                        <div style="margin-left: 22px; font-size: 12px; margin-top: -2px; margin-bottom: 4px; color: #555;">
+                            左转: {route_left_turns} 个，右转: {route_right_turns} 个，掉头: {route_uturns} 个
+                        </div>
+                        '''
+                    
+                    if route_distance > 0:
+                        legend_html += f'''
+                        <div style="margin-left: 20px; font-size: 12px; margin-bottom: 10px;">
+                            <div>高速: {round(highway_distance, 2)} 公里 ({round(highway_distance/route_distance*100 if route_distance > 0 else 0, 1)}%)</div>
+                            <div>高架: {round(elevated_distance, 2)} 公里 ({round(elevated_distance/route_distance*100 if route_distance > 0 else 0, 1)}%)</div>
+                            <div>普通: {round(route_distance - highway_distance - elevated_distance, 2)} 公里 ({round((route_distance - highway_distance - elevated_distance)/route_distance*100 if route_distance > 0 else 0, 1)}%)</div>
+                        </div>
+                        '''
+            
+            # 总计统计
+            legend_html += f'''
+            <div style="border-top: 1px solid #ccc; margin-top: 5px; padding-top: 5px;">
+                <div style="font-weight: bold; text-align: center;">总里程: {round(total_distance, 2)} 公里</div>
+                <div style="text-align: center;">高速总里程: {round(total_highway_distance, 2)} 公里 ({round(total_highway_distance/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
+                <div style="text-align: center;">高架总里程: {round(total_elevated_distance, 2)} 公里 ({round(total_elevated_distance/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
+                <div style="text-align: center;">普通道路总里程: {round(total_distance - total_highway_distance - total_elevated_distance, 2)} 公里 ({round((total_distance - total_highway_distance - total_elevated_distance)/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
+                <div style="text-align: center; margin-top: 4px;">
+                    总左转路口: {int(total_left_turns)} 个，
+                    总右转路口: {int(total_right_turns)} 个，
+                    总掉头路口: {int(total_uturns)} 个
+                </div>
+            </div>
+            '''
+            
+            legend_html += '</div>'
+            route_map.get_root().html.add_child(folium.Element(legend_html))
+            
+            temp_dir = tempfile.gettempdir()
+            self.combined_map_path = output_path or os.path.join(temp_dir, 'all_routes_map.html')
+            route_map.save(self.combined_map_path)
+            
+            self.update_api_response(f"✅ 备用地图已生成，包含 {len(self.route_data)} 条路线")
+            self.update_api_response(f"   📍 转向路口: 左转{total_left_turns}个, 右转{total_right_turns}个, 掉头{total_uturns}个")
+            self.update_api_response(f"   📏 总里程: {round(total_distance, 2)}公里 (高速{round(total_highway_distance, 2)}公里, 高架{round(total_elevated_distance, 2)}公里)")
+            
+            return True
+            
+        except Exception as e:
+            logger.error(f"生成综合地图错误: {str(e)}")
+            self.update_api_response(f"❌ 备用地图生成失败: {str(e)}")
+            return False
+    
+    def _auto_save_files_to_program_dir(self, timestamp=None):
+        """自动保存Excel和JSON文件到程序目录（生成路线后调用）
+
+        timestamp 为上一次保存的时间戳时覆盖同一批文件（获取到真实路线后重新保存）。
+        """
+        try:
+            from openpyxl import Workbook
+            from openpyxl.styles import Alignment, Font, PatternFill
+            
+            timestamp = timestamp or time.strftime('%Y%m%d%H%M%S')
+            self.last_export_timestamp = timestamp
+            
+            # 保存Excel文件
+            wb = Workbook()
+            ws = wb.active
+            ws.title = "路线列表"
+            
+            # 设置列头
+            headers = ["序号", "城市名称", "路线名称", "图例1", "图例2", "路线链接", "JSON文件", "驾车里程(公里)"]
+            for col_num, header in enumerate(headers, 1):
+                cell = ws.cell(row=1, column=col_num)
+                cell.value = header
+                cell.font = Font(bold=True, size=12)
+                cell.fill = PatternFill(start_color="CCE5FF", end_color="CCE5FF", fill_type="solid")
+                cell.alignment = Alignment(horizontal='center', vertical='center')
+            
+            city_name = self._get_city_name() or "未指定城市"
+            
+            # 填充数据
+            row = 2
+            for i, route in enumerate(self.last_generated_routes, 1):
+                ws.cell(row=row, column=1).value = i
+                ws.cell(row=row, column=2).value = city_name
+                ws.cell(row=row, column=3).value = f"路线_{route['route_id']}"
+                ws.cell(row=row, column=4).value = ""
+                ws.cell(row=row, column=5).value = ""
+                ws.cell(row=row, column=6).value = route.get('navigation_url', '')
+                
+                # 构建JSON内容
+                point_list = []
+                point_list.append({
+                    "lat": route['start_point']['lat'],
+                    "lon": route['start_point']['lon'],
+                    "name": route['start_point']['name'],
+                    "address": route['start_point']['name']
+                })
+                for wp in route.get('waypoint_details', []):
+                    point_list.append({
+                        "lat": wp['lat'],
+                        "lon": wp['lon'],
+                        "name": wp['name'],
+                        "address": wp['name']
+                    })
+                point_list.append({
+                    "lat": route['end_point']['lat'],
+                    "lon": route['end_point']['lon'],
+                    "name": route['end_point']['name'],
+                    "address": route['end_point']['name']
+                })
+                
+                route_json = [{
+                    "routeName": f"路线_{timestamp}_{route['route_id']}",
+                    "pointList": point_list
+                }]
+                if 'driving_distance' in route:
+                    route_json[0]["drivingDistance"] = route['driving_distance']
+                
+                json_content = json.dumps(route_json, ensure_ascii=False, indent=2)
+                ws.cell(row=row, column=7).value = json_content
+                ws.cell(row=row, column=8).value = route.get('driving_distance', '')
+                
+                for col in range(1, 9):
+                    ws.cell(row=row, column=col).alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+                
+                row += 1
+            
+            # 合并城市名称列
+            if len(self.last_generated_routes) > 1:
+                ws.merge_cells(start_row=2, start_column=2, end_row=row-1, end_column=2)
+                ws.cell(row=2, column=2).alignment = Alignment(horizontal='center', vertical='center')
+            
+            # 调整列宽
+            ws.column_dimensions['A'].width = 8
+            ws.column_dimensions['B'].width = 15
+            ws.column_dimensions['C'].width = 20
+            ws.column_dimensions['D'].width = 12
+            ws.column_dimensions['E'].width = 12
+            ws.column_dimensions['F'].width = 40  # 路线链接列宽
+            ws.column_dimensions['G'].width = 40  # JSON文件列宽
+            ws.column_dimensions['H'].width = 16  # 驾车里程列宽
+            
+            # 设置有内容行的行高为60
+            for row_num in range(2, row):
+                ws.row_dimensions[row_num].height = 60
+            
+            # 保存Excel文件到程序目录
+            excel_filename = f"routes_{timestamp}.xlsx"
+            excel_path = os.path.join(self.excel_dir, excel_filename)
+            wb.save(excel_path)
+            if excel_path not in self.exported_files['excel']:
+                self.exported_files['excel'].append(excel_path)
+            
+            # 保存JSON文件到程序目录
+            self._save_json_files_to_program_dir(timestamp)
+            
+            logger.info(f"已自动保存Excel和JSON文件到程序目录: {excel_filename}")
+            
+        except Exception as e:
+            logger.error(f"自动保存文件失败: {str(e)}", exc_info=True)
+    
+    def _save_json_files_to_program_dir(self, timestamp):
+        """保存JSON文件到程序目录"""
+        try:
+            for route in self.last_generated_routes:
+                # 构建JSON格式
+                point_list = []
+                
+                # 添加起点
+                point_list.append({
+                    "lat": route['start_point']['lat'],
+                    "lon": route['start_point']['lon'],
+                    "name": route['start_point']['name'],
+                    "address": route['start_point']['name']
+                })
+                
+                # 添加途径点
+                for wp in route.get('waypoint_details', []):
+                    point_list.append({
+                        "lat": wp['lat'],
+                        "lon": wp['lon'],
+                        "name": wp['name'],
+                        "address": wp['name']
+                    })
+                
+                # 添加终点
+                point_list.append({
+                    "lat": route['end_point']['lat'],
+                    "lon": route['end_point']['lon'],
+                    "name": route['end_point']['name'],
+                    "address": route['end_point']['name']
+                })
+                
+                route_json = [{
+                    "routeName": f"路线_{timestamp}_{route['route_id']}",
+                    "pointList": point_list
+                }]
+                if 'driving_distance' in route:
+                    route_json[0]["drivingDistance"] = route['driving_distance']
+                
+                # 保存JSON文件
+                json_filename = f"route_{route['route_id']}_{timestamp}.json"
+                json_path = os.path.join(self.json_dir, json_filename)
+                with open(json_path, 'w', encoding='utf-8') as f:
+                    json.dump(route_json, f, ensure_ascii=False, indent=2)
+                
+                # 记录到导出文件列表
+                if json_path not in self.exported_files['json']:
+                    self.exported_files['json'].append(json_path)
+
+        except Exception as e:
+            logger.error(f"保存JSON文件失败: {str(e)}", exc_info=True)
+
+    def calculate_distance(self, lat1, lon1, lat2, lon2):
+        """计算两点间的距离（单位：米）"""
+        # 地球半径（米）
+        R = 6371000
+        
+        # 将经纬度转换为弧度
+        lat1_rad = math.radians(lat1)
+        lon1_rad = math.radians(lon1)
+        lat2_rad = math.radians(lat2)
+        lon2_rad = math.radians(lon2)
+        
+        # 计算差值
+        dlat = lat2_rad - lat1_rad
+        dlon = lon2_rad - lon1_rad
+        
+        # Haversine公式
+        a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
+        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+        distance = R * c
+        
+        return distance
+    
@@ -3,7 +3,7 @@ import os
 import json
 import math
 import time
-from urllib.parse import urlparse, parse_qs, quote
+from urllib.parse import urlparse, parse_qs
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QFileDialog,
                             QLabel, QVBoxLayout, QHBoxLayout, QGridLayout, QWidget, QProgressBar,
                             QMessageBox, QTextEdit, QLineEdit, QTabWidget, QGroupBox,
@@ -14,6 +14,7 @@ from PyQt5.QtGui import QFont, QIcon
 import webbrowser
 import logging
 import threading
+import multiprocessing
 import tempfile
 import random
 import re
@@ -72,36 +73,16 @@ def _lazy_import_geo():
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Selenium 延迟导入（在需要时才导入）
-SELENIUM_AVAILABLE = None  # 延迟检测
-_selenium_modules = {}
-
-def _lazy_import_selenium():
-    """延迟导入 Selenium"""
-    global SELENIUM_AVAILABLE, _selenium_modules
-    if SELENIUM_AVAILABLE is None:
-        try:
-            from selenium import webdriver
-            from selenium.webdriver.chrome.service import Service
-            from selenium.webdriver.chrome.options import Options
-            from selenium.webdriver.common.by import By
-            from selenium.webdriver.support.ui import WebDriverWait
-            from selenium.webdriver.support import expected_conditions as EC
-            from webdriver_manager.chrome import ChromeDriverManager
-            _selenium_modules = {
-                'webdriver': webdriver,
-                'Service': Service,
-                'Options': Options,
-                'By': By,
-                'WebDriverWait': WebDriverWait,
-                'EC': EC,
-                'ChromeDriverManager': ChromeDriverManager
-            }
-            SELENIUM_AVAILABLE = True
-        except ImportError:
-            SELENIUM_AVAILABLE = False
-            logger.warning("Selenium未安装，无法使用浏览器获取位置功能")
-    return SELENIUM_AVAILABLE, _selenium_modules
+# 路线生成核心流程（不依赖 PyQt，命令行批处理也使用这一套实现）
+from route_core import (VALID_SCENES, CITY_DISTRICTS, DEFAULT_AMAP_KEY, DEFAULT_BACKUP_KEYS,
+                        DEFAULT_ROUTE_CONFIG, ApiKeyPool, PlanCache, PolylineCache,
+                        DistrictBoundaryCache, SearchCheckpoint, RoadSnapCache, RoadSegmentStore,
+                        RoutePipelineMixin, TURN_MARKER_STYLES, parse_turn_point, route_geojson,
+                        canvas_route_map_script, map_asset_tags, ROUTE_MAP_CSS, ROUTE_MAP_JS,
+                        ROUTE_CANVAS_JS, LOCATION_MAP_CSS, LOCATION_MAP_JS, write_route_sidecars,
+                        LOCATION_CLUSTER_JS, location_map_script, RouteMapPage, load_route_workbooks,
+                        LOCATION_MARKER_ICONS, location_marker_registry_script,
+                        format_feasibility_report, search_scene_targets)
 
 # 版本信息
 VERSION = "V6.1"
@@ -353,99 +334,6 @@ COLORS = ['red',  'green', 'purple', 'darkred',
           'maroon', 'forestgreen',  'hotpink',  'fuchsia', 'coral',  'violet']
           #'darkgreen','indigo', 'dodgerblue'
 
-# 有效场景列表（用于Excel导入时验证场景名称）
-VALID_SCENES = ["学校", "医院", "公园", "景区", "商场", "美食街", "酒店", "加油站", "银行", "地铁站", "公交站"]
-
-# 全国主要城市及行政区数据（新增）
-CITY_DISTRICTS = {
-    # 直辖市
-    "北京": ["东城区", "西城区", "朝阳区", "丰台区", "石景山区", "海淀区", "门头沟区", "房山区", "通州区", "顺义区", "昌平区", "大兴区", "怀柔区", "平谷区", "密云区", "延庆区"],
-    "上海": ["黄浦区", "徐汇区", "长宁区", "静安区", "普陀区", "虹口区", "杨浦区", "闵行区", "宝山区", "嘉定区", "浦东新区", "金山区", "松江区", "青浦区", "奉贤区", "崇明区"],
-    "天津": ["和平区", "河东区", "河西区", "南开区", "河北区", "红桥区", "东丽区", "西青区", "津南区", "北辰区", "武清区", "宝坻区", "滨海新区", "宁河区", "静海区", "蓟州区"],
-    "重庆": ["万州区", "涪陵区", "渝中区", "大渡口区", "江北区", "沙坪坝区", "九龙坡区", "南岸区", "北碚区", "綦江区", "大足区", "渝北区", "巴南区", "黔江区", "长寿区", "江津区", "合川区", "永川区", "南川区", "璧山区", "铜梁区", "潼南区", "荣昌区", "开州区", "梁平区", "武隆区", "城口县", "丰都县", "垫江县", "忠县", "云阳县", "奉节县", "巫山县", "巫溪县", "石柱土家族自治县", "秀山土家族苗族自治县", "酉阳土家族苗族自治县", "彭水苗族土家族自治县"],
-    
-    # 省会城市
-    "广州": ["越秀区", "海珠区", "荔湾区", "天河区", "白云区", "黄埔区", "番禺区", "花都区", "南沙区", "从化区", "增城区"],
-    "深圳": ["罗湖区", "福田区", "南山区", "宝安区", "龙岗区", "盐田区", "龙华区", "坪山区", "光明区", "大鹏新区"],
-    "成都": ["锦江区", "青羊区", "金牛区", "武侯区", "成华区", "龙泉驿区", "青白江区", "新都区", "温江区", "双流区", "郫都区", "新津区", "都江堰市", "彭州市", "邛崃市", "崇州市", "简阳市", "金堂县", "大邑县", "蒲江县"],
-    "杭州": ["上城区", "下城区", "江干区", "拱墅区", "西湖区", "滨江区", "萧山区", "余杭区", "富阳区", "临安区", "建德市", "桐庐县", "淳安县"],
-    "武汉": ["江岸区", "江汉区", "硚口区", "汉阳区", "武昌区", "青山区", "洪山区", "东西湖区", "汉南区", "蔡甸区", "江夏区", "黄陂区", "新洲区"],
-    "西安": ["新城区", "碑林区", "莲湖区", "灞桥区", "未央区", "雁塔区", "阎良区", "临潼区", "长安区", "高陵区", "鄠邑区", "蓝田县", "周至县"],
-    "南京": ["玄武区", "秦淮区", "建邺区", "鼓楼区", "浦口区", "栖霞区", "雨花台区", "江宁区", "六合区", "溧水区", "高淳区"],
-    "长沙": ["芙蓉区", "天心区", "岳麓区", "开福区", "雨花区", "望城区", "宁乡市", "浏阳市", "长沙县"],
-    "郑州": ["中原区", "二七区", "管城回族区", "金水区", "上街区", "惠济区", "巩义市", "荥阳市", "新密市", "新郑市", "登封市", "中牟县"],
-    "济南": ["历下区", "市中区", "槐荫区", "天桥区", "历城区", "长清区", "章丘区", "济阳区", "莱芜区", "钢城区", "平阴县", "商河县"],
-    "青岛": ["市南区", "市北区", "黄岛区", "崂山区", "李沧区", "城阳区", "即墨区", "胶州市", "平度市", "莱西市"],
-    "沈阳": ["和平区", "沈河区", "大东区", "皇姑区", "铁西区", "苏家屯区", "浑南区", "沈北新区", "于洪区", "辽中区", "新民市", "康平县", "法库县"],
-    "大连": ["中山区", "西岗区", "沙河口区", "甘井子区", "旅顺口区", "金州区", "普兰店区", "瓦房店市", "庄河市", "长海县"],
-    "哈尔滨": ["道里区", "南岗区", "道外区", "平房区", "松北区", "香坊区", "呼兰区", "阿城区", "双城区", "尚志市", "五常市", "依兰县", "方正县", "宾县", "巴彦县", "木兰县", "通河县", "延寿县"],
-    "长春": ["南关区", "宽城区", "朝阳区", "二道区", "绿园区", "双阳区", "九台区", "榆树市", "德惠市", "公主岭市", "农安县"],
-    "福州": ["鼓楼区", "台江区", "仓山区", "晋安区", "马尾区", "长乐区", "福清市", "闽侯县", "连江县", "罗源县", "闽清县", "永泰县", "平潭县"],
-    "厦门": ["思明区", "海沧区", "湖里区", "集美区", "同安区", "翔安区"],
-    "昆明": ["五华区", "盘龙区", "官渡区", "西山区", "东川区", "呈贡区", "晋宁区", "安宁市", "富民县", "宜良县", "石林彝族自治县", "嵩明县", "禄劝彝族苗族自治县", "寻甸回族彝族自治县"],
-    "南昌": ["东湖区", "西湖区", "青云谱区", "湾里区", "青山湖区", "新建区", "南昌县", "安义县", "进贤县"],
-    "贵阳": ["南明区", "云岩区", "花溪区", "乌当区", "白云区", "观山湖区", "清镇市", "开阳县", "息烽县", "修文县"],
-    "南宁": ["兴宁区", "青秀区", "江南区", "西乡塘区", "良庆区", "邕宁区", "武鸣区", "隆安县", "马山县", "上林县", "宾阳县", "横州市"],
-    "拉萨": ["城关区", "堆龙德庆区", "达孜区", "林周县", "当雄县", "尼木县", "曲水县", "墨竹工卡县"],
-    "西宁": ["城东区", "城中区", "城西区", "城北区", "大通回族土族自治县", "湟中县", "湟源县"],
-    "兰州": ["城关区", "七里河区", "西固区", "安宁区", "红古区", "永登县", "皋兰县", "榆中县"],
-    "银川": ["兴庆区", "西夏区", "金凤区", "灵武市", "永宁县", "贺兰县"],
-    "乌鲁木齐": ["天山区", "沙依巴克区", "新市区", "水磨沟区", "头屯河区", "达坂城区", "米东区", "乌鲁木齐县"],
-    "呼和浩特": ["新城区", "回民区", "玉泉区", "赛罕区", "土默特左旗", "托克托县", "和林格尔县", "清水河县", "武川县"],
-    "太原": ["小店区", "迎泽区", "杏花岭区", "尖草坪区", "万柏林区", "晋源区", "清徐县", "阳曲县", "娄烦县", "古交市"],
-    "石家庄": ["长安区", "桥西区", "新华区", "井陉矿区", "裕华区", "藁城区", "鹿泉区", "栾城区", "辛集市", "晋州市", "新乐市", "井陉县", "正定县", "行唐县", "灵寿县", "高邑县", "深泽县", "赞皇县", "无极县", "平山县", "元氏县", "赵县"],
-    "合肥": ["瑶海区", "庐阳区", "蜀山区", "包河区", "长丰县", "肥东县", "肥西县", "庐江县", "巢湖市"],
-    "南京": ["玄武区", "秦淮区", "建邺区", "鼓楼区", "浦口区", "栖霞区", "雨花台区", "江宁区", "六合区", "溧水区", "高淳区"],
-    "杭州": ["上城区", "下城区", "江干区", "拱墅区", "西湖区", "滨江区", "萧山区", "余杭区", "富阳区", "临安区", "建德市", "桐庐县", "淳安县"],
-    "宁波": ["海曙区", "江北区", "北仑区", "镇海区", "鄞州区", "奉化区", "余姚市", "慈溪市", "象山县", "宁海县"],
-    "苏州": ["姑苏区", "虎丘区", "吴中区", "相城区", "吴江区", "苏州工业园区", "常熟市", "张家港市", "昆山市", "太仓市"],
-    "无锡": ["锡山区", "惠山区", "滨湖区", "梁溪区", "新吴区", "江阴市", "宜兴市"],
-    "常州": ["天宁区", "钟楼区", "新北区", "武进区", "金坛区", "溧阳市"],
-    "徐州": ["云龙区", "鼓楼区", "贾汪区", "泉山区", "铜山区", "丰县", "沛县", "睢宁县", "新沂市", "邳州市"],
-    "南通": ["崇川区", "港闸区", "通州区", "如东县", "启东市", "如皋市", "海门市", "海安市"],
-    "扬州": ["广陵区", "邗江区", "江都区", "宝应县", "仪征市", "高邮市"],
-    "镇江": ["京口区", "润州区", "丹徒区", "丹阳市", "扬中市", "句容市"],
-    "泰州": ["海陵区", "高港区", "姜堰区", "兴化市", "靖江市", "泰兴市"],
-    "盐城": ["亭湖区", "盐都区", "大丰区", "响水县", "滨海县", "阜宁县", "射阳县", "建湖县", "东台市"],
-    "淮安": ["淮安区", "淮阴区", "清江浦区", "洪泽区", "涟水县", "盱眙县", "金湖县"],
-    "连云港": ["连云区", "海州区", "赣榆区", "东海县", "灌云县", "灌南县"],
-    "宿迁": ["宿城区", "宿豫区", "沭阳县", "泗阳县", "泗洪县"],
-    
-    # 其他主要城市
-    "东莞": ["莞城街道", "南城街道", "东城街道", "万江街道", "石碣镇", "石龙镇", "茶山镇", "石排镇", "企石镇", "横沥镇", "桥头镇", "谢岗镇", "东坑镇", "常平镇", "寮步镇", "樟木头镇", "大朗镇", "黄江镇", "清溪镇", "塘厦镇", "凤岗镇", "大岭山镇", "长安镇", "虎门镇", "厚街镇", "沙田镇", "道滘镇", "洪梅镇", "麻涌镇", "望牛墩镇", "中堂镇", "高埗镇"],
-    "佛山": ["禅城区", "南海区", "顺德区", "三水区", "高明区"],
-    "中山": ["石岐区", "东区", "西区", "南区", "五桂山区", "火炬开发区", "黄圃镇", "南头镇", "东凤镇", "阜沙镇", "小榄镇", "东升镇", "古镇镇", "横栏镇", "三角镇", "民众镇", "南朗镇", "港口镇", "大涌镇", "沙溪镇", "三乡镇", "板芙镇", "神湾镇", "坦洲镇"],
-    "珠海": ["香洲区", "斗门区", "金湾区"],
-    "惠州": ["惠城区", "惠阳区", "惠东县", "博罗县", "龙门县", "大亚湾经济技术开发区", "仲恺高新技术产业开发区"],
-    "汕头": ["龙湖区", "金平区", "濠江区", "潮阳区", "潮南区", "澄海区", "南澳县"],
-    "江门": ["蓬江区", "江海区", "新会区", "台山市", "开平市", "鹤山市", "恩平市"],
-    "湛江": ["赤坎区", "霞山区", "坡头区", "麻章区", "廉江市", "雷州市", "吴川市", "遂溪县", "徐闻县"],
-    "茂名": ["茂南区", "电白区", "高州市", "化州市", "信宜市"],
-    "肇庆": ["端州区", "鼎湖区", "高要区", "四会市", "广宁县", "怀集县", "封开县", "德庆县"],
-    "揭阳": ["榕城区", "揭东区", "揭西县", "惠来县", "普宁市"],
-    "潮州": ["湘桥区", "潮安区", "饶平县"],
-    "汕尾": ["城区", "海丰县", "陆河县", "陆丰市"],
-    "河源": ["源城区", "紫金县", "龙川县", "连平县", "和平县", "东源县"],
-    "阳江": ["江城区", "阳东区", "阳西县", "阳春市"],
-    "清远": ["清城区", "清新区", "英德市", "连州市", "佛冈县", "阳山县", "连山壮族瑶族自治县", "连南瑶族自治县"],
-    "韶关": ["武江区", "浈江区", "曲江区", "乐昌市", "南雄市", "始兴县", "仁化县", "翁源县", "乳源瑶族自治县", "新丰县"],
-    "梅州": ["梅江区", "梅县区", "兴宁市", "大埔县", "丰顺县", "五华县", "平远县", "蕉岭县"],
-    "云浮": ["云城区", "云安区", "罗定市", "新兴县", "郁南县"],
-    "柳州": ["城中区", "鱼峰区", "柳南区", "柳北区", "柳江区", "柳城县", "鹿寨县", "融安县", "融水苗族自治县", "三江侗族自治县"],
-    "桂林": ["秀峰区", "叠彩区", "象山区", "七星区", "雁山区", "临桂区", "阳朔县", "灵川县", "全州县", "兴安县", "永福县", "灌阳县", "龙胜各族自治县", "资源县", "平乐县", "恭城瑶族自治县"],
-    "梧州": ["万秀区", "长洲区", "龙圩区", "苍梧县", "藤县", "蒙山县", "岑溪市"],
-    "北海": ["海城区", "银海区", "铁山港区", "合浦县"],
-    "防城港": ["港口区", "防城区", "上思县", "东兴市"],
-    "钦州": ["钦南区", "钦北区", "灵山县", "浦北县"],
-    "贵港": ["港北区", "港南区", "覃塘区", "平南县", "桂平市"],
-    "玉林": ["玉州区", "福绵区", "容县", "陆川县", "博白县", "兴业县", "北流市"],
-    "百色": ["右江区", "田阳区", "田东县", "德保县", "那坡县", "凌云县", "乐业县", "田林县", "西林县", "隆林各族自治县", "靖西市", "平果市"],
-    "贺州": ["八步区", "平桂区", "昭平县", "钟山县", "富川瑶族自治县"],
-    "河池": ["金城江区", "宜州区", "南丹县", "天峨县", "凤山县", "东兰县", "罗城仫佬族自治县", "环江毛南族自治县", "巴马瑶族自治县", "都安瑶族自治县", "大化瑶族自治县"],
-    "来宾": ["兴宾区", "忻城县", "象州县", "武宣县", "金秀瑶族自治县", "合山市"],
-    "崇左": ["江州区", "扶绥县", "宁明县", "龙州县", "大新县", "天等县", "凭祥市"]
-}
-
 # GCJ-02坐标转换工具函数
 # def gcj02_from_wgs84(lng, lat):
 #     """将WGS84坐标转换为GCJ-02坐标(高德坐标系)
@@ -1408,12 +1296,18 @@ class RouteGenerator(QThread):
     generation_finished = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     log_updated = pyqtSignal(str)  # 新增：用于实时报告日志
+
+    # 生成的地图文件名（路线数据脚本按它分目录存放）
+    MAP_FILENAME = "路线全览.html"
     
-    def __init__(self, excel_files, output_dir, auto_open=False):
+    def __init__(self, excel_files, output_dir, auto_open=False, render_mode="folium"):
         super().__init__()
         self.excel_files = excel_files
         self.output_dir = output_dir
         self.auto_open = auto_open
+        # 地图渲染方式：folium（AntPath + Marker）、canvas（GeoJSON 图层 + circleMarker）
+        # 或 template（与 canvas 相同的图层，页面按模板直接写出，不构建 folium 对象）
+        self.render_mode = render_mode
     
     def run(self):
         import time
@@ -1422,7 +1316,8 @@ class RouteGenerator(QThread):
         # 延迟导入重量级库
         global pd, folium, MarkerCluster, AntPath
         _lazy_import_pandas()
-        _lazy_import_folium()
+        if self.render_mode != "template":
+            _lazy_import_folium()
 
         try:
             self.log_updated.emit("开始生成地图...")
@@ -1435,240 +1330,29 @@ class RouteGenerator(QThread):
             
             self.progress_updated.emit(0)
             
-            # 加载所有Excel文件
-            routes = []
+            # 加载所有Excel文件（进程池并行读取，结果按选择顺序合并）
             total_files = len(self.excel_files)
-            
-            for i, file_path in enumerate(self.excel_files):
-                file_start_time = time.time()
-                self.log_updated.emit(f"[{i+1}/{total_files}] 开始处理: {os.path.basename(file_path)}")
-                
-                progress = int((i / total_files) * 100)
-                self.progress_updated.emit(progress)
-                
-                try:
-                    # 读取Excel文件
-                    xl = pd.ExcelFile(file_path)
-                    if "所有坐标点" not in xl.sheet_names:
-                        continue
-                        
-                    df = pd.read_excel(file_path, sheet_name="所有坐标点")
-                    
-                    # 获取经纬度列
-                    if '经度' in df.columns:
-                        lon_col = '经度'
-                    elif 'B' in df.columns:
-                        lon_col = 'B'
-                    else:
-                        lon_col = 1
-                        
-                    if '纬度' in df.columns:
-                        lat_col = '纬度'
-                    elif 'C' in df.columns:
-                        lat_col = 'C'
-                    else:
-                        lat_col = 2
-                    
-                    # 跳过第一行（标题行）如果没有列名为"经度"和"纬度"
-                    if '经度' not in df.columns and '纬度' not in df.columns:
-                        df = df.iloc[1:]
-                    
-                    # 创建点列表
-                    point_list = []
-                    for idx, row in df.iterrows():
-                        try:
-                            lon = float(row[lon_col])
-                            lat = float(row[lat_col])
-                            
-                            point = {
-                                'lon': lon,
-                                'lat': lat,
-                                # 将WGS84坐标转换为GCJ-02坐标系
-                                #'lon': gcj02_from_wgs84(lon, lat)[0],
-                                #'lat': gcj02_from_wgs84(lon, lat)[1],
-                                'name': f'点{idx}',
-                                'address': ''
-                            }
-                            point_list.append(point)
-                        except (ValueError, TypeError):
-                            continue
-                    
-                    if not point_list:
-                        continue
-                    
-                    # 检查是否有道路类型信息
-                    road_types = []
-                    road_names = []  # 新增：存储道路名称
-                    
-                    if "道路类型" in df.columns:
-                        print(f"文件 {file_path} 包含道路类型列")
-                        
-                        # 调试：打印道路类型列的唯一值
-                        unique_types = df["道路类型"].unique()
-                        print(f"道路类型列的唯一值: {unique_types}")
-                        
-                        # 打印前10个道路类型值的实际内容和类型
-                        print("前10个道路类型值:")
-                        for j, val in enumerate(df["道路类型"].iloc[:10]):
-                            print(f"  值{j}: '{val}' (类型: {type(val).__name__})")
-                        
-                        for _, row in df.iterrows():
-                            road_type_value = row["道路类型"]
-                            
-                            # 处理NaN或None值
-                            if pd.isna(road_type_value) or road_type_value is None:
-                                road_types.append("0")
-                                continue
-                            
-                            # 将值转换为字符串并去除空白
-                            road_type = str(road_type_value).strip()
-                            
-                            # 检查道路类型值
-                            if road_type in ["高速公路", "1"]:
-                                road_types.append("1")
-                            elif road_type in ["城市高架", "2"]:
-                                road_types.append("2")
-                            else:
-                                road_types.append("0")
-                    else:
-                        print(f"文件 {file_path} 不包含道路类型列")
-                    
-                    # 检查是否有道路名称信息
-                    if "道路名称" in df.columns:
-                        print(f"文件 {file_path} 包含道路名称列")
-                        for _, row in df.iterrows():
-                            road_name_value = row["道路名称"]
-                            # 处理NaN或None值
-                            if pd.isna(road_name_value) or road_name_value is None:
-                                road_names.append("")
-                            else:
-                                road_names.append(str(road_name_value).strip())
-                    else:
-                        print(f"文件 {file_path} 不包含道路名称列")
-                    
-                    # 创建路线对象
-                    route_data = {
-                        'routeName': os.path.basename(file_path).replace('.xlsx', '').replace('.xls', ''),
-                        'pointList': point_list
-                    }
-                    
-                    # 如果有道路类型信息，添加到路线数据中
-                    if road_types and len(road_types) == len(point_list):
-                        # 确保所有道路类型都是字符串
-                        road_types = [str(rt).strip() for rt in road_types]
-                        route_data['road_types'] = road_types
-                        print(f"成功添加 {len(road_types)} 个道路类型信息到路线 {route_data['routeName']}")
-                        
-                        # 调试：统计各类型道路数量
-                        type_counts = {}
-                        for rt in road_types:
-                            type_counts[rt] = type_counts.get(rt, 0) + 1
-                        for rt, count in type_counts.items():
-                            print(f"  类型 '{rt}': {count}个点")
-                    else:
-                        print(f"警告：道路类型数量({len(road_types)})与点数量({len(point_list)})不匹配，无法添加道路类型信息")
-                    
-                    # 如果有道路名称信息，添加到路线数据中
-                    if road_names and len(road_names) == len(point_list):
-                        route_data['road_names'] = road_names
-                        print(f"成功添加 {len(road_names)} 个道路名称信息到路线 {route_data['routeName']}")
-                    else:
-                        print(f"警告：道路名称数量({len(road_names)})与点数量({len(point_list)})不匹配，无法添加道路名称信息")
-
-                    # 统计当前路线的左右转 / 右转 / 掉头总数（如果Excel中包含路段信息）
-                    left_turns_total = 0
-                    right_turns_total = 0
-                    uturns_total = 0
-                    try:
-                        if "路段信息" in xl.sheet_names:
-                            seg_df = pd.read_excel(file_path, sheet_name="路段信息")
-                            if "左转数" in seg_df.columns:
-                                left_turns_total = int(seg_df["左转数"].fillna(0).sum())
-                            if "右转数" in seg_df.columns:
-                                right_turns_total = int(seg_df["右转数"].fillna(0).sum())
-                            if "掉头数" in seg_df.columns:
-                                uturns_total = int(seg_df["掉头数"].fillna(0).sum())
-                            print(f"路线 {route_data['routeName']} 转向统计: 左转 {left_turns_total}，右转 {right_turns_total}，掉头 {uturns_total}")
-                    except Exception as e:
-                        print(f"读取转向统计失败（{file_path}）: {e}")
-
-                    # 将转向统计作为路线的附加属性，用于在HTML中展示
-                    route_data["left_turns_total"] = int(left_turns_total)
-                    route_data["right_turns_total"] = int(right_turns_total)
-                    route_data["uturns_total"] = int(uturns_total)
-
-                    # 如果Excel中存在“转向节点”Sheet，则读取具体的转向位置
-                    turn_points = []
-                    try:
-                        if "转向节点" in xl.sheet_names:
-                            turn_df = pd.read_excel(file_path, sheet_name="转向节点")
-                            for _, row in turn_df.iterrows():
-                                try:
-                                    lon_raw = row.get("经度")
-                                    lat_raw = row.get("纬度")
-                                    if pd.isna(lon_raw) or pd.isna(lat_raw):
-                                        continue
-                                    lon_val = float(lon_raw)
-                                    lat_val = float(lat_raw)
-
-                                    type_raw = row.get("类型")
-                                    type_label = "" if pd.isna(type_raw) else str(type_raw).strip()
-                                    if not type_label:
-                                        continue
-                                    if "左" in type_label:
-                                        t_type = "left"
-                                    elif "右" in type_label:
-                                        t_type = "right"
-                                    elif ("掉" in type_label) or ("调" in type_label):
-                                        t_type = "uturn"
-                                    else:
-                                        t_type = type_label
-
-                                    idx_val = row.get("序号")
-                                    type_idx_val = row.get("同类型序号")
-
-                                    from_raw = row.get("由道路")
-                                    if pd.isna(from_raw):
-                                        from_road = ""
-                                    else:
-                                        from_road = str(from_raw).strip()
-
-                                    to_raw = row.get("到道路")
-                                    if pd.isna(to_raw):
-                                        to_road = ""
-                                    else:
-                                        to_road = str(to_raw).strip()
-
-                                    turn_points.append({
-                                        "lon": lon_val,
-                                        "lat": lat_val,
-                                        "type": t_type,
-                                        "index": int(idx_val) if pd.notna(idx_val) else None,
-                                        "type_index": int(type_idx_val) if pd.notna(type_idx_val) else None,
-                                        "from_road": from_road,
-                                        "to_road": to_road
-                                    })
-                                except Exception:
-                                    continue
-                            print(f"路线 {route_data['routeName']} 读取到 {len(turn_points)} 个转向节点")
-                    except Exception as e:
-                        print(f"读取转向节点失败（{file_path}）: {e}")
+            loaded_files = 0
+
+            def on_loaded(i, file_path, route_data, error, file_elapsed):
+                nonlocal loaded_files
+                loaded_files += 1
+                self.progress_updated.emit(int(loaded_files / total_files * 90))
+                self.log_updated.emit(f"[{loaded_files}/{total_files}] {os.path.basename(file_path)}")
+                if error is not None:
+                    self.log_updated.emit(f"  ❌ 文件处理失败: {str(error)}")
+                    self.error_occurred.emit(f"处理文件 {file_path} 时出错: {str(error)}")
+                elif route_data is None:
+                    self.log_updated.emit("  ⚠️ 未找到有效坐标点，已跳过")
+                else:
+                    self.log_updated.emit(f"  ✅ 文件处理完成，耗时: {file_elapsed:.2f}秒")
+                    self.log_updated.emit(f"  - 坐标点数: {len(route_data['pointList'])}")
+                    self.log_updated.emit(f"  - 道路类型数: {len(route_data.get('road_types', []))}")
+                    self.log_updated.emit(f"  - 转向节点数: {len(route_data['turn_points'])}")
 
-                    route_data["turn_points"] = turn_points
+            loaded = load_route_workbooks(self.excel_files, on_loaded=on_loaded)
+            routes = [route_data for route_data in loaded if route_data is not None]
 
-                    routes.append(route_data)
-                    
-                    file_elapsed = time.time() - file_start_time
-                    self.log_updated.emit(f"  ✅ 文件处理完成，耗时: {file_elapsed:.2f}秒")
-                    self.log_updated.emit(f"  - 坐标点数: {len(point_list)}")
-                    self.log_updated.emit(f"  - 道路类型数: {len(road_types)}")
-                    self.log_updated.emit(f"  - 转向节点数: {len(turn_points)}")
-                
-                except Exception as e:
-                    self.log_updated.emit(f"  ❌ 文件处理失败: {str(e)}")
-                    self.error_occurred.emit(f"处理文件 {file_path} 时出错: {str(e)}")
-                    continue
-            
             if not routes:
                 self.log_updated.emit("❌ 没有可用的路线数据")
                 raise Exception("没有可用的路线数据")
@@ -1691,7 +1375,7 @@ class RouteGenerator(QThread):
             # 保存HTML文件
             self.log_updated.emit("保存HTML文件...")
             save_start_time = time.time()
-            html_path = os.path.join(self.output_dir, "路线全览.html")
+            html_path = os.path.join(self.output_dir, self.MAP_FILENAME)
             route_map.save(html_path)
             
             save_elapsed = time.time() - save_start_time
@@ -1726,17 +1410,30 @@ class RouteGenerator(QThread):
             self.error_occurred.emit(str(e))
     
     def create_route_map(self, routes):
-        """创建包含所有路线的地图（合并左右转标注与精细箭头）"""
+        """创建包含所有路线的地图（合并左右转标注与精细箭头）
+
+        render_mode 为 canvas 时不再逐个生成 Marker/DivIcon，每条路线输出一个 GeoJSON 图层，
+        在 canvas 上用 circleMarker 绘制，图例和开关行为与 folium 模式相同。
+        render_mode 为 template 时图层与 canvas 相同，但页面由 RouteMapPage 按模板直接写出，
+        不导入 folium，也不构建 Map/Element 对象树。
+        """
         import time
+        template = self.render_mode == "template"
+        canvas = template or self.render_mode == "canvas"
+        if not template:
+            _lazy_import_folium()
         self.log_updated.emit(f"\n--- 开始创建地图 (共{len(routes)}条路线) ---")
-        
+        canvas_routes = []
+
         # 以第一条路线的第一个点为中心
         start_point = routes[0]['pointList'][0]
-        m = folium.Map(
+        map_class = RouteMapPage if template else folium.Map
+        m = map_class(
             location=[start_point['lat'], start_point['lon']], zoom_start=10,
             tiles='https://webrd03.is.autonavi.com/appmaptile?lang=zh_cn&size=1&scale=1&style=8&x={x}&y={y}&z={z}',
             attr='© <a href="https://ditu.amap.com/">高德地图</a>',
-            control_scale=True
+            control_scale=True,
+            prefer_canvas=canvas
         )
         self.log_updated.emit("  ✅ 地图对象初始化完成")
 
@@ -1748,12 +1445,8 @@ class RouteGenerator(QThread):
         total_uturns = 0
 
         legend_html = '''
-        <div style="position: fixed;
-            bottom: 50px; right: 50px; width: 360px; height: auto;
-            background-color: white; border:2px solid grey; z-index:9999;
-            font-size:14px; font-family: 'Microsoft YaHei', Arial, sans-serif;
-            padding: 12px; border-radius: 5px; max-height: 500px; overflow-y: auto;">
-            <div style="text-align: center; font-weight: bold; font-size: 16px; margin-bottom: 8px;">路线图例</div>
+        <div class="route-legend">
+            <div class="route-legend-title">路线图例</div>
         '''
 
         for i, route in enumerate(routes):
@@ -1763,9 +1456,10 @@ class RouteGenerator(QThread):
             color = COLORS[i % len(COLORS)]
             route_name = route.get('routeName', '未命名路线')
 
-            fg = folium.FeatureGroup(name=f"{route_name}")
             if 'pointList' not in route or not isinstance(route['pointList'], list):
                 continue
+            if not canvas:
+                fg = folium.FeatureGroup(name=f"{route_name}")
 
             locations = []
             points = []
@@ -1798,41 +1492,9 @@ class RouteGenerator(QThread):
                 else:
                     locations_to_draw = locations
 
-                # 使用 AntPath 实现动态路线效果（流动虚线动画）
-                AntPath(
-                    locations_to_draw,
-                    color=color,
-                    weight=3,  # 线条粗细（调细）
-                    opacity=0.85,
-                    tooltip=route_name,
-                    delay=1200,  # 动画速度（毫秒，越大越慢）
-                    dash_array=[10, 20],  # 虚线样式 [线段长度, 间隔长度]
-                    pulse_color='#FFFFFF',  # 流动部分颜色（白色）
-                    reverse=False,  # 正向流动
-                    hardwareAccelerated=True,  # 硬件加速
-                ).add_to(fg)
-
-                self.log_updated.emit(f"    - 动态路线绘制完成 ({len(locations_to_draw)}个坐标点)")
-
                 start_point = points[0]
                 end_point = points[-1]
 
-                folium.Marker(
-                    [start_point['lat'], start_point['lon']],
-                    tooltip=f"{route_name} - 起点",
-                    icon=folium.Icon(color='lightgreen', icon='play', prefix='fa'),
-                    popup=f"<b>{route_name}</b><br>起点"
-                ).add_to(fg)
-
-                folium.Marker(
-                    [end_point['lat'], end_point['lon']],
-                    tooltip=f"{route_name} - 终点",
-                    icon=folium.Icon(color='darkred', icon='stop', prefix='fa'),
-                    popup=f"<b>{route_name}</b><br>终点"
-                ).add_to(fg)
-
-                self.log_updated.emit(f"    - 起点/终点标记完成")
-
                 # 转向标记（左转/右转/掉头）
                 route_left_turns = int(route.get("left_turns_total", 0) or 0)
                 route_right_turns = int(route.get("right_turns_total", 0) or 0)
@@ -1847,79 +1509,83 @@ class RouteGenerator(QThread):
                 total_right_turns += route_right_turns
                 total_uturns += route_uturns
 
-                route_turn_points = route.get("turn_points", []) or []
-                for tp in route_turn_points:
-                    try:
-                        lon_tp = float(tp.get("lon"))
-                        lat_tp = float(tp.get("lat"))
-                        t_type = str(tp.get("type") or "").lower()
-                        idx = int(tp.get("index", 0) or 0)
-                        type_idx = int(tp.get("type_index", 0) or 0)
-                        from_road = str(tp.get("from_road", "") or "")
-                        to_road = str(tp.get("to_road", "") or "")
-                    except Exception:
-                        continue
+                if canvas:
+                    # Canvas 模式：线、起终点和转向点合成一个 GeoJSON 图层，由页面脚本统一绘制
+                    geojson = route_geojson(route_name, color, locations_to_draw,
+                                            start_point, end_point, route_turn_points)
+                    canvas_routes.append({'index': i, 'name': route_name, 'geojson': geojson})
+                    turn_marker_count = len(geojson['features']) - 3
+                    self.log_updated.emit(f"    - GeoJSON图层完成 ({len(locations_to_draw)}个坐标点)")
+                else:
+                    for tp in route_turn_points:
+                        parsed = parse_turn_point(tp, route_name)
+                        if parsed is None:
+                            continue
+                        lat_tp, lon_tp, t_type, tooltip = parsed
+                        icon_color, icon_text, _ = TURN_MARKER_STYLES[t_type]
 
-                    if t_type == "left":
-                        icon_color = 'blue'
-                        icon_text = 'L'
-                        type_label = "左转"
-                    elif t_type == "right":
-                        icon_color = 'orange'
-                        icon_text = 'R'
-                        type_label = "右转"
-                    elif t_type == "uturn":
-                        icon_color = 'purple'
-                        icon_text = 'U'
-                        type_label = "掉头"
-                    else:
-                        continue
+                        turn_icon = folium.features.DivIcon(
+                            icon_size=(18, 18),
+                            icon_anchor=(9, 9),
+                            class_name=f"turn-{t_type}-marker route-{i}",
+                            html=f'''
+                                <div style="
+                                    width: 16px;
+                                    height: 16px;
+                                    border-radius: 50%;
+                                    background-color: {icon_color};
+                                    color: white;
+                                    font-size: 11px;
+                                    text-align: center;
+                                    line-height: 16px;
+                                    box-shadow: 0 0 3px #000;
+                                ">{icon_text}</div>
+                            '''
+                        )
 
-                    if type_idx > 0:
-                        order_text = f"第{type_idx}个{type_label}"
-                    elif idx > 0:
-                        order_text = f"全程第{idx}个{type_label}"
-                    else:
-                        order_text = type_label
+                        folium.Marker(
+                            [lat_tp, lon_tp],
+                            icon=turn_icon,
+                            tooltip=tooltip
+                        ).add_to(fg)
+                        turn_marker_count += 1
 
-                    if from_road or to_road:
-                        fr = from_road or "未知道路"
-                        tr = to_road or "未知道路"
-                        trans_text = f"，由 {fr} 转到 {tr}"
-                    else:
-                        trans_text = ""
-
-                    tooltip = f"{route_name} - {order_text}{trans_text}"
-
-                    turn_icon = folium.features.DivIcon(
-                        icon_size=(18, 18),
-                        icon_anchor=(9, 9),
-                        class_name=f"turn-{t_type}-marker route-{i}",
-                        html=f'''
-                            <div style="
-                                width: 16px;
-                                height: 16px;
-                                border-radius: 50%;
-                                background-color: {icon_color};
-                                color: white;
-                                font-size: 11px;
-                                text-align: center;
-                                line-height: 16px;
-                                box-shadow: 0 0 3px #000;
-                            ">{icon_text}</div>
-                        '''
-                    )
+                print(f"    - 转向标记完成 (共{turn_marker_count}个: L={route_left_turns}, R={route_right_turns}, U={route_uturns})")
+
+                if not canvas:
+                    # 使用 AntPath 实现动态路线效果（流动虚线动画）
+                    AntPath(
+                        locations_to_draw,
+                        color=color,
+                        weight=3,  # 线条粗细（调细）
+                        opacity=0.85,
+                        tooltip=route_name,
+                        delay=1200,  # 动画速度（毫秒，越大越慢）
+                        dash_array=[10, 20],  # 虚线样式 [线段长度, 间隔长度]
+                        pulse_color='#FFFFFF',  # 流动部分颜色（白色）
+                        reverse=False,  # 正向流动
+                        hardwareAccelerated=True,  # 硬件加速
+                    ).add_to(fg)
+
+                    self.log_updated.emit(f"    - 动态路线绘制完成 ({len(locations_to_draw)}个坐标点)")
 
                     folium.Marker(
-                        [lat_tp, lon_tp],
-                        icon=turn_icon,
-                        tooltip=tooltip
+                        [start_point['lat'], start_point['lon']],
+                        tooltip=f"{route_name} - 起点",
+                        icon=folium.Icon(color='lightgreen', icon='play', prefix='fa'),
+                        popup=f"<b>{route_name}</b><br>起点"
                     ).add_to(fg)
-                    turn_marker_count += 1
 
-                print(f"    - 转向标记完成 (共{turn_marker_count}个: L={route_left_turns}, R={route_right_turns}, U={route_uturns})")
+                    folium.Marker(
+                        [end_point['lat'], end_point['lon']],
+                        tooltip=f"{route_name} - 终点",
+                        icon=folium.Icon(color='darkred', icon='stop', prefix='fa'),
+                        popup=f"<b>{route_name}</b><br>终点"
+                    ).add_to(fg)
+
+                    self.log_updated.emit(f"    - 起点/终点标记完成")
 
-                fg.add_to(m)
+                    fg.add_to(m)
 
                 route_distance = self.calculate_route_distance(points)
                 total_distance += route_distance
@@ -1961,24 +1627,22 @@ class RouteGenerator(QThread):
                     total_elevated_distance += elevated_distance
 
                 legend_html += f'''
-                <div style="display: flex; align-items: center; margin-bottom: 6px; font-size: 14px;">
-                    <input type="checkbox" id="checkbox-{i}" checked
-                           onchange="toggleRoute({i}, this.checked)"
-                           style="margin-right: 6px; width: 16px; height: 16px;">
-                    <div style="background-color: {color}; width: 16px; height: 16px; margin-right: 6px; border-radius: 2px;"></div>
-                    <label for="checkbox-{i}" style="cursor: pointer; font-size: 14px;">{route_name} ({round(route_distance, 2)} 公里)</label>
+                <div class="route-legend-item">
+                    <input type="checkbox" id="checkbox-{i}" checked onchange="toggleRoute({i}, this.checked)">
+                    <div class="route-legend-swatch" style="background-color: {color};"></div>
+                    <label for="checkbox-{i}">{route_name} ({round(route_distance, 2)} 公里)</label>
                 </div>
                 '''
 
                 if route_left_turns > 0 or route_right_turns > 0 or route_uturns > 0:
                     legend_html += f'''
-                    <div style="margin-left: 24px; font-size: 13px; margin-top: -3px; margin-bottom: 5px; color: #555;">
+                    <div class="route-legend-turns">
                         左转: {route_left_turns} 个，右转: {route_right_turns} 个，掉头: {route_uturns} 个
                     </div>
                     '''
 
                 legend_html += f'''
-                <div id="route-info-{i}" class="route-info" style="margin-left: 24px; font-size: 13px; margin-bottom: 10px; color: #333;">
+                <div id="route-info-{i}" class="route-info">
                     <div>高速: {round(highway_distance, 2)} 公里 ({round(highway_distance/route_distance*100 if route_distance > 0 else 0, 1)}%)</div>
                     <div>高架: {round(elevated_distance, 2)} 公里 ({round(elevated_distance/route_distance*100 if route_distance > 0 else 0, 1)}%)</div>
                     <div>普通: {round(route_distance - highway_distance - elevated_distance, 2)} 公里 ({round((route_distance - highway_distance - elevated_distance)/route_distance*100 if route_distance > 0 else 0, 1)}%)</div>
@@ -1990,36 +1654,36 @@ class RouteGenerator(QThread):
 
         self.log_updated.emit(f"\n  添加图例和控制脚本...")
         legend_html += '''
-        <div style="margin-top: 10px; border-top: 1px solid #ccc; padding-top: 10px;">
-            <div style="font-weight: bold; font-size: 14px; margin-bottom: 6px;">转向位置标注</div>
-            <div style="font-size: 14px; margin-bottom: 5px;">
-                <label style="cursor:pointer; margin-right: 12px;">
-                    <input type="checkbox" id="toggle-left-turns" checked onchange="toggleTurnMarkers('left', this.checked)" style="width: 14px; height: 14px;">
+        <div class="route-legend-section">
+            <div class="route-legend-section-title">转向位置标注</div>
+            <div class="route-legend-toggles">
+                <label>
+                    <input type="checkbox" id="toggle-left-turns" checked onchange="toggleTurnMarkers('left', this.checked)">
                     左转路口
                 </label>
-                <label style="cursor:pointer; margin-right: 12px;">
-                    <input type="checkbox" id="toggle-right-turns" checked onchange="toggleTurnMarkers('right', this.checked)" style="width: 14px; height: 14px;">
+                <label>
+                    <input type="checkbox" id="toggle-right-turns" checked onchange="toggleTurnMarkers('right', this.checked)">
                     右转路口
                 </label>
-                <label style="cursor:pointer;">
-                    <input type="checkbox" id="toggle-uturns" checked onchange="toggleTurnMarkers('uturn', this.checked)" style="width: 14px; height: 14px;">
+                <label>
+                    <input type="checkbox" id="toggle-uturns" checked onchange="toggleTurnMarkers('uturn', this.checked)">
                     掉头路口
                 </label>
             </div>
-            <div style="margin-top: 8px; border-top: 1px solid #eee; padding-top: 8px; text-align: center;">
-                <button onclick="toggleAllRoutes(true)" style="margin-right: 10px; padding: 5px 12px; font-size: 13px; cursor: pointer;">全选路线</button>
-                <button onclick="toggleAllRoutes(false)" style="padding: 5px 12px; font-size: 13px; cursor: pointer;">全不选路线</button>
+            <div class="route-legend-buttons">
+                <button onclick="toggleAllRoutes(true)">全选路线</button>
+                <button onclick="toggleAllRoutes(false)">全不选路线</button>
             </div>
         </div>
         '''
 
         legend_html += f'''
-        <div style="border-top: 1px solid #ccc; margin-top: 8px; padding-top: 8px; font-size: 14px;">
-            <div style="font-weight: bold; text-align: center; font-size: 15px; margin-bottom: 4px;">总里程: {round(total_distance, 2)} 公里</div>
-            <div style="text-align: center;">高速总里程: {round(total_highway_distance, 2)} 公里 ({round(total_highway_distance/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
-            <div style="text-align: center;">高架总里程: {round(total_elevated_distance, 2)} 公里 ({round(total_elevated_distance/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
-            <div style="text-align: center;">普通道路总里程: {round(total_distance - total_highway_distance - total_elevated_distance, 2)} 公里 ({round((total_distance - total_highway_distance - total_elevated_distance)/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
-            <div style="text-align: center; margin-top: 6px;">
+        <div class="route-legend-total">
+            <div class="route-legend-total-title">总里程: {round(total_distance, 2)} 公里</div>
+            <div>高速总里程: {round(total_highway_distance, 2)} 公里 ({round(total_highway_distance/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
+            <div>高架总里程: {round(total_elevated_distance, 2)} 公里 ({round(total_elevated_distance/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
+            <div>普通道路总里程: {round(total_distance - total_highway_distance - total_elevated_distance, 2)} 公里 ({round((total_distance - total_highway_distance - total_elevated_distance)/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
+            <div class="route-legend-total-turns">
                 总左转路口: {int(total_left_turns)} 个，
                 总右转路口: {int(total_right_turns)} 个，
                 总掉头路口: {int(total_uturns)} 个
@@ -2028,163 +1692,47 @@ class RouteGenerator(QThread):
         '''
 
         legend_html += '</div>'
-        m.get_root().html.add_child(folium.Element(legend_html))
 
-        map_info_html = '''
-        <div id="map-info-box" style="position: fixed;
-            top: 10px; left: 50px; width: 260px;
-            background-color: white; border:2px solid grey; z-index:9999;
-            font-size:14px; font-family: 'Microsoft YaHei', Arial, sans-serif;
-            padding: 12px; border-radius: 5px;">
-            <div style="font-weight: bold; font-size: 15px; margin-bottom: 8px;">地图说明:</div>
-            <div style="margin-bottom: 5px; font-size: 14px;"><span style="color:lightgreen;">●</span> 浅绿色标记为路线起点</div>
-            <div style="margin-bottom: 5px; font-size: 14px;"><span style="color:darkred;">●</span> 深红色标记为路线终点</div>
-            <div style="margin-bottom: 5px; font-size: 14px;">➤ 动态流动线条表示行驶方向</div>
-            <div style="margin-bottom: 5px; font-size: 14px;">路线颜色与右侧图例对应</div>
-            <div style="margin-top: 10px; text-align: center;">
-                <button id="toggle-markers-btn" style="padding: 6px 12px; cursor: pointer; background-color: #f0f0f0; border: 1px solid #ccc; border-radius: 4px; font-weight: bold; font-size: 13px;">隐藏所有标记</button>
+        direction_hint = "● 圆点标记为转向路口" if canvas else "➤ 动态流动线条表示行驶方向"
+        map_info_html = f'''
+        <div id="map-info-box">
+            <div class="map-info-title">地图说明:</div>
+            <div class="map-info-line"><span style="color:lightgreen;">●</span> 浅绿色标记为路线起点</div>
+            <div class="map-info-line"><span style="color:darkred;">●</span> 深红色标记为路线终点</div>
+            <div class="map-info-line">{direction_hint}</div>
+            <div class="map-info-line">路线颜色与右侧图例对应</div>
+            <div class="map-info-buttons">
+                <button id="toggle-markers-btn">隐藏所有标记</button>
             </div>
         </div>
         '''
 
-        m.get_root().html.add_child(folium.Element(map_info_html))
-
-        marker_control_js = '''
-        <script>
-        document.addEventListener('DOMContentLoaded', function() {
-            var btn = document.getElementById('toggle-markers-btn');
-            if (!btn) { return; }
-            var markersHidden = false;
-            btn.onclick = function() {
-                if (markersHidden) {
-                    window.location.reload();
-                    return;
-                }
-                markersHidden = true;
-                this.textContent = '显示所有标记';
-                this.style.backgroundColor = '#ffcccc';
-                var styleEl = document.getElementById('marker-style');
-                if (!styleEl) {
-                    styleEl = document.createElement('style');
-                    styleEl.id = 'marker-style';
-                    document.head.appendChild(styleEl);
-                }
-                styleEl.textContent = `
-                    .leaflet-marker-pane *,
-                    .leaflet-shadow-pane *,
-                    .leaflet-popup-pane * {
-                        display: none !important;
-                        visibility: hidden !important;
-                        opacity: 0 !important;
-                        width: 0 !important;
-                        height: 0 !important;
-                        overflow: hidden !important;
-                        position: absolute !important;
-                        left: -9999px !important;
-                        top: -9999px !important;
-                        pointer-events: none !important;
-                        z-index: -9999 !important;
-                    }
-                `;
-                setTimeout(function() {
-                    var markerPane = document.querySelector('.leaflet-marker-pane');
-                    var shadowPane = document.querySelector('.leaflet-shadow-pane');
-                    var popupPane = document.querySelector('.leaflet-popup-pane');
-                    if (markerPane) markerPane.innerHTML = '';
-                    if (shadowPane) shadowPane.innerHTML = '';
-                    if (popupPane) popupPane.innerHTML = '';
-                }, 100);
-            };
-        });
-        </script>
-        '''
-
-        m.get_root().html.add_child(folium.Element(marker_control_js))
-
-        route_control_js = '''
-        <script>
-        document.addEventListener('DOMContentLoaded', function() {
-            setTimeout(function() {
-                var layerControls = document.querySelectorAll('.leaflet-control-layers-selector');
-                var routeLayers = [];
-                var layerNames = [];
-                for (var i = 0; i < layerControls.length; i++) {
-                    routeLayers.push(layerControls[i]);
-                    var label = layerControls[i].nextSibling;
-                    while (label && label.nodeType !== 1) { label = label.nextSibling; }
-                    layerNames.push(label ? label.textContent.trim() : '未命名图层');
-                }
-
-                window.toggleRoute = function(index, show) {
-                    var checkboxId = 'checkbox-' + index;
-                    var checkboxLabel = document.querySelector('label[for="' + checkboxId + '"]');
-                    if (checkboxLabel) {
-                        var routeName = checkboxLabel.textContent.trim().split(' (')[0];
-                        for (var i = 0; i < layerNames.length; i++) {
-                            if (layerNames[i] === routeName) {
-                                if (routeLayers[i].checked !== show) {
-                                    routeLayers[i].click();
-                                }
-                                break;
-                            }
-                        }
-                        var routeInfoDiv = document.getElementById('route-info-' + index);
-                        if (routeInfoDiv) { routeInfoDiv.style.display = show ? 'block' : 'none'; }
-
-                        var turnMarkers = document.getElementsByClassName('route-' + index);
-                        for (var k = 0; k < turnMarkers.length; k++) {
-                            turnMarkers[k].style.display = show ? 'block' : 'none';
-                        }
-                    }
-                };
-
-                window.toggleTurnMarkers = function(type, show) {
-                    var className = 'turn-' + type + '-marker';
-                    var markers = document.getElementsByClassName(className);
-                    for (var i = 0; i < markers.length; i++) {
-                        markers[i].style.display = show ? 'block' : 'none';
-                    }
-                };
-
-                window.toggleAllRoutes = function(show) {
-                    var checkboxes = document.querySelectorAll('input[id^="checkbox-"]');
-                    for (var i = 0; i < checkboxes.length; i++) {
-                        checkboxes[i].checked = show;
-                        var index = parseInt(checkboxes[i].id.replace('checkbox-', ''));
-                        toggleRoute(index, show);
-                    }
-                };
-
-                for (var i = 0; i < routeLayers.length; i++) {
-                    (function(index, layerName) {
-                        routeLayers[index].addEventListener('change', function() {
-                            var checkboxes = document.querySelectorAll('input[id^="checkbox-"]');
-                            for (var j = 0; j < checkboxes.length; j++) {
-                                var checkboxId = checkboxes[j].id;
-                                var checkboxLabel = document.querySelector('label[for="' + checkboxId + '"]');
-                                if (checkboxLabel && checkboxLabel.textContent.trim().split(' (')[0] === layerName) {
-                                    checkboxes[j].checked = this.checked;
-                                    var routeIndex = parseInt(checkboxId.replace('checkbox-', ''));
-                                    var routeInfoDiv = document.getElementById('route-info-' + routeIndex);
-                                    if (routeInfoDiv) { routeInfoDiv.style.display = this.checked ? 'block' : 'none'; }
-
-                                    var turnMarkers = document.getElementsByClassName('route-' + routeIndex);
-                                    for (var k = 0; k < turnMarkers.length; k++) {
-                                        turnMarkers[k].style.display = this.checked ? 'block' : 'none';
-                                    }
-                                    break;
-                                }
-                            }
-                        });
-                    })(i, layerNames[i]);
-                }
-
-            }, 1500);
-        });
-        </script>
-        '''
+        # 图例样式和控制脚本写成地图旁的共享资源文件，页面只引用
+        if canvas:
+            # 图层、开关函数和"隐藏所有标记"按钮都由 Canvas 渲染脚本提供
+            tags = map_asset_tags(self.output_dir, ('route_map.css', ROUTE_MAP_CSS),
+                                  ('route_canvas.js', ROUTE_CANVAS_JS))
+            # 路线几何数据拆成单独的数据文件，页面只内联路线索引，显示且进入视野时才加载
+            route_index = write_route_sidecars(self.output_dir, canvas_routes,
+                                               os.path.splitext(self.MAP_FILENAME)[0])
+            route_script = canvas_route_map_script(m.get_name(), route_index)
+            if template:
+                m.add_header(tags)
+                m.add_body(legend_html)
+                m.add_body(map_info_html)
+                m.add_body(route_script)
+            else:
+                m.get_root().header.add_child(folium.Element(tags))
+                m.get_root().html.add_child(folium.Element(legend_html))
+                m.get_root().html.add_child(folium.Element(map_info_html))
+                m.get_root().html.add_child(folium.Element(route_script))
+            print(f"--- 地图创建完成 ---\n")
+            return m
 
-        m.get_root().html.add_child(folium.Element(route_control_js))
+        m.get_root().html.add_child(folium.Element(legend_html))
+        m.get_root().html.add_child(folium.Element(map_info_html))
+        tags = map_asset_tags(self.output_dir, ('route_map.css', ROUTE_MAP_CSS), ('route_map.js', ROUTE_MAP_JS))
+        m.get_root().header.add_child(folium.Element(tags))
         folium.LayerControl(collapsed=True).add_to(m)
 
         print(f"--- 地图创建完成 ---\n")
@@ -2318,6 +1866,60 @@ class SettingsDialog(QDialog):
         self.rectify_checkbox.setStyleSheet("font-size: 22px;")
         form_layout.addWidget(self.rectify_checkbox, row, 1)
 
+        # 分块搜索开关
+        row += 1
+        tiled_search_label = QLabel("分块搜索:")
+        tiled_search_label.setStyleSheet("font-size: 22px;")
+        form_layout.addWidget(tiled_search_label, row, 0)
+
+        self.tiled_search_checkbox = QCheckBox("按区域分块并发搜索（地点更多）")
+        self.tiled_search_checkbox.setStyleSheet("font-size: 22px;")
+        form_layout.addWidget(self.tiled_search_checkbox, row, 1)
+
+        # 够用即停开关和超额系数
+        row += 1
+        early_stop_label = QLabel("够用即停:")
+        early_stop_label.setStyleSheet("font-size: 22px;")
+        form_layout.addWidget(early_stop_label, row, 0)
+
+        early_stop_layout = QHBoxLayout()
+        self.early_stop_checkbox = QCheckBox("按路线需求搜索，超额系数")
+        self.early_stop_checkbox.setStyleSheet("font-size: 22px;")
+        early_stop_layout.addWidget(self.early_stop_checkbox)
+        self.overfetch_input = QLineEdit()
+        self.overfetch_input.setPlaceholderText("1.5")
+        self.overfetch_input.setFixedWidth(80)
+        self.overfetch_input.setFixedHeight(40)
+        self.overfetch_input.setStyleSheet("font-size: 22px;")
+        early_stop_layout.addWidget(self.overfetch_input)
+        early_stop_layout.addStretch()
+        form_layout.addLayout(early_stop_layout, row, 1)
+
+        # 地图渲染方式
+        row += 1
+        map_render_label = QLabel("地图渲染:")
+        map_render_label.setStyleSheet("font-size: 22px;")
+        form_layout.addWidget(map_render_label, row, 0)
+
+        self.map_render_mode_combo = QComboBox()
+        self.map_render_mode_combo.addItem("🗺️ 标准(folium)", "folium")
+        self.map_render_mode_combo.addItem("⚡ Canvas/GeoJSON(大批量)", "canvas")
+        self.map_render_mode_combo.addItem("🚀 模板直出(超大批量)", "template")
+        self.map_render_mode_combo.setFixedWidth(360)
+        self.map_render_mode_combo.setFixedHeight(40)
+        self.map_render_mode_combo.setStyleSheet("font-size: 22px;")
+        form_layout.addWidget(self.map_render_mode_combo, row, 1)
+
+        # 生成后自动获取真实路线
+        row += 1
+        auto_fetch_label = QLabel("真实路线:")
+        auto_fetch_label.setStyleSheet("font-size: 22px;")
+        form_layout.addWidget(auto_fetch_label, row, 0)
+
+        self.auto_fetch_polylines_checkbox = QCheckBox("生成路线后自动获取真实驾车路线（消耗驾车API额度）")
+        self.auto_fetch_polylines_checkbox.setStyleSheet("font-size: 22px;")
+        form_layout.addWidget(self.auto_fetch_polylines_checkbox, row, 1)
+
         layout.addLayout(form_layout)
 
         # ========== 起点/终点设置 ==========
@@ -2539,6 +2141,24 @@ class SettingsDialog(QDialog):
             if hasattr(self.parent_window, 'rectify_checkbox'):
                 self.rectify_checkbox.setChecked(self.parent_window.rectify_checkbox.isChecked())
 
+            # 加载分块搜索状态
+            if hasattr(self.parent_window, 'tiled_search_checkbox'):
+                self.tiled_search_checkbox.setChecked(self.parent_window.tiled_search_checkbox.isChecked())
+
+            # 加载够用即停设置
+            if hasattr(self.parent_window, 'early_stop_checkbox'):
+                self.early_stop_checkbox.setChecked(self.parent_window.early_stop_checkbox.isChecked())
+                self.overfetch_input.setText(self.parent_window.overfetch_input.text())
+
+            # 加载地图渲染方式
+            if hasattr(self.parent_window, 'map_render_mode_combo'):
+                self.map_render_mode_combo.setCurrentIndex(
+                    max(0, self.map_render_mode_combo.findData(self.parent_window.map_render_mode_combo.currentData())))
+
+            # 加载自动获取真实路线设置
+            if hasattr(self.parent_window, 'auto_fetch_polylines_checkbox'):
+                self.auto_fetch_polylines_checkbox.setChecked(self.parent_window.auto_fetch_polylines_checkbox.isChecked())
+
             # 加载起点设置
             if hasattr(self.parent_window, 'start_point_mode'):
                 mode = self.parent_window.start_point_mode
@@ -2806,6 +2426,23 @@ class SettingsDialog(QDialog):
             if hasattr(self.parent_window, 'rectify_checkbox'):
                 self.parent_window.rectify_checkbox.setChecked(self.rectify_checkbox.isChecked())
 
+            # 保存分块搜索状态
+            if hasattr(self.parent_window, 'tiled_search_checkbox'):
+                self.parent_window.tiled_search_checkbox.setChecked(self.tiled_search_checkbox.isChecked())
+
+            # 保存够用即停设置
+            if hasattr(self.parent_window, 'early_stop_checkbox'):
+                self.parent_window.early_stop_checkbox.setChecked(self.early_stop_checkbox.isChecked())
+                self.parent_window.overfetch_input.setText(self.overfetch_input.text())
+
+            # 保存地图渲染方式
+            if hasattr(self.parent_window, 'map_render_mode_combo'):
+                self.parent_window.map_render_mode_combo.setCurrentIndex(self.map_render_mode_combo.currentIndex())
+
+            # 保存自动获取真实路线设置
+            if hasattr(self.parent_window, 'auto_fetch_polylines_checkbox'):
+                self.parent_window.auto_fetch_polylines_checkbox.setChecked(self.auto_fetch_polylines_checkbox.isChecked())
+
             # 保存起点设置
             if self.auto_start_radio.isChecked():
                 self.parent_window.start_point_mode = "auto"
@@ -3103,11 +2740,12 @@ class FilesManagerDialog(QDialog):
             QMessageBox.critical(self, "删除失败", str(e))
 
 
-class MainWindow(QMainWindow):
+class MainWindow(QMainWindow, RoutePipelineMixin):
     # 定义信号用于线程安全的UI更新
     update_status_signal = pyqtSignal(str, str)  # (text, color)
     set_button_enabled_signal = pyqtSignal(str, bool)  # (button_name, enabled)
     update_table_signal = pyqtSignal()
+    repair_routes_signal = pyqtSignal(object)  # 被删除的地点，路线修复在主线程进行
     
     def __init__(self):
         # 性能优化配置
@@ -3135,14 +2773,11 @@ class MainWindow(QMainWindow):
         
         # 高德地图API设置
         # 主API密钥
-        self.key = '46fa5492b6c1effefb33cff59a0a9536'
-        # 5cd11205cc7744d742da10dda92daecd
+        self.key = DEFAULT_AMAP_KEY
         # 备用API密钥列表 - 如果主密钥不起作用，可以尝试这些
-        self.backup_keys = [
-            '8325164e247e15eea68b59e89200988b',  # 备用密钥1
-            '3fabc36268a955439fc99a589aacbd87',  # 备用密钥2
-            '2b2d86f7b4f48047e7d5b3cec6e9f51f'   # 备用密钥3
-        ]
+        self.backup_keys = list(DEFAULT_BACKUP_KEYS)
+        # 密钥池：搜索、纠偏等请求统一从这里取密钥并限流
+        self.key_pool = ApiKeyPool([self.key] + self.backup_keys)
         
         # 设置窗口图标
         self.setWindowIcon(QIcon(self.get_icon_path()))
@@ -3154,6 +2789,7 @@ class MainWindow(QMainWindow):
         self.valid_locations = []              # 有效的地点（带坐标）
         self.map_file_path = None
         self.route_data = []                   # 生成的路线数据
+        self.route_session = None              # 路线生成会话（已使用/可用地点索引）
         self.combined_map_path = None          # 所有路线的综合地图
         self.show_heatmap = False              # 是否显示热力图
         self.auto_open_map = False             # 是否自动打开生成的地图（默认关闭）
@@ -3182,16 +2818,7 @@ class MainWindow(QMainWindow):
 
         
         # 【路线规划配置参数】
-        self.route_config = {
-            'waypoint_min_distance': 0.5,      # 途径点距起/终点最小距离：0.5公里(500米)
-            'waypoint_max_distance': 15,       # 途径点距起/终点最大距离：15公里
-            'between_waypoint_min': 0.5,       # 相邻途径点最小距离：0.5公里(500米)
-            'between_waypoint_max': 1.0,       # 相邻途径点最大距离：1.0公里(1000米)
-            'non_adjacent_min': 0.5,           # 不相邻点最小距离：0.5公里(500米)
-            'dedup_distance': 0.2,             # 地点去重距离：0.2公里(200米)
-            'similarity_threshold': 0.6,       # 路线相似度阈值
-            'enable_deduplication': True,      # 启用去重功能
-        }
+        self.route_config = dict(DEFAULT_ROUTE_CONFIG)
         
         # 路线策略配置
         self.route_strategy = 34  # 默认走高速
@@ -3212,6 +2839,7 @@ class MainWindow(QMainWindow):
         self.http_server = None
         self.http_server_port = None  # 动态分配端口
         self.current_map_path = None  # 当前地图文件路径
+        self.location_map_stale = False  # 地图页面就地更新后，地图文件是否落后于地点状态
         # HTTP服务器延迟启动，在程序完全加载后再启动以加快启动速度
         QTimer.singleShot(500, self.start_http_server)
         
@@ -3227,6 +2855,18 @@ class MainWindow(QMainWindow):
         self.json_dir = os.path.join(self.files_base_dir, "json_files")
         os.makedirs(self.excel_dir, exist_ok=True)
         os.makedirs(self.json_dir, exist_ok=True)
+        # 路线规划缓存（相同输入重新生成时直接复用）
+        self.plan_cache = PlanCache(os.path.join(self.files_base_dir, "plan_cache"))
+        # 真实驾车路线缓存（后台获取的路线坐标）
+        self.polyline_cache = PolylineCache(os.path.join(self.files_base_dir, "polyline_cache"))
+        # 行政区边界缓存（按区县多边形搜索和筛选地点）
+        self.district_cache = DistrictBoundaryCache(os.path.join(self.files_base_dir, "district_cache"))
+        # 备选纠偏结果缓存（周边道路搜索/逆地理编码，约10米精度）
+        self.road_snap_cache = RoadSnapCache(os.path.join(self.files_base_dir, "road_snap_cache"))
+        # 离线道路线段库（由已获取的驾车路线坐标构建，纠偏时优先离线吸附）
+        self.road_segment_store = RoadSegmentStore(os.path.join(self.files_base_dir, "road_segments"))
+        # 搜索断点（暂停或重启后从断点继续搜索）
+        self.search_checkpoint = SearchCheckpoint(os.path.join(self.files_base_dir, "search_checkpoints"))
         
         # 当前主题
         self.current_theme = "light"
@@ -3238,6 +2878,7 @@ class MainWindow(QMainWindow):
         self.update_status_signal.connect(self._on_update_status)
         self.set_button_enabled_signal.connect(self._on_set_button_enabled)
         self.update_table_signal.connect(self._update_location_table)
+        self.repair_routes_signal.connect(self._repair_routes_after_map_delete)
         
         self.init_ui()
         
@@ -3455,6 +3096,11 @@ class MainWindow(QMainWindow):
                 'distance_tolerance': self.distance_tolerance_input.text() if hasattr(self, 'distance_tolerance_input') else '',
                 'location_filter': self.location_filter_input.text() if hasattr(self, 'location_filter_input') else '',
                 'rectify_enabled': self.rectify_checkbox.isChecked() if hasattr(self, 'rectify_checkbox') else True,
+                'tiled_search': self.tiled_search_checkbox.isChecked() if hasattr(self, 'tiled_search_checkbox') else False,
+                'early_stop': self.early_stop_checkbox.isChecked() if hasattr(self, 'early_stop_checkbox') else False,
+                'overfetch_factor': self.overfetch_input.text() if hasattr(self, 'overfetch_input') else '',
+                'map_render_mode': self.map_render_mode_combo.currentData() if hasattr(self, 'map_render_mode_combo') else 'folium',
+                'auto_fetch_polylines': self.auto_fetch_polylines_checkbox.isChecked() if hasattr(self, 'auto_fetch_polylines_checkbox') else False,
                 # 起点设置
                 'start_point_mode': self.start_point_mode if hasattr(self, 'start_point_mode') else 'auto',
                 'specified_start_index': self.specified_start_index if hasattr(self, 'specified_start_index') else None,
@@ -3500,6 +3146,17 @@ class MainWindow(QMainWindow):
                     self.location_filter_input.setText(settings['location_filter'])
                 if hasattr(self, 'rectify_checkbox'):
                     self.rectify_checkbox.setChecked(settings.get('rectify_enabled', True))
+                if hasattr(self, 'tiled_search_checkbox'):
+                    self.tiled_search_checkbox.setChecked(settings.get('tiled_search', False))
+                if hasattr(self, 'early_stop_checkbox'):
+                    self.early_stop_checkbox.setChecked(settings.get('early_stop', False))
+                if hasattr(self, 'overfetch_input') and settings.get('overfetch_factor'):
+                    self.overfetch_input.setText(settings['overfetch_factor'])
+                if hasattr(self, 'map_render_mode_combo'):
+                    index = self.map_render_mode_combo.findData(settings.get('map_render_mode', 'folium'))
+                    self.map_render_mode_combo.setCurrentIndex(max(0, index))
+                if hasattr(self, 'auto_fetch_polylines_checkbox'):
+                    self.auto_fetch_polylines_checkbox.setChecked(settings.get('auto_fetch_polylines', False))
                 # 加载起点设置
                 self.start_point_mode = settings.get('start_point_mode', 'auto')
                 self.specified_start_index = settings.get('specified_start_index', None)
@@ -4202,6 +3859,16 @@ class MainWindow(QMainWindow):
         self.spatial_sort_combo.setStyleSheet("font-size: 22px;")
         row1_layout.addWidget(self.spatial_sort_combo)
 
+        # 规划模式选择
+        row1_layout.addWidget(QLabel("规划模式:"))
+        self.plan_mode_combo = QComboBox()
+        self.plan_mode_combo.addItem("🔗 逐条贪心", "greedy")
+        self.plan_mode_combo.addItem("🧮 全局均衡聚类", "balanced")
+        self.plan_mode_combo.setFixedWidth(220)
+        self.plan_mode_combo.setFixedHeight(40)
+        self.plan_mode_combo.setStyleSheet("font-size: 22px;")
+        row1_layout.addWidget(self.plan_mode_combo)
+
         row1_layout.addStretch()
         route_main_layout.addLayout(row1_layout)
         
@@ -4219,7 +3886,19 @@ class MainWindow(QMainWindow):
         self.location_filter_input.setText("")
         self.rectify_checkbox = QCheckBox()
         self.rectify_checkbox.setChecked(True)
-        
+        self.tiled_search_checkbox = QCheckBox()
+        self.tiled_search_checkbox.setChecked(False)
+        self.early_stop_checkbox = QCheckBox()
+        self.early_stop_checkbox.setChecked(False)
+        self.overfetch_input = QLineEdit()
+        self.overfetch_input.setText("")
+        self.map_render_mode_combo = QComboBox()
+        self.map_render_mode_combo.addItem("🗺️ 标准(folium)", "folium")
+        self.map_render_mode_combo.addItem("⚡ Canvas/GeoJSON(大批量)", "canvas")
+        self.map_render_mode_combo.addItem("🚀 模板直出(超大批量)", "template")
+        self.auto_fetch_polylines_checkbox = QCheckBox()
+        self.auto_fetch_polylines_checkbox.setChecked(False)
+
         # 第二行：操作按钮
         row2_layout = QHBoxLayout()
         row2_layout.setSpacing(15)
@@ -4238,6 +3917,13 @@ class MainWindow(QMainWindow):
         self.all_routes_button.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         self.all_routes_button.clicked.connect(self.view_amap_route_links)
 
+        # 获取真实路线按钮（调用驾车路线API，完成后重新保存路线文件并刷新地图）
+        self.fetch_polyline_btn = QPushButton("🛣️ 获取真实路线")
+        self.fetch_polyline_btn.setEnabled(False)
+        self.fetch_polyline_btn.setFixedHeight(60)
+        self.fetch_polyline_btn.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.fetch_polyline_btn.clicked.connect(self.fetch_real_routes)
+
         # 导出JSON按钮
         self.export_json_btn = QPushButton("💾 导出JSON")
         self.export_json_btn.clicked.connect(self.export_json_files)
@@ -4259,6 +3945,7 @@ class MainWindow(QMainWindow):
         
         row2_layout.addWidget(self.generate_route_btn, 1)
         row2_layout.addWidget(self.all_routes_button, 1)
+        row2_layout.addWidget(self.fetch_polyline_btn, 1)
         row2_layout.addWidget(self.export_json_btn, 1)
         row2_layout.addWidget(self.export_excel_btn, 1)
         row2_layout.addWidget(self.reset_btn, 1)
@@ -4559,9 +4246,10 @@ class MainWindow(QMainWindow):
             else:
                 location_filter_distance = None  # 未填写，不筛选
             
-            # 在线程中执行搜索
+            # 在线程中执行搜索（分块搜索或关键字轮询搜索）
+            search_target = self._search_scene_tiled if self.tiled_search_checkbox.isChecked() else self._search_scene_thread
             threading.Thread(
-                target=self._search_scene_thread,
+                target=search_target,
                 args=(city, selected_districts, selected_scenes, location_filter_distance),
                 daemon=True
             ).start()
@@ -4571,343 +4259,6 @@ class MainWindow(QMainWindow):
             self.update_api_response(f"❌ 搜索场景地点失败: {str(e)}")
             QMessageBox.critical(self, "错误", f"搜索场景地点失败: {str(e)}")
     
-    def _search_scene_thread(self, city, selected_districts, selected_scenes, location_filter_distance):
-        """在线程中搜索场景地点并直接获取坐标（轮询方式）
-
-        Args:
-            city: 城市名称
-            selected_districts: 选中的区域列表
-            selected_scenes: 选中的场景列表
-            location_filter_distance: 地点筛选距离（公里），None表示不筛选
-        """
-        try:
-            added_count = 0
-            filtered_no_coord = 0
-            filtered_wrong_district = 0
-            filtered_too_close = 0
-            total_found = 0
-
-            # 密钥管理：主密钥 + 备用密钥列表
-            all_keys = [self.key] + self.backup_keys
-            current_key_index = 0
-            current_key = all_keys[current_key_index]
-            
-            # 记录已搜索的场景
-            for scene in selected_scenes:
-                if scene not in self.searched_scenes:
-                    self.searched_scenes.append(scene)
-            
-            # 为每个(场景, 行政区)组合创建搜索状态
-            # 状态包含: 场景名、行政区、当前页码、当前页内索引、该页的POI列表、是否耗尽
-            search_states = []
-            for scene in selected_scenes:
-                for district in selected_districts:
-                    search_states.append({
-                        'scene': scene,
-                        'district': district,
-                        'page': 1,
-                        'poi_index': 0,
-                        'pois': [],
-                        'exhausted': False,
-                        'total_pages': None
-                    })
-            
-            if not search_states:
-                return
-            
-            # 轮询获取地点
-            current_index = 0
-            consecutive_failures = 0  # 连续失败计数器
-            max_consecutive_failures = len(search_states) * 2  # 最大连续失败次数
-            
-            while True:
-                if self.is_search_stopped:
-                    self.update_api_response("⏹️ 搜索已终止")
-                    return
-                if self.is_search_paused:
-                    self.update_api_response(f"⏸️ 搜索已暂停")
-                    return
-                
-                # 检查是否所有搜索都已耗尽
-                if all(state['exhausted'] for state in search_states):
-                    break
-                
-                # 获取当前要处理的搜索状态
-                state = search_states[current_index]
-                
-                # 跳过已耗尽的搜索
-                if state['exhausted']:
-                    current_index = (current_index + 1) % len(search_states)
-                    continue
-                
-                # 如果当前页的POI已经处理完，获取下一页
-                if state['poi_index'] >= len(state['pois']):
-                    scene = state['scene']
-                    district = state['district']
-                    page = state['page']
-
-                    # 构建API请求URL - 使用当前密钥
-                    if district:
-                        search_keywords = f"{scene} {district}"
-                    else:
-                        search_keywords = scene
-
-                    url = f"https://restapi.amap.com/v3/place/text?keywords={quote(search_keywords)}&city={quote(city)}&output=json&offset=20&page={page}&key={current_key}"
-
-                    try:
-                        response = requests.get(url, timeout=10)
-                        data = response.json()
-                    except Exception as e:
-                        self.update_api_response(f"❌ API请求失败: {str(e)}")
-                        state['exhausted'] = True
-                        current_index = (current_index + 1) % len(search_states)
-                        consecutive_failures += 1
-                        if consecutive_failures >= max_consecutive_failures:
-                            break
-                        continue
-
-                    if data.get('status') != '1':
-                        error_info = data.get('info', '未知错误')
-                        error_code = data.get('infocode', '')
-
-                        # 检查是否是密钥相关错误（配额用尽、密钥无效等）
-                        key_error_codes = ['10001', '10003', '10004', '10005', '10009', '10011']
-                        if error_code in key_error_codes:
-                            # 尝试切换到下一个密钥
-                            if current_key_index < len(all_keys) - 1:
-                                current_key_index += 1
-                                current_key = all_keys[current_key_index]
-                                self.update_api_response(f"⚠️ 密钥{current_key_index}达到限制({error_info})，切换到备用密钥{current_key_index + 1}")
-                                # 不标记为exhausted，重试当前搜索
-                                continue
-                            else:
-                                self.update_api_response(f"❌ 所有密钥都已用尽，搜索终止")
-                                break
-
-                        self.update_api_response(f"❌ [{scene}] 搜索失败: {error_info}")
-                        state['exhausted'] = True
-                        current_index = (current_index + 1) % len(search_states)
-                        consecutive_failures += 1
-                        if consecutive_failures >= max_consecutive_failures:
-                            break
-                        continue
-                    
-                    pois = data.get('pois', [])
-                    if not pois:
-                        state['exhausted'] = True
-                        current_index = (current_index + 1) % len(search_states)
-                        consecutive_failures += 1
-                        if consecutive_failures >= max_consecutive_failures:
-                            break
-                        continue
-                    
-                    # 获取总页数
-                    if state['total_pages'] is None:
-                        total = int(data.get('count', '0'))
-                        state['total_pages'] = (total // 20) + 1
-                    
-                    # 保存这一页的POI
-                    state['pois'] = pois
-                    state['poi_index'] = 0
-                    
-                    time.sleep(0.3)  # API请求间隔
-                
-                # 处理当前POI
-                found_valid = False
-                while state['poi_index'] < len(state['pois']):
-                    if self.is_search_stopped or self.is_search_paused:
-                        break
-
-                    poi = state['pois'][state['poi_index']]
-                    state['poi_index'] += 1
-
-                    total_found += 1
-                    name = poi.get('name', '')
-                    location_str = poi.get('location', '')
-                    poi_district = poi.get('adname', '')
-                    scene = state['scene']
-
-                    if not name:
-                        continue
-
-                    # 筛选1: 检查是否有坐标
-                    if not location_str:
-                        filtered_no_coord += 1
-                        self.update_api_response(f"   ⛔ {name} - 无坐标，已过滤")
-                        continue
-
-                    try:
-                        lon, lat = map(float, location_str.split(','))
-                    except:
-                        filtered_no_coord += 1
-                        self.update_api_response(f"   ⛔ {name} - 坐标格式错误，已过滤")
-                        continue
-
-                    # 检查是否已存在（名称+经纬度）
-                    existing_loc = None
-                    for existing in self.valid_locations:
-                        if (existing['name'] == name and
-                            abs(existing.get('lon', 0) - lon) < 0.000001 and
-                            abs(existing.get('lat', 0) - lat) < 0.000001):
-                            existing_loc = existing
-                            break
-
-                    if existing_loc:
-                        # 已存在相同地点，自动跳过（去重）
-                        self.update_api_response(f"   ⛔ 跳过重复地点: {name}")
-                        continue
-
-                    # 检查名称是否已存在（仅名称重复）
-                    if name in self.locations or any(c['name'] == name for c in self.coordinates):
-                        continue
-
-                    # 筛选2: 检查是否在选中区域内
-                    if selected_districts and selected_districts[0] != "":
-                        if not any(d in poi_district for d in selected_districts):
-                            filtered_wrong_district += 1
-                            self.update_api_response(f"   ⛔ {name} - 不在选中区域({poi_district})，已过滤")
-                            continue
-
-                    # 筛选3: 检查与已有地点的距离
-                    too_close = False
-                    if location_filter_distance is not None and location_filter_distance > 0:
-                        new_point = {'lat': lat, 'lon': lon}
-                        for existing in self.valid_locations:
-                            dist = self.calculate_distance_between_points(new_point, existing)
-                            if dist < location_filter_distance:
-                                too_close = True
-                                filtered_too_close += 1
-                                self.update_api_response(f"   ⛔ {name} - 距离{existing['name']}太近({dist*1000:.0f}m<{location_filter_distance*1000:.0f}m)，已过滤")
-                                break
-
-                    if too_close:
-                        continue
-
-                    # 通过所有筛选，添加到列表
-                    loc_data = {
-                        'name': name,
-                        'lon': lon,
-                        'lat': lat,
-                        'district': poi_district,
-                        'scene': scene,
-                        'status': 'active'  # 新增地点默认为正常状态
-                    }
-                    self.coordinates.append(loc_data)
-                    self.valid_locations.append(loc_data)
-                    self.locations.append(name)
-                    added_count += 1
-                    found_valid = True
-                    consecutive_failures = 0  # 成功获取，重置失败计数
-
-                    self.update_api_response(f"   ✅ {name} ({poi_district}) [{scene}] - 坐标: {lon:.6f}, {lat:.6f}")
-
-                    # 更新表格（线程安全）
-                    self._safe_update_table()
-
-                    # 更新状态（线程安全）
-                    valid_count = len(self.valid_locations)
-                    self._safe_update_status(f"已获取 {valid_count} 个有效坐标", "blue")
-
-                    # 刷新生成按钮状态
-                    self.refresh_generate_button_state()
-
-                    # 找到一个有效地点后，立即切换到下一个场景
-                    break
-
-                # 如果没有找到有效地点，增加失败计数
-                if not found_valid:
-                    consecutive_failures += 1
-                    if consecutive_failures >= max_consecutive_failures:
-                        self.update_api_response(f"⚠️ 连续{consecutive_failures}次未找到有效地点，可能已获取所有可用地点")
-                        break
-                
-                # 如果当前页处理完且还有下一页，准备获取下一页
-                if state['poi_index'] >= len(state['pois']):
-                    if state['total_pages'] is None or state['page'] < state['total_pages']:
-                        state['page'] += 1
-                        state['pois'] = []
-                        state['poi_index'] = 0
-                    else:
-                        state['exhausted'] = True
-                
-                # 切换到下一个搜索状态
-                current_index = (current_index + 1) % len(search_states)
-            
-            # 搜索完成
-            self.update_api_response(f"\n📊 搜索统计:")
-            self.update_api_response(f"   总共找到: {total_found} 个地点")
-            self.update_api_response(f"   成功添加: {added_count} 个")
-            self.update_api_response(f"   过滤-无坐标: {filtered_no_coord} 个")
-            self.update_api_response(f"   过滤-不在区域: {filtered_wrong_district} 个")
-            self.update_api_response(f"   过滤-距离太近: {filtered_too_close} 个")
-            self.update_api_response(f"   当前有效坐标: {len(self.valid_locations)} 个")
-            
-            # 标记坐标就绪状态
-            self.coordinates_ready = False  # 先设为False，等纠偏完成后设为True
-            
-            # 执行坐标纠偏（修正到最近公开道路）- 根据开关状态决定
-            rectify_enabled = self.rectify_checkbox.isChecked()
-            if not self.is_search_paused and len(self.valid_locations) > 0 and rectify_enabled:
-                # 设置纠偏状态标志
-                self.is_rectifying = True
-                self.refresh_generate_button_state()  # 禁用生成按钮
-                
-                self._safe_update_status(f"正在进行坐标纠偏...", "blue")
-                
-                # 批量纠偏坐标（使用并发优化）
-                rectified_locations = self.rectify_coordinates_batch_concurrent(
-                    self.valid_locations, 
-                    batch_size=30,
-                    max_workers=3  # 使用3个并发线程
-                )
-                
-                # 更新坐标列表
-                self.valid_locations = rectified_locations
-                self.coordinates = rectified_locations.copy()
-                
-                # 更新表格显示
-                self._safe_update_table()
-                
-                # 统计纠偏数量
-                rectified_count = sum(1 for loc in rectified_locations if loc.get('rectified', False))
-                self.update_api_response(f"📍 坐标纠偏完成: {rectified_count}/{len(rectified_locations)} 个点已修正到道路")
-                
-                # 纠偏完成，恢复状态
-                self.is_rectifying = False
-                self.coordinates_ready = True
-            elif not rectify_enabled:
-                self.update_api_response(f"ℹ️ 坐标纠偏已禁用，使用原始坐标")
-                self.coordinates_ready = True  # 未启用纠偏，坐标直接就绪
-            
-            if self.is_search_paused:
-                self._safe_update_status(f"搜索已暂停，当前有 {len(self.valid_locations)} 个有效坐标", "orange")
-            else:
-                status_suffix = "（已纠偏）" if rectify_enabled else ""
-                self._safe_update_status(f"搜索完成，共 {len(self.valid_locations)} 个有效坐标{status_suffix}", "green")
-            
-        except Exception as e:
-            logger.error(f"搜索线程错误: {str(e)}", exc_info=True)
-            self.update_api_response(f"❌ 搜索线程错误: {str(e)}")
-            self._safe_update_status(f"搜索出错: {str(e)}", "red")
-        finally:
-            # 如果是暂停状态，保持按钮可用；否则恢复默认状态
-            if self.is_search_paused and not self.is_search_stopped:
-                # 暂停状态：保持暂停/终止按钮可用
-                logger.info("搜索已暂停，保持按钮可用状态")
-            else:
-                # 完成或终止状态：恢复按钮默认状态
-                self._safe_set_button_enabled('search_scene_btn', True)
-                self._safe_set_button_enabled('pause_btn', False)
-                self._safe_set_button_enabled('stop_btn', False)
-                # 重置暂停按钮文本
-                if hasattr(self, 'pause_btn'):
-                    try:
-                        self.pause_btn.setText("⏸️ 暂停搜索")
-                    except:
-                        pass
-                self.refresh_generate_button_state()
-                logger.info("搜索线程结束，按钮状态已恢复")
-    
     def toggle_search_pause(self):
         """切换搜索暂停/继续状态"""
         if self.is_search_paused:
@@ -4973,6 +4324,33 @@ class MainWindow(QMainWindow):
             # 使用默认值：不限制
             return 0, float('inf'), 0
     
+    def _is_rectify_enabled(self):
+        """是否启用坐标纠偏（界面开关）"""
+        return self.rectify_checkbox.isChecked()
+    
+    def _get_spatial_sort_type(self):
+        """空间排序算法类型（界面选择）"""
+        return self.spatial_sort_combo.currentData()
+    
+    def _get_distance_calc_mode(self):
+        """距离计算方式（界面选择）"""
+        return self.distance_calc_combo.currentData()
+
+    def _get_search_targets(self, selected_scenes):
+        """够用即停时各场景的目标地点数（按界面上的路线数、途径点数和超额系数计算）"""
+        if not self.early_stop_checkbox.isChecked():
+            return None
+        try:
+            overfetch_factor = float(self.overfetch_input.text().strip() or 1.5)
+        except ValueError:
+            overfetch_factor = 1.5
+        return search_scene_targets(selected_scenes, self.route_num_spin.value(), self.waypoint_spin.value(),
+                                    self.scene_ratios, overfetch_factor)
+    
+    def _get_city_name(self):
+        """当前城市名称（界面选择）"""
+        return self.city_combo.currentText().strip() if hasattr(self, 'city_combo') else ""
+    
     def on_city_changed(self):
         """城市选择变化时更新行政区选项"""
         # 清除所有已有的行政区多选框（除了全区域）
@@ -5048,6 +4426,9 @@ class MainWindow(QMainWindow):
                         if loc.get('name') == loc_name and loc.get('status', 'active') != 'deleted':
                             loc['status'] = 'deleted'
                             deleted_count += 1
+                            # 同步路线生成会话，之后的增量修复不再选用该地点
+                            if self.route_session is not None:
+                                self.route_session.remove_point(loc)
 
                             # 添加到deleted_locations用于地图标记
                             self.deleted_locations.append({
@@ -5086,20 +4467,23 @@ class MainWindow(QMainWindow):
                     logger.info(f"收到HTTP请求: {self.path}")
                     parsed_path = urlparse(self.path)
                     
-                    # 处理重新生成地图的请求
+                    # 处理重新生成地图的请求（if_stale=1 时只在地图文件落后于地点状态时重新生成）
                     if parsed_path.path == '/regenerate_map':
                         logger.info("处理重新生成地图请求")
                         try:
+                            query_params = parse_query_string(parsed_path.query)
+                            regenerated = not query_params.get('if_stale') or parent.location_map_stale
                             # 调用主窗口的重新生成地图方法
-                            map_path = parent.regenerate_map_file()
-                            
+                            map_path = parent.regenerate_map_file() if regenerated else parent.current_map_path
+
                             self.send_response(200)
                             self.send_header('Content-type', 'application/json')
                             self.send_header('Access-Control-Allow-Origin', '*')
                             self.end_headers()
                             response = json.dumps({
-                                'status': 'success', 
-                                'message': '地图已重新生成',
+                                'status': 'success',
+                                'message': '地图已重新生成' if regenerated else '地图已是最新',
+                                'regenerated': bool(regenerated),
                                 'map_path': map_path
                             }, ensure_ascii=False)
                             self.wfile.write(response.encode('utf-8'))
@@ -5145,16 +4529,29 @@ class MainWindow(QMainWindow):
                         if location_name:
                             # 调用主窗口的删除方法
                             logger.info(f"调用delete_location_from_map函数")
-                            parent.delete_location_from_map(location_name)
-                            
-                            # 返回成功响应
+                            deleted_loc = parent.delete_location_from_map(location_name)
+
+                            # 返回该地点的状态补丁，页面据此就地更新标记
                             self.send_response(200)
                             self.send_header('Content-type', 'application/json')
                             self.send_header('Access-Control-Allow-Origin', '*')
                             self.end_headers()
-                            response = json.dumps({'status': 'success', 'message': f'已删除地点: {location_name}'}, ensure_ascii=False)
+                            if deleted_loc:
+                                response = json.dumps({
+                                    'status': 'success',
+                                    'message': f'已删除地点: {location_name}',
+                                    'patch': {
+                                        'name': deleted_loc['name'],
+                                        'lon': deleted_loc['lon'],
+                                        'lat': deleted_loc['lat'],
+                                        'status': deleted_loc.get('status', 'active'),
+                                        'icon': LOCATION_MARKER_ICONS[deleted_loc.get('status', 'active')]
+                                    }
+                                }, ensure_ascii=False)
+                            else:
+                                response = json.dumps({'status': 'error', 'message': f'未找到地点: {location_name}'}, ensure_ascii=False)
                             self.wfile.write(response.encode('utf-8'))
-                            logger.info(f"已返回成功响应")
+                            logger.info(f"已返回删除结果")
                         else:
                             logger.warning("地点名称为空")
                             self.send_response(400)
@@ -5199,22 +4596,27 @@ class MainWindow(QMainWindow):
             logger.error(f"启动HTTP服务器失败: {str(e)}")
     
     def delete_location_from_map(self, location_name):
-        """从地图页面删除地点（标记为已删除状态）"""
+        """从地图页面删除地点（标记为已删除状态），返回被删除的地点，未找到时返回 None"""
         try:
             logger.info(f"开始处理删除请求: {location_name}")
             logger.info(f"当前valid_locations数量: {len(self.valid_locations)}")
             
             # 查找并标记地点为已删除
             found = False
+            deleted_loc = None
             for loc in self.valid_locations:
                 if loc.get('name') == location_name:
                     logger.info(f"找到地点: {location_name}，当前状态: {loc.get('status', 'active')}")
                     loc['status'] = 'deleted'
                     logger.info(f"已标记为deleted状态")
                     found = True
+                    deleted_loc = loc
                     break
-            
+
             if found:
+                # 页面已就地更新，地图文件等下次打开时再重新生成
+                self.location_map_stale = True
+
                 # 立即更新表格显示（线程安全）
                 logger.info("触发表格更新信号")
                 self.update_table_signal.emit()
@@ -5230,13 +4632,33 @@ class MainWindow(QMainWindow):
                     "orange"
                 )
                 logger.info(f"从地图删除地点成功: {location_name}")
+                
+                # 增量修复经过该地点的路线交给主线程（会读取界面设置并可能调用API），
+                # 删除请求不等待修复完成
+                if self.route_data:
+                    self.repair_routes_signal.emit(deleted_loc)
             else:
                 logger.warning(f"未找到地点: {location_name}")
                 logger.info(f"所有地点名称: {[loc.get('name') for loc in self.valid_locations]}")
-                
+
+            return deleted_loc
+
         except Exception as e:
             logger.error(f"删除地点失败: {str(e)}", exc_info=True)
-    
+            return None
+
+    def _repair_routes_after_map_delete(self, deleted_loc):
+        """增量修复经过被删除地点的路线（主线程，其余路线保持不变）"""
+        try:
+            repaired = self.repair_routes_after_delete(deleted_loc)
+            if repaired:
+                self.last_generated_routes = self.route_data.copy()
+                self.update_api_response(
+                    f"🔧 已重新规划经过 {deleted_loc['name']} 的路线: {', '.join(str(r) for r in repaired)}"
+                )
+        except Exception as e:
+            logger.error(f"修复路线失败: {str(e)}", exc_info=True)
+
     def regenerate_map_file(self):
         """重新生成地图文件（用于删除后更新地图）"""
         try:
@@ -5272,34 +4694,83 @@ class MainWindow(QMainWindow):
             
             logger.info(f"重新生成地图，共 {len(all_locations)} 个地点（正常: {normal_count}，已删除: {deleted_count}）")
             
-            # 计算地图中心点
-            all_lats = [loc['lat'] for loc in all_locations]
-            all_lons = [loc['lon'] for loc in all_locations]
-            center_lat = sum(all_lats) / len(all_lats)
-            center_lon = sum(all_lons) / len(all_lons)
-            
-            # 创建高德地图
-            map = folium.Map(
-                location=[center_lat, center_lon],
-                zoom_start=12,
-                tiles='https://webrd03.is.autonavi.com/appmaptile?lang=zh_cn&size=1&scale=1&style=8&x={x}&y={y}&z={z}',
-                attr='© <a href="https://ditu.amap.com/">高德地图</a>'
-            )
+            # 保存地图文件（使用固定文件名以便覆盖）
+            if self.current_map_path:
+                map_path = self.current_map_path
+            else:
+                temp_dir = tempfile.gettempdir()
+                map_path = os.path.join(temp_dir, "所有地点地图_current.html")
+                self.current_map_path = map_path
+
+            self._write_all_locations_map(all_locations, map_path)
+            logger.info(f"地图文件已保存: {map_path}")
+
+            return map_path
             
-            # 添加地点标记
-            for i, loc in enumerate(all_locations):
-                # 根据状态设置标记颜色
+        except Exception as e:
+            logger.error(f"重新生成地图失败: {str(e)}", exc_info=True)
+            raise
+    
+    def _attach_location_map_assets(self, map_obj, map_dir):
+        """为地点地图引用共享的删除对话框脚本和样式（保存前加入，不再改写已保存的HTML）"""
+        try:
+            tags = map_asset_tags(map_dir, ('location_map.css', LOCATION_MAP_CSS),
+                                  ('location_map.js', LOCATION_MAP_JS))
+            server = f"<script>var LOCATION_MAP_SERVER = 'http://localhost:{self.http_server_port}';</script>"
+            map_obj.get_root().header.add_child(folium.Element(server + '\n' + tags))
+        except Exception as e:
+            logger.error(f"添加地图脚本失败: {str(e)}", exc_info=True)
+
+    def _write_all_locations_map(self, all_locations, map_path):
+        """生成并保存所有地点地图
+
+        标准模式为每个地点创建带弹窗的 folium Marker；Canvas/大批量模式下地点只以数据数组
+        写入页面，由共享脚本放进 MarkerCluster 聚合图层，弹窗在点击时按模板生成。
+        """
+        _lazy_import_folium()
+        clustered = self.map_render_mode_combo.currentData() in ("canvas", "template")
+        map_dir = os.path.dirname(map_path)
+
+        # 计算地图中心点
+        all_lats = [loc['lat'] for loc in all_locations]
+        all_lons = [loc['lon'] for loc in all_locations]
+        center_lat = sum(all_lats) / len(all_lats)
+        center_lon = sum(all_lons) / len(all_lons)
+
+        # 创建高德地图
+        map = folium.Map(
+            location=[center_lat, center_lon],
+            zoom_start=12,
+            tiles='https://webrd03.is.autonavi.com/appmaptile?lang=zh_cn&size=1&scale=1&style=8&x={x}&y={y}&z={z}',
+            attr='© <a href="https://ditu.amap.com/">高德地图</a>',
+            prefer_canvas=clustered
+        )
+
+        if clustered:
+            # 聚合插件脚本放在页面主体中，保证在 Leaflet 之后加载
+            for name, url in MarkerCluster.default_css:
+                map.get_root().header.add_child(folium.CssLink(url), name=name)
+            for name, url in MarkerCluster.default_js:
+                map.get_root().html.add_child(folium.JavascriptLink(url), name=name)
+            map.get_root().header.add_child(folium.Element(
+                map_asset_tags(map_dir, ('location_cluster.js', LOCATION_CLUSTER_JS))))
+            rows = [[loc['name'], round(loc['lon'], 6), round(loc['lat'], 6), loc['status_flag']]
+                    for loc in all_locations]
+            map.get_root().html.add_child(folium.Element(location_map_script(map.get_name(), rows)))
+        else:
+            # 添加地点标记（按地点名称登记，删除后页面按名称找到标记就地更新）
+            markers = []
+            for loc in all_locations:
+                # 根据状态设置标记图标：已删除为红色禁止图标，正常为蓝色信息图标
+                icon_style = LOCATION_MARKER_ICONS['deleted' if loc['status_flag'] == 'deleted' else 'active']
                 if loc['status_flag'] == 'deleted':
-                    color = "red"
-                    icon_name = 'ban'
                     delete_button = "<button disabled style='background-color: #ccc; color: #666; padding: 5px 10px; border: none; border-radius: 3px; cursor: not-allowed;'>已删除</button>"
                 else:
-                    color = "blue"
-                    icon_name = 'info-sign'
-                    delete_button = f"""<button onclick="deleteLocation('{loc['name']}')" 
-                        style='background-color: #f44336; color: white; padding: 5px 10px; border: none; 
+                    # 创建删除按钮，点击时调用删除API
+                    delete_button = f"""<button onclick="deleteLocation('{loc['name']}')"
+                        style='background-color: #f44336; color: white; padding: 5px 10px; border: none;
                         border-radius: 3px; cursor: pointer; margin-top: 5px;'>🗑️ 删除地点</button>"""
-                
+
                 # 创建popup内容
                 popup_html = f"""
                     <div style='width: 200px; font-family: Arial;'>
@@ -5311,276 +4782,22 @@ class MainWindow(QMainWindow):
                         {delete_button}
                     </div>
                 """
-                
-                folium.Marker(
+
+                # 创建标记
+                marker = folium.Marker(
                     location=[loc['lat'], loc['lon']],
                     tooltip=f"{loc['name']} ({loc['status']})",
                     popup=folium.Popup(popup_html, max_width=250),
-                    icon=folium.Icon(color=color, icon=icon_name, prefix='fa')
+                    icon=folium.Icon(color=icon_style['markerColor'], icon=icon_style['icon'],
+                                     prefix=icon_style['prefix'])
                 ).add_to(map)
-            
-            # 保存地图文件（使用固定文件名以便覆盖）
-            if self.current_map_path:
-                map_path = self.current_map_path
-            else:
-                temp_dir = tempfile.gettempdir()
-                map_path = os.path.join(temp_dir, "所有地点地图_current.html")
-                self.current_map_path = map_path
-            
-            map.save(map_path)
-            logger.info(f"地图文件已保存: {map_path}")
-            
-            # 添加JavaScript功能
-            self._add_javascript_to_map(map_path)
-            
-            return map_path
-            
-        except Exception as e:
-            logger.error(f"重新生成地图失败: {str(e)}", exc_info=True)
-            raise
-    
-    def _add_javascript_to_map(self, map_path):
-        """为地图添加JavaScript交互功能"""
-        try:
-            # 在HTML文件中添加JavaScript删除功能
-            with open(map_path, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            # 添加删除地点的JavaScript函数
-            delete_script = f"""
-            <style>
-            /* 自定义对话框样式 */
-            .custom-modal {{
-                display: none;
-                position: fixed;
-                z-index: 9999;
-                left: 0;
-                top: 0;
-                width: 100%;
-                height: 100%;
-                background-color: rgba(0,0,0,0.5);
-            }}
-            .modal-content {{
-                background-color: #fefefe;
-                margin: 15% auto;
-                padding: 20px;
-                border: 1px solid #888;
-                border-radius: 8px;
-                width: 400px;
-                box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-                animation: slideDown 0.3s ease;
-            }}
-            @keyframes slideDown {{
-                from {{ transform: translateY(-50px); opacity: 0; }}
-                to {{ transform: translateY(0); opacity: 1; }}
-            }}
-            .modal-header {{
-                font-size: 18px;
-                font-weight: bold;
-                margin-bottom: 15px;
-                color: #333;
-            }}
-            .modal-body {{
-                margin-bottom: 20px;
-                color: #666;
-                line-height: 1.6;
-            }}
-            .modal-buttons {{
-                text-align: right;
-            }}
-            .modal-btn {{
-                padding: 8px 20px;
-                margin-left: 10px;
-                border: none;
-                border-radius: 4px;
-                cursor: pointer;
-                font-size: 14px;
-                transition: all 0.3s;
-            }}
-            .btn-confirm {{
-                background-color: #f44336;
-                color: white;
-            }}
-            .btn-confirm:hover {{
-                background-color: #da190b;
-            }}
-            .btn-cancel {{
-                background-color: #e0e0e0;
-                color: #333;
-            }}
-            .btn-cancel:hover {{
-                background-color: #d0d0d0;
-            }}
-            .loading-overlay {{
-                display: none;
-                position: fixed;
-                z-index: 10000;
-                left: 0;
-                top: 0;
-                width: 100%;
-                height: 100%;
-                background-color: rgba(0,0,0,0.7);
-            }}
-            .loading-content {{
-                position: absolute;
-                top: 50%;
-                left: 50%;
-                transform: translate(-50%, -50%);
-                background-color: white;
-                padding: 30px;
-                border-radius: 8px;
-                text-align: center;
-            }}
-            .spinner {{
-                border: 4px solid #f3f3f3;
-                border-top: 4px solid #3498db;
-                border-radius: 50%;
-                width: 40px;
-                height: 40px;
-                animation: spin 1s linear infinite;
-                margin: 0 auto 15px;
-            }}
-            @keyframes spin {{
-                0% {{ transform: rotate(0deg); }}
-                100% {{ transform: rotate(360deg); }}
-            }}
-            </style>
-            
-            <!-- 确认对话框 -->
-            <div id="confirmModal" class="custom-modal">
-                <div class="modal-content">
-                    <div class="modal-header">⚠️ 确认删除</div>
-                    <div class="modal-body" id="modalMessage"></div>
-                    <div class="modal-buttons">
-                        <button class="modal-btn btn-cancel" onclick="closeModal()">取消</button>
-                        <button class="modal-btn btn-confirm" onclick="confirmDelete()">确认删除</button>
-                    </div>
-                </div>
-            </div>
-            
-            <!-- 加载中提示 -->
-            <div id="loadingOverlay" class="loading-overlay">
-                <div class="loading-content">
-                    <div class="spinner"></div>
-                    <div>正在删除地点...</div>
-                </div>
-            </div>
-            
-            <script>
-            let currentLocationToDelete = null;
-            let markersMap = {{}};  // 存储地点名称到标记的映射
-            
-            function deleteLocation(locationName) {{
-                currentLocationToDelete = locationName;
-                document.getElementById('modalMessage').innerHTML = 
-                    '确定要删除地点 <strong>"' + locationName + '"</strong> 吗？<br><br>' +
-                    '删除后该地点将标记为<span style="color: red; font-weight: bold;">已删除状态</span>（红色显示），不会从列表中移除。';
-                document.getElementById('confirmModal').style.display = 'block';
-            }}
-            
-            function closeModal() {{
-                document.getElementById('confirmModal').style.display = 'none';
-                currentLocationToDelete = null;
-            }}
-            
-            function confirmDelete() {{
-                if (!currentLocationToDelete) return;
-                
-                const locationToDelete = currentLocationToDelete;
-                
-                // 关闭确认对话框
-                closeModal();
-                
-                // 显示加载中
-                document.getElementById('loadingOverlay').style.display = 'block';
-                document.querySelector('.loading-content div:last-child').textContent = '正在删除地点...';
-
-                // 发送删除请求到Python后端
-                fetch('http://localhost:{self.http_server_port}/delete_location?name=' + encodeURIComponent(locationToDelete))
-                    .then(response => response.json())
-                    .then(data => {{
-                        if (data.status === 'success') {{
-                            // 显示更新状态提示
-                            document.querySelector('.loading-content div:last-child').textContent = '正在重新生成地图...';
-
-                            // 调用后端重新生成地图
-                            return fetch('http://localhost:{self.http_server_port}/regenerate_map')
-                                .then(response => response.json())
-                                .then(mapData => {{
-                                    if (mapData.status === 'success') {{
-                                        // 在loading overlay中显示成功信息（保持位置不变）
-                                        document.querySelector('.spinner').style.display = 'none';
-                                        document.querySelector('.loading-content div:last-child').innerHTML =
-                                            '<span style="color: #4CAF50; font-size: 24px;">✅</span><br><br>' +
-                                            data.message + ' - 地图已更新';
-
-                                        // 0.8秒后自动刷新页面显示新地图
-                                        setTimeout(function() {{
-                                            window.location.reload();
-                                        }}, 800);
-                                    }} else {{
-                                        document.getElementById('loadingOverlay').style.display = 'none';
-                                        alert('❌ 重新生成地图失败: ' + mapData.message);
-                                    }}
-                                }});
-                        }} else {{
-                            document.getElementById('loadingOverlay').style.display = 'none';
-                            alert('❌ 删除失败');
-                        }}
-                    }})
-                    .catch(error => {{
-                        document.getElementById('loadingOverlay').style.display = 'none';
-                        console.error('Error:', error);
-                        alert('❌ 删除请求失败: ' + error.message);
-                    }});
-            }}
-            
-            function showSuccessMessage(message) {{
-                // 创建成功提示
-                const successDiv = document.createElement('div');
-                successDiv.style.cssText = `
-                    position: fixed;
-                    top: 20px;
-                    left: 50%;
-                    transform: translateX(-50%);
-                    background-color: #4CAF50;
-                    color: white;
-                    padding: 15px 30px;
-                    border-radius: 5px;
-                    box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-                    z-index: 10001;
-                    font-size: 16px;
-                    animation: slideDown 0.3s ease;
-                `;
-                successDiv.textContent = message;
-                document.body.appendChild(successDiv);
-                
-                // 3秒后自动移除
-                setTimeout(function() {{
-                    successDiv.remove();
-                }}, 3000);
-            }}
-            
-            // 点击对话框外部关闭
-            window.onclick = function(event) {{
-                const modal = document.getElementById('confirmModal');
-                if (event.target === modal) {{
-                    closeModal();
-                }}
-            }}
-            </script>
-            """
-            
-            # 在</body>标签之前插入脚本
-            html_content = html_content.replace('</body>', delete_script + '</body>')
-            
-            # 写回文件
-            with open(map_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-                
-        except Exception as e:
-            logger.error(f"添加JavaScript失败: {str(e)}", exc_info=True)
-    
+                markers.append((loc['name'], marker.get_name()))
+            map.get_root().html.add_child(folium.Element(location_marker_registry_script(markers)))
+
+        self._attach_location_map_assets(map, map_dir)
+        map.save(map_path)
+        self.location_map_stale = False
+
     def show_all_locations_map(self):
         """显示所有地点及经纬度坐标在地图上"""
         try:
@@ -5619,63 +4836,11 @@ class MainWindow(QMainWindow):
             self.update_api_response(f"🗺️ 开始生成所有地点地图，共 {len(all_locations)} 个地点")
             self.update_api_response(f"   正常: {normal_count} 个，已删除: {deleted_count} 个")
             
-            # 计算地图中心点
-            all_lats = [loc['lat'] for loc in all_locations]
-            all_lons = [loc['lon'] for loc in all_locations]
-            center_lat = sum(all_lats) / len(all_lats)
-            center_lon = sum(all_lons) / len(all_lons)
-            
-            # 创建高德地图
-            map = folium.Map(
-                location=[center_lat, center_lon],
-                zoom_start=12,
-                tiles='https://webrd03.is.autonavi.com/appmaptile?lang=zh_cn&size=1&scale=1&style=8&x={x}&y={y}&z={z}',
-                attr='© <a href="https://ditu.amap.com/">高德地图</a>'
-            )
-            
-            # 添加地点标记
-            for i, loc in enumerate(all_locations):
-                # 根据状态设置标记颜色
-                if loc['status_flag'] == 'deleted':
-                    color = "red"  # 已删除地点用红色
-                    icon_name = 'ban'  # 禁止图标
-                    delete_button = "<button disabled style='background-color: #ccc; color: #666; padding: 5px 10px; border: none; border-radius: 3px; cursor: not-allowed;'>已删除</button>"
-                else:
-                    color = "blue"  # 正常地点用蓝色
-                    icon_name = 'info-sign'  # 信息图标
-                    # 创建删除按钮，点击时调用删除API
-                    delete_button = f"""<button onclick="deleteLocation('{loc['name']}')" 
-                        style='background-color: #f44336; color: white; padding: 5px 10px; border: none; 
-                        border-radius: 3px; cursor: pointer; margin-top: 5px;'>🗑️ 删除地点</button>"""
-                
-                # 创建popup内容
-                popup_html = f"""
-                    <div style='width: 200px; font-family: Arial;'>
-                        <b style='font-size: 14px;'>{loc['name']}</b><br>
-                        <hr style='margin: 5px 0;'>
-                        <span style='font-size: 12px;'>经度: {loc['lon']:.6f}</span><br>
-                        <span style='font-size: 12px;'>纬度: {loc['lat']:.6f}</span><br>
-                        <span style='font-size: 12px;'>状态: <span style='color: {"red" if loc['status_flag'] == "deleted" else "green"};'>{loc['status']}</span></span><br>
-                        {delete_button}
-                    </div>
-                """
-                
-                # 创建标记
-                folium.Marker(
-                    location=[loc['lat'], loc['lon']],
-                    tooltip=f"{loc['name']} ({loc['status']})",
-                    popup=folium.Popup(popup_html, max_width=250),
-                    icon=folium.Icon(color=color, icon=icon_name, prefix='fa')
-                ).add_to(map)
-            
             # 保存地图文件（使用固定文件名以便覆盖）
             temp_dir = tempfile.gettempdir()
             map_path = os.path.join(temp_dir, "所有地点地图_current.html")
             self.current_map_path = map_path  # 保存当前地图路径
-            map.save(map_path)
-
-            # 添加JavaScript交互功能
-            self._add_javascript_to_map(map_path)
+            self._write_all_locations_map(all_locations, map_path)
 
             # 自动打开地图
             webbrowser.open(f'file://{os.path.abspath(map_path)}')
@@ -6209,9 +5374,10 @@ class MainWindow(QMainWindow):
                     updated_coords.append(loc)
                     updated_valid_locations.append(loc)
             
-            # 更新全局数据
+            # 更新全局数据（地点列表整体替换，路线生成会话在下次使用时按现有路线重建）
             self.coordinates = updated_coords
             self.valid_locations = updated_valid_locations
+            self.route_session = None
             
             # 更新表格UI
             # 1. 清空表格
@@ -6324,1880 +5490,28 @@ class MainWindow(QMainWindow):
         except Exception:
             pass
     
-    # ======================== 坐标纠偏功能 ========================
-    
-    def rectify_coordinates_batch(self, locations, batch_size=30):
-        """批量纠偏坐标到最近公开道路
-        
-        使用高德地图轨迹纠偏API，将原始坐标修正到最近的公开道路上
-        
-        Args:
-            locations: 地点列表，每个元素包含 name, lon, lat 等字段
-            batch_size: 每批处理的点数，默认30个（API限制）
-        
-        Returns:
-            rectified_locations: 纠偏后的地点列表
-        """
-        if not locations:
-            return locations
-        
-        self.update_api_response(f"\n🔧 开始坐标纠偏...")
-        self.update_api_response(f"📊 待纠偏坐标数: {len(locations)}")
-        self.update_api_response(f"📦 批次大小: {batch_size}")
-        
-        rectified_locations = []
-        total_batches = (len(locations) + batch_size - 1) // batch_size
-        
-        for batch_idx in range(total_batches):
-            start_idx = batch_idx * batch_size
-            end_idx = min(start_idx + batch_size, len(locations))
-            batch = locations[start_idx:end_idx]
-            
-            self.update_api_response(f"   📍 处理第 {batch_idx + 1}/{total_batches} 批 ({len(batch)} 个点)...")
-            
-            try:
-                rectified_batch = self._rectify_batch(batch)
-                rectified_locations.extend(rectified_batch)
-                
-                # 统计纠偏结果
-                corrected = sum(1 for i, loc in enumerate(rectified_batch) 
-                               if loc['lon'] != batch[i]['lon'] or loc['lat'] != batch[i]['lat'])
-                self.update_api_response(f"      ✅ 完成，{corrected}/{len(batch)} 个坐标已纠偏")
-                
-            except Exception as e:
-                logger.error(f"批次 {batch_idx + 1} 纠偏失败: {str(e)}")
-                self.update_api_response(f"      ⚠️ 批次纠偏失败，保留原坐标: {str(e)}")
-                rectified_locations.extend(batch)
-            
-            # 添加短暂延迟，避免API频率限制
-            if batch_idx < total_batches - 1:
-                time.sleep(0.3)
-        
-        self.update_api_response(f"🔧 坐标纠偏完成，共处理 {len(rectified_locations)} 个点")
-        
-        return rectified_locations
-    
-    def rectify_coordinates_batch_concurrent(self, locations, batch_size=30, max_workers=3):
-        """并发批量纠偏坐标到最近公开道路（性能优化版本）
-        
-        使用多线程并发处理多个批次，大幅提升纠偏效率
-        
-        Args:
-            locations: 地点列表，每个元素包含 name, lon, lat 等字段
-            batch_size: 每批处理的点数，默认30个（API限制）
-            max_workers: 最大并发线程数，默认3（避免API频率限制）
-        
-        Returns:
-            rectified_locations: 纠偏后的地点列表
-        """
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-        
-        if not locations:
-            return locations
-        
-        self.update_api_response(f"\n🔧 开始坐标纠偏（并发模式）...")
-        self.update_api_response(f"📊 待纠偏坐标数: {len(locations)}")
-        self.update_api_response(f"📦 批次大小: {batch_size}")
-        self.update_api_response(f"🚀 并发线程数: {max_workers}")
-        
-        # 将locations分成多个批次
-        batches = []
-        for i in range(0, len(locations), batch_size):
-            batch = locations[i:i + batch_size]
-            batches.append((i // batch_size, batch))
-        
-        total_batches = len(batches)
-        self.update_api_response(f"📦 总批次数: {total_batches}")
-        
-        # 用于存储结果，保持顺序
-        results = [None] * total_batches
-        completed_count = 0
-        
-        def process_batch(batch_info):
-            """处理单个批次"""
-            batch_idx, batch = batch_info
-            try:
-                rectified_batch = self._rectify_batch(batch)
-                corrected = sum(1 for i, loc in enumerate(rectified_batch) 
-                               if loc['lon'] != batch[i]['lon'] or loc['lat'] != batch[i]['lat'])
-                return batch_idx, rectified_batch, corrected, None
-            except Exception as e:
-                logger.error(f"批次 {batch_idx + 1} 纠偏失败: {str(e)}")
-                return batch_idx, batch, 0, str(e)
-        
-        # 使用线程池并发处理
-        start_time = time.time()
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_batch = {executor.submit(process_batch, batch_info): batch_info[0] for batch_info in batches}
-            
-            for future in as_completed(future_to_batch):
-                batch_idx, rectified_batch, corrected, error = future.result()
-                results[batch_idx] = rectified_batch
-                completed_count += 1
-                
-                if error:
-                    self.update_api_response(f"   ⚠️ 批次 {batch_idx + 1}/{total_batches} 失败: {error}")
-                else:
-                    self.update_api_response(f"   ✅ 批次 {batch_idx + 1}/{total_batches} 完成 ({corrected}/{len(rectified_batch)} 纠偏)")
-                
-                # 更新进度状态
-                progress_pct = int(completed_count / total_batches * 100)
-                self._safe_update_status(f"坐标纠偏中... {completed_count}/{total_batches} ({progress_pct}%)", "blue")
-        
-        # 合并结果
-        rectified_locations = []
-        for batch_result in results:
-            if batch_result:
-                rectified_locations.extend(batch_result)
-        
-        elapsed_time = time.time() - start_time
-        self.update_api_response(f"🔧 坐标纠偏完成，共处理 {len(rectified_locations)} 个点")
-        self.update_api_response(f"⏱️ 耗时: {elapsed_time:.1f} 秒")
-        
-        return rectified_locations
-    
-    def _rectify_batch(self, batch):
-        """对一批坐标进行纠偏
-        
-        使用高德地图轨迹纠偏API (grasproad)
-        API文档: https://lbs.amap.com/api/track/lieying-kaifa/api/grasproad
-        
-        Args:
-            batch: 一批地点，每个包含 name, lon, lat
-        
-        Returns:
-            rectified_batch: 纠偏后的地点列表
-        """
-        # 构建请求数据
-        # 轨迹纠偏API需要每个点包含：x(经度), y(纬度), sp(速度), ag(方向), tm(时间戳)
-        # 对于静态POI点，我们使用模拟值
-        
-        base_time = int(time.time())
-        trace_points = []
-        
-        for i, loc in enumerate(batch):
-            point = {
-                "x": loc['lon'],
-                "y": loc['lat'],
-                "sp": 10,  # 模拟速度 10 km/h
-                "ag": 0,   # 方向角度
-                "tm": base_time + i * 60  # 每个点间隔60秒
-            }
-            trace_points.append(point)
-        
-        # 高德轨迹纠偏API
-        url = "https://restapi.amap.com/v4/grasproad/driving"
-        
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        params = {
-            "key": self.key
-        }
-        
-        request_data = {
-            "data": trace_points
-        }
-        
-        try:
-            response = requests.post(
-                url, 
-                params=params, 
-                json=request_data, 
-                headers=headers,
-                timeout=30
-            )
-            
-            result = response.json()
-            
-            # 调试：记录API响应
-            logger.info(f"轨迹纠偏API响应: errcode={result.get('errcode')}, errmsg={result.get('errmsg')}")
-            
-            if result.get('errcode') == 10000 or result.get('errcode') == 0:
-                # 成功
-                roads_data = result.get('data', {}).get('roads', [])
-                
-                # 调试：记录roads数据
-                logger.info(f"轨迹纠偏返回 {len(roads_data)} 条道路数据")
-                
-                if roads_data:
-                    # 解析纠偏后的坐标
-                    rectified_batch = []
-                    
-                    for i, loc in enumerate(batch):
-                        new_loc = loc.copy()
-                        
-                        # 尝试从纠偏结果中获取对应的坐标
-                        if i < len(roads_data):
-                            road_point = roads_data[i]
-                            
-                            # 高德轨迹纠偏API返回的坐标在crosspoint字段中
-                            # 格式: "经度,纬度"
-                            crosspoint = road_point.get('crosspoint', '')
-                            if crosspoint:
-                                try:
-                                    lon_str, lat_str = crosspoint.split(',')
-                                    new_loc['lon'] = float(lon_str)
-                                    new_loc['lat'] = float(lat_str)
-                                    new_loc['rectified'] = True
-                                    new_loc['road_name'] = road_point.get('roadname', '')
-                                    # 记录原始坐标
-                                    new_loc['original_lon'] = loc['lon']
-                                    new_loc['original_lat'] = loc['lat']
-                                    logger.info(f"纠偏成功: {loc['name']} ({loc['lon']},{loc['lat']}) -> ({new_loc['lon']},{new_loc['lat']}) 道路:{new_loc['road_name']}")
-                                except (ValueError, AttributeError) as e:
-                                    logger.warning(f"解析crosspoint失败: {crosspoint}, 错误: {e}")
-                            elif 'x' in road_point and 'y' in road_point:
-                                # 兼容其他可能的返回格式
-                                new_loc['lon'] = float(road_point['x'])
-                                new_loc['lat'] = float(road_point['y'])
-                                new_loc['rectified'] = True
-                                new_loc['original_lon'] = loc['lon']
-                                new_loc['original_lat'] = loc['lat']
-                        
-                        rectified_batch.append(new_loc)
-                    
-                    return rectified_batch
-                else:
-                    # 没有返回纠偏数据，尝试备选方案
-                    logger.warning("轨迹纠偏API未返回roads数据，尝试备选方案")
-                    return self._rectify_using_nearby_road(batch)
-            else:
-                # API返回错误
-                error_msg = result.get('errmsg', result.get('errdetail', '未知错误'))
-                logger.warning(f"轨迹纠偏API错误: {error_msg}")
-                
-                # 尝试使用道路吸附API作为备选方案
-                return self._rectify_using_nearby_road(batch)
-                
-        except requests.exceptions.Timeout:
-            logger.warning("轨迹纠偏API超时")
-            return self._rectify_using_nearby_road(batch)
-        except Exception as e:
-            logger.error(f"轨迹纠偏请求失败: {str(e)}")
-            return self._rectify_using_nearby_road(batch)
-    
-    def _rectify_using_nearby_road(self, batch):
-        """备选纠偏方案：使用周边道路搜索获取最近道路上的点
-        
-        原理：
-        1. 使用逆地理编码获取该点附近的道路信息
-        2. 使用周边搜索找到最近的道路/路口
-        3. 将坐标吸附到最近的道路上
+    def get_target_distance_range(self):
+        """获取用户设置的目标里程范围
+        返回: (min_distance, max_distance) 或 None（表示未设置，随机规划）
         """
-        self.update_api_response(f"   🔄 使用周边道路搜索进行纠偏...")
-        rectified_batch = []
-        
-        for loc in batch:
-            try:
-                # 方案1: 使用周边搜索找最近的道路/路口
-                url = "https://restapi.amap.com/v3/place/around"
-                params = {
-                    "key": self.key,
-                    "location": f"{loc['lon']},{loc['lat']}",
-                    "radius": 100,  # 100米范围
-                    "types": "190301|190302|190303|190304|190305",  # 道路类型: 路口、交叉口等
-                    "offset": 1,  # 只取最近的1个
-                    "extensions": "base"
-                }
-                
-                response = requests.get(url, params=params, timeout=10)
-                result = response.json()
-                
-                if result.get('status') == '1':
-                    pois = result.get('pois', [])
-                    if pois and len(pois) > 0:
-                        # 取最近的路口/道路点
-                        nearest_poi = pois[0]
-                        location = nearest_poi.get('location', '')
-                        if location:
-                            lon_str, lat_str = location.split(',')
-                            new_loc = loc.copy()
-                            new_loc['lon'] = float(lon_str)
-                            new_loc['lat'] = float(lat_str)
-                            new_loc['rectified'] = True
-                            new_loc['road_name'] = nearest_poi.get('name', '')
-                            new_loc['original_lon'] = loc['lon']
-                            new_loc['original_lat'] = loc['lat']
-                            rectified_batch.append(new_loc)
-                            logger.info(f"周边搜索纠偏成功: {loc['name']} -> {new_loc['road_name']}")
-                            continue
-                
-                # 方案2: 如果周边搜索没找到，尝试逆地理编码获取道路信息
-                new_loc = self._rectify_single_point(loc)
-                rectified_batch.append(new_loc)
-                    
-            except Exception as e:
-                logger.warning(f"周边道路搜索失败: {str(e)}")
-                rectified_batch.append(loc)
-            
-            time.sleep(0.1)  # 避免API频率限制
-        
-        return rectified_batch
-    
-    def _rectify_single_point(self, loc):
-        """对单个点进行纠偏：使用逆地理编码获取最近道路，然后搜索道路坐标"""
-        try:
-            # 逆地理编码获取道路信息
-            url = "https://restapi.amap.com/v3/geocode/regeo"
-            params = {
-                "key": self.key,
-                "location": f"{loc['lon']},{loc['lat']}",
-                "extensions": "all",  # 获取详细信息
-                "radius": 100,
-                "roadlevel": 0  # 获取所有级别道路
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            result = response.json()
-            
-            if result.get('status') == '1':
-                regeocode = result.get('regeocode', {})
-                roads = regeocode.get('roads', [])
-                
-                # 如果有道路信息，取最近的道路
-                if roads and len(roads) > 0:
-                    nearest_road = roads[0]
-                    road_location = nearest_road.get('location', '')
-                    road_name = nearest_road.get('name', '')
-                    
-                    if road_location:
-                        lon_str, lat_str = road_location.split(',')
-                        new_loc = loc.copy()
-                        new_loc['lon'] = float(lon_str)
-                        new_loc['lat'] = float(lat_str)
-                        new_loc['rectified'] = True
-                        new_loc['road_name'] = road_name
-                        new_loc['original_lon'] = loc['lon']
-                        new_loc['original_lat'] = loc['lat']
-                        logger.info(f"逆地理纠偏成功: {loc['name']} -> {road_name}")
-                        return new_loc
-                
-                # 没有道路信息，记录最近的街道
-                address_component = regeocode.get('addressComponent', {})
-                street = address_component.get('street', '')
-                if street:
-                    new_loc = loc.copy()
-                    new_loc['nearest_road'] = street
-                    return new_loc
-            
-            return loc
-            
-        except Exception as e:
-            logger.warning(f"单点纠偏失败: {str(e)}")
-            return loc
-    
-    def calculate_distance_between_points(self, point1, point2):
-        """计算两个坐标点之间的直线距离（单位：公里）- Haversine公式"""
-        EARTH_RADIUS = 6371
-        
-        lat1_rad = math.radians(point1['lat'])
-        lon1_rad = math.radians(point1['lon'])
-        lat2_rad = math.radians(point2['lat'])
-        lon2_rad = math.radians(point2['lon'])
-        
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-        
-        a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
-        c = 2 * math.asin(math.sqrt(a))
-        distance = EARTH_RADIUS * c
-        
-        return distance
-    
-    def get_driving_distance(self, point1, point2):
-        """使用高德API获取两点之间的实际驾驶距离（单位：公里）"""
         try:
-            origin = f"{point1['lon']},{point1['lat']}"
-            destination = f"{point2['lon']},{point2['lat']}"
-            
-            # 使用高德地图v5驾车路径规划API
-            route_url = "https://restapi.amap.com/v5/direction/driving"
-            
-            params = {
-                'origin': origin,
-                'destination': destination,
-                'key': self.key,
-                'strategy': 34
-            }
-            
-            response = requests.get(route_url, params=params, timeout=10)
-            data = response.json()
-            
-            if data.get('status') == '1' and data.get('route'):
-                paths = data['route'].get('paths', [])
-                if paths:
-                    # 获取第一条路径的距离（单位：米）
-                    distance_meters = int(paths[0].get('distance', 0))
-                    distance_km = distance_meters / 1000
-                    return distance_km
+            target_text = self.target_distance_input.text().strip()
+            if not target_text:
+                return None  # 未填写，随机规划
             
-            # API调用失败，回退到直线距离
-            return self.calculate_distance_between_points(point1, point2)
+            target_distance = float(target_text)
+            if target_distance <= 0:
+                return None
             
-        except Exception as e:
-            logger.error(f"获取驾驶距离失败: {str(e)}")
-            # 出错时回退到直线距离
-            return self.calculate_distance_between_points(point1, point2)
-    
-    def is_waypoint_in_valid_range(self, waypoint, start_point, end_point, other_waypoints=None):
-        """检查途径点是否在合理的距离范围内"""
-        config = self.route_config
-        
-        dist_to_start = self.calculate_distance_between_points(waypoint, start_point)
-        if not (config['waypoint_min_distance'] <= dist_to_start <= config['waypoint_max_distance']):
-            return False
-        
-        dist_to_end = self.calculate_distance_between_points(waypoint, end_point)
-        if not (config['waypoint_min_distance'] <= dist_to_end <= config['waypoint_max_distance']):
-            return False
-        
-        # 检查与其他途径点的距离
-        non_adj_min = config.get('non_adjacent_min', 0.5)  # 不相邻点最小距离
-        if other_waypoints:
-            for other_wp in other_waypoints:
-                dist_between = self.calculate_distance_between_points(waypoint, other_wp)
-                # 相邻点检查
-                if not (config['between_waypoint_min'] <= dist_between <= config['between_waypoint_max']):
-                    return False
-                # 不相邻点检查（大于500米）
-                if dist_between < non_adj_min:
-                    return False
-        
-        if len(other_waypoints or []) > 0:
-            for other_wp in (other_waypoints or []):
-                if self.are_points_collinear(start_point, waypoint, other_wp):
-                    return False
-        
-        return True
-    
-    def are_points_collinear(self, p1, p2, p3, tolerance=0.05):
-        """检查三个点是否共线"""
-        area = abs(
-            (p2['lat'] - p1['lat']) * (p3['lon'] - p1['lon']) -
-            (p3['lat'] - p1['lat']) * (p2['lon'] - p1['lon'])
-        )
-        
-        return area < tolerance
-    
-    def calculate_route_signature(self, route):
-        """生成路线的指纹（特征值）"""
-        all_points = [
-            (route['start_point']['lon'], route['start_point']['lat']),
-            (route['end_point']['lon'], route['end_point']['lat'])
-        ]
-        for wp in route.get('waypoint_details', []):
-            all_points.append((wp['lon'], wp['lat']))
-        
-        total_distance = 0
-        for i in range(len(all_points) - 1):
-            p1 = {'lat': all_points[i][1], 'lon': all_points[i][0]}
-            p2 = {'lat': all_points[i+1][1], 'lon': all_points[i+1][0]}
-            total_distance += self.calculate_distance_between_points(p1, p2)
-        
-        center_lat = sum(p[1] for p in all_points) / len(all_points)
-        center_lon = sum(p[0] for p in all_points) / len(all_points)
-        
-        signature = {
-            'total_distance': round(total_distance, 2),
-            'center': (round(center_lat, 4), round(center_lon, 4)),
-            'point_count': len(all_points),
-            'points_sorted': tuple(sorted(all_points))
-        }
-        
-        return signature
-    
-    def calculate_route_similarity(self, route1, route2):
-        """计算两条路线的相似度"""
-        sig1 = self.calculate_route_signature(route1)
-        sig2 = self.calculate_route_signature(route2)
-        
-        points1 = set(sig1['points_sorted'])
-        points2 = set(sig2['points_sorted'])
-        overlap = len(points1 & points2)
-        total = len(points1 | points2)
-        point_similarity = overlap / total if total > 0 else 0
-        
-        dist_diff = abs(sig1['total_distance'] - sig2['total_distance'])
-        avg_dist = (sig1['total_distance'] + sig2['total_distance']) / 2
-        distance_similarity = 1 - (dist_diff / avg_dist if avg_dist > 0 else 0)
-        
-        center1 = {'lat': sig1['center'][0], 'lon': sig1['center'][1]}
-        center2 = {'lat': sig2['center'][0], 'lon': sig2['center'][1]}
-        center_dist = self.calculate_distance_between_points(center1, center2)
-        center_similarity = max(0, 1 - (center_dist / 5))
-        
-        final_similarity = (
-            point_similarity * 0.5 +
-            distance_similarity * 0.3 +
-            center_similarity * 0.2
-        )
-        
-        return final_similarity
-    
-    def is_route_duplicate(self, new_route, existing_routes):
-        """检查新路线是否与现有路线重复"""
-        if not self.route_config['enable_deduplication']:
-            return False
-        
-        if not existing_routes:
-            return False
-        
-        for existing_route in existing_routes:
-            similarity = self.calculate_route_similarity(new_route, existing_route)
-            if similarity > self.route_config['similarity_threshold']:
-                self.update_api_response(
-                    f"⚠️ 新路线与已生成的路线 {existing_route['route_id']} 相似度过高 "
-                    f"({similarity:.2%})，已过滤"
-                )
-                return True
-        
-        return False
-    
-    # ======================== 空间排序算法 ========================
-    
-    def select_start_point(self):
-        """根据用户设置的起点模式选择起点
-        
-        Returns:
-            起点地点字典 {name, lon, lat, ...}
-        """
-        if not self.valid_locations:
-            return None
-        
-        mode = self.start_point_mode
-        
-        if mode == "auto":
-            # 自动模式：选择距离质心最近的点作为起点
-            centroid = self.calculate_centroid(self.valid_locations)
-            if centroid:
-                # 找到距离质心最近的实际点
-                closest_point = min(
-                    self.valid_locations,
-                    key=lambda p: self.calculate_distance_between_points(
-                        {'lon': centroid['lon'], 'lat': centroid['lat']}, p
-                    )
-                )
-                self.update_api_response(f"📍 自动起点：选择距离中心最近的点")
-                return closest_point
-            else:
-                return self.valid_locations[0]
-        
-        elif mode == "current_location":
-            # 当前位置模式：尝试获取用户位置
-            current_loc = self.get_current_location()
-            if current_loc:
-                # 注意：不将当前位置添加到valid_locations，只作为起点使用
-                # 这样可以避免干扰序号选择和表格显示
-                self.update_api_response(f"📍 使用当前位置作为起点: {current_loc['lon']:.6f}, {current_loc['lat']:.6f}")
-                return current_loc
-            else:
-                # 获取失败，退回自动模式
-                self.update_api_response("⚠️ 无法获取当前位置，使用自动模式")
-                centroid = self.calculate_centroid(self.valid_locations)
-                if centroid:
-                    return min(
-                        self.valid_locations,
-                        key=lambda p: self.calculate_distance_between_points(
-                            {'lon': centroid['lon'], 'lat': centroid['lat']}, p
-                        )
-                    )
-                return self.valid_locations[0]
-        
-        elif mode == "specified":
-            # 指定序号模式：直接使用valid_locations的索引
-            # 因为表格顾序已经与valid_locations保持一致
-            if self.specified_start_index is not None:
-                # 序号从1开始，索引从0开始
-                idx = self.specified_start_index - 1
-                
-                if 0 <= idx < len(self.valid_locations):
-                    selected_loc = self.valid_locations[idx]
-                    self.update_api_response(
-                        f"📍 使用指定序号 {self.specified_start_index} 作为起点: "
-                        f"{selected_loc['name']} ({selected_loc['lon']:.6f}, {selected_loc['lat']:.6f})"
-                    )
-                    return selected_loc
-                else:
-                    self.update_api_response(
-                        f"⚠️ 序号 {self.specified_start_index} 超出范围 (1-{len(self.valid_locations)})，使用第一个点"
-                    )
-                    if self.valid_locations:
-                        return self.valid_locations[0]
-            else:
-                self.update_api_response("⚠️ 未指定起点序号，使用第一个点")
-                if self.valid_locations:
-                    return self.valid_locations[0]
-        
-        elif mode == "manual":
-            # 手动输入模式：使用用户输入的经纬度和地名
-            if self.manual_start_coords:
-                lon = self.manual_start_coords.get('lon')
-                lat = self.manual_start_coords.get('lat')
-                name = self.manual_start_coords.get('name', '手动输入点')
-
-                if lon is not None and lat is not None:
-                    self.update_api_response(
-                        f"📍 使用手动输入的起点: {name} ({lon:.6f}, {lat:.6f})"
-                    )
-                    return {
-                        'name': name,
-                        'lon': lon,
-                        'lat': lat,
-                        'scene': '手动输入'
-                    }
-                else:
-                    self.update_api_response("⚠️ 手动起点经纬度未设置，使用第一个点")
-                    if self.valid_locations:
-                        return self.valid_locations[0]
-            else:
-                self.update_api_response("⚠️ 手动起点未设置，使用第一个点")
-                if self.valid_locations:
-                    return self.valid_locations[0]
-
-        elif mode == "saved":
-            # 从收藏中选择模式：使用用户选择的收藏点
-            if self.manual_start_coords:
-                lon = self.manual_start_coords.get('lon')
-                lat = self.manual_start_coords.get('lat')
-                name = self.manual_start_coords.get('name', '收藏点')
-
-                if lon is not None and lat is not None:
-                    self.update_api_response(
-                        f"📍 使用收藏点作为起点: {name} ({lon:.6f}, {lat:.6f})"
-                    )
-                    return {
-                        'name': name,
-                        'lon': lon,
-                        'lat': lat,
-                        'scene': '收藏点'
-                    }
-                else:
-                    self.update_api_response("⚠️ 收藏点起点经纬度未设置，使用自动模式")
-                    centroid = self.calculate_centroid(self.valid_locations)
-                    if centroid:
-                        return min(
-                            self.valid_locations,
-                            key=lambda p: self.calculate_distance_between_points(
-                                {'lon': centroid['lon'], 'lat': centroid['lat']}, p
-                            )
-                        )
-                    if self.valid_locations:
-                        return self.valid_locations[0]
-            else:
-                self.update_api_response("⚠️ 未选择收藏点起点，使用自动模式")
-                centroid = self.calculate_centroid(self.valid_locations)
-                if centroid:
-                    return min(
-                        self.valid_locations,
-                        key=lambda p: self.calculate_distance_between_points(
-                            {'lon': centroid['lon'], 'lat': centroid['lat']}, p
-                        )
-                    )
-                if self.valid_locations:
-                    return self.valid_locations[0]
-        
-        # 默认返回第一个点
-        return self.valid_locations[0]
-    
-    def select_end_point(self, start_point, available_points):
-        """根据用户设置的终点模式选择终点
-        
-        Args:
-            start_point: 起点
-            available_points: 可用的终点候选列表
-            
-        Returns:
-            终点地点字典 {name, lon, lat, ...}
-        """
-        if not available_points:
-            return None
-        
-        mode = self.end_point_mode
-        
-        if mode == "same_as_start":
-            # 同起点模式：返回起点作为终点（闭环路线）
-            self.update_api_response(f"🔄 终点模式：同起点（闭环路线）")
-            return start_point
-        
-        elif mode == "specified":
-            # 指定序号模式：直接使用valid_locations的索引
-            if self.specified_end_index is not None:
-                idx = self.specified_end_index - 1
-                
-                if 0 <= idx < len(self.valid_locations):
-                    selected_loc = self.valid_locations[idx]
-                    # 确保选择的点在可用点列表中
-                    if any(p['name'] == selected_loc['name'] for p in available_points):
-                        self.update_api_response(
-                            f"🏁 使用指定序号 {self.specified_end_index} 作为终点: "
-                            f"{selected_loc['name']} ({selected_loc['lon']:.6f}, {selected_loc['lat']:.6f})"
-                        )
-                        return selected_loc
-                    else:
-                        self.update_api_response(f"⚠️ 指定的终点已被使用，使用自动选择")
-                else:
-                    self.update_api_response(
-                        f"⚠️ 序号 {self.specified_end_index} 超出范围 (1-{len(self.valid_locations)})，使用自动选择"
-                    )
-        
-        elif mode == "manual":
-            # 手动输入模式：使用用户输入的经纬度和地名
-            if self.manual_end_coords:
-                lon = self.manual_end_coords.get('lon')
-                lat = self.manual_end_coords.get('lat')
-                name = self.manual_end_coords.get('name', '手动输入点')
-
-                if lon is not None and lat is not None:
-                    self.update_api_response(
-                        f"🏁 使用手动输入的终点: {name} ({lon:.6f}, {lat:.6f})"
-                    )
-                    return {
-                        'name': name,
-                        'lon': lon,
-                        'lat': lat,
-                        'scene': '手动输入'
-                    }
-                else:
-                    self.update_api_response("⚠️ 手动终点经纬度未设置，使用自动选择")
-                    return None
-            else:
-                self.update_api_response("⚠️ 手动终点未设置，使用自动选择")
-                return None
-
-        elif mode == "saved":
-            # 从收藏中选择模式：使用用户选择的收藏点
-            if self.manual_end_coords:
-                lon = self.manual_end_coords.get('lon')
-                lat = self.manual_end_coords.get('lat')
-                name = self.manual_end_coords.get('name', '收藏点')
-
-                if lon is not None and lat is not None:
-                    self.update_api_response(
-                        f"🏁 使用收藏点作为终点: {name} ({lon:.6f}, {lat:.6f})"
-                    )
-                    return {
-                        'name': name,
-                        'lon': lon,
-                        'lat': lat,
-                        'scene': '收藏点'
-                    }
-                else:
-                    self.update_api_response("⚠️ 收藏点终点经纬度未设置，使用自动选择")
-                    return None
-            else:
-                self.update_api_response("⚠️ 未选择收藏点终点，使用自动选择")
-                return None
-        
-        # auto模式或其他情况：返回None，让算法自动选择
-        return None
-    
-    def get_current_location(self):
-        """获取用户当前位置（通过高德IP定位API，失败则使用浏览器授权）
-        
-        Returns:
-            位置字典 {name, lon, lat} 或 None
-        """
-        # 方法1: 尝试IP定位
-        try:
-            url = f"https://restapi.amap.com/v3/ip?key={self.key}"
-            response = requests.get(url, timeout=10)
-            data = response.json()
-            
-            if data.get('status') == '1':
-                # 获取城市中心点作为当前位置
-                rectangle = data.get('rectangle', '')
-                if rectangle:
-                    # rectangle格式: "经度1,纬度1;经度2,纬度2"
-                    coords = rectangle.split(';')
-                    if len(coords) >= 2:
-                        lon1, lat1 = map(float, coords[0].split(','))
-                        lon2, lat2 = map(float, coords[1].split(','))
-                        # 取中心点
-                        center_lon = (lon1 + lon2) / 2
-                        center_lat = (lat1 + lat2) / 2
-                        self.update_api_response(f"✅ IP定位成功: {data.get('city', '未知城市')}")
-                        return {
-                            'name': f"当前位置({data.get('city', '未知城市')})",
-                            'lon': center_lon,
-                            'lat': center_lat,
-                            'scene': '当前位置'
-                        }
-            
-            self.update_api_response(f"⚠️ IP定位失败: {data.get('info', '未知错误')}，尝试使用浏览器定位...")
-        except Exception as e:
-            logger.error(f"IP定位失败: {e}")
-            self.update_api_response(f"⚠️ IP定位失败: {str(e)}，尝试使用浏览器定位...")
-
-        # 方法2: 使用浏览器授权定位
-        # 延迟检查 selenium 是否可用
-        selenium_available, _ = _lazy_import_selenium()
-        if selenium_available:
-            return self.get_location_by_browser()
-        else:
-            self.update_api_response("❌ 无法获取位置，请安装selenium: pip install selenium webdriver-manager")
-            return None
-    
-    def get_location_by_browser(self):
-        """通过浏览器访问高德地图获取精确位置
-
-        Returns:
-            位置字典 {name, lon, lat} 或 None
-        """
-        driver = None
-        try:
-            self.update_api_response("🌐 正在启动浏览器获取位置...")
-
-            # 延迟导入 selenium
-            available, modules = _lazy_import_selenium()
-            if not available:
-                self.update_api_response("❌ Selenium未安装，无法使用浏览器定位")
-                return None
-
-            Options = modules['Options']
-            Service = modules['Service']
-            ChromeDriverManager = modules['ChromeDriverManager']
-            webdriver = modules['webdriver']
-
-            # 配置Chrome选项
-            chrome_options = Options()
-            chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-            chrome_options.add_experimental_option('excludeSwitches', ['enable-automation'])
-            chrome_options.add_experimental_option('useAutomationExtension', False)
-            chrome_options.add_argument('--disable-gpu')
-            # 允许地理位置访问
-            prefs = {
-                "profile.default_content_setting_values.geolocation": 1,  # 1=允许, 2=拒绝
-            }
-            chrome_options.add_experimental_option('prefs', prefs)
-
-            # 创建driver
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=chrome_options)
-            driver.set_page_load_timeout(30)
-            
-            # 访问高德地图定位页面
-            self.update_api_response("📍 正在访问高德地图...")
-            driver.get("https://www.amap.com/")
-            
-            # 等待页面加载并执行JavaScript获取位置
-            time.sleep(5)  # 增加等待时间
-            
-            # 注入JavaScript获取位置
-            location_script = """
-            return new Promise((resolve, reject) => {
-                if (!navigator.geolocation) {
-                    reject('浏览器不支持地理定位');
-                    return;
-                }
-                const timeout = setTimeout(() => {
-                    reject('定位超时');
-                }, 20000);
-                
-                navigator.geolocation.getCurrentPosition(
-                    position => {
-                        clearTimeout(timeout);
-                        resolve({
-                            longitude: position.coords.longitude,
-                            latitude: position.coords.latitude,
-                            accuracy: position.coords.accuracy
-                        });
-                    },
-                    error => {
-                        clearTimeout(timeout);
-                        reject('定位失败: ' + error.message);
-                    },
-                    {timeout: 15000, enableHighAccuracy: true, maximumAge: 0}
-                );
-            });
-            """
-            
-            self.update_api_response("📡 正在获取GPS位置，请在浏览器中允许位置授权...（最多等待20秒）")
-            location_data = driver.execute_async_script(location_script)
-            
-            if location_data and 'longitude' in location_data:
-                lon = location_data['longitude']
-                lat = location_data['latitude']
-                accuracy = location_data.get('accuracy', 0)
-                
-                # 使用高德逆地理编码获取地址名称
-                try:
-                    url = f"https://restapi.amap.com/v3/geocode/regeo?location={lon},{lat}&key={self.key}"
-                    response = requests.get(url, timeout=10)
-                    data = response.json()
-                    if data.get('status') == '1':
-                        address = data.get('regeocode', {}).get('formatted_address', '当前位置')
-                        location_name = f"当前位置({address[:20]}...)"
-                    else:
-                        location_name = "当前位置"
-                except:
-                    location_name = "当前位置"
-                
-                self.update_api_response(f"✅ 浏览器定位成功！经度:{lon:.6f} 纬度:{lat:.6f} 精度:{accuracy:.0f}米")
-                
-                return {
-                    'name': location_name,
-                    'lon': lon,
-                    'lat': lat,
-                    'scene': '当前位置'
-                }
-            else:
-                self.update_api_response("❌ 未获取到位置信息")
-                return None
-                
-        except Exception as e:
-            logger.error(f"浏览器定位失败: {e}")
-            self.update_api_response(f"❌ 浏览器定位失败: {str(e)}")
-            return None
-        finally:
-            if driver:
-                try:
-                    driver.quit()
-                    self.update_api_response("🔒 浏览器已关闭")
-                except:
-                    pass
-    
-    def find_leftmost_top_point(self, points):
-        """找到最左上角的点：先比较经度（选最小→最西），若相同选纬度最大→最北"""
-        if not points:
-            return None
-        return min(points, key=lambda p: (p['lon'], -p['lat']))
-    
-    def calculate_centroid(self, points):
-        """计算所有点的重心（经纬度平均值）"""
-        if not points:
-            return None
-        avg_lon = sum(p['lon'] for p in points) / len(points)
-        avg_lat = sum(p['lat'] for p in points) / len(points)
-        return {'lon': avg_lon, 'lat': avg_lat}
-    
-    def calculate_angle_from_centroid(self, point, centroid):
-        """计算点相对于重心的角度（0-360度，北为0，顺时针增加）"""
-        import math
-        dx = point['lon'] - centroid['lon']
-        dy = point['lat'] - centroid['lat']
-        # atan2返回-π到π，转换为0-360度，北为0
-        angle = math.atan2(dx, dy)  # 注意：y轴向上为北
-        angle_deg = math.degrees(angle)
-        if angle_deg < 0:
-            angle_deg += 360
-        return angle_deg
-    
-    def spatial_sort_clockwise(self, points, start_point=None):
-        """顺时针排序：基于重心的角度，从小到大排列"""
-        if len(points) <= 1:
-            return points
-        centroid = self.calculate_centroid(points)
-        # 按角度从小到大排序（顺时针：北→东→南→西）
-        sorted_points = sorted(points, key=lambda p: self.calculate_angle_from_centroid(p, centroid))
-        return sorted_points
-    
-    def spatial_sort_counterclockwise(self, points, start_point=None):
-        """逆时针排序：基于重心的角度，从大到小排列"""
-        if len(points) <= 1:
-            return points
-        centroid = self.calculate_centroid(points)
-        # 按角度从大到小排序（逆时针：北→西→南→东）
-        sorted_points = sorted(points, key=lambda p: -self.calculate_angle_from_centroid(p, centroid))
-        return sorted_points
-    
-    def spatial_sort_coordinate(self, points, start_point=None):
-        """坐标轴排序：先按纬度（北→南，大到小），再按经度（西→东，小到大）"""
-        if len(points) <= 1:
-            return points
-        # 纬度降序（北→南），经度升序（西→东）
-        sorted_points = sorted(points, key=lambda p: (-p['lat'], p['lon']))
-        return sorted_points
-    
-    def spatial_sort_radial(self, points, start_point):
-        """放射状排序：以起点为中心，按距离由近到远排列"""
-        if len(points) <= 1:
-            return points
-        if not start_point:
-            return points
-        # 按距离起点的直线距离排序
-        sorted_points = sorted(points, 
-                              key=lambda p: self.calculate_distance_between_points(start_point, p))
-        return sorted_points
-    
-    def calculate_morton_code(self, lon, lat, precision=20):
-        """计算Morton码（Z-order曲线）
-        将经纬度转为整数后交错组合成Morton码
-        """
-        # 将经纬度归一化到0-1范围
-        # 经度：-180到180 → 0到1
-        # 纬度：-90到90 → 0到1
-        norm_lon = (lon + 180) / 360
-        norm_lat = (lat + 90) / 180
-        
-        # 转为整数（precision位）
-        max_val = (1 << precision) - 1
-        int_lon = int(norm_lon * max_val)
-        int_lat = int(norm_lat * max_val)
-        
-        # 交错组合成Morton码
-        morton = 0
-        for i in range(precision):
-            morton |= ((int_lon >> i) & 1) << (2 * i)
-            morton |= ((int_lat >> i) & 1) << (2 * i + 1)
-        
-        return morton
-    
-    def spatial_sort_morton(self, points, start_point=None):
-        """Morton码排序：保证空间相邻点排序后仍相邻"""
-        if len(points) <= 1:
-            return points
-        # 为每个点计算Morton码并排序
-        sorted_points = sorted(points, 
-                              key=lambda p: self.calculate_morton_code(p['lon'], p['lat']))
-        return sorted_points
-    
-    def apply_spatial_sort(self, points, sort_type, start_point=None):
-        """根据选择的排序类型应用空间排序"""
-        if sort_type == "clockwise":
-            return self.spatial_sort_clockwise(points, start_point)
-        elif sort_type == "counterclockwise":
-            return self.spatial_sort_counterclockwise(points, start_point)
-        elif sort_type == "coordinate":
-            return self.spatial_sort_coordinate(points, start_point)
-        elif sort_type == "radial":
-            return self.spatial_sort_radial(points, start_point)
-        elif sort_type == "morton":
-            return self.spatial_sort_morton(points, start_point)
-        else:
-            return points
-    
-    # ======================== 贪心算法优化 ========================
-    
-    def greedy_optimize_route(self, start_point, candidates, waypoint_num, 
-                              min_adj_km=0, max_adj_km=float('inf'), non_adj_min=0,
-                              calc_distance=None, scene_ratios=None):
-        """贪心算法优化路线：从起点出发，每次选择最近的未访问点（支持场景比例约束）
-        
-        Args:
-            start_point: 起点
-            candidates: 候选途径点列表（已经过空间排序）
-            waypoint_num: 需要选择的途径点数量
-            min_adj_km: 相邻点最小距离（公里）
-            max_adj_km: 相邻点最大距离（公里）
-            non_adj_min: 非相邻点最小距离（公里）
-            calc_distance: 距离计算函数
-            scene_ratios: 场景比例字典 {场景名: 百分比}，为空表示不限制
-        
-        Returns:
-            selected_waypoints: 优化后的途径点列表
-        """
-        if calc_distance is None:
-            calc_distance = self.calculate_distance_between_points
-        
-        # 初始化场景配额
-        scene_quotas = {}  # {场景名: 配额数量}
-        scene_used = {}    # {场景名: 已使用数量}
-        
-        if scene_ratios:
-            # 根据比例计算各场景的配额
-            total_ratio = sum(scene_ratios.values())
-            if total_ratio > 0:
-                for scene, ratio in scene_ratios.items():
-                    quota = int(waypoint_num * ratio / total_ratio)
-                    scene_quotas[scene] = quota
-                    scene_used[scene] = 0
-                
-                # 处理舍入误差：将剩余配额分配给比例最高的场景
-                allocated = sum(scene_quotas.values())
-                if allocated < waypoint_num:
-                    max_ratio_scene = max(scene_ratios.items(), key=lambda x: x[1])[0]
-                    scene_quotas[max_ratio_scene] += (waypoint_num - allocated)
-        
-        selected = []
-        remaining = candidates.copy()
-        current_point = start_point
-        distance_limit_enabled = min_adj_km > 0 or max_adj_km < float('inf') or non_adj_min > 0
-        
-        while len(selected) < waypoint_num and remaining:
-            best_candidate = None
-            best_distance = float('inf')
-            
-            for candidate in remaining:
-                # 检查场景配额
-                if scene_quotas:
-                    candidate_scene = candidate.get('scene', '未分类')
-                    if candidate_scene in scene_quotas:
-                        if scene_used.get(candidate_scene, 0) >= scene_quotas[candidate_scene]:
-                            continue  # 该场景配额已满，跳过
-                    # 如果候选点的场景不在配额中，也跳过（只选择配置的场景）
-                    elif candidate_scene != '未分类':
-                        continue
-                
-                dist = calc_distance(current_point, candidate)
-                
-                # 检查距离约束
-                if distance_limit_enabled:
-                    # 相邻点距离约束
-                    if dist < min_adj_km or dist > max_adj_km:
-                        continue
-                    
-                    # 非相邻点距离约束
-                    if non_adj_min > 0 and len(selected) > 0:
-                        valid = True
-                        for wp in selected[:-1] if len(selected) > 1 else []:
-                            if calc_distance(wp, candidate) < non_adj_min:
-                                valid = False
-                                break
-                        if not valid:
-                            continue
-                
-                # 贪心选择：选最近的
-                if dist < best_distance:
-                    best_distance = dist
-                    best_candidate = candidate
-            
-            if best_candidate:
-                selected.append(best_candidate)
-                remaining.remove(best_candidate)
-                current_point = best_candidate
-                
-                # 更新场景使用计数
-                if scene_quotas:
-                    candidate_scene = best_candidate.get('scene', '未分类')
-                    if candidate_scene in scene_used:
-                        scene_used[candidate_scene] += 1
-            else:
-                # 没有满足约束的点
-                if scene_quotas:
-                    # 在场景约束下没有找到满足条件的点，尝试放宽场景约束
-                    fallback_candidates = []
-                    for p in remaining:
-                        p_scene = p.get('scene', '未分类')
-                        # 允许选择未满配额的场景
-                        if p_scene in scene_quotas and scene_used.get(p_scene, 0) < scene_quotas[p_scene]:
-                            fallback_candidates.append(p)
-                    
-                    if fallback_candidates:
-                        fallback = min(fallback_candidates, 
-                                      key=lambda p: calc_distance(current_point, p))
-                        selected.append(fallback)
-                        remaining.remove(fallback)
-                        current_point = fallback
-                        
-                        fallback_scene = fallback.get('scene', '未分类')
-                        if fallback_scene in scene_used:
-                            scene_used[fallback_scene] += 1
-                    else:
-                        break  # 所有场景配额都已用完
-                else:
-                    # 没有场景约束，放宽距离条件选择最近的
-                    if remaining:
-                        fallback = min(remaining, 
-                                      key=lambda p: calc_distance(current_point, p))
-                        selected.append(fallback)
-                        remaining.remove(fallback)
-                        current_point = fallback
-                    else:
-                        break
-        
-        return selected
-
-    def select_optimal_waypoints(self, start_point, end_point, waypoint_num, used_waypoints_set, moving_left=True):
-        """智能选择最优的途径点 - 空间排序 + 贪心算法 + 场景比例约束
-        
-        算法流程：
-        1. 空间排序：根据用户选择的算法对候选点进行空间排序
-        2. 场景比例：根据用户设置的场景比例分配各场景的途径点数量
-        3. 贪心优化：从起点出发，每次选择最近的未访问点（在场景配额内），压缩路线长度
-        4. 距离约束：检查相邻点和非相邻点的距离约束
-        """
-        # 从UI获取距离配置
-        self.get_distance_config_from_ui()
-        config = self.route_config
-        
-        # 获取空间排序算法类型
-        sort_type = self.spatial_sort_combo.currentData()
-        sort_name_map = {
-            "clockwise": "顺时针",
-            "counterclockwise": "逆时针", 
-            "coordinate": "坐标轴(北→南)",
-            "radial": "放射状(近→远)",
-            "morton": "Morton码"
-        }
-        sort_name = sort_name_map.get(sort_type, sort_type)
-        
-        self.update_api_response(f"\n🔍 开始选择 {waypoint_num} 个途径点")
-        self.update_api_response(f"📋 起点: {start_point['name']}")
-        self.update_api_response(f"📋 终点: {end_point['name']}")
-        self.update_api_response(f"📋 候选点总数: {len(self.valid_locations)}")
-        
-        # 显示场景比例设置
-        if self.scene_ratios:
-            self.update_api_response(f"🎭 场景比例约束: 已启用")
-            for scene, ratio in self.scene_ratios.items():
-                count = int(waypoint_num * ratio / 100)
-                self.update_api_response(f"   - {scene}: {ratio}% ({count}个点)")
-        else:
-            self.update_api_response(f"🎲 场景比例: 随机分配（不限制）")
-        
-        # 距离约束参数（从UI获取，0或inf表示不限制）
-        min_adj_km = config.get('between_waypoint_min', 0)
-        max_adj_km = config.get('between_waypoint_max', float('inf'))
-        non_adj_min = config.get('non_adjacent_min', 0)
-        
-        # 判断是否启用距离限制
-        distance_limit_enabled = min_adj_km > 0 or max_adj_km < float('inf') or non_adj_min > 0
-        
-        if distance_limit_enabled:
-            adj_min_str = f"{min_adj_km*1000:.0f}m" if min_adj_km > 0 else "不限"
-            adj_max_str = f"{max_adj_km*1000:.0f}m" if max_adj_km < float('inf') else "不限"
-            non_adj_str = f">{non_adj_min*1000:.0f}m" if non_adj_min > 0 else "不限"
-            self.update_api_response(f"📊 距离约束: 相邻点{adj_min_str}-{adj_max_str}, 非相邻点{non_adj_str}")
-        else:
-            self.update_api_response(f"📊 距离约束: 未启用")
-        
-        # 获取距离计算方式
-        use_amap_distance = self.distance_calc_combo.currentData() == "amap"
-        if use_amap_distance:
-            self.update_api_response(f"🚗 使用高德导航距离计算(精准但较慢)")
-            calc_distance = self.get_driving_distance
-        else:
-            self.update_api_response(f"📍 使用Haversine直线距离计算(快速)")
-            calc_distance = self.calculate_distance_between_points
-        
-        # 筛选候选点：排除起终点、已使用点、无坐标点
-        candidates = []
-        for point in self.valid_locations:
-            if point['name'] == start_point['name'] or point['name'] == end_point['name']:
-                continue
-            if point['name'] in used_waypoints_set:
-                continue
-            if point.get('lat') is None or point.get('lon') is None:
-                continue
-            candidates.append(point.copy())  # 使用副本避免修改原数据
-        
-        self.update_api_response(f"🔢 可用候选点: {len(candidates)}")
-        
-        if len(candidates) == 0:
-            self.update_api_response("⚠️ 没有可用的候选途径点")
-            return []
-        
-        # Step 1: 空间排序（确定点的基础顺序）
-        self.update_api_response(f"📐 执行算法排序: {sort_name}...")
-        sorted_candidates = self.apply_spatial_sort(candidates, sort_type, start_point)
-        
-        # 显示排序后的前几个点
-        if sorted_candidates:
-            preview = [p['name'] for p in sorted_candidates[:5]]
-            self.update_api_response(f"   排序后前5点: {' → '.join(preview)}...")
-        
-        # Step 2: 贪心算法优化（压缩路线长度 + 场景比例约束）
-        selected_waypoints = self.greedy_optimize_route(
-            start_point=start_point,
-            candidates=sorted_candidates,
-            waypoint_num=waypoint_num,
-            min_adj_km=min_adj_km,
-            max_adj_km=max_adj_km,
-            non_adj_min=non_adj_min,
-            calc_distance=calc_distance,
-            scene_ratios=self.scene_ratios  # 传入场景比例配置
-        )
-        
-        # 输出选中的途径点
-        current_point = start_point
-        scene_stats = {}  # 统计各场景选中的点数
-        for i, wp in enumerate(selected_waypoints):
-            dist = calc_distance(current_point, wp)
-            scene = wp.get('scene', '未分类')
-            scene_stats[scene] = scene_stats.get(scene, 0) + 1
-            self.update_api_response(f"   ✅ 第{i+1}个途径点: {wp['name']} [{scene}] (距{dist*1000:.0f}m)")
-            current_point = wp
-        
-        # 输出场景统计
-        if scene_stats and self.scene_ratios:
-            self.update_api_response(f"🎭 场景分布统计:")
-            for scene, count in scene_stats.items():
-                percentage = (count / len(selected_waypoints) * 100) if selected_waypoints else 0
-                target_pct = self.scene_ratios.get(scene, 0)
-                status = "✅" if abs(percentage - target_pct) < 10 else "⚠️"
-                self.update_api_response(f"   {status} {scene}: {count}个 ({percentage:.1f}%, 目标{target_pct}%)")
-        
-        # 检查最后一个途径点与终点的距离
-        if selected_waypoints and distance_limit_enabled:
-            last_wp = selected_waypoints[-1]
-            dist_to_end = calc_distance(last_wp, end_point)
-            if min_adj_km > 0 and dist_to_end < min_adj_km:
-                self.update_api_response(f"   ⚠️ 最后途径点距终点{dist_to_end*1000:.0f}m < 最小限制{min_adj_km*1000:.0f}m")
-            elif max_adj_km < float('inf') and dist_to_end > max_adj_km:
-                self.update_api_response(f"   ⚠️ 最后途径点距终点{dist_to_end*1000:.0f}m > 最大限制{max_adj_km*1000:.0f}m")
-            else:
-                self.update_api_response(f"   ✅ 最后途径点距终点{dist_to_end*1000:.0f}m")
-        
-        self.update_api_response(f"📌 最终选择的途径点: {len(selected_waypoints)}个")
-        
-        if len(selected_waypoints) < waypoint_num:
-            self.update_api_response(f"⚠️ 警告：只找到 {len(selected_waypoints)}/{waypoint_num} 个途径点")
-        
-        return selected_waypoints
-    
-    def generate_navigation_url(self, start_point, end_point, waypoints):
-        """生成高德导航链接"""
-        try:
-            base_url = "https://ditu.amap.com/dir?type=car&policy=1"
-            
-            start_lnglat = f"{start_point['lon']},{start_point['lat']}"
-            base_url += f"&from[lnglat]={start_lnglat}"
-            base_url += f"&from[name]={quote(start_point['name'])}"
-            
-            end_lnglat = f"{end_point['lon']},{end_point['lat']}"
-            base_url += f"&to[lnglat]={end_lnglat}"
-            base_url += f"&to[name]={quote(end_point['name'])}"
-            
-            for i, point in enumerate(waypoints):
-                wp_lnglat = f"{point['lon']},{point['lat']}"
-                base_url += f"&via[{i}][lnglat]={wp_lnglat}"
-                base_url += f"&via[{i}][name]={quote(point['name'])}"
-                
-            return base_url
-        except Exception as e:
-            self.update_api_response(f"❌ 生成导航链接错误: {str(e)}")
-            logger.error(f"生成导航链接错误: {str(e)}")
-            return None
-    
-    def get_driving_route(self, start, end, waypoints):
-        """获取驾驶路线 - 使用高德地图v5驾车路径规划API
-        返回: (points, road_types, road_names, turn_points) 或 (None, None, None, None)
-        """
-        # 尝试使用主密钥和备用密钥
-        keys_to_try = [self.key] + self.backup_keys
-        
-        for key_index, current_key in enumerate(keys_to_try):
-            try:
-                origin = f"{start['lon']},{start['lat']}"
-                destination = f"{end['lon']},{end['lat']}"
-                
-                # 途径点格式：经度1,纬度1|经度2,纬度2（v5 API使用|分隔）
-                waypoint_str = ""
-                if waypoints:
-                    waypoint_str = "|".join([f"{wp['lon']},{wp['lat']}" for wp in waypoints])
-                
-                # 使用高德地图v5驾车路径规划API
-                route_url = "https://restapi.amap.com/v5/direction/driving"
-                
-                # 获取当前选择的路线策略
-                strategy = getattr(self, 'route_strategy', 34)  # 默认走高速
-                
-                params = {
-                    'origin': origin,
-                    'destination': destination,
-                    'key': current_key,
-                    'strategy': strategy,  # 路线策略：34走高速、35不走高速、37大路优先
-                    'show_fields': 'polyline',  # 返回路线坐标点
-                    'extensions': 'all'  # 请求详细信息，包括转向指令
-                }
-                
-                # 只有当有途径点时才添加waypoints参数
-                if waypoint_str:
-                    params['waypoints'] = waypoint_str
-                
-                response = requests.get(route_url, params=params, timeout=15)
-                data = response.json()
-                
-                # v5 API响应格式
-                if data.get('status') == '1' and data.get('route'):
-                    route = data['route']
-                    points = []
-                    road_types = []
-                    road_names = []
-                    turn_points = []
-                    
-                    # 转向统计
-                    global_turn_index = 0
-                    left_turn_index = 0
-                    right_turn_index = 0
-                    uturn_index = 0
-                    
-                    # v5 API的路径数据结构
-                    paths = route.get('paths', [])
-                    for path in paths:
-                        steps = path.get('steps', [])
-                        for i, step in enumerate(steps):
-                            polyline = step.get('polyline', '')
-                            road_name = step.get('road', '未知道路')
-                            road_type = step.get('road_type', '0')  # 道路类型
-                            
-                            # 解析转向指令
-                            action = str(step.get("action", "") or "")
-                            assistant_action = str(step.get("assistant_action", "") or "")
-                            instruction = str(step.get("instruction", "") or "")
-                            action_text = action + assistant_action + instruction
-                            
-                            turn_type = None
-                            if ("掉头" in action_text) or ("调头" in action_text):
-                                turn_type = "uturn"
-                            elif "左转" in action_text:
-                                turn_type = "left"
-                            elif "右转" in action_text:
-                                turn_type = "right"
-                            
-                            # 添加坐标点
-                            polyline_points = []
-                            if polyline:
-                                for point in polyline.split(';'):
-                                    if point:
-                                        lon, lat = point.split(',')
-                                        points.append([float(lat), float(lon)])
-                                        polyline_points.append(point)
-                                        road_types.append(road_type)
-                                        road_names.append(road_name)
-                            
-                            # 处理转向点
-                            if turn_type and polyline_points:
-                                global_turn_index += 1
-                                try:
-                                    # 使用当前step的终点作为转向位置
-                                    turn_point = polyline_points[-1]
-                                    lon_mid, lat_mid = map(float, turn_point.split(","))
-                                    
-                                    # 获取前后道路名称
-                                    prev_name = ""
-                                    if i > 0:
-                                        prev_name = str(steps[i - 1].get("road", "") or "").strip()
-                                    curr_name = road_name.strip()
-                                    next_name = ""
-                                    if i + 1 < len(steps):
-                                        next_name = str(steps[i + 1].get("road", "") or "").strip()
-                                    
-                                    from_road_name = ""
-                                    to_road_name = ""
-                                    
-                                    # 确定转向的起止道路
-                                    if curr_name and next_name and curr_name != next_name:
-                                        from_road_name = curr_name
-                                        to_road_name = next_name
-                                    elif prev_name and curr_name and prev_name != curr_name:
-                                        from_road_name = prev_name
-                                        to_road_name = curr_name
-                                    elif prev_name and next_name and prev_name != next_name:
-                                        from_road_name = prev_name
-                                        to_road_name = next_name
-                                    else:
-                                        from_road_name = prev_name or curr_name
-                                        to_road_name = next_name or curr_name
-                                    
-                                    # 过滤主路/辅路切换
-                                    def _base_name(name: str) -> str:
-                                        return name.replace("辅路", "").strip()
-                                    
-                                    base_from = _base_name(from_road_name)
-                                    base_to = _base_name(to_road_name)
-                                    if base_from and base_from == base_to:
-                                        continue
-                                    
-                                    # 根据转向类型更新计数
-                                    if turn_type == "left":
-                                        left_turn_index += 1
-                                        type_idx = left_turn_index
-                                    elif turn_type == "right":
-                                        right_turn_index += 1
-                                        type_idx = right_turn_index
-                                    else:  # uturn
-                                        uturn_index += 1
-                                        type_idx = uturn_index
-                                    
-                                    turn_points.append({
-                                        "lon": lon_mid,
-                                        "lat": lat_mid,
-                                        "type": turn_type,
-                                        "index": global_turn_index,
-                                        "type_index": type_idx,
-                                        "from_road": from_road_name,
-                                        "to_road": to_road_name,
-                                    })
-                                except Exception as e:
-                                    logger.debug(f"解析转向点错误: {e}")
-                    
-                    if points:
-                        self.update_api_response(
-                            f"✅ 使用密钥{key_index + 1}成功获取驾驶路线，"
-                            f"共{len(points)}个坐标点，{len(turn_points)}个转向点"
-                        )
-                        return points, road_types, road_names, turn_points
-                else:
-                    error_info = data.get('info', '未知错误')
-                    error_code = data.get('infocode', '')
-                    self.update_api_response(f"⚠️ 密钥{key_index + 1}请求失败: {error_info} (错误码: {error_code})")
-                    
-                    # 如果是密钥问题，尝试下一个密钥
-                    if error_code in ['10001', '10003', '10004', '10005']:
-                        continue
-                    
-            except requests.exceptions.Timeout:
-                self.update_api_response(f"⚠️ 密钥{key_index + 1}请求超时，尝试下一个密钥")
-                continue
-            except Exception as e:
-                logger.error(f"获取驾驶路线错误 (密钥{key_index + 1}): {str(e)}")
-                self.update_api_response(f"❌ 密钥{key_index + 1}获取路线错误: {str(e)}")
-                continue
-        
-        self.update_api_response("❌ 所有密钥均无法获取驾驶路线")
-        return None, None, None, None
-    
-    # # 路线策略选择变更（已注释）
-    # def on_strategy_changed(self, index):
-    #     """路线策略选择变更"""
-    #     if hasattr(self, 'strategy_combo'):
-    #         self.route_strategy = self.strategy_combo.currentData()
-    #         strategy_name = self.strategy_combo.currentText()
-    #         self.update_api_response(f"🛣️ 路线策略已切换为: {strategy_name} (strategy={self.route_strategy})")
-    
-    def get_target_distance_range(self):
-        """获取用户设置的目标里程范围
-        返回: (min_distance, max_distance) 或 None（表示未设置，随机规划）
-        """
-        try:
-            target_text = self.target_distance_input.text().strip()
-            if not target_text:
-                return None  # 未填写，随机规划
-            
-            target_distance = float(target_text)
-            if target_distance <= 0:
-                return None
-            
-            # 偏差范围默认为5km
-            tolerance = 5
-            
-            min_distance = max(0, target_distance - tolerance)
-            max_distance = target_distance + tolerance
-            
-            return (min_distance, max_distance)
-        except ValueError:
-            return None  # 输入无效，随机规划
-    
-    def generate_simple_route(self, start_point, end_point, waypoints):
-        """当无法从API获取路线时，生成简单的直线路径"""
-        points = [[start_point['lat'], start_point['lon']]]
-        
-        for wp in waypoints:
-            points.append([wp['lat'], wp['lon']])
-        
-        points.append([end_point['lat'], end_point['lon']])
-        
-        return points
-    
-    def generate_route(self, route_num, waypoint_num, existing_routes=None):
-        """【改进版】生成一条测试路线 - 空间排序 + 贪心算法
-        
-        起点设置模式：
-        1. 自动模式：选择所有地点的质心（中心点）
-        2. 手动-当前位置：使用用户当前位置（需定位）
-        3. 手动-指定序号：使用用户指定的地点序号
-        
-        多路线串联：后续路线起点承接上一条路线的终点
-        """
-        if existing_routes is None:
-            existing_routes = []
-        
-        if len(self.valid_locations) < 2:
-            self.update_api_response("❌ 错误: 有效地点数量不足，无法生成路线")
-            return None
-        
-        # 获取目标里程范围
-        distance_range = self.get_target_distance_range()
-        
-        start_point = None
-        end_point = None
-        straight_distance = 0
-        
-        # 获取空间排序算法
-        sort_type = self.spatial_sort_combo.currentData()
-
-        # 确定起点
-        # 当用户选择"从收藏中选择"作为起点时，每条路线都使用该收藏点作为起点
-        if self.start_point_mode == "saved" and self.manual_start_coords:
-            # 用户选择了收藏点作为起点，所有路线都使用该收藏点
-            lon = self.manual_start_coords.get('lon')
-            lat = self.manual_start_coords.get('lat')
-            name = self.manual_start_coords.get('name', '收藏点')
-            if lon is not None and lat is not None:
-                start_point = {
-                    'name': name,
-                    'lon': lon,
-                    'lat': lat,
-                    'scene': '收藏点'
-                }
-                self.update_api_response(f"📍 路线 {route_num}: 使用收藏点作为起点 ({name})")
-            else:
-                # 收藏点数据不完整，回退到自动模式
-                start_point = self.select_start_point()
-                self.update_api_response(f"⚠️ 路线 {route_num}: 收藏点数据不完整，使用自动选择起点")
-        elif existing_routes:
-            # 后续路线：起点直接承接上一条路线的终点（避免全局绕路）
-            prev_route = existing_routes[-1]
-            start_point = prev_route['end_point']
-            self.update_api_response(f"🔗 路线 {route_num}: 起点承接自路线 {prev_route['route_id']} 的终点 ({start_point['name']})")
-        else:
-            # 第一条路线：根据起点模式选择
-            start_point = self.select_start_point()
-            mode_text = {
-                "auto": "自动（质心）",
-                "current_location": "当前位置",
-                "specified": f"指定序号 {self.specified_start_index}",
-                "saved": "收藏点"
-            }.get(self.start_point_mode, "自动")
-            self.update_api_response(f"🚩 路线 {route_num}: 起点模式 [{mode_text}] ({start_point['name']})")
-        
-        # 收集已使用的点
-        used_points_set = set()
-        used_points_set.add(start_point['name'])
-        for existing_route in existing_routes:
-            used_points_set.add(existing_route['start_point']['name'])
-            used_points_set.add(existing_route['end_point']['name'])
-            for wp_name in existing_route['waypoints'].split('; '):
-                if wp_name.strip():
-                    used_points_set.add(wp_name.strip())
-        
-        # 筛选可用点（排除已使用的）
-        available_points = [p for p in self.valid_locations 
-                          if p['name'] not in used_points_set 
-                          and p.get('lat') is not None 
-                          and p.get('lon') is not None]
-        
-        if len(available_points) == 0:
-            self.update_api_response(f"❌ 路线 {route_num}: 没有可用的终点")
-            return None
-        
-        # 应用空间排序对可用点进行排序
-        sorted_available = self.apply_spatial_sort(available_points, sort_type, start_point)
-        
-        # 改进：先选择途经点，再基于最后一个途经点选择终点
-        # 这样可以避免终点离最后一个途经点过远
-        
-        waypoints = []
-        temp_endpoint = None
-        
-        if waypoint_num > 0:
-            # 先选择途经点，但不指定终点，让算法自由选择
-            # 使用一个临时终点（排序后的最后一个点）
-            temp_endpoint = sorted_available[-1] if sorted_available else available_points[0]
-            
-            waypoints = self.select_optimal_waypoints(
-                start_point, temp_endpoint, waypoint_num, used_points_set
-            )
-            
-            if len(waypoints) < waypoint_num:
-                self.update_api_response(f"⚠️ 警告：只找到 {len(waypoints)}/{waypoint_num} 个途径点")
-        
-        # 现在选择终点：从最后一个实际点（起点或最后一个途经点）出发
-        last_actual_point = waypoints[-1] if waypoints else start_point
-        
-        # 更新已使用的点（包括途经点）
-        for wp in waypoints:
-            used_points_set.add(wp['name'])
-        
-        # 重新筛选可用终点（排除已用作途经点的）
-        available_endpoints = [p for p in sorted_available if p['name'] not in used_points_set]
-        
-        if not available_endpoints:
-            self.update_api_response(f"❌ 路线 {route_num}: 没有可用的终点")
-            return None
-
-        # 优先处理用户选择的收藏点终点（saved模式）
-        # 当用户选择"从收藏中选择"作为终点时，每条路线都使用该收藏点作为终点
-        if self.end_point_mode == "saved" and self.manual_end_coords:
-            lon = self.manual_end_coords.get('lon')
-            lat = self.manual_end_coords.get('lat')
-            name = self.manual_end_coords.get('name', '收藏点')
-            if lon is not None and lat is not None:
-                end_point = {
-                    'name': name,
-                    'lon': lon,
-                    'lat': lat,
-                    'scene': '收藏点'
-                }
-                dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
-                straight_distance = self.calculate_distance_between_points(start_point, end_point)
-                self.update_api_response(f"🏁 路线 {route_num}: 使用收藏点作为终点 ({name})")
-            else:
-                # 收藏点数据不完整，使用自动选择
-                self.update_api_response(f"⚠️ 路线 {route_num}: 收藏点数据不完整，使用自动选择终点")
-                end_point = available_endpoints[0]
-                dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
-                straight_distance = self.calculate_distance_between_points(start_point, end_point)
-        elif self.end_point_mode == "same_as_start":
-            # 闭环路线：终点与起点相同
-            end_point = start_point
-            dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
-            straight_distance = 0
-            self.update_api_response(f"🔄 路线 {route_num}: 闭环路线，终点与起点相同 ({end_point['name']})")
-        else:
-            # 其他模式：使用原有的终点选择逻辑
-            user_selected_endpoint = self.select_end_point(start_point, available_endpoints)
-
-            if user_selected_endpoint:
-                # 用户指定了终点（同起点或指定序号）
-                end_point = user_selected_endpoint
-                dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
-                straight_distance = self.calculate_distance_between_points(start_point, end_point)
-            else:
-                # 自动选择终点：从最后一个实际点出发选择合适的终点
-                if distance_range:
-                    min_dist, max_dist = distance_range
-                    straight_min = min_dist / 1.5
-                    straight_max = max_dist / 1.2
-
-                    # 计算已经累积的距离
-                    accumulated_dist = 0
-                    if waypoints:
-                        current = start_point
-                        for wp in waypoints:
-                            accumulated_dist += self.calculate_distance_between_points(current, wp)
-                            current = wp
-
-                    # 计算还需要多少距离才能达到目标
-                    remaining_min = max(0, straight_min - accumulated_dist)
-                    remaining_max = straight_max - accumulated_dist
-
-                    # 在可用终点中找符合距离的
-                    valid_endpoints = []
-                    for p in available_endpoints:
-                        dist = self.calculate_distance_between_points(last_actual_point, p)
-                        if remaining_min <= dist <= remaining_max:
-                            valid_endpoints.append((p, dist))
-
-                    if valid_endpoints:
-                        # 选择距离适中的点作为终点（优先选择距离较近的）
-                        valid_endpoints.sort(key=lambda x: x[1])
-                        end_point, dist_to_end = valid_endpoints[len(valid_endpoints)//2]  # 选中间的
-                    else:
-                        # 没有符合距离的，选择距离最接近目标的点
-                        target_dist = (remaining_min + remaining_max) / 2
-                        end_point = min(available_endpoints,
-                                       key=lambda p: abs(self.calculate_distance_between_points(last_actual_point, p) - target_dist))
-                        dist_to_end = self.calculate_distance_between_points(last_actual_point, end_point)
-                else:
-                    # 没有目标里程，智能选择终点：基于已有途经点的平均距离
-                    endpoint_distances = [(p, self.calculate_distance_between_points(last_actual_point, p))
-                                         for p in available_endpoints]
-                    endpoint_distances.sort(key=lambda x: x[1])
-
-                    # 计算已有路线的平均相邻点距离
-                    if waypoints and len(waypoints) > 0:
-                        all_points = [start_point] + waypoints
-                        total_dist = 0
-                        for i in range(len(all_points) - 1):
-                            total_dist += self.calculate_distance_between_points(all_points[i], all_points[i+1])
-                        avg_adjacent_dist = total_dist / len(all_points) if len(all_points) > 1 else 5.0  # 默认5km
-
-                        # 终点距离应该在平均距离的0.5-2倍之间，保持路线连贯性
-                        min_reasonable = avg_adjacent_dist * 0.5
-                        max_reasonable = avg_adjacent_dist * 2.0
-
-                        self.update_api_response(f"   📊 平均相邻距离: {avg_adjacent_dist*1000:.0f}m, 终点范围: {min_reasonable*1000:.0f}-{max_reasonable*1000:.0f}m")
-
-                        # 在合理范围内选择终点
-                        reasonable_endpoints = [(p, d) for p, d in endpoint_distances
-                                               if min_reasonable <= d <= max_reasonable]
-
-                        if reasonable_endpoints:
-                            # 有合理距离的点，选择靠前1/3的点（较近但不是最近）
-                            target_idx = len(reasonable_endpoints) // 3
-                            end_point, dist_to_end = reasonable_endpoints[target_idx]
-                            self.update_api_response(f"   ✅ 在合理范围内选择第{target_idx+1}个候选点")
-                        else:
-                            # 没有合理范围内的点，选择最接近平均距离的点
-                            target_dist = avg_adjacent_dist
-                            end_point, dist_to_end = min(endpoint_distances,
-                                                        key=lambda x: abs(x[1] - target_dist))
-                            self.update_api_response(f"   ⚠️ 无合理范围点，选择最接近平均距离的点")
-                    else:
-                        # 没有途经点，使用保守策略：选择前1/3距离的点（较近）
-                        max_idx = max(1, len(endpoint_distances) // 3)
-                        end_point, dist_to_end = endpoint_distances[max_idx]
-                        self.update_api_response(f"   ℹ️ 无途经点参考，选择较近的终点(第{max_idx+1}/{len(endpoint_distances)}个)")
-        
-        straight_distance = self.calculate_distance_between_points(start_point, end_point)
-        
-        self.update_api_response(
-            f"📍 路线 {route_num}: 起点[{start_point['name']}] → 终点[{end_point['name']}] "
-            f"(直线距离: {straight_distance:.2f}km, 最后一点到终点: {dist_to_end*1000:.0f}m)")
-        
-        # 使用前面已收集的 used_points_set
-        used_points_set.add(end_point['name'])
-        
-        if waypoints:
-            waypoint_dists = []
-            prev_point = start_point
-            for wp in waypoints:
-                dist = self.calculate_distance_between_points(prev_point, wp)
-                waypoint_dists.append(f"{wp['name']}({dist*1000:.0f}m)")
-                prev_point = wp
-
-            self.update_api_response(
-                f"   └─ 途径点: {' → '.join(waypoint_dists)}"
-            )
-        
-        nav_url = self.generate_navigation_url(start_point, end_point, waypoints)
-        if not nav_url:
-            self.update_api_response(f"❌ 路线 {route_num} 生成导航链接失败")
-            return None
-        
-        # 使用简化路线（不再调用驾驶路线API获取详细信息）
-        waypoint_coords = [{"lat": wp["lat"], "lon": wp["lon"]} for wp in waypoints]
-        real_points = self.generate_simple_route(start_point, end_point, waypoint_coords)
-        road_types = []
-        road_names = []
-        turn_points = []
-        
-        route_info = {
-            'route_id': route_num,
-            'start_point': start_point,
-            'end_point': end_point,
-            'waypoints': '; '.join([wp['name'] for wp in waypoints]),
-            'navigation_url': nav_url,
-            'real_points': real_points if real_points else [],
-            'road_types': road_types if road_types else [],
-            'road_names': road_names if road_names else [],
-            'turn_points': turn_points if turn_points else [],
-            'road_names': road_names if road_names else [],
-            'waypoint_details': [{'name': wp['name'], 'lat': wp['lat'], 'lon': wp['lon']} for wp in waypoints],
-            'straight_distance': straight_distance,
-            'waypoint_count': len(waypoints)
-        }
-        
-        # 验证途径点距离是否满足要求
-        if waypoints:
-            config = self.route_config
-            min_adj_km = config.get('between_waypoint_min', 0)
-            max_adj_km = config.get('between_waypoint_max', float('inf'))
-            non_adj_min = config.get('non_adjacent_min', 0)
-            
-            # 判断是否启用距离限制
-            distance_limit_enabled = min_adj_km > 0 or max_adj_km < float('inf') or non_adj_min > 0
-            
-            all_points = [start_point] + waypoints + [end_point]
-            
-            self.update_api_response(f"📏 途径点距离信息...")
-            for i in range(len(all_points) - 1):
-                dist = self.calculate_distance_between_points(all_points[i], all_points[i+1])
-                self.update_api_response(f"   {all_points[i]['name']} → {all_points[i+1]['name']}: {dist*1000:.0f}m")
-                if distance_limit_enabled:
-                    if min_adj_km > 0 and dist < min_adj_km:
-                        self.update_api_response(f"   ⚠️ 相邻点距离{dist*1000:.0f}m < 最小限制{min_adj_km*1000:.0f}m")
-                    if max_adj_km < float('inf') and dist > max_adj_km:
-                        self.update_api_response(f"   ⚠️ 相邻点距离{dist*1000:.0f}m > 最大限制{max_adj_km*1000:.0f}m")
-            
-            # 检查不相邻点距离（仅在启用限制时）
-            if distance_limit_enabled and non_adj_min > 0:
-                for i in range(len(all_points)):
-                    for j in range(i + 2, len(all_points)):
-                        dist = self.calculate_distance_between_points(all_points[i], all_points[j])
-                        if dist < non_adj_min:
-                            self.update_api_response(f"   ⚠️ 不相邻点 {all_points[i]['name']} 和 {all_points[j]['name']} 距离{dist*1000:.0f}m < {non_adj_min*1000:.0f}m")
-        
-        if self.is_route_duplicate(route_info, existing_routes):
-            self.update_api_response(f"⏭️ 路线 {route_num} 已被过滤（与现有路线过于相似）")
-            return None
-        
-        self.update_api_response(f"✅ 路线 {route_num} 已成功生成（包含 {len(waypoints)} 个途径点）")
-        return route_info
+            # 偏差范围默认为5km
+            tolerance = 5
+            
+            min_distance = max(0, target_distance - tolerance)
+            max_distance = target_distance + tolerance
+            
+            return (min_distance, max_distance)
+        except ValueError:
+            return None  # 输入无效，随机规划
     
     def _generate_map_from_excel_files(self, excel_files, output_dir):
         """直接生成地图，不使用QThread（在threading.Thread中调用）"""
@@ -8316,11 +5630,11 @@ class MainWindow(QMainWindow):
             self.update_api_response(f"  ⏱️ 开始创建地图（{len(routes)}条路线）...")
             
             # 创建地图
-            generator = RouteGenerator([], output_dir)
+            generator = RouteGenerator([], output_dir, render_mode=self.map_render_mode_combo.currentData())
             m = generator.create_route_map(routes)
             
             # 保存HTML
-            html_path = os.path.join(output_dir, "路线全览.html")
+            html_path = os.path.join(output_dir, generator.MAP_FILENAME)
             m.save(html_path)
             
             elapsed = time.time() - start_time
@@ -8357,25 +5671,8 @@ class MainWindow(QMainWindow):
             self.update_api_response(f"📍 每条路线包含 {waypoint_num} 个途径点")
             self.update_api_response(f"📍 途径点距离范围: {self.route_config['waypoint_min_distance']}-{self.route_config['waypoint_max_distance']}km")
             
-            self.route_data = []
-            failed_count = 0
-            max_failed = 10
-            
-            route_id = 1
-            while len(self.route_data) < target_route_num and failed_count < max_failed:
-                route = self.generate_route(route_id, waypoint_num, self.route_data)
-                
-                if route:
-                    self.route_data.append(route)
-                    self._safe_update_status(
-                        f"已生成 {len(self.route_data)}/{target_route_num} 条有效路线", "blue"
-                    )
-                    failed_count = 0
-                    time.sleep(1)
-                else:
-                    failed_count += 1
-                
-                route_id += 1
+            plan_mode = self.plan_mode_combo.currentData() if hasattr(self, 'plan_mode_combo') else "greedy"
+            self.generate_route_batch(active_locations, waypoint_num, target_route_num, plan_mode)
             
             self._safe_update_status(
                 f"✅ 完成! 成功生成 {len(self.route_data)} 条路线", "green"
@@ -8392,6 +5689,10 @@ class MainWindow(QMainWindow):
                     logger.info("已自动保存Excel和JSON文件到程序目录")
                 except Exception as save_error:
                     logger.error(f"自动保存文件失败: {str(save_error)}", exc_info=True)
+                # 按设置在后台获取真实驾车路线（消耗驾车API额度），完成后重新保存文件并刷新地图
+                if self.auto_fetch_polylines_checkbox.isChecked():
+                    self._safe_set_button_enabled('fetch_polyline_btn', False)
+                    self.start_polyline_fetch(self.route_data)
             
         except Exception as e:
             self._safe_update_status(f"❌ 路线生成错误: {str(e)}", "red")
@@ -8406,252 +5707,18 @@ class MainWindow(QMainWindow):
             # 如果有路线数据，启用查看地图按钮
             if hasattr(self, 'route_data') and self.route_data:
                 self._safe_set_button_enabled('all_routes_button', True)
+                self._safe_set_button_enabled('fetch_polyline_btn', not getattr(self, 'polyline_fetch_running', False))
                 logger.info(f"已启用查看地图按钮，路线数量: {len(self.route_data)}")
             logger.info("按钮状态恢复完成")
     
-    def generate_realistic_route_map(self):
-        """生成综合路线地图（增强版：包含转向标记、里程统计）"""
-        try:
-            if not self.route_data:
-                return False
-            
-            all_lats = []
-            all_lons = []
-            
-            for route in self.route_data:
-                for point in route.get('real_points', []):
-                    all_lats.append(point[0])
-                    all_lons.append(point[1])
-            
-            if not all_lats:
-                return False
-            
-            center_lat = sum(all_lats) / len(all_lats)
-            center_lon = sum(all_lons) / len(all_lons)
-            
-            # 使用高德地图瓦片服务
-            route_map = folium.Map(
-                location=[center_lat, center_lon],
-                zoom_start=12,
-                tiles='https://webrd03.is.autonavi.com/appmaptile?lang=zh_cn&size=1&scale=1&style=8&x={x}&y={y}&z={z}',
-                attr='© <a href="https://ditu.amap.com/">高德地图</a>',
-                control_scale=True
-            )
-            
-            # 使用与地图生成功能相同的颜色列表
-            colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'darkblue', 'darkgreen']
-            
-            # 统计信息
-            total_distance = 0
-            total_highway_distance = 0
-            total_elevated_distance = 0
-            total_left_turns = 0
-            total_right_turns = 0
-            total_uturns = 0
-            
-            # 图例HTML
-            legend_html = '''
-            <div style="position: fixed; 
-                bottom: 50px; right: 50px; width: 350px; height: auto; 
-                background-color: white; border:2px solid grey; z-index:9999; 
-                font-size:14px; padding: 10px; border-radius: 5px; max-height: 500px; overflow-y: auto;">
-                <div style="text-align: center; font-weight: bold; margin-bottom: 5px;">路线图例</div>
-            '''
-            
-            for i, route in enumerate(self.route_data):
-                color = colors[i % len(colors)]
-                route_id = route['route_id']
-                
-                if route.get('real_points'):
-                    # 获取路线信息
-                    start_name = route.get('start_point', {}).get('name', '起点')
-                    end_name = route.get('end_point', {}).get('name', '终点')
-                    waypoints = route.get('waypoints', '')
-                    
-                    # 使用PolyLine绘制路径
-                    folium.PolyLine(
-                        locations=route['real_points'],
-                        color=color,
-                        weight=4,
-                        opacity=0.8,
-                        tooltip=f"路线 {route_id}"
-                    ).add_to(route_map)
-                    
-                    # 添加起点标记
-                    start_point = route['real_points'][0]
-                    folium.Marker(
-                        location=start_point,
-                        popup=f"<b>路线{route_id} - 起点</b><br>{start_name}",
-                        icon=folium.Icon(color='lightgreen', icon='play', prefix='fa')
-                    ).add_to(route_map)
-                    
-                    # 添加终点标记
-                    end_point = route['real_points'][-1]
-                    folium.Marker(
-                        location=end_point,
-                        popup=f"<b>路线{route_id} - 终点</b><br>{end_name}",
-                        icon=folium.Icon(color='darkred', icon='stop', prefix='fa')
-                    ).add_to(route_map)
-                    
-                    # 添加转向标记
-                    turn_points = route.get('turn_points', [])
-                    route_left_turns = 0
-                    route_right_turns = 0
-                    route_uturns = 0
-                    
-                    for tp in turn_points:
-                        try:
-                            lat_tp = float(tp.get("lat"))
-                            lon_tp = float(tp.get("lon"))
-                            t_type = str(tp.get("type") or "").lower()
-                            type_idx = int(tp.get("type_index", 0) or 0)
-                            from_road = str(tp.get("from_road", "") or "")
-                            to_road = str(tp.get("to_road", "") or "")
-                        except Exception:
-                            continue
-                        
-                        if t_type == "left":
-                            icon_color = 'blue'
-                            icon_text = 'L'
-                            type_label = "左转"
-                            route_left_turns += 1
-                        elif t_type == "right":
-                            icon_color = 'orange'
-                            icon_text = 'R'
-                            type_label = "右转"
-                            route_right_turns += 1
-                        elif t_type == "uturn":
-                            icon_color = 'purple'
-                            icon_text = 'U'
-                            type_label = "掉头"
-                            route_uturns += 1
-                        else:
-                            continue
-                        
-                        if type_idx > 0:
-                            order_text = f"第{type_idx}个{type_label}"
-                        else:
-                            order_text = type_label
-                        
-                        if from_road or to_road:
-                            fr = from_road or "未知道路"
-                            tr = to_road or "未知道路"
-                            trans_text = f"，由 {fr} 转到 {tr}"
-                        else:
-                            trans_text = ""
-                        
-                        tooltip = f"路线{route_id} - {order_text}{trans_text}"
-                        
-                        turn_icon = folium.features.DivIcon(
-                            icon_size=(18, 18),
-                            icon_anchor=(9, 9),
-                            html=f'''
-                                <div style="
-                                    width: 16px;
-                                    height: 16px;
-                                    border-radius: 50%;
-                                    background-color: {icon_color};
-                                    color: white;
-                                    font-size: 11px;
-                                    text-align: center;
-                                    line-height: 16px;
-                                    box-shadow: 0 0 3px #000;
-                                ">{icon_text}</div>
-                            '''
-                        )
-                        
-                        folium.Marker(
-                            [lat_tp, lon_tp],
-                            icon=turn_icon,
-                            tooltip=tooltip
-                        ).add_to(route_map)
-                    
-                    total_left_turns += route_left_turns
-                    total_right_turns += route_right_turns
-                    total_uturns += route_uturns
-                    
-                    # 计算里程
-                    route_distance = 0
-                    highway_distance = 0
-                    elevated_distance = 0
-                    
-                    road_types = route.get('road_types', [])
-                    if road_types and len(route['real_points']) > 1:
-                        for j in range(len(route['real_points']) - 1):
-                            if j < len(road_types):
-                                road_type = str(road_types[j]).strip()
-                                lat1, lon1 = route['real_points'][j]
-                                lat2, lon2 = route['real_points'][j + 1]
-                                
-                                distance = self.calculate_distance(lat1, lon1, lat2, lon2) / 1000
-                                route_distance += distance
-                                
-                                if road_type == "1":
-                                    highway_distance += distance
-                                elif road_type == "2":
-                                    elevated_distance += distance
-                    
-                    total_distance += route_distance
-                    total_highway_distance += highway_distance
-                    total_elevated_distance += elevated_distance
-                    
-                    # 添加到图例
-                    legend_html += f'''
-                    <div style="display: flex; align-items: center; margin-bottom: 5px;">
-                        <div style="background-color: {color}; width: 15px; height: 15px; margin-right: 5px;"></div>
-                        <span>路线 {route_id} ({round(route_distance, 2)} 公里)</span>
-                    </div>
-                    '''
-                    
-                    if route_left_turns > 0 or route_right_turns > 0 or route_uturns > 0:
-                        legend_html += f'''
-                        <div style="margin-left: 22px; font-size: 12px; margin-top: -2px; margin-bottom: 4px; color: #555;">
-                            左转: {route_left_turns} 个，右转: {route_right_turns} 个，掉头: {route_uturns} 个
-                        </div>
-                        '''
-                    
-                    if route_distance > 0:
-                        legend_html += f'''
-                        <div style="margin-left: 20px; font-size: 12px; margin-bottom: 10px;">
-                            <div>高速: {round(highway_distance, 2)} 公里 ({round(highway_distance/route_distance*100 if route_distance > 0 else 0, 1)}%)</div>
-                            <div>高架: {round(elevated_distance, 2)} 公里 ({round(elevated_distance/route_distance*100 if route_distance > 0 else 0, 1)}%)</div>
-                            <div>普通: {round(route_distance - highway_distance - elevated_distance, 2)} 公里 ({round((route_distance - highway_distance - elevated_distance)/route_distance*100 if route_distance > 0 else 0, 1)}%)</div>
-                        </div>
-                        '''
-            
-            # 总计统计
-            legend_html += f'''
-            <div style="border-top: 1px solid #ccc; margin-top: 5px; padding-top: 5px;">
-                <div style="font-weight: bold; text-align: center;">总里程: {round(total_distance, 2)} 公里</div>
-                <div style="text-align: center;">高速总里程: {round(total_highway_distance, 2)} 公里 ({round(total_highway_distance/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
-                <div style="text-align: center;">高架总里程: {round(total_elevated_distance, 2)} 公里 ({round(total_elevated_distance/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
-                <div style="text-align: center;">普通道路总里程: {round(total_distance - total_highway_distance - total_elevated_distance, 2)} 公里 ({round((total_distance - total_highway_distance - total_elevated_distance)/total_distance*100 if total_distance > 0 else 0, 1)}%)</div>
-                <div style="text-align: center; margin-top: 4px;">
-                    总左转路口: {int(total_left_turns)} 个，
-                    总右转路口: {int(total_right_turns)} 个，
-                    总掉头路口: {int(total_uturns)} 个
-                </div>
-            </div>
-            '''
-            
-            legend_html += '</div>'
-            route_map.get_root().html.add_child(folium.Element(legend_html))
-            
-            temp_dir = tempfile.gettempdir()
-            self.combined_map_path = os.path.join(temp_dir, 'all_routes_map.html')
-            route_map.save(self.combined_map_path)
-            
-            self.update_api_response(f"✅ 备用地图已生成，包含 {len(self.route_data)} 条路线")
-            self.update_api_response(f"   📍 转向路口: 左转{total_left_turns}个, 右转{total_right_turns}个, 掉头{total_uturns}个")
-            self.update_api_response(f"   📏 总里程: {round(total_distance, 2)}公里 (高速{round(total_highway_distance, 2)}公里, 高架{round(total_elevated_distance, 2)}公里)")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"生成综合地图错误: {str(e)}")
-            self.update_api_response(f"❌ 备用地图生成失败: {str(e)}")
-            return False
-    
+    def fetch_real_routes(self):
+        """获取当前路线的真实驾车路线（后台进行，完成后重新保存路线文件并刷新地图）"""
+        if not self.route_data:
+            QMessageBox.information(self, "提示", "请先生成路线")
+            return
+        self.fetch_polyline_btn.setEnabled(False)
+        self.start_polyline_fetch(self.route_data)
+
     def view_all_routes_map(self):
         """查看所有路线地图（使用地图生成样式）"""
         if self.combined_map_path and os.path.exists(self.combined_map_path):
@@ -8709,6 +5776,8 @@ class MainWindow(QMainWindow):
             # 4. 重置按钮状态
             if hasattr(self, 'all_routes_button'):
                 self.all_routes_button.setEnabled(False)
+            if hasattr(self, 'fetch_polyline_btn'):
+                self.fetch_polyline_btn.setEnabled(False)
             if hasattr(self, 'generate_route_btn'):
                 self.generate_route_btn.setEnabled(True)
             if hasattr(self, 'pause_btn'):
@@ -8752,8 +5821,8 @@ class MainWindow(QMainWindow):
         
         # 创建表格
         table = QTableWidget()
-        table.setColumnCount(4)
-        table.setHorizontalHeaderLabels(["路线", "起点 → 终点", "复制链接", "打开链接"])
+        table.setColumnCount(5)
+        table.setHorizontalHeaderLabels(["路线", "起点 → 终点", "驾车里程", "复制链接", "打开链接"])
         table.setRowCount(len(self.route_data))
         
         # 设置列宽
@@ -8762,6 +5831,7 @@ class MainWindow(QMainWindow):
         header.setSectionResizeMode(1, QHeaderView.Stretch)
         header.setSectionResizeMode(2, QHeaderView.ResizeToContents)
         header.setSectionResizeMode(3, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(4, QHeaderView.ResizeToContents)
         
         for row, route in enumerate(self.route_data):
             # 路线ID
@@ -8770,6 +5840,10 @@ class MainWindow(QMainWindow):
             # 起点 → 终点
             route_desc = f"{route['start_point']['name']} → {route['end_point']['name']}"
             table.setItem(row, 1, QTableWidgetItem(route_desc))
+
+            # 驾车里程（获取真实路线后才有）
+            driving_distance = route.get('driving_distance')
+            table.setItem(row, 2, QTableWidgetItem(f"{driving_distance} 公里" if driving_distance is not None else "未获取"))
             
             nav_url = route.get('navigation_url', '')
             
@@ -8778,12 +5852,12 @@ class MainWindow(QMainWindow):
             copy_btn.setProperty("nav_url", nav_url)
             copy_btn.setProperty("route_id", route['route_id'])
             copy_btn.clicked.connect(lambda checked, url=nav_url, rid=route['route_id']: self._copy_nav_url(url, rid))
-            table.setCellWidget(row, 2, copy_btn)
+            table.setCellWidget(row, 3, copy_btn)
             
             # 打开按钮
             open_btn = QPushButton("🌐 打开")
             open_btn.clicked.connect(lambda checked, url=nav_url, rid=route['route_id']: self._open_nav_url(url, rid))
-            table.setCellWidget(row, 3, open_btn)
+            table.setCellWidget(row, 4, open_btn)
         
         layout.addWidget(table)
         
@@ -9241,156 +6315,6 @@ class MainWindow(QMainWindow):
             self.update_api_response(f"❌ 导出地点坐标Excel失败: {str(e)}")
             QMessageBox.critical(self, "导出失败", f"导出失败: {str(e)}")
     
-    def _auto_save_files_to_program_dir(self):
-        """自动保存Excel和JSON文件到程序目录（生成路线后调用）"""
-        try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Alignment, Font, PatternFill
-            
-            timestamp = pd.Timestamp.now().strftime('%Y%m%d%H%M%S')
-            
-            # 保存Excel文件
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "路线列表"
-            
-            # 设置列头
-            headers = ["序号", "城市名称", "路线名称", "图例1", "图例2", "路线链接", "JSON文件"]
-            for col_num, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col_num)
-                cell.value = header
-                cell.font = Font(bold=True, size=12)
-                cell.fill = PatternFill(start_color="CCE5FF", end_color="CCE5FF", fill_type="solid")
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-            
-            city_name = self.city_combo.currentText() if hasattr(self, 'city_combo') else "未指定城市"
-            
-            # 填充数据
-            row = 2
-            for i, route in enumerate(self.last_generated_routes, 1):
-                ws.cell(row=row, column=1).value = i
-                ws.cell(row=row, column=2).value = city_name
-                ws.cell(row=row, column=3).value = f"路线_{route['route_id']}"
-                ws.cell(row=row, column=4).value = ""
-                ws.cell(row=row, column=5).value = ""
-                ws.cell(row=row, column=6).value = route.get('navigation_url', '')
-                
-                # 构建JSON内容
-                point_list = []
-                point_list.append({
-                    "lat": route['start_point']['lat'],
-                    "lon": route['start_point']['lon'],
-                    "name": route['start_point']['name'],
-                    "address": route['start_point']['name']
-                })
-                for wp in route.get('waypoint_details', []):
-                    point_list.append({
-                        "lat": wp['lat'],
-                        "lon": wp['lon'],
-                        "name": wp['name'],
-                        "address": wp['name']
-                    })
-                point_list.append({
-                    "lat": route['end_point']['lat'],
-                    "lon": route['end_point']['lon'],
-                    "name": route['end_point']['name'],
-                    "address": route['end_point']['name']
-                })
-                
-                route_json = [{
-                    "routeName": f"路线_{timestamp}_{route['route_id']}",
-                    "pointList": point_list
-                }]
-                
-                json_content = json.dumps(route_json, ensure_ascii=False, indent=2)
-                ws.cell(row=row, column=7).value = json_content
-                
-                for col in range(1, 8):
-                    ws.cell(row=row, column=col).alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                
-                row += 1
-            
-            # 合并城市名称列
-            if len(self.last_generated_routes) > 1:
-                ws.merge_cells(start_row=2, start_column=2, end_row=row-1, end_column=2)
-                ws.cell(row=2, column=2).alignment = Alignment(horizontal='center', vertical='center')
-            
-            # 调整列宽
-            ws.column_dimensions['A'].width = 8
-            ws.column_dimensions['B'].width = 15
-            ws.column_dimensions['C'].width = 20
-            ws.column_dimensions['D'].width = 12
-            ws.column_dimensions['E'].width = 12
-            ws.column_dimensions['F'].width = 40  # 路线链接列宽
-            ws.column_dimensions['G'].width = 40  # JSON文件列宽
-            
-            # 设置有内容行的行高为60
-            for row_num in range(2, row):
-                ws.row_dimensions[row_num].height = 60
-            
-            # 保存Excel文件到程序目录
-            excel_filename = f"routes_{timestamp}.xlsx"
-            excel_path = os.path.join(self.excel_dir, excel_filename)
-            wb.save(excel_path)
-            self.exported_files['excel'].append(excel_path)
-            
-            # 保存JSON文件到程序目录
-            self._save_json_files_to_program_dir(timestamp)
-            
-            logger.info(f"已自动保存Excel和JSON文件到程序目录: {excel_filename}")
-            
-        except Exception as e:
-            logger.error(f"自动保存文件失败: {str(e)}", exc_info=True)
-    
-    def _save_json_files_to_program_dir(self, timestamp):
-        """保存JSON文件到程序目录"""
-        try:
-            for route in self.last_generated_routes:
-                # 构建JSON格式
-                point_list = []
-                
-                # 添加起点
-                point_list.append({
-                    "lat": route['start_point']['lat'],
-                    "lon": route['start_point']['lon'],
-                    "name": route['start_point']['name'],
-                    "address": route['start_point']['name']
-                })
-                
-                # 添加途径点
-                for wp in route.get('waypoint_details', []):
-                    point_list.append({
-                        "lat": wp['lat'],
-                        "lon": wp['lon'],
-                        "name": wp['name'],
-                        "address": wp['name']
-                    })
-                
-                # 添加终点
-                point_list.append({
-                    "lat": route['end_point']['lat'],
-                    "lon": route['end_point']['lon'],
-                    "name": route['end_point']['name'],
-                    "address": route['end_point']['name']
-                })
-                
-                route_json = [{
-                    "routeName": f"路线_{timestamp}_{route['route_id']}",
-                    "pointList": point_list
-                }]
-                
-                # 保存JSON文件
-                json_filename = f"route_{route['route_id']}_{timestamp}.json"
-                json_path = os.path.join(self.json_dir, json_filename)
-                with open(json_path, 'w', encoding='utf-8') as f:
-                    json.dump(route_json, f, ensure_ascii=False, indent=2)
-                
-                # 记录到导出文件列表
-                self.exported_files['json'].append(json_path)
-
-        except Exception as e:
-            logger.error(f"保存JSON文件失败: {str(e)}", exc_info=True)
-
     def clear_generated_files(self):
         """清空生成的Excel和JSON文件"""
         reply = QMessageBox.question(self, "确认清空",
@@ -9498,17 +6422,6 @@ class MainWindow(QMainWindow):
         waypoint_num = self.waypoint_spin.value()
         route_num = self.route_num_spin.value()
 
-        required_points = route_num * (waypoint_num + 2)
-        if required_points > len(self.valid_locations):
-            reply = QMessageBox.question(self,
-                                       "确认",
-                                       f"生成 {route_num} 条路线需要至少 {required_points} 个有效地点，但只有 {len(self.valid_locations)} 个。\n"
-                                       "可能无法生成所有路线，是否继续？",
-                                       QMessageBox.Yes | QMessageBox.No,
-                                       QMessageBox.No)
-            if reply != QMessageBox.Yes:
-                return
-
         # 场景比例设置弹窗（如果启用且有场景）
         if self.enable_scene_ratio_dialog:
             # 从有效地点中统计实际场景分布
@@ -9537,6 +6450,22 @@ class MainWindow(QMainWindow):
                     # 用户取消了设置
                     self.update_api_response("⚠️ 用户取消了路线规划")
                     return
+
+        # 可行性预检：按场景配额和相邻点距离环估算地点是否足够
+        active_locations = [loc for loc in self.valid_locations
+                            if loc.get('status', 'active') != 'deleted']
+        plan_mode = self.plan_mode_combo.currentData() if hasattr(self, 'plan_mode_combo') else "greedy"
+        report = self.check_feasibility(active_locations, waypoint_num, route_num, plan_mode)
+        if not report['feasible']:
+            reply = QMessageBox.question(self,
+                                       "确认",
+                                       "地点可能不足以生成全部路线：\n\n"
+                                       + "\n".join(format_feasibility_report(report))
+                                       + "\n\n是否继续？",
+                                       QMessageBox.Yes | QMessageBox.No,
+                                       QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
         
         self.generate_route_btn.setEnabled(False)
         if hasattr(self, 'pause_btn'):
@@ -9768,6 +6697,9 @@ class MainWindow(QMainWindow):
             "road_names": road_names,
             "turn_points": turn_points or []
         })
+        # 路线坐标（经度, 纬度）加入离线道路线段库
+        self.road_segment_store.add_polyline(all_coords, road_names)
+        self.road_segment_store.save()
         self.log_text.append(f"  ✅ {os.path.basename(self.json_files[idx])} 处理完成")
         self._calculate_next_json(idx + 1)
 
@@ -10037,28 +6969,6 @@ class MainWindow(QMainWindow):
             self.log_text.append(f"  - 失败: {fail_count} 个文件")
         self.log_text.append(f"{'='*60}\n")
     
-    def calculate_distance(self, lat1, lon1, lat2, lon2):
-        """计算两点间的距离（单位：米）"""
-        # 地球半径（米）
-        R = 6371000
-        
-        # 将经纬度转换为弧度
-        lat1_rad = math.radians(lat1)
-        lon1_rad = math.radians(lon1)
-        lat2_rad = math.radians(lat2)
-        lon2_rad = math.radians(lon2)
-        
-        # 计算差值
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-        
-        # Haversine公式
-        a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        distance = R * c
-        
-        return distance
-    
     def select_excel_files(self):
         """选择Excel文件"""
         files, _ = QFileDialog.getOpenFileNames(self, "选择Excel文件", "", "Excel文件 (*.xlsx *.xls)")
@@ -10168,7 +7078,8 @@ class MainWindow(QMainWindow):
         self.generate_btn.setEnabled(False)
 
         # 创建并启动生成线程（手动生成时自动打开）
-        self.gen_thread = RouteGenerator(self.excel_files, output_dir, auto_open=True)
+        self.gen_thread = RouteGenerator(self.excel_files, output_dir, auto_open=True,
+                                         render_mode=self.map_render_mode_combo.currentData())
         self.gen_thread.progress_updated.connect(self.update_map_progress)
         self.gen_thread.generation_finished.connect(self.on_generation_finished)
         self.gen_thread.error_occurred.connect(self.on_generation_error)
@@ -10884,6 +7795,8 @@ class MainWindow(QMainWindow):
         )
 
 if __name__ == "__main__":
+    # 打包为可执行文件时，读取Excel的进程池子进程需要先经过这里
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
 
     # 设置应用程序字体